@@ -12,6 +12,8 @@ from dataclasses import dataclass
 from typing import List, Dict, Optional
 from enum import Enum
 
+from utils.lazy import LazyProxy
+
 # 加载环境变量
 try:
     from dotenv import load_dotenv
@@ -53,9 +55,13 @@ class AIConfigManager:
         self.timeout = int(os.environ.get('AI_TIMEOUT', 60))
         self.max_retries = 3
         self.error_cooldown = 60  # 错误后冷却时间(秒) - 缩短为1分钟，允许快速重试
+        self.health_thread = None
         self._init_endpoints()
-        
-        # 启动后台健康检查
+
+    def start_health_check(self):
+        """启动后台健康检查线程（只在后台任务进程中调用，见 utils/background_role.py）"""
+        if self.health_thread is not None:
+            return
         import threading
         self.health_thread = threading.Thread(target=self._health_check_loop, daemon=True)
         self.health_thread.start()
@@ -282,20 +288,24 @@ class AIConfigManager:
         return sequence
 
 
-# 全局配置管理器实例
-ai_manager = AIConfigManager()
+# 全局配置管理器实例（首次使用时才查库加载端点）
+ai_manager = LazyProxy(AIConfigManager, 'ai_manager')
 
 
 # ========== 兼容旧代码的配置 ==========
-# 使用第一个可用端点作为默认配置
-_default_endpoint = ai_manager.endpoints[0] if ai_manager.endpoints else None
-AI_CONFIG = {
-    "API_KEY": _default_endpoint.api_key if _default_endpoint else "",
-    "BASE_URL": _default_endpoint.base_url if _default_endpoint else "",
-    "MODEL": _default_endpoint.models[0] if _default_endpoint and _default_endpoint.models else "deepseek-v3",
-    "FALLBACK_MODELS": _default_endpoint.models[1:] if _default_endpoint and len(_default_endpoint.models) > 1 else ["deepseek-chat", "gpt-4o-mini"],
-    "TIMEOUT": ai_manager.timeout
-}
+def __getattr__(name):
+    """AI_CONFIG 在首次访问时计算，避免导入本模块即加载端点"""
+    if name != 'AI_CONFIG':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    # 使用第一个可用端点作为默认配置
+    _default_endpoint = ai_manager.endpoints[0] if ai_manager.endpoints else None
+    return {
+        "API_KEY": _default_endpoint.api_key if _default_endpoint else "",
+        "BASE_URL": _default_endpoint.base_url if _default_endpoint else "",
+        "MODEL": _default_endpoint.models[0] if _default_endpoint and _default_endpoint.models else "deepseek-v3",
+        "FALLBACK_MODELS": _default_endpoint.models[1:] if _default_endpoint and len(_default_endpoint.models) > 1 else ["deepseek-chat", "gpt-4o-mini"],
+        "TIMEOUT": ai_manager.timeout
+    }
 
 
 def get_model_config(task_type="analysis"):
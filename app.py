@@ -10,20 +10,22 @@ import time
 import smtplib
 import hashlib
 import os
+import zipfile
+import importlib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
 from threading import Thread, Lock
-from werkzeug.utils import secure_filename
 from werkzeug.exceptions import HTTPException
-from ai_config import AI_CONFIG, get_model_config, switch_to_backup_api
 from database import DatabasePool, close_db, DB_INTEGRITY_ERRORS, DB_OPERATIONAL_ERRORS
 from db_init import init_db, reload_notification_config, migrate_to_dynamic_milestones, allowed_file
-from api_utils import api_response, validate_json, cached, SafeJSONEncoder
+from api_utils import api_response, validate_json, SafeJSONEncoder
 from concurrent.futures import ThreadPoolExecutor
 import uuid
 from storage_service import storage_service
 from services.kb_service import kb_service
+from services.notification_stream_service import notification_stream_service
+from services.project_export_service import project_export_service
 
 app = Flask(__name__)
 app.json_encoder = SafeJSONEncoder
@@ -72,67 +74,78 @@ def force_static(filename):
 def wecom_verify_file():
     return send_from_directory('.', 'WW_verify_qbEX7XXnUe5licTo.txt')
 
-from routes.alignment_routes import alignment_bp
-from routes.project_routes import project_bp
-from routes.member_routes import member_bp
-from routes.log_routes import log_bp
-from routes.doc_routes import doc_bp
-from routes.lifecycle_routes import lifecycle_bp
-from routes.task_routes import task_bp
-from routes.analytics_routes import analytics_bp
-from routes.monitor_routes import monitor_bp
-from routes.standup_routes import standup_bp
-from routes.gantt_routes import gantt_bp
-from routes.ai_insight_routes import ai_insight_bp
 from services.project_service import project_service
 from services.ai_service import ai_service
-from routes.nl_query_routes import nl_query_bp
-from routes.financial_routes import financial_bp
-from routes.pmo_routes import pmo_bp
-from routes.report_routes import report_bp
-from routes.risk_simulation_routes import risk_bp
-from routes.collaboration_routes import collab_bp
-from routes.operational_routes import operational_bp
-from routes.interface_spec_routes import spec_bp
-from routes.wecom_routes import wecom_bp
-from routes.form_generator_routes import form_generator_bp
-from routes.mobile_routes import mobile_bp
-from routes.hardware_routes import hardware_bp
-from routes.communication_routes import communication_bp
-from routes.business_routes import business_bp
-from routes.performance_review_routes import performance_review_bp
 from services.analytics_service import analytics_service
 from services.monitor_service import monitor_service
 from services.auth_service import auth_service
 from ai_utils import call_ai
-from app_config import NOTIFICATION_CONFIG, PROJECT_STATUS, PROJECT_TEMPLATES
-app.register_blueprint(alignment_bp)
-app.register_blueprint(project_bp)
-app.register_blueprint(member_bp)
-app.register_blueprint(log_bp)
-app.register_blueprint(doc_bp)
-app.register_blueprint(lifecycle_bp)
-app.register_blueprint(task_bp)
-app.register_blueprint(analytics_bp)
-app.register_blueprint(monitor_bp)
-app.register_blueprint(standup_bp)
-app.register_blueprint(gantt_bp)
-app.register_blueprint(ai_insight_bp)
-app.register_blueprint(nl_query_bp)
-app.register_blueprint(financial_bp)
-app.register_blueprint(pmo_bp)
-app.register_blueprint(report_bp)
-app.register_blueprint(risk_bp)
-app.register_blueprint(collab_bp)
-app.register_blueprint(operational_bp)
-app.register_blueprint(spec_bp)
-app.register_blueprint(wecom_bp)
-app.register_blueprint(form_generator_bp, url_prefix='/api/form-generator')
-app.register_blueprint(mobile_bp)
-app.register_blueprint(hardware_bp)
-app.register_blueprint(communication_bp)
-app.register_blueprint(business_bp)
-app.register_blueprint(performance_review_bp)
+from app_config import NOTIFICATION_CONFIG, PROJECT_STATUS, PROJECT_TEMPLATES, STARTUP_CONFIG
+from utils.background_role import background_role
+
+# 蓝图清单：(模块, 蓝图变量名, 注册参数)
+# LAZY_IMPORTS 模式下路由模块（及其依赖的服务）在进程处理第一个请求前才导入并注册，
+# 只导入 app 做初始化/脚本任务的进程不必付出这部分开销
+BLUEPRINTS = (
+    ('routes.alignment_routes', 'alignment_bp', {}),
+    ('routes.project_routes', 'project_bp', {}),
+    ('routes.member_routes', 'member_bp', {}),
+    ('routes.log_routes', 'log_bp', {}),
+    ('routes.doc_routes', 'doc_bp', {}),
+    ('routes.lifecycle_routes', 'lifecycle_bp', {}),
+    ('routes.task_routes', 'task_bp', {}),
+    ('routes.analytics_routes', 'analytics_bp', {}),
+    ('routes.monitor_routes', 'monitor_bp', {}),
+    ('routes.standup_routes', 'standup_bp', {}),
+    ('routes.gantt_routes', 'gantt_bp', {}),
+    ('routes.ai_insight_routes', 'ai_insight_bp', {}),
+    ('routes.nl_query_routes', 'nl_query_bp', {}),
+    ('routes.financial_routes', 'financial_bp', {}),
+    ('routes.pmo_routes', 'pmo_bp', {}),
+    ('routes.report_routes', 'report_bp', {}),
+    ('routes.risk_simulation_routes', 'risk_bp', {}),
+    ('routes.collaboration_routes', 'collab_bp', {}),
+    ('routes.operational_routes', 'operational_bp', {}),
+    ('routes.interface_spec_routes', 'spec_bp', {}),
+    ('routes.wecom_routes', 'wecom_bp', {}),
+    ('routes.form_generator_routes', 'form_generator_bp', {'url_prefix': '/api/form-generator'}),
+    ('routes.mobile_routes', 'mobile_bp', {}),
+    ('routes.hardware_routes', 'hardware_bp', {}),
+    ('routes.communication_routes', 'communication_bp', {}),
+    ('routes.business_routes', 'business_bp', {}),
+    ('routes.performance_review_routes', 'performance_review_bp', {}),
+)
+_blueprints_lock = Lock()
+_blueprints_registered = False
+
+
+def register_blueprints():
+    """导入并注册全部蓝图（幂等）"""
+    global _blueprints_registered
+    if _blueprints_registered:
+        return
+    with _blueprints_lock:
+        if _blueprints_registered:
+            return
+        for module_name, attr, options in BLUEPRINTS:
+            app.register_blueprint(getattr(importlib.import_module(module_name), attr), **options)
+        _blueprints_registered = True
+
+
+def _register_blueprints_before_first_request(wsgi_app):
+    # 路由匹配发生在 before_request 之前，因此在 WSGI 入口处补注册
+    def wrapper(environ, start_response):
+        if not _blueprints_registered:
+            register_blueprints()
+        return wsgi_app(environ, start_response)
+    return wrapper
+
+
+if STARTUP_CONFIG['LAZY_IMPORTS']:
+    app.wsgi_app = _register_blueprints_before_first_request(app.wsgi_app)
+else:
+    register_blueprints()
+
 from services.scheduler_service import report_scheduler
 
 
@@ -171,6 +184,8 @@ def require_global_auth():
 
     silent_401_prefixes = [
         '/api/notifications/unread-count',
+        '/api/notifications/channel',
+        '/api/notifications/poll',
         '/api/reminders/digest',
         '/api/warnings/count',
         '/api/check-and-create-reminders',
@@ -192,14 +207,20 @@ _scheduler_started = False
 
 
 def ensure_scheduler_started():
-    """确保调度器在当前进程只启动一次（兼容 gunicorn/flask 运行方式）。"""
+    """确保后台线程（报告调度、通知外发补发、AI 健康检查、SSE 推送服务）只在被选为后台任务进程的 worker 中启动一次。"""
     global _scheduler_started
-    if _scheduler_started:
+    if _scheduler_started or not background_role.is_designated():
         return
     with _scheduler_lock:
         if _scheduler_started:
             return
         report_scheduler.start()
+        from services.notification_dispatcher import notification_dispatcher
+        notification_dispatcher.start()
+        from ai_config import ai_manager
+        ai_manager.start_health_check()
+        from services.notification_stream_server import notification_stream_server
+        notification_stream_server.start()
         _scheduler_started = True
 
 
@@ -379,6 +400,9 @@ def enrich_task_rows(rows):
         row['hospital_name'] = project.get('hospital_name')
     return enriched
 
+# register_task 的这些关键字参数只用于任务中心展示，不传给 runner
+TASK_META_KWARGS = ('project_id', 'payload_summary', 'source_endpoint', 'retried_from_task_id')
+
 def register_task(task_id, task_type, title, runner, *runner_args, **runner_kwargs):
     """统一登记后台任务，便于任务中心查看与重试。"""
     now = _now_iso()
@@ -405,6 +429,7 @@ def register_task(task_id, task_type, title, runner, *runner_args, **runner_kwar
         "error": None,
     }
     persist_task_record(task_results[task_id])
+    notification_stream_service.task_updated(task_results[task_id])
     task_registry[task_id] = {
         "task_type": task_type,
         "title": title,
@@ -430,6 +455,7 @@ def update_task_status(task_id, status, result=None, error=None):
         current["error"] = None
     task_results[task_id] = current
     persist_task_record(current)
+    notification_stream_service.task_updated(current)
 
 def launch_registered_task(task_id):
     """按注册信息启动任务。"""
@@ -437,7 +463,8 @@ def launch_registered_task(task_id):
     if not task_meta:
         raise KeyError(f"Task {task_id} is not registered")
     update_task_status(task_id, "processing", result=None, error=None)
-    safe_submit(task_meta["runner"], task_id, *task_meta["args"], **task_meta["kwargs"])
+    runner_kwargs = {k: v for k, v in task_meta["kwargs"].items() if k not in TASK_META_KWARGS}
+    safe_submit(task_meta["runner"], task_id, *task_meta["args"], **runner_kwargs)
 
 def warm_task_cache(limit=100):
     """启动时预热最近任务缓存。"""
@@ -645,15 +672,7 @@ def get_project_health_dashboard():
     return api_response(True, {'projects': health_data, 'summary': summary})
 
 # ========== 智能预警 API ==========
-@app.route('/api/warnings', methods=['GET'])
-def get_project_warnings():
-    """获取所有项目的预警信息"""
-    try:
-        from services.warning_service import warning_service
-        data = warning_service.get_warning_summary()
-        return api_response(True, data)
-    except Exception as e:
-        return api_response(False, message=str(e), code=500)
+# /api/warnings - Handled by monitor_bp
 
 @app.route('/api/warnings/count', methods=['GET'])
 def get_warning_count():
@@ -828,42 +847,7 @@ def analyze_communications(project_id):
     except Exception as e:
         return api_response(False, message=f'AI分析失败: {str(e)}', code=500)
 
-@app.route('/api/extract-text', methods=['POST'])
-def extract_text():
-    """从上传的文件中提取文本内容（支持 PDF/Word/TXT 等）"""
-    if 'file' not in request.files:
-        return api_response(False, message='没有选择文件', code=400)
-    
-    file = request.files['file']
-    if file.filename == '':
-        return api_response(False, message='没有选择文件', code=400)
-    
-    from services.file_parser import is_supported, extract_text_from_file
-    if not is_supported(file.filename):
-        return api_response(False, message='不支持的文件格式', code=400)
-        
-    # 保存到临时目录
-    temp_dir = os.path.join(app.root_path, 'uploads', 'temp_extract')
-    os.makedirs(temp_dir, exist_ok=True)
-    
-    filepath = os.path.join(temp_dir, f"{int(time.time())}_{secure_filename(file.filename)}")
-    try:
-        file.save(filepath)
-        text = extract_text_from_file(filepath)
-        
-        # 提取完删除临时文件
-        if os.path.exists(filepath):
-            os.remove(filepath)
-            
-        return api_response(True, data={
-            'text': text,
-            'filename': file.filename,
-            'length': len(text)
-        })
-    except Exception as e:
-        if os.path.exists(filepath):
-            os.remove(filepath)
-        return api_response(False, message=f'文本提取失败: {str(e)}', code=500)
+# /api/extract-text - Handled by spec_bp
 
 @app.route('/api/projects/<int:project_id>/communications/analyze-file', methods=['POST'])
 def analyze_communication_file(project_id):
@@ -1118,12 +1102,7 @@ def ai_task_suggestions(project_id):
         return api_response(False, message=str(e), code=500)
 
 # ========== 任务依赖关系 API ==========
-@app.route('/api/projects/<int:project_id>/dependencies', methods=['GET'])
-def get_project_dependencies(project_id):
-    """获取项目所有任务依赖关系"""
-    from services.dependency_service import dependency_service
-    deps = dependency_service.get_dependencies(project_id)
-    return api_response(True, deps)
+# /api/projects/<int:project_id>/dependencies - Handled by project_bp
 
 @app.route('/api/dependencies', methods=['POST'])
 def add_task_dependency():
@@ -1149,7 +1128,8 @@ def delete_task_dependency(dep_id):
 def get_critical_path(project_id):
     """获取项目关键路径"""
     from services.dependency_service import dependency_service
-    result = dependency_service.get_critical_path(project_id)
+    level = str(request.args.get('level', '')).lower() in ('1', 'true', 'yes')
+    result = dependency_service.get_critical_path(project_id, level=level)
     return api_response(True, result)
 
 @app.route('/api/tasks/<int:task_id>/impact', methods=['GET'])
@@ -1208,12 +1188,7 @@ def get_daily_briefing():
     result = standup_service.generate_daily_briefing()
     return api_response(True, result)
 
-@app.route('/api/standup/push-wecom', methods=['POST'])
-def push_briefing_wecom():
-    """推送每日简报到企业微信"""
-    from services.standup_service import standup_service
-    result = standup_service.push_briefing_to_wecom()
-    return api_response(result['success'], message=result['message'])
+# /api/standup/push-wecom - Handled by standup_bp
 
 @app.route('/api/projects/<int:project_id>/standup/history', methods=['GET'])
 def get_standup_history(project_id):
@@ -1596,17 +1571,7 @@ def remove_project_access(project_id, user_id):
         return api_response(False, message=str(e), code=500)
 
 # ========== 数据分析 API ==========
-@app.route('/api/analytics/compare', methods=['POST'])
-def compare_projects():
-    """项目对比分析"""
-    try:
-        from services.analytics_service import analytics_service
-        data = request.json or {}
-        project_ids = data.get('project_ids', [])
-        result = analytics_service.compare_projects(project_ids)
-        return api_response(True, result)
-    except Exception as e:
-        return api_response(False, message=str(e), code=500)
+# /api/analytics/compare - Handled by analytics_bp
 
 @app.route('/api/analytics/trends', methods=['GET'])
 def get_trend_analysis():
@@ -2116,6 +2081,24 @@ def download_task_result(task_id):
     response.headers['Content-Disposition'] = f'attachment; filename=\"{filename}\"; filename*=UTF-8\'\'{filename}'
     return response
 
+@app.route('/api/tasks/<task_id>/artifact', methods=['GET'])
+def download_task_artifact(task_id):
+    """下载后台任务写入存储的产物（如项目导出包）。"""
+    task = task_results.get(task_id) or fetch_task_record(task_id)
+    if task is None:
+        return api_response(False, message="任务不存在 (Task not found)", code=404)
+    try:
+        artifact = json.loads(task.get('result') or '{}')
+    except (TypeError, ValueError):
+        artifact = {}
+    if task.get('status') != 'completed' or not artifact.get('remote_path'):
+        return api_response(False, message="任务暂无可下载的文件", code=400)
+    return storage_service.stream_response(
+        artifact['remote_path'],
+        artifact.get('filename') or os.path.basename(artifact['remote_path']),
+        range_header=request.headers.get('Range'),
+    )
+
 @app.route('/api/tasks/<task_id>/retry', methods=['POST'])
 def retry_task(task_id):
     task_meta = task_registry.get(task_id)
@@ -2498,152 +2481,10 @@ def run_daily_cruise_async():
         return api_response(False, message=str(e), code=500)
 
 # ========== 燃尽图数据 API ==========
-@app.route('/api/projects/<int:project_id>/burndown', methods=['GET'])
-def get_burndown_data(project_id):
-    with DatabasePool.get_connection() as conn:
-        sql_pj = DatabasePool.format_sql('SELECT * FROM projects WHERE id = ?')
-        project = conn.execute(sql_pj, (project_id,)).fetchone()
-        if not project:
-            return jsonify({'error': '项目不存在'}), 404
-        
-        # 获取历史记录
-        sql_history = DatabasePool.format_sql('''
-            SELECT record_date, progress, tasks_total, tasks_completed 
-            FROM progress_history WHERE project_id = ? ORDER BY record_date
-        ''')
-        history = conn.execute(sql_history, (project_id,)).fetchall()
-        
-        # 获取当前状态
-        sql_tasks = DatabasePool.format_sql('''
-            SELECT COUNT(*) as total, SUM(CASE WHEN is_completed = ? THEN 1 ELSE 0 END) as completed
-            FROM tasks t JOIN project_stages s ON t.stage_id = s.id WHERE s.project_id = ?
-        ''')
-        tasks_stats = conn.execute(sql_tasks, (True, project_id,)).fetchone()
-        total_tasks = tasks_stats['total'] or 0
-        completed_tasks = tasks_stats['completed'] or 0
-        
-        start_date_str = project['plan_start_date'] or str(project['created_at'])[:10]
-        end_date_str = project['plan_end_date'] or (datetime.now() + timedelta(days=30)).strftime('%Y-%m-%d')
-        
-        try:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
-        except:
-            start_date = datetime.now() - timedelta(days=30)
-            end_date = datetime.now() + timedelta(days=30)
-        
-        total_days = (end_date - start_date).days or 1
-        today = datetime.now()
-        
-        ideal_line = []
-        for i in range(total_days + 1):
-            curr = start_date + timedelta(days=i)
-            ideal_rem = total_tasks - (total_tasks * i / total_days)
-            ideal_line.append({'date': curr.strftime('%Y-%m-%d'), 'value': round(max(0, ideal_rem), 1)})
-        
-        actual_line = []
-        if history:
-            for row in history:
-                actual_line.append({'date': row['record_date'], 'value': row['tasks_total'] - row['tasks_completed']})
-            
-            # 如果最后一条记录不是今天，添加今天的实时数据
-            if str(history[-1]['record_date'])[:10] != today.strftime('%Y-%m-%d'):
-                actual_line.append({'date': today.strftime('%Y-%m-%d'), 'value': total_tasks - completed_tasks})
-        else:
-            # 兜底：如果没有历史记录，生成简单的两点线（开始日和今日）
-            actual_line.append({'date': start_date.strftime('%Y-%m-%d'), 'value': total_tasks})
-            if today > start_date:
-                actual_line.append({'date': today.strftime('%Y-%m-%d'), 'value': total_tasks - completed_tasks})
-
-        return jsonify({
-            'project_name': project['project_name'],
-            'total_tasks': total_tasks,
-            'completed_tasks': completed_tasks,
-            'ideal_line': ideal_line,
-            'actual_line': actual_line
-        })
+# /api/projects/<int:project_id>/burndown - Handled by analytics_bp
 
 # ========== 仪表盘统计 API ==========
-@app.route('/api/dashboard/stats', methods=['GET'])
-@cached(ttl=60)
-def get_dashboard_stats():
-    with DatabasePool.get_connection() as conn:
-        total_projects = conn.execute(DatabasePool.format_sql("SELECT COUNT(*) as c FROM projects")).fetchone()['c']
-        in_progress = conn.execute(DatabasePool.format_sql("SELECT COUNT(*) as c FROM projects WHERE status = ?"), ('进行中',)).fetchone()['c']
-        completed = conn.execute(DatabasePool.format_sql("SELECT COUNT(*) as c FROM projects WHERE status = ?"), ('已完成',)).fetchone()['c']
-        
-        today_str = datetime.now().strftime('%Y-%m-%d')
-        sql_delayed = DatabasePool.format_sql("SELECT COUNT(*) as c FROM projects WHERE plan_end_date < ? AND status NOT IN ('已完成', '已终止', '已验收', '质保期')")
-        delayed = conn.execute(sql_delayed, (today_str,)).fetchone()['c']
-        
-        on_departure = conn.execute(DatabasePool.format_sql("SELECT COUNT(*) as c FROM projects WHERE status IN ('暂停', '离场待返')")).fetchone()['c']
-        total_issues = conn.execute(DatabasePool.format_sql("SELECT COUNT(*) as c FROM issues WHERE status != ?"), ('已解决',)).fetchone()['c']
-        critical_issues = conn.execute(DatabasePool.format_sql("SELECT COUNT(*) as c FROM issues WHERE status != ? AND severity = ?"), ('已解决', '高')).fetchone()['c']
-        
-        week_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-        sql_task_comp = DatabasePool.format_sql("SELECT COUNT(*) as c FROM tasks WHERE is_completed = ? AND completed_date >= ?")
-        tasks_completed_this_week = conn.execute(sql_task_comp, (True, week_ago,)).fetchone()['c']
-        
-        # 统计逾期里程碑总数
-        sql_overdue_m = DatabasePool.format_sql('''
-            SELECT COUNT(*) as c FROM milestones 
-            WHERE is_completed = ? AND target_date < ?
-        ''')
-        overdue_milestones_total = conn.execute(sql_overdue_m, (False, today_str)).fetchone()['c']
-
-    
-        # 按状态分组统计
-        status_stats = conn.execute(DatabasePool.format_sql('''
-            SELECT status, COUNT(*) as count FROM projects GROUP BY status
-        ''')).fetchall()
-        
-        projects_progress = []
-        sql_proj_prog = DatabasePool.format_sql('''
-            SELECT p.id, p.project_name, p.hospital_name, p.progress, p.status, p.plan_end_date,
-            (SELECT COUNT(*) FROM milestones m_ov WHERE m_ov.project_id = p.id AND m_ov.is_completed = ? AND m_ov.target_date < ?) as overdue_count
-            FROM projects p WHERE p.status NOT IN ('已完成', '已终止', '已验收', '质保期') 
-            ORDER BY overdue_count DESC, progress DESC
-        ''')
-        rows = conn.execute(sql_proj_prog, (False, today_str)).fetchall()
-        
-        for row in rows:
-            p_dict = dict(row)
-            # 判定阶段
-            if p_dict['status'] in ['暂停', '离场待返']: p_dict['phase'] = '离场'
-            elif p_dict['plan_end_date'] and str(p_dict['plan_end_date']) < today_str: p_dict['phase'] = '延期'
-            elif p_dict['progress'] < 30: p_dict['phase'] = '启动期'
-            elif p_dict['progress'] < 70: p_dict['phase'] = '实施中'
-            else: p_dict['phase'] = '收尾期'
-            
-            projects_progress.append(p_dict)
-
-    
-        sql_notif = DatabasePool.format_sql('''
-            SELECT n.*, p.project_name 
-            FROM notifications n 
-            LEFT JOIN projects p ON n.project_id = p.id
-            WHERE n.is_read = ? AND (n.due_date IS NULL OR n.due_date >= ?)
-            ORDER BY n.due_date ASC LIMIT 10
-        ''')
-        upcoming_reminders = conn.execute(sql_notif, (False, today_str)).fetchall()
-        
-        # 本周工时统计
-        sql_hours = DatabasePool.format_sql('SELECT SUM(work_hours) as total FROM work_logs WHERE log_date >= ?')
-        week_hours = conn.execute(sql_hours, (week_ago,)).fetchone()['total'] or 0
-    
-    return api_response(True, {
-        'stats': {
-            'total_projects': total_projects, 'in_progress': in_progress,
-            'completed': completed, 'delayed': delayed, 'on_departure': on_departure,
-            'total_issues': total_issues, 'critical_issues': critical_issues,
-            'tasks_completed_this_week': tasks_completed_this_week,
-            'week_hours': round(week_hours, 1),
-            'overdue_milestones': overdue_milestones_total
-        },
-        'status_stats': [dict(s) for s in status_stats],
-        'projects_progress': [dict(p) for p in projects_progress],
-        'upcoming_reminders': [dict(r) for r in upcoming_reminders]
-    })
+# /api/dashboard/stats - Handled by analytics_bp
 
 
 # ========== Analytics and Performance - Handled by analytics_bp
@@ -2710,41 +2551,76 @@ def get_operation_logs():
         return jsonify([dict(l) for l in logs])
 
 # ========== 数据导出 API ==========
+def _run_project_export_task(task_id, project_id):
+    """后台导出项目数据包并上传存储，完成后通过任务中心与站内通知告知。"""
+    try:
+        result = project_export_service.export_to_storage(project_id)
+        update_task_status(task_id, "completed", result=json.dumps(result, ensure_ascii=False))
+        try:
+            monitor_service.create_notification({
+                'project_id': project_id,
+                'title': '项目数据导出完成',
+                'content': f"导出包 {result['filename']} 已生成，可在任务中心下载。",
+                'type': 'info',
+            })
+        except Exception as notify_err:
+            logging.warning("Export notification failed: %s", notify_err)
+    except Exception as e:
+        logging.error("Project export task failed: %s", e, exc_info=True)
+        update_task_status(task_id, "failed", error=str(e))
+
 @app.route('/api/projects/<int:project_id>/export', methods=['GET'])
 def export_project_data(project_id):
-    """导出项目完整数据为JSON"""
-    with DatabasePool.get_connection() as conn:
-        sql_p = DatabasePool.format_sql('SELECT * FROM projects WHERE id = ?')
-        project = dict(conn.execute(sql_p, (project_id,)).fetchone())
-        
-        sql_s = DatabasePool.format_sql('SELECT * FROM project_stages WHERE project_id = ?')
-        stages = [dict(s) for s in conn.execute(sql_s, (project_id,)).fetchall()]
-        
-        for stage in stages:
-            sql_t = DatabasePool.format_sql('SELECT * FROM tasks WHERE stage_id = ?')
-            stage['tasks'] = [dict(t) for t in conn.execute(sql_t, (stage['id'],)).fetchall()]
-        
-        data = {
-            'export_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'project': project,
-            'stages': stages,
-            'interfaces': [dict(i) for i in conn.execute(DatabasePool.format_sql('SELECT * FROM interfaces WHERE project_id = ?'), (project_id,)).fetchall()],
-            'issues': [dict(i) for i in conn.execute(DatabasePool.format_sql('SELECT * FROM issues WHERE project_id = ?'), (project_id,)).fetchall()],
-            'milestones': [dict(m) for m in conn.execute(DatabasePool.format_sql('SELECT * FROM milestones WHERE project_id = ?'), (project_id,)).fetchall()],
-            'members': [dict(m) for m in conn.execute(DatabasePool.format_sql('SELECT * FROM project_members WHERE project_id = ?'), (project_id,)).fetchall()],
-            'contacts': [dict(c) for c in conn.execute(DatabasePool.format_sql('SELECT * FROM customer_contacts WHERE project_id = ?'), (project_id,)).fetchall()],
-            'departures': [dict(d) for d in conn.execute(DatabasePool.format_sql('SELECT * FROM project_departures WHERE project_id = ?'), (project_id,)).fetchall()],
-            'work_logs': [dict(w) for w in conn.execute(DatabasePool.format_sql('SELECT * FROM work_logs WHERE project_id = ?'), (project_id,)).fetchall()],
-            'documents': [dict(d) for d in conn.execute(DatabasePool.format_sql('SELECT * FROM project_documents WHERE project_id = ?'), (project_id,)).fetchall()],
-            'expenses': [dict(e) for e in conn.execute(DatabasePool.format_sql('SELECT * FROM project_expenses WHERE project_id = ?'), (project_id,)).fetchall()],
-            'changes': [dict(c) for c in conn.execute(DatabasePool.format_sql('SELECT * FROM project_changes WHERE project_id = ?'), (project_id,)).fetchall()],
-            'acceptances': [dict(a) for a in conn.execute(DatabasePool.format_sql('SELECT * FROM project_acceptances WHERE project_id = ?'), (project_id,)).fetchall()],
-            'satisfaction': [dict(s) for s in conn.execute(DatabasePool.format_sql('SELECT * FROM customer_satisfaction WHERE project_id = ?'), (project_id,)).fetchall()],
-            'follow_ups': [dict(f) for f in conn.execute(DatabasePool.format_sql('SELECT * FROM follow_up_records WHERE project_id = ?'), (project_id,)).fetchall()],
-            'devices': [dict(d) for d in conn.execute(DatabasePool.format_sql('SELECT * FROM medical_devices WHERE project_id = ?'), (project_id,)).fetchall()]
-        }
-        
-    return jsonify(data)
+    """
+    导出项目完整数据
+    - format=zip (默认): 每张表一个 NDJSON 文件，流式打包
+    - format=ndjson: 单个 NDJSON 流
+    - format=json: 旧版整体 JSON 结构
+    - async=1: 后台生成并上传存储，任务中心可下载
+    """
+    project = project_export_service.project_exists(project_id)
+    if not project:
+        return api_response(False, message='项目不存在', code=404)
+
+    fmt = (request.args.get('format') or 'zip').strip().lower()
+    if request.args.get('async') in ('1', 'true'):
+        task_id = str(uuid.uuid4())
+        register_task(
+            task_id, 'project_export', f"项目数据导出 #{project_id} {project['project_name']}",
+            _run_project_export_task, project_id,
+            source_endpoint=f'/api/projects/{project_id}/export',
+        )
+        launch_registered_task(task_id)
+        return api_response(True, {"task_id": task_id, "status": "processing"})
+
+    if fmt == 'json':
+        return jsonify(project_export_service.build_json(project_id))
+
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    if fmt == 'ndjson':
+        response = app.response_class(project_export_service.iter_ndjson(project_id), mimetype='application/x-ndjson')
+        filename = f"project_{project_id}_{timestamp}.ndjson"
+    else:
+        response = app.response_class(project_export_service.iter_zip(project_id), mimetype='application/zip')
+        filename = f"project_{project_id}_{timestamp}.zip"
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@app.route('/api/projects/import', methods=['POST'])
+def import_project_data():
+    """从导出 ZIP 恢复 (mode=restore) 或克隆 (mode=clone) 项目。"""
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return api_response(False, message='请上传项目导出包', code=400)
+    mode = (request.form.get('mode') or 'clone').strip().lower()
+    try:
+        result = project_export_service.import_archive(file.stream, mode=mode)
+        return api_response(True, result, message='项目数据导入完成')
+    except (ValueError, zipfile.BadZipFile) as e:
+        return api_response(False, message=str(e), code=400)
+    except Exception as e:
+        logging.error("Project import failed: %s", e, exc_info=True)
+        return api_response(False, message=f'导入失败: {str(e)}', code=500)
 
 
 # ========== Global Analytics - Handled by analytics_bp
@@ -3465,14 +3341,7 @@ def download_kb_attachment(kid):
         try:
             # 检查是否是本地路径 (旧数据)
             if os.path.exists(item['attachment_path']):
-                 return send_file(item['attachment_path'], as_attachment=True, download_name=os.path.basename(item['attachment_path']))
-            
-            # 尝试从网盘下载
-            local_path = storage_service.download_file(item['attachment_path'])
-            
-            # 发送文件后删除临时文件? send_file 不会自动删除
-            # 可以使用 after_request 或者专门的 cleanup
-            # 这里简单起见，不立即删除，依靠系统定期清理 temp_downloads 或下次重启清理
+                 return send_file(item['attachment_path'], as_attachment=True, download_name=os.path.basename(item['attachment_path']), conditional=True)
             
             # 使用 KB 标题 + 原始扩展名 作为下载文件名
             params_name = os.path.basename(item['attachment_path']) # fallback
@@ -3488,8 +3357,13 @@ def download_kb_attachment(kid):
             except:
                 filename = params_name
             
-            # encode for header? flask send_file handles unicode usually, but safe_title helps
-            return send_file(local_path, as_attachment=True, download_name=filename)
+            # 知识库附件属于热点文件，走本地 LRU 磁盘缓存，支持 Range 断点续传
+            return storage_service.stream_response(
+                item['attachment_path'],
+                filename,
+                range_header=request.headers.get('Range'),
+                use_cache=True,
+            )
         except Exception as e:
             return jsonify({'error': f'下载失败: {str(e)}'}), 500
             
@@ -4348,7 +4222,6 @@ def bind_wecom_userid(user_id):
         return jsonify({'success': False, 'message': str(e)}), 500
 
 # ========== 存储配置 API (Baidu Netdisk) ==========
-from storage_service import storage_service
 
 @app.route('/api/admin/storage/auth-url', methods=['GET'])
 @require_auth('*')
@@ -4505,7 +4378,6 @@ def save_map_config():
 
 if __name__ == '__main__':
     with app.app_context():
-        from app_config import NOTIFICATION_CONFIG
         init_db()
         reload_notification_config(NOTIFICATION_CONFIG)
         warm_task_cache()
@@ -1,6 +1,7 @@
 # app_config.py
 
 import os
+import tempfile
 from urllib.parse import urlparse, unquote
 try:
     from dotenv import load_dotenv
@@ -88,6 +89,31 @@ DB_CONFIG = {
 }
 
 
+# ========== 进程启动配置 ==========
+STARTUP_CONFIG = {
+    # 重型依赖与服务单例在首次使用时才加载；gunicorn --preload 时可设为 false，在主进程一次性预热后 fork
+    "LAZY_IMPORTS": os.environ.get("LAZY_IMPORTS", "true").lower() == "true",
+    # 后台线程（报告调度、AI 健康检查）运行于哪个进程：auto=文件锁选举一个进程，true=每个进程，false=都不运行
+    "BACKGROUND_TASKS": os.environ.get("BACKGROUND_TASKS", "auto").lower(),
+    "BACKGROUND_LOCK_FILE": os.environ.get(
+        "BACKGROUND_LOCK_FILE", os.path.join(tempfile.gettempdir(), "icu_pm_background.lock")
+    ),
+}
+
+
+# ========== 通知推送（SSE）配置 ==========
+NOTIFICATION_STREAM_CONFIG = {
+    # SSE 由独立端口的 asyncio 服务承载，空闲连接不占 WSGI 线程；false 时前端只用长轮询
+    "ENABLED": os.environ.get("NOTIFICATION_STREAM_ENABLED", "true").lower() == "true",
+    "HOST": os.environ.get("NOTIFICATION_STREAM_HOST", "0.0.0.0"),
+    "PORT": int(os.environ.get("NOTIFICATION_STREAM_PORT", 5001)),
+    # 浏览器访问推送服务的地址；由反向代理把 /api/notifications/stream 同源转发到 PORT 时填 /api/notifications/stream，留空按当前主机名 + PORT 拼接
+    "PUBLIC_URL": os.environ.get("NOTIFICATION_STREAM_PUBLIC_URL", ""),
+    # 单进程并发 SSE 连接上限，需同时保证进程文件描述符上限（ulimit -n / LimitNOFILE）足够
+    "MAX_CONNECTIONS": int(os.environ.get("NOTIFICATION_STREAM_MAX_CONNECTIONS", 5000)),
+}
+
+
 # ========== 项目状态定义 ==========
 PROJECT_STATUS = {
     "待启动": {"next": ["进行中"], "color": "#9ca3af"},
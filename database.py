@@ -1,5 +1,7 @@
+import hashlib
 import sqlite3
 import threading
+import time
 from contextlib import contextmanager
 import os
 import re
@@ -330,37 +332,21 @@ class DatabasePool:
 
     @classmethod
     def table_exists(cls, conn, table_name, schema='public'):
-        if cls.is_postgres():
-            row = conn.execute(
-                """
-                SELECT 1
-                FROM information_schema.tables
-                WHERE table_schema = %s AND table_name = %s
-                """,
-                (schema, table_name),
-            ).fetchone()
-        else:
-            row = conn.execute(
-                "SELECT name FROM sqlite_master WHERE type='table' AND name=?",
-                (table_name,),
-            ).fetchone()
-        return row is not None
+        return schema_catalog.columns(conn, table_name, schema) is not None
 
     @classmethod
     def get_table_columns(cls, conn, table_name, schema='public'):
-        if cls.is_postgres():
-            rows = conn.execute(
-                """
-                SELECT column_name
-                FROM information_schema.columns
-                WHERE table_schema = %s AND table_name = %s
-                """,
-                (schema, table_name),
-            ).fetchall()
-            return {r['column_name'] for r in rows}
-
-        rows = conn.execute(f"PRAGMA table_info({table_name})").fetchall()
-        return {r['name'] if not isinstance(r, tuple) else r[1] for r in rows}
+        return set(schema_catalog.columns(conn, table_name, schema) or ())
+
+    @classmethod
+    def get_column_types(cls, conn, table_name, schema='public'):
+        """列名 → 小写类型名（PostgreSQL 为 format_type 结果，SQLite 为声明类型）"""
+        return dict(schema_catalog.columns(conn, table_name, schema) or {})
+
+    @classmethod
+    def refresh_schema_version(cls, conn):
+        """DDL 变更后调用：重新加载表结构目录，指纹变化时写入 schema_version 让其他进程失效"""
+        return schema_catalog.refresh_version(conn)
 
     @classmethod
     def get_inserted_id(cls, cursor):
@@ -370,6 +356,48 @@ class DatabasePool:
             return row[0] if row else None
         return cursor.lastrowid
 
+    @staticmethod
+    def _split_values_template(sql):
+        """把单行 INSERT ... VALUES (...) 拆成 execute_values 所需的 (VALUES %s 语句, 行模板)；不适用时返回 None"""
+        match = re.search(r'\bVALUES\s*\(', sql, re.IGNORECASE)
+        if not match or not sql.lstrip().upper().startswith('INSERT'):
+            return None
+        start = match.end() - 1
+        depth = 0
+        for pos in range(start, len(sql)):
+            if sql[pos] == '(':
+                depth += 1
+            elif sql[pos] == ')':
+                depth -= 1
+                if depth == 0:
+                    return sql[:match.start()] + 'VALUES %s' + sql[pos + 1:], sql[start:pos + 1]
+        return None
+
+    @classmethod
+    def executemany(cls, conn, sql, rows, page_size=500):
+        """批量写入（sql 为 ? 占位的 SQLite 风格）。
+        SQLite 直接 executemany；PostgreSQL 下 psycopg2 的 executemany 每行一次往返，
+        单行 INSERT 改用 execute_values 合并为多行 VALUES，其余语句用 execute_batch 分页发送。
+        注意：合并后的 INSERT ... ON CONFLICT DO UPDATE 同一批内不能有重复冲突键。"""
+        rows = list(rows)
+        if not rows:
+            return
+        sql = cls.format_sql(sql)
+        cursor = conn.cursor()
+        if not cls.is_postgres():
+            cursor.executemany(sql, rows)
+            return
+        from psycopg2.extras import execute_batch, execute_values
+
+        raw_cursor = getattr(cursor, '_cursor', cursor)
+        sql = re.sub(r'(?<!%)%(?!s|%)', '%%', sql)
+        split = cls._split_values_template(sql)
+        if split:
+            query, template = split
+            execute_values(raw_cursor, query, rows, template=template, page_size=page_size)
+        else:
+            execute_batch(raw_cursor, sql, rows, page_size=page_size)
+
     @classmethod
     def _init_pg_pool(cls):
         if cls._pg_pool is None and psycopg2 is not None:
@@ -492,6 +520,55 @@ class DatabasePool:
             finally:
                 cls._release_sqlite_connection()
 
+    @classmethod
+    @contextmanager
+    def get_readonly_connection(cls, timeout_seconds=5.0):
+        """
+        获取只读连接上下文管理器（用于执行不受信任的查询，如 AI 生成的 SQL）
+        - SQLite：每线程独立的 mode=ro 连接 + PRAGMA query_only，超时通过 progress handler 中断
+        - PostgreSQL：从连接池独占一条连接，READ ONLY 事务 + statement_timeout，结束后回滚
+        与 get_connection 的线程内共享连接相互隔离，不会影响外层事务。
+        """
+        db_type = DB_CONFIG.get('TYPE', 'sqlite')
+
+        if db_type == 'postgres':
+            cls._init_pg_pool()
+            if not cls._pg_pool_semaphore.acquire(timeout=max(float(cls._pg_pool_timeout_seconds or 15), 0.1)):
+                raise TimeoutError("Timed out waiting for a PostgreSQL connection")
+            conn = None
+            try:
+                conn = cls._pg_pool.getconn()
+                conn.cursor_factory = DictCursor
+                conn.rollback()
+                with conn.cursor() as cursor:
+                    cursor.execute('SET TRANSACTION READ ONLY')
+                    cursor.execute('SET LOCAL statement_timeout = %s', (int(timeout_seconds * 1000),))
+                yield conn
+            finally:
+                if conn is not None:
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        pass
+                    cls._pg_pool.putconn(conn)
+                cls._pg_pool_semaphore.release()
+        else:
+            conn = getattr(cls._local, 'ro_conn', None)
+            if conn is None:
+                uri = 'file:{}?mode=ro'.format(os.path.abspath(DATABASE_SQLITE).replace('?', '%3f').replace('#', '%23'))
+                conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+                conn.row_factory = sqlite3.Row
+                conn.execute('PRAGMA query_only = ON')
+                cls._local.ro_conn = conn
+
+            deadline = time.monotonic() + timeout_seconds
+            conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, 10000)
+            try:
+                yield conn
+            finally:
+                conn.set_progress_handler(None, 0)
+                conn.rollback()
+
     @classmethod
     def close_connection(cls, exception=None):
         """关闭当前线程的连接 (主要针对 SQLite)"""
@@ -501,6 +578,121 @@ class DatabasePool:
             cls._local.conn = None
             cls._local.conn_depth = 0
 
+class SchemaCatalog:
+    """
+    进程级表结构目录
+    - 一条查询加载全部表的列名与类型（PostgreSQL 走 pg_catalog，SQLite 走 pragma_table_info）
+    - system_config.schema_version 保存结构指纹；init_db / 迁移改动 DDL 后刷新指纹，
+      其他进程每 CHECK_INTERVAL_SECONDS 比对一次指纹，不一致时整体重载
+    - 目录中没有的表单独查询一次并补入（含不存在的表），不会反复查系统表
+    """
+
+    CHECK_INTERVAL_SECONDS = 30
+    VERSION_KEY = 'schema_version'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tables = None
+        self._version = None
+        self._checked_at = 0.0
+
+    @staticmethod
+    def _rows(conn, table_name=None, schema='public'):
+        if DatabasePool.is_postgres():
+            sql = """
+                SELECT n.nspname AS table_schema, c.relname AS table_name, a.attname AS column_name,
+                       format_type(a.atttypid, a.atttypmod) AS data_type
+                FROM pg_catalog.pg_attribute a
+                JOIN pg_catalog.pg_class c ON a.attrelid = c.oid
+                JOIN pg_catalog.pg_namespace n ON c.relnamespace = n.oid
+                WHERE c.relkind IN ('r', 'p', 'v', 'm') AND a.attnum > 0 AND NOT a.attisdropped
+                  AND n.nspname = %s
+            """
+            params = [schema]
+            if table_name is not None:
+                sql += " AND c.relname = %s"
+                params.append(table_name)
+            rows = conn.execute(sql + " ORDER BY c.relname, a.attnum", tuple(params)).fetchall()
+            return [(r[0], r[1], r[2], r[3]) for r in rows]
+
+        sql = """
+            SELECT m.name AS table_name, p.name AS column_name, p.type AS data_type
+            FROM sqlite_master m JOIN pragma_table_info(m.name) p
+            WHERE m.type IN ('table', 'view') AND m.name NOT LIKE 'sqlite_%'
+        """
+        params = ()
+        if table_name is not None:
+            sql += " AND m.name = ?"
+            params = (table_name,)
+        rows = conn.execute(sql + " ORDER BY m.name, p.cid", params).fetchall()
+        return [(schema, r[0], r[1], r[2]) for r in rows]
+
+    @staticmethod
+    def _group(rows):
+        tables = {}
+        for table_schema, table_name, column_name, data_type in rows:
+            tables.setdefault((table_schema, table_name), {})[column_name] = (data_type or '').lower()
+        return tables
+
+    @staticmethod
+    def _fingerprint(tables):
+        digest = hashlib.sha1()
+        for key in sorted(k for k, v in tables.items() if v is not None):
+            digest.update(repr((key, sorted(tables[key].items()))).encode('utf-8'))
+        return digest.hexdigest()[:16]
+
+    def _read_version(self, conn):
+        if not self._tables or not self._tables.get(('public', 'system_config')):
+            return None
+        row = conn.execute(DatabasePool.format_sql(
+            'SELECT value FROM system_config WHERE config_key = ?'
+        ), (self.VERSION_KEY,)).fetchone()
+        return row[0] if row else None
+
+    def _load(self, conn):
+        self._tables = self._group(self._rows(conn))
+        self._version = self._read_version(conn)
+        self._checked_at = time.monotonic()
+
+    def _ensure(self, conn):
+        if self._tables is None:
+            self._load(conn)
+        elif time.monotonic() - self._checked_at > self.CHECK_INTERVAL_SECONDS:
+            self._checked_at = time.monotonic()
+            if self._read_version(conn) != self._version:
+                self._load(conn)
+
+    def columns(self, conn, table_name, schema='public'):
+        """返回 {列名: 类型}；表不存在返回 None"""
+        with self._lock:
+            self._ensure(conn)
+            key = (schema, table_name)
+            if key not in self._tables:
+                self._tables[key] = self._group(self._rows(conn, table_name, schema)).get(key)
+            return self._tables[key]
+
+    def invalidate(self):
+        with self._lock:
+            self._tables = None
+            self._version = None
+
+    def refresh_version(self, conn):
+        with self._lock:
+            self._tables = self._group(self._rows(conn))
+            fingerprint = self._fingerprint(self._tables)
+            if self._tables.get(('public', 'system_config')) and self._read_version(conn) != fingerprint:
+                conn.execute(DatabasePool.format_sql('''
+                    INSERT INTO system_config (config_key, value) VALUES (?, ?)
+                    ON CONFLICT (config_key) DO UPDATE SET value = EXCLUDED.value
+                '''), (self.VERSION_KEY, fingerprint))
+            self._version = fingerprint
+            self._checked_at = time.monotonic()
+            return fingerprint
+
+
+schema_catalog = SchemaCatalog()
+
+
 def get_db():
     """保留函数名兼容旧代码"""
     db_type = DB_CONFIG.get('TYPE', 'sqlite')
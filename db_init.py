@@ -28,9 +28,47 @@ def reload_notification_config(NOTIFICATION_CONFIG):
         print(f"Error loading notification config: {e}")
 
 def init_db():
-    """初始化数据库并进行必要的升级"""
+    """初始化/升级数据库：执行尚未应用的迁移步骤（已是最新时仅一次查询，见 migrations.py）"""
+    from migrations import migrate
+    return migrate()
+
+
+def _db_type():
     from app_config import DB_CONFIG
-    db_type = DB_CONFIG.get('TYPE', 'sqlite')
+    return DB_CONFIG.get('TYPE', 'sqlite')
+
+
+def _safe_executor(cursor, db_type):
+    """返回安全执行 DDL 的函数：失败不影响后续 SQL（PostgreSQL 中 ALTER 失败会中止整个事务，使用 SAVEPOINT 隔离）"""
+    sp_counter = [0]
+
+    def _safe_alter(sql_pg, sql_lite=None):
+        """安全执行 ALTER TABLE，失败不影响后续 SQL"""
+        sp_counter[0] += 1
+        sp_name = f"sp_alter_{sp_counter[0]}"
+        try:
+            if db_type == 'postgres':
+                cursor.execute(f"SAVEPOINT {sp_name}")
+                try:
+                    cursor.execute(sql_pg)
+                    cursor.execute(f"RELEASE SAVEPOINT {sp_name}")
+                except Exception:
+                    cursor.execute(f"ROLLBACK TO SAVEPOINT {sp_name}")
+            else:
+                cursor.execute(sql_lite or sql_pg)
+        except Exception:
+            pass
+
+    return _safe_alter
+
+
+def apply_baseline_schema():
+    """基线结构：建表、补列、数据修正与默认管理员（全部幂等，可重复执行）
+
+    已冻结：对本函数的任何修改都会改变基线迁移的校验和，导致每个环境重新执行全部基线 DDL。
+    新的结构变更请在 migrations.MIGRATIONS 末尾追加 repeatable=False 的步骤。
+    """
+    db_type = _db_type()
     with DatabasePool.get_connection() as conn:
         cursor = conn.cursor()
     
@@ -40,24 +78,7 @@ def init_db():
         BOOL_TYPE = "BOOLEAN" if db_type == 'postgres' else "BOOLEAN"
         TIMESTAMP_TYPE = "TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP" if db_type == 'postgres' else "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
 
-        # PostgreSQL 中 ALTER TABLE 失败会中止整个事务，使用 SAVEPOINT 隔离
-        _sp_counter = [0]
-        def _safe_alter(sql_pg, sql_lite=None):
-            """安全执行 ALTER TABLE，失败不影响后续 SQL"""
-            _sp_counter[0] += 1
-            sp_name = f"sp_alter_{_sp_counter[0]}"
-            try:
-                if db_type == 'postgres':
-                    cursor.execute(f"SAVEPOINT {sp_name}")
-                    try:
-                        cursor.execute(sql_pg)
-                        cursor.execute(f"RELEASE SAVEPOINT {sp_name}")
-                    except Exception:
-                        cursor.execute(f"ROLLBACK TO SAVEPOINT {sp_name}")
-                else:
-                    cursor.execute(sql_lite or sql_pg)
-            except Exception:
-                pass
+        _safe_alter = _safe_executor(cursor, db_type)
         
         # 0. 系统配置表
         cursor.execute(f'''
@@ -280,6 +301,23 @@ def init_db():
                 FOREIGN KEY (issue_id) REFERENCES issues(id)
             )
         ''')
+
+        # 5.1 问题 MinHash 签名与聚类归属（写入问题时增量维护，供跨项目问题模式聚类）
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS issue_signatures (
+                issue_id INTEGER PRIMARY KEY,
+                text_hash TEXT NOT NULL,
+                signature TEXT,
+                cluster_id INTEGER,
+                updated_at {TIMESTAMP_TYPE}
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS issue_lsh_buckets (
+                band_key TEXT NOT NULL,
+                issue_id INTEGER NOT NULL
+            )
+        ''')
         
         # 6. 消息提醒表
         cursor.execute(f'''
@@ -301,6 +339,26 @@ def init_db():
         ''')
         _safe_alter("ALTER TABLE notifications ADD COLUMN IF NOT EXISTS target_user_id INTEGER", "ALTER TABLE notifications ADD COLUMN target_user_id INTEGER")
 
+        # 通知外发队列（企微/邮件），由 NotificationDispatcher 按渠道限流、合并、退避重试
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS notification_outbox (
+                id {PK_AUTO},
+                channel TEXT NOT NULL,
+                dedupe_key TEXT NOT NULL,
+                title TEXT,
+                content TEXT,
+                payload TEXT,
+                status TEXT DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                coalesced_count INTEGER DEFAULT 0,
+                next_attempt_at TEXT,
+                last_error TEXT,
+                enqueued_at {REAL_TYPE},
+                sent_at TEXT,
+                created_at {TIMESTAMP_TYPE}
+            )
+        ''')
+
     
         # 7. 医疗设备主表
         cursor.execute(f'''
@@ -906,7 +964,20 @@ def init_db():
                 UNIQUE(task_id, depends_on_task_id)
             )
         ''')
-    
+
+        # 28.5 项目工作日历（排程引擎：周末、节假日、调休上班日、人员并行容量）
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS project_calendars (
+                project_id INTEGER PRIMARY KEY,
+                weekend_days TEXT DEFAULT '5,6',
+                holidays TEXT,
+                extra_workdays TEXT,
+                default_capacity INTEGER DEFAULT 1,
+                updated_at {TIMESTAMP_TYPE},
+                FOREIGN KEY (project_id) REFERENCES projects(id)
+            )
+        ''')
+
         # 29. 进度快照表
         cursor.execute(f'''
             CREATE TABLE IF NOT EXISTS progress_snapshots (
@@ -921,7 +992,70 @@ def init_db():
                 FOREIGN KEY (project_id) REFERENCES projects(id)
             )
         ''')
+        # 快照热指标落到定长列，趋势查询不再解析 snapshot_data JSON
+        for col_name, col_def in (
+            ('project_status', 'TEXT'),
+            ('tasks_total', 'INTEGER'),
+            ('tasks_completed', 'INTEGER'),
+            ('issues_total', 'INTEGER'),
+            ('issues_open', 'INTEGER'),
+            ('interfaces_total', 'INTEGER'),
+            ('interfaces_completed', 'INTEGER'),
+        ):
+            _safe_alter(
+                f"ALTER TABLE progress_snapshots ADD COLUMN IF NOT EXISTS {col_name} {col_def}",
+                f"ALTER TABLE progress_snapshots ADD COLUMN {col_name} {col_def}"
+            )
+        # 批量 upsert 依赖 (project_id, snapshot_date) 唯一；先清理历史重复行
+        _safe_alter('''
+            DELETE FROM progress_snapshots WHERE id NOT IN (
+                SELECT MAX(id) FROM progress_snapshots GROUP BY project_id, snapshot_date
+            )
+        ''')
+        _safe_alter("CREATE UNIQUE INDEX IF NOT EXISTS uq_progress_snapshots_project_date ON progress_snapshots(project_id, snapshot_date)")
+
+        # 29.4 快照阶段明细（每个快照日每阶段一行）
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS progress_snapshot_stages (
+                id {PK_AUTO},
+                project_id INTEGER NOT NULL,
+                snapshot_date DATE NOT NULL,
+                stage_id INTEGER,
+                stage_name TEXT,
+                stage_order INTEGER,
+                progress INTEGER DEFAULT 0,
+                status TEXT,
+                FOREIGN KEY (project_id) REFERENCES projects(id)
+            )
+        ''')
     
+        # 29.4.1 项目数据版本号（由触发器在项目及其子表写入时递增，供项目详情缓存判断失效）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS project_data_versions (
+                project_id INTEGER PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+
+        # 29.4.2 项目特征向量（float32，data_version 落后于 project_data_versions 时重算，供相似项目检索）
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS project_feature_vectors (
+                project_id INTEGER PRIMARY KEY,
+                data_version INTEGER NOT NULL DEFAULT 0,
+                feature_schema TEXT,
+                vector {'BYTEA' if db_type == 'postgres' else 'BLOB'},
+                updated_at {TIMESTAMP_TYPE}
+            )
+        ''')
+
+        # 29.4.3 接口数据版本号（接口规范/对照/字段映射写入时递增，project_id = 0 表示标准接口库）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS interface_data_versions (
+                project_id INTEGER PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+
         # 29.5 地图地理编码缓存表
         cursor.execute(f'''
             CREATE TABLE IF NOT EXISTS geo_cache (
@@ -1307,7 +1441,35 @@ def init_db():
                     FOREIGN KEY (result_id) REFERENCES alignment_results(id)
                 )
             ''')
-    
+
+        # 35.1 对齐引擎写入的列（分块持久化与会话进度）
+        alignment_columns = {
+            'alignment_sessions': [
+                ('vendor_name', 'TEXT'), ('vendor_doc_path', 'TEXT'), ('vendor_doc_text', 'TEXT'),
+                ('created_by', 'TEXT'), ('total_spec_interfaces', 'INTEGER DEFAULT 0'),
+                ('matched_count', 'INTEGER DEFAULT 0'), ('partial_count', 'INTEGER DEFAULT 0'),
+                ('missing_count', 'INTEGER DEFAULT 0'), ('extra_count', 'INTEGER DEFAULT 0'),
+                ('match_score', f'{REAL_TYPE} DEFAULT 0'), ('ai_summary', 'TEXT'), ('completed_at', 'TIMESTAMP'),
+                ('progress_total', 'INTEGER DEFAULT 0'), ('progress_done', 'INTEGER DEFAULT 0'),
+            ],
+            'alignment_results': [
+                ('spec_interface_id', 'INTEGER'), ('match_status', 'TEXT'), ('confidence', f'{REAL_TYPE} DEFAULT 0'),
+                ('vendor_interface_name', 'TEXT'), ('vendor_view_name', 'TEXT'), ('vendor_protocol', 'TEXT'),
+                ('vendor_description', 'TEXT'), ('diff_summary', 'TEXT'), ('risk_note', 'TEXT'),
+                ('match_source', 'TEXT'), ('is_confirmed', 'INTEGER DEFAULT 0'), ('manual_note', 'TEXT'),
+            ],
+            'alignment_field_maps': [
+                ('spec_field_id', 'INTEGER'), ('vendor_field_type', 'TEXT'),
+                ('map_status', 'TEXT'), ('transform_rule', 'TEXT'),
+            ],
+        }
+        for table_name, columns in alignment_columns.items():
+            for col_name, col_def in columns:
+                _safe_alter(
+                    f'ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {col_name} {col_def}',
+                    f'ALTER TABLE {table_name} ADD COLUMN {col_name} {col_def}'
+                )
+
         # 36. 接口对照结果
         cursor.execute(f'''
             CREATE TABLE IF NOT EXISTS interface_comparisons (
@@ -1416,53 +1578,9 @@ def init_db():
                             )
 
         migrate_add_form_making_stage(cursor)
+        migrate_snapshot_metric_columns(cursor)
         conn.commit()
 
-        # Indexes
-        indexes = [
-            ("idx_tasks_stage_id", "tasks", "stage_id"),
-            ("idx_project_stages_project_id", "project_stages", "project_id"),
-            ("idx_milestones_project_id", "milestones", "project_id"),
-            ("idx_interfaces_project_id", "interfaces", "project_id"),
-            ("idx_issues_project_id", "issues", "project_id"),
-            ("idx_medical_devices_project_id", "medical_devices", "project_id"),
-            ("idx_notifications_project_id", "notifications", "project_id"),
-            ("idx_documents_project_id", "project_documents", "project_id"),
-            ("idx_project_members_project_id", "project_members", "project_id"),
-            ("idx_worklogs_project_id", "work_logs", "project_id"),
-            ("idx_task_deps_task_id", "task_dependencies", "task_id"),
-            ("idx_task_deps_depends_on", "task_dependencies", "depends_on_task_id"),
-            ("idx_snapshots_project_id", "progress_snapshots", "project_id"),
-            ("idx_standup_project_id", "standup_minutes", "project_id"),
-            ("idx_business_metrics_project_id", "business_monthly_metrics", "project_id"),
-            ("idx_business_metrics_month", "business_monthly_metrics", "metric_month"),
-            ("idx_kb_items_project_id", "kb_items", "project_id"),
-            ("idx_kb_items_category", "kb_items", "category"),
-            ("idx_interface_specs_project", "interface_specs", "project_id"),
-            ("idx_interface_specs_source", "interface_specs", "spec_source"),
-            ("idx_spec_fields_spec", "interface_spec_fields", "spec_id"),
-            ("idx_alignment_sessions_project", "alignment_sessions", "project_id"),
-            ("idx_alignment_results_session", "alignment_results", "session_id"),
-            ("idx_alignment_field_maps_result", "alignment_field_maps", "result_id"),
-            ("idx_comparisons_project", "interface_comparisons", "project_id"),
-            ("idx_field_mappings_comp", "field_mappings", "comparison_id"),
-            ("idx_issues_owner_member", "issues", "owner_member_id"),
-            ("idx_perf_cycles_start_date", "performance_review_cycles", "start_date"),
-            ("idx_perf_targets_cycle", "performance_review_targets", "cycle_id"),
-            ("idx_perf_targets_project", "performance_review_targets", "project_id"),
-            ("idx_perf_forms_cycle", "performance_review_forms", "cycle_id"),
-            ("idx_perf_forms_target", "performance_review_forms", "target_id"),
-            ("idx_perf_recognition_target", "performance_recognition", "target_id"),
-            ("idx_perf_cards_cycle", "performance_score_cards", "cycle_id"),
-            ("idx_perf_cards_target", "performance_score_cards", "target_id"),
-            ("idx_perf_adjustments_scorecard", "performance_adjustments", "scorecard_id"),
-            ("idx_perf_appeals_scorecard", "performance_appeals", "scorecard_id"),
-            ("idx_perf_appeals_cycle", "performance_appeals", "cycle_id"),
-            ("idx_issue_push_receipts_issue", "issue_push_receipts", "issue_id"),
-        ]
-        for idx_name, table_name, column_name in indexes:
-            _safe_alter(f"CREATE INDEX IF NOT EXISTS {idx_name} ON {table_name}({column_name})")
-
         try:
             if db_type == 'postgres':
                 cursor.execute("SAVEPOINT sp_seed_users")
@@ -1484,8 +1602,196 @@ def init_db():
         except Exception:
             if db_type == 'postgres':
                 cursor.execute("ROLLBACK TO SAVEPOINT sp_seed_users")
+
+        conn.commit()
+
+
+# 常用查询索引：(索引名, 表, 列)
+SCHEMA_INDEXES = [
+    ("idx_tasks_stage_id", "tasks", "stage_id"),
+    ("idx_project_stages_project_id", "project_stages", "project_id"),
+    ("idx_milestones_project_id", "milestones", "project_id"),
+    ("idx_interfaces_project_id", "interfaces", "project_id"),
+    ("idx_issues_project_id", "issues", "project_id"),
+    ("idx_medical_devices_project_id", "medical_devices", "project_id"),
+    ("idx_notifications_project_id", "notifications", "project_id"),
+    ("idx_documents_project_id", "project_documents", "project_id"),
+    ("idx_project_members_project_id", "project_members", "project_id"),
+    ("idx_worklogs_project_id", "work_logs", "project_id"),
+    ("idx_task_deps_task_id", "task_dependencies", "task_id"),
+    ("idx_task_deps_depends_on", "task_dependencies", "depends_on_task_id"),
+    ("idx_snapshots_project_id", "progress_snapshots", "project_id"),
+    ("idx_outbox_status_next", "notification_outbox", "status, next_attempt_at"),
+    ("idx_outbox_dedupe", "notification_outbox", "dedupe_key"),
+    ("idx_snapshot_stages_project_date", "progress_snapshot_stages", "project_id, snapshot_date"),
+    ("idx_standup_project_id", "standup_minutes", "project_id"),
+    ("idx_business_metrics_project_id", "business_monthly_metrics", "project_id"),
+    ("idx_business_metrics_month", "business_monthly_metrics", "metric_month"),
+    ("idx_kb_items_project_id", "kb_items", "project_id"),
+    ("idx_kb_items_category", "kb_items", "category"),
+    ("idx_interface_specs_project", "interface_specs", "project_id"),
+    ("idx_interface_specs_source", "interface_specs", "spec_source"),
+    ("idx_spec_fields_spec", "interface_spec_fields", "spec_id"),
+    ("idx_alignment_sessions_project", "alignment_sessions", "project_id"),
+    ("idx_alignment_results_session", "alignment_results", "session_id"),
+    ("idx_alignment_field_maps_result", "alignment_field_maps", "result_id"),
+    ("idx_comparisons_project", "interface_comparisons", "project_id"),
+    ("idx_field_mappings_comp", "field_mappings", "comparison_id"),
+    ("idx_issues_owner_member", "issues", "owner_member_id"),
+    ("idx_perf_cycles_start_date", "performance_review_cycles", "start_date"),
+    ("idx_perf_targets_cycle", "performance_review_targets", "cycle_id"),
+    ("idx_perf_targets_project", "performance_review_targets", "project_id"),
+    ("idx_perf_forms_cycle", "performance_review_forms", "cycle_id"),
+    ("idx_perf_forms_target", "performance_review_forms", "target_id"),
+    ("idx_perf_recognition_target", "performance_recognition", "target_id"),
+    ("idx_perf_cards_cycle", "performance_score_cards", "cycle_id"),
+    ("idx_perf_cards_target", "performance_score_cards", "target_id"),
+    ("idx_perf_adjustments_scorecard", "performance_adjustments", "scorecard_id"),
+    ("idx_perf_appeals_scorecard", "performance_appeals", "scorecard_id"),
+    ("idx_perf_appeals_cycle", "performance_appeals", "cycle_id"),
+    ("idx_issue_push_receipts_issue", "issue_push_receipts", "issue_id"),
+    ("idx_issue_signatures_cluster", "issue_signatures", "cluster_id"),
+    ("idx_issue_lsh_buckets_key", "issue_lsh_buckets", "band_key"),
+    ("idx_issue_lsh_buckets_issue", "issue_lsh_buckets", "issue_id"),
+]
+
+
+def apply_schema_indexes():
+    """创建 SCHEMA_INDEXES 中的索引（已存在则跳过）"""
+    with DatabasePool.get_connection() as conn:
+        cursor = conn.cursor()
+        _safe_alter = _safe_executor(cursor, _db_type())
+        for idx_name, table_name, column_name in SCHEMA_INDEXES:
+            _safe_alter(f"CREATE INDEX IF NOT EXISTS {idx_name} ON {table_name}({column_name})")
         conn.commit()
 
+
+def apply_data_version_triggers():
+    """安装项目/接口数据版本号触发器（供详情缓存、对话上下文、特征向量判断失效）"""
+    db_type = _db_type()
+    with DatabasePool.get_connection() as conn:
+        cursor = conn.cursor()
+        _safe_alter = _safe_executor(cursor, db_type)
+        for trigger_sql in data_version_trigger_sql(db_type):
+            _safe_alter(trigger_sql)
+        conn.commit()
+
+
+def create_wecom_callback_dedup_table():
+    """企业微信回调去重表：各 worker 共用，以 dedup_key 主键冲突判断重试，seen_at 为 Unix 时间戳，按 TTL 清理"""
+    real_type = 'DOUBLE PRECISION' if _db_type() == 'postgres' else 'REAL'
+    with DatabasePool.get_connection() as conn:
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS wecom_callback_dedup (
+                dedup_key TEXT PRIMARY KEY,
+                seen_at {real_type} NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_wecom_callback_dedup_seen_at ON wecom_callback_dedup (seen_at)')
+        conn.commit()
+
+
+# 写入后需要让项目详情缓存失效的表，及其定位 project_id 的方式
+PROJECT_VERSION_SOURCES = [
+    ('projects', 'self'),
+    ('project_stages', 'project'),
+    ('tasks', 'stage'),
+    ('task_dependencies', 'task'),
+    ('milestones', 'project'),
+    ('interfaces', 'project'),
+    ('issues', 'project'),
+    ('project_members', 'project'),
+    ('customer_contacts', 'project'),
+    ('project_departures', 'project'),
+    ('medical_devices', 'project'),
+]
+
+# 写入后需要让接口对话上下文缓存失效的表；标准接口库（project_id 为空）记在 project_id = 0 上
+INTERFACE_VERSION_SOURCES = [
+    ('interface_specs', 'spec'),
+    ('interface_spec_fields', 'spec_field'),
+    ('interface_comparisons', 'project'),
+    ('field_mappings', 'comparison'),
+]
+
+# 各定位方式对应的 project_id 表达式，{row} 为触发器中的行变量
+VERSION_PROJECT_EXPRESSIONS = {
+    'self': '{row}.id',
+    'project': '{row}.project_id',
+    'stage': '(SELECT project_id FROM project_stages WHERE id = {row}.stage_id)',
+    'task': '(SELECT s.project_id FROM tasks t JOIN project_stages s ON t.stage_id = s.id WHERE t.id = {row}.task_id)',
+    'spec': 'COALESCE({row}.project_id, 0)',
+    'spec_field': '(SELECT COALESCE(project_id, 0) FROM interface_specs WHERE id = {row}.spec_id)',
+    'comparison': '(SELECT project_id FROM interface_comparisons WHERE id = {row}.comparison_id)',
+}
+
+
+def _data_version_trigger_sql(db_type, version_table, function_name, trigger_prefix, sources):
+    """生成在 sources 各表写入时递增 version_table 中对应项目版本号的触发器语句"""
+    if db_type == 'postgres':
+        kinds = list(dict.fromkeys(kind for _, kind in sources))
+        branches = '\n                ELS'.join(
+            f"IF TG_ARGV[0] = '{kind}' THEN\n                    pid := {VERSION_PROJECT_EXPRESSIONS[kind].format(row='rec')};"
+            for kind in kinds
+        )
+        statements = [f'''
+            CREATE OR REPLACE FUNCTION {function_name}() RETURNS trigger AS $$
+            DECLARE
+                rec RECORD;
+                pid INTEGER;
+            BEGIN
+                IF TG_OP = 'DELETE' THEN rec := OLD; ELSE rec := NEW; END IF;
+                {branches}
+                END IF;
+                IF pid IS NOT NULL THEN
+                    INSERT INTO {version_table} (project_id, version) VALUES (pid, 1)
+                    ON CONFLICT (project_id) DO UPDATE SET version = {version_table}.version + 1;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''']
+        for table, kind in sources:
+            statements.append(f"DROP TRIGGER IF EXISTS {trigger_prefix}_{table} ON {table}")
+            statements.append(
+                f"CREATE TRIGGER {trigger_prefix}_{table} AFTER INSERT OR UPDATE OR DELETE ON {table} "
+                f"FOR EACH ROW EXECUTE PROCEDURE {function_name}('{kind}')"
+            )
+        return statements
+
+    statements = []
+    for table, kind in sources:
+        for op, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            pid_expr = VERSION_PROJECT_EXPRESSIONS[kind].format(row=row)
+            statements.append(f'''
+                CREATE TRIGGER IF NOT EXISTS {trigger_prefix}_{table}_{op.lower()} AFTER {op} ON {table}
+                BEGIN
+                    INSERT INTO {version_table} (project_id, version)
+                    SELECT pid, 1 FROM (SELECT {pid_expr} AS pid) WHERE pid IS NOT NULL
+                    ON CONFLICT (project_id) DO UPDATE SET version = version + 1;
+                END
+            ''')
+    return statements
+
+
+def project_data_version_trigger_sql(db_type):
+    """生成维护 project_data_versions 的触发器语句（跨进程、覆盖所有写入路径）"""
+    return _data_version_trigger_sql(
+        db_type, 'project_data_versions', 'bump_project_data_version', 'trg_pdv', PROJECT_VERSION_SOURCES
+    )
+
+
+def interface_data_version_trigger_sql(db_type):
+    """生成维护 interface_data_versions 的触发器语句（接口规范、对照、字段映射写入时递增）"""
+    return _data_version_trigger_sql(
+        db_type, 'interface_data_versions', 'bump_interface_data_version', 'trg_idv', INTERFACE_VERSION_SOURCES
+    )
+
+
+def data_version_trigger_sql(db_type):
+    return project_data_version_trigger_sql(db_type) + interface_data_version_trigger_sql(db_type)
+
+
 def migrate_add_form_making_stage(cursor):
     """为现有项目添加‘表单制作’阶段"""
     projects = cursor.execute(DatabasePool.format_sql('''
@@ -1520,6 +1826,47 @@ def migrate_add_form_making_stage(cursor):
             for t in tasks:
                 cursor.execute(DatabasePool.format_sql('INSERT INTO tasks (stage_id, task_name) VALUES (?, ?)'), (stage_id, t))
 
+def migrate_snapshot_metric_columns(cursor):
+    """把旧快照 JSON 中的热指标回填到定长列与阶段明细表（只处理尚未回填的行）"""
+    rows = cursor.execute(DatabasePool.format_sql('''
+        SELECT id, project_id, snapshot_date, snapshot_data FROM progress_snapshots
+        WHERE tasks_total IS NULL AND snapshot_data IS NOT NULL
+    ''')).fetchall()
+    metric_rows = []
+    stage_rows = []
+    for row in rows:
+        row = dict(row) if not isinstance(row, (list, tuple)) else dict(zip(('id', 'project_id', 'snapshot_date', 'snapshot_data'), row))
+        try:
+            data = json.loads(row['snapshot_data'] or '{}')
+        except (TypeError, ValueError):
+            data = {}
+        tasks = data.get('tasks') or {}
+        issues = data.get('issues') or {}
+        interfaces = data.get('interfaces') or {}
+        metric_rows.append((
+            data.get('status'), tasks.get('total') or 0, tasks.get('completed') or 0,
+            issues.get('total') or 0, issues.get('open') or 0,
+            interfaces.get('total') or 0, interfaces.get('completed') or 0, row['id'],
+        ))
+        for stage in data.get('stages') or []:
+            stage_rows.append((
+                row['project_id'], row['snapshot_date'], None, stage.get('stage_name'),
+                stage.get('stage_order'), stage.get('progress') or 0, stage.get('status'),
+            ))
+    if metric_rows:
+        cursor.executemany(DatabasePool.format_sql('''
+            UPDATE progress_snapshots
+            SET project_status = ?, tasks_total = ?, tasks_completed = ?, issues_total = ?,
+                issues_open = ?, interfaces_total = ?, interfaces_completed = ?
+            WHERE id = ?
+        '''), metric_rows)
+    if stage_rows:
+        cursor.executemany(DatabasePool.format_sql('''
+            INSERT INTO progress_snapshot_stages
+            (project_id, snapshot_date, stage_id, stage_name, stage_order, progress, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        '''), stage_rows)
+
 def migrate_to_dynamic_milestones():
     """将现有项目的静态里程碑迁移为基于阶段的动态里程碑"""
     from services.project_service import ProjectService
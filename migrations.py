@@ -0,0 +1,222 @@
+"""
+数据库结构迁移
+- schema_migrations 记录已应用的迁移步骤（编号、名称、校验和、耗时），启动时一次查询即可判断是否需要迁移，
+  已是最新时不再执行任何 DDL，也不会对业务热表加锁
+- 步骤按编号顺序执行，每步独立提交；校验和取自步骤函数源码或其生成的 SQL；
+  仅部署 .pyc / zip 包取不到源码时无法判断改动，已应用的步骤视为最新
+- repeatable 步骤仅限由原 init_db 拆出的基线（编号不超过 BASELINE_VERSION，全部幂等），校验和变化时整步重新执行；
+  修改基线会让所有环境重跑全部基线 DDL，因此基线已冻结，新的结构变更必须追加到 MIGRATIONS 末尾且 repeatable=False
+- 执行期间持有迁移锁：PostgreSQL 使用 pg_advisory_lock，SQLite 使用数据库文件旁的 fcntl 文件锁，
+  多个 worker 同时启动时只有一个进程执行迁移，其余等锁后复核发现已是最新直接返回
+
+命令行：
+    python migrations.py status   查看已应用步骤
+    python migrations.py plan     列出待执行步骤（不修改数据库）
+    python migrations.py apply    执行待执行步骤
+"""
+
+import hashlib
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import db_init
+from database import DatabasePool, DATABASE_SQLITE
+
+logger = logging.getLogger(__name__)
+
+ADVISORY_LOCK_KEY = 7_349_001  # pg_advisory_lock 全局键，仅用于结构迁移
+BASELINE_VERSION = 3  # 可重复执行的基线步骤的最大编号
+UNKNOWN_CHECKSUM = 'source-unavailable'
+_process_lock = threading.Lock()
+
+Migration = namedtuple('Migration', 'version name apply checksum_source repeatable')
+
+
+def _source_of(*funcs):
+    def source():
+        try:
+            return '\n'.join(inspect.getsource(f) for f in funcs)
+        except (OSError, TypeError):
+            # 仅部署 .pyc / zip 包时取不到源码
+            return None
+    return source
+
+
+def _index_source():
+    return repr(db_init.SCHEMA_INDEXES)
+
+
+def _trigger_source():
+    return '\n'.join(db_init.data_version_trigger_sql(db_init._db_type()))
+
+
+MIGRATIONS = [
+    Migration(1, 'baseline_schema', db_init.apply_baseline_schema, _source_of(
+        db_init.apply_baseline_schema, db_init.migrate_add_form_making_stage, db_init.migrate_snapshot_metric_columns,
+    ), True),
+    Migration(2, 'baseline_indexes', db_init.apply_schema_indexes, _index_source, True),
+    Migration(3, 'data_version_triggers', db_init.apply_data_version_triggers, _trigger_source, True),
+    Migration(4, 'wecom_callback_dedup', db_init.create_wecom_callback_dedup_table,
+              _source_of(db_init.create_wecom_callback_dedup_table), False),
+]
+
+
+def checksum(migration):
+    """步骤校验和；取不到校验来源时返回 None"""
+    source = migration.checksum_source()
+    if source is None:
+        return None
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+
+def _ensure_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            checksum TEXT NOT NULL,
+            duration_ms INTEGER,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+
+def applied_migrations(conn):
+    """返回 {version: row}；迁移表尚不存在时返回空字典"""
+    try:
+        rows = conn.execute(
+            'SELECT version, name, checksum, duration_ms, applied_at FROM schema_migrations ORDER BY version'
+        ).fetchall()
+    except Exception:
+        conn.rollback()
+        return {}
+    return {row['version']: dict(row) for row in rows}
+
+
+def pending_migrations(conn):
+    """返回 [(migration, checksum, reason)]，reason 为 new / changed"""
+    for migration in MIGRATIONS:
+        if migration.repeatable and migration.version > BASELINE_VERSION:
+            raise ValueError(
+                f"迁移 {migration.version}_{migration.name} 不能是 repeatable：新的结构变更应为一次性步骤"
+            )
+    applied = applied_migrations(conn)
+    pending = []
+    for migration in MIGRATIONS:
+        digest = checksum(migration)
+        row = applied.get(migration.version)
+        if row is None:
+            pending.append((migration, digest or UNKNOWN_CHECKSUM, 'new'))
+        elif digest is None:
+            logger.debug("迁移 %s_%s 取不到源码，按已应用处理", migration.version, migration.name)
+        elif row['checksum'] != digest:
+            if migration.repeatable:
+                pending.append((migration, digest, 'changed'))
+            else:
+                logger.warning("迁移 %s_%s 已应用但源码已修改，一次性步骤不会重复执行", migration.version, migration.name)
+    return pending
+
+
+@contextmanager
+def migration_lock(conn):
+    """跨进程迁移锁"""
+    with _process_lock:
+        if DatabasePool.is_postgres():
+            conn.execute(DatabasePool.format_sql('SELECT pg_advisory_lock(?)'), (ADVISORY_LOCK_KEY,))
+            try:
+                yield
+            finally:
+                conn.execute(DatabasePool.format_sql('SELECT pg_advisory_unlock(?)'), (ADVISORY_LOCK_KEY,))
+                conn.commit()
+            return
+        fd = os.open(f'{DATABASE_SQLITE}.migrate.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+
+def migrate():
+    """执行待执行的迁移步骤，返回本次应用的版本号列表；已是最新时仅一次查询"""
+    with DatabasePool.get_connection() as conn:
+        if not pending_migrations(conn):
+            return []
+
+        applied = []
+        with migration_lock(conn):
+            _ensure_table(conn)
+            # 等锁期间其他进程可能已完成迁移，持锁后复核
+            for migration, digest, reason in pending_migrations(conn):
+                logger.info("应用数据库迁移 %s_%s (%s)", migration.version, migration.name, reason)
+                started = time.perf_counter()
+                migration.apply()
+                duration_ms = int((time.perf_counter() - started) * 1000)
+                conn.execute(DatabasePool.format_sql('''
+                    INSERT INTO schema_migrations (version, name, checksum, duration_ms, applied_at)
+                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT (version) DO UPDATE SET
+                        name = excluded.name, checksum = excluded.checksum,
+                        duration_ms = excluded.duration_ms, applied_at = excluded.applied_at
+                '''), (migration.version, migration.name, digest, duration_ms))
+                conn.commit()
+                applied.append(migration.version)
+
+            if applied:
+                # DDL 已就绪：刷新表结构目录，结构指纹变化时通知其他进程
+                DatabasePool.refresh_schema_version(conn)
+                conn.commit()
+        return applied
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else 'plan'
+    if command not in ('status', 'plan', 'apply'):
+        print(__doc__)
+        return 2
+
+    if command == 'apply':
+        started = time.perf_counter()
+        applied = migrate()
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"已应用 {len(applied)} 个迁移步骤 {applied}，耗时 {elapsed:.0f} ms" if applied else "数据库已是最新")
+        return 0
+
+    with DatabasePool.get_connection() as conn:
+        if command == 'status':
+            applied = applied_migrations(conn)
+            if not applied:
+                print("尚未应用任何迁移")
+            for row in applied.values():
+                print(f"{row['version']:>4}  {row['name']:<28} {row['checksum'][:12]}  {row['applied_at']}  {row['duration_ms']} ms")
+            return 0
+
+        pending = pending_migrations(conn)
+        if not pending:
+            print("数据库已是最新")
+        for migration, digest, reason in pending:
+            print(f"{migration.version:>4}  {migration.name:<28} {digest[:12]}  {reason}")
+        return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
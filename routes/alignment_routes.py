@@ -194,6 +194,15 @@ def get_session_detail(session_id):
     return api_response(True, detail)
 
 
+@alignment_bp.route('/sessions/<int:session_id>/progress', methods=['GET'])
+def get_session_progress(session_id):
+    """获取对齐会话进度（已完成接口数 / 标准接口总数）"""
+    progress = alignment_service.get_session_progress(session_id)
+    if not progress:
+        return api_response(False, error='会话不存在')
+    return api_response(True, progress)
+
+
 @alignment_bp.route('/sessions/<int:session_id>', methods=['DELETE'])
 def delete_session(session_id):
     """删除对齐会话"""
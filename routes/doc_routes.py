@@ -1,9 +1,8 @@
 import os
-import flask
-from flask import Blueprint, request, current_app, send_file
+from flask import Blueprint, request, send_file
 from services.doc_service import doc_service
 from utils.response_utils import api_response
-from utils.file_utils import allowed_file, get_upload_path
+from utils.file_utils import allowed_file
 
 doc_bp = Blueprint('doc', __name__, url_prefix='/api')
 
@@ -68,24 +67,14 @@ def download_document(doc_id):
         from storage_service import storage_service
         # Check if it's a local file (legacy) or remote
         if os.path.exists(doc['file_path']):
-             return send_file(doc['file_path'], as_attachment=True, download_name=doc['doc_name'])
+             return send_file(doc['file_path'], as_attachment=True, download_name=doc['doc_name'], conditional=True)
         
-        # Assume it's a remote path
-        local_temp_path = storage_service.download_file(doc['file_path'])
-        
-        # Use after_this_request to clean up
-        @flask.after_this_request
-        def remove_file(response):
-            try:
-                if os.path.exists(local_temp_path):
-                    os.remove(local_temp_path)
-                    # Try to remove the temp dir if empty
-                    os.rmdir(os.path.dirname(local_temp_path))
-            except Exception as e:
-                current_app.logger.error(f"Error removing temp file: {e}")
-            return response
-            
-        return send_file(local_temp_path, as_attachment=True, download_name=doc['doc_name'])
+        # Remote path: stream straight through (R2) or via an auto-cleaned temp file (Baidu)
+        return storage_service.stream_response(
+            doc['file_path'],
+            doc['doc_name'],
+            range_header=request.headers.get('Range'),
+        )
     except Exception as e:
          return api_response(False, message=f"下载失败: {str(e)}", code=500)
 
@@ -11,6 +11,7 @@ import mimetypes
 import requests
 from services.ai_service import ai_service
 from services.file_parser import extract_text_from_file
+from services.form_job_service import form_job_service
 from api_utils import api_response
 from ai_config import ai_manager, TaskType
 try:
@@ -2000,114 +2001,112 @@ def extract_form_source_text():
         return api_response(False, message=str(e), code=500)
 
 
-@form_generator_bp.route('/generate-from-document', methods=['POST'])
-def generate_from_document():
-    try:
-        data = request.json or {}
-        source_text = (data.get('source_text') or '').strip()
-        source_name = (data.get('source_name') or '').strip()
-        layout_analysis = data.get('layout_analysis') or []
-        vision_analysis = _normalize_vision_analysis(data.get('vision_analysis') or {}, layout_analysis)
-        if source_text.startswith('[') and layout_analysis:
-            source_text = ''
-        if not source_text:
-            if not layout_analysis:
-                return api_response(False, message="缺少表单文本内容", code=400)
-            source_text = '[仅检测到表格结构，无可用文本内容]'
-        candidates = _extract_form_candidates(source_text)
-        text_tables = _extract_textual_tables(source_text)
-
-        reference_form = _find_reference_form(source_name, source_text)
-        if reference_form:
-            ref_data = _promote_date_controls_in_smartcare_form(copy.deepcopy(reference_form['data']), candidates, vision_analysis)
-            formatted_text = json.dumps(ref_data, ensure_ascii=False, indent=2)
-            return api_response(True, {
-                "data": ref_data.get('pages', [{}])[0].get('components', []),
-                "smartcare_form": ref_data,
-                "formatted_text": formatted_text,
-                "smartcare_formatted_text": formatted_text,
-                "total_count": len(ref_data.get('pages', [{}])[0].get('components', [])),
-                "detected_candidates": candidates,
-                "control_summary": _summarize_generated_controls(ref_data.get('pages', [{}])[0].get('components', [])),
-                "reference_match": {
-                    "filename": reference_form['filename'],
-                    "form_name": reference_form['form_name']
-                }
-            })
-
-        if text_tables:
-            score_table_items = _build_score_matrix_candidates(text_tables[0], source_text=source_text)
-            if score_table_items:
-                smartcare_form = _build_smartcare_form(score_table_items, source_name=source_name or '评分表单')
-                smartcare_form = _promote_date_controls_in_smartcare_form(smartcare_form, score_table_items, vision_analysis)
-                formatted_text = json.dumps(score_table_items, ensure_ascii=False, indent=2)
-                smartcare_formatted_text = json.dumps(smartcare_form, ensure_ascii=False, indent=2)
-                return api_response(True, {
-                    "data": score_table_items,
-                    "formatted_text": formatted_text,
-                    "smartcare_form": smartcare_form,
-                    "smartcare_formatted_text": smartcare_formatted_text,
-                    "total_count": len(score_table_items),
-                    "detected_candidates": score_table_items,
-                    "control_summary": _summarize_generated_controls(score_table_items),
-                    "layout_analysis": layout_analysis,
-                    "vision_analysis": vision_analysis,
-                    "generation_strategy": "score_table"
-                })
-
-            if not layout_analysis:
-                smartcare_form = _build_smartcare_text_table_form(text_tables[0], source_name=source_name or '表格型表单', source_text=source_text)
-                smartcare_formatted_text = json.dumps(smartcare_form, ensure_ascii=False, indent=2)
-                components = smartcare_form.get('pages', [{}])[0].get('components', [])
-                return api_response(True, {
-                    "data": components,
-                    "formatted_text": json.dumps(components, ensure_ascii=False, indent=2),
-                    "smartcare_form": smartcare_form,
-                    "smartcare_formatted_text": smartcare_formatted_text,
-                    "total_count": len(components),
-                    "detected_candidates": candidates,
-                    "control_summary": _summarize_generated_controls(components),
-                    "layout_analysis": layout_analysis,
-                    "vision_analysis": vision_analysis,
-                    "generation_strategy": "text_table"
-                })
-
-        if _should_use_semantic_parser_directly(candidates):
-            smartcare_form = _build_smartcare_form(candidates, source_name=source_name or '智能生成表单')
-            smartcare_form = _promote_date_controls_in_smartcare_form(smartcare_form, candidates, vision_analysis)
-            formatted_text = json.dumps(candidates, ensure_ascii=False, indent=2)
+def _generate_form_from_document_data(data):
+    """根据提取文本/表格结构生成 SmartCare 表单，返回 (success, payload 或错误信息, code)。"""
+    source_text = (data.get('source_text') or '').strip()
+    source_name = (data.get('source_name') or '').strip()
+    layout_analysis = data.get('layout_analysis') or []
+    vision_analysis = _normalize_vision_analysis(data.get('vision_analysis') or {}, layout_analysis)
+    if source_text.startswith('[') and layout_analysis:
+        source_text = ''
+    if not source_text:
+        if not layout_analysis:
+            return False, "缺少表单文本内容", 400
+        source_text = '[仅检测到表格结构，无可用文本内容]'
+    candidates = _extract_form_candidates(source_text)
+    text_tables = _extract_textual_tables(source_text)
+
+    reference_form = _find_reference_form(source_name, source_text)
+    if reference_form:
+        ref_data = _promote_date_controls_in_smartcare_form(copy.deepcopy(reference_form['data']), candidates, vision_analysis)
+        formatted_text = json.dumps(ref_data, ensure_ascii=False, indent=2)
+        return True, {
+            "data": ref_data.get('pages', [{}])[0].get('components', []),
+            "smartcare_form": ref_data,
+            "formatted_text": formatted_text,
+            "smartcare_formatted_text": formatted_text,
+            "total_count": len(ref_data.get('pages', [{}])[0].get('components', [])),
+            "detected_candidates": candidates,
+            "control_summary": _summarize_generated_controls(ref_data.get('pages', [{}])[0].get('components', [])),
+            "reference_match": {
+                "filename": reference_form['filename'],
+                "form_name": reference_form['form_name']
+            }
+        }, 200
+
+    if text_tables:
+        score_table_items = _build_score_matrix_candidates(text_tables[0], source_text=source_text)
+        if score_table_items:
+            smartcare_form = _build_smartcare_form(score_table_items, source_name=source_name or '评分表单')
+            smartcare_form = _promote_date_controls_in_smartcare_form(smartcare_form, score_table_items, vision_analysis)
+            formatted_text = json.dumps(score_table_items, ensure_ascii=False, indent=2)
             smartcare_formatted_text = json.dumps(smartcare_form, ensure_ascii=False, indent=2)
-            return api_response(True, {
-                "data": candidates,
+            return True, {
+                "data": score_table_items,
                 "formatted_text": formatted_text,
                 "smartcare_form": smartcare_form,
                 "smartcare_formatted_text": smartcare_formatted_text,
-                "total_count": len(candidates),
-                "detected_candidates": candidates,
-                "control_summary": _summarize_generated_controls(candidates),
+                "total_count": len(score_table_items),
+                "detected_candidates": score_table_items,
+                "control_summary": _summarize_generated_controls(score_table_items),
                 "layout_analysis": layout_analysis,
                 "vision_analysis": vision_analysis,
-                "generation_strategy": "semantic"
-            })
+                "generation_strategy": "score_table"
+            }, 200
 
-        if (not candidates or source_text.startswith('[仅检测到表格结构')) and layout_analysis:
-            smartcare_form = _build_smartcare_table_form_with_ocr(layout_analysis, source_name=source_name or '表格型扫描件', vision_analysis=vision_analysis)
-            smartcare_form = _promote_date_controls_in_smartcare_form(smartcare_form, candidates, vision_analysis)
+        if not layout_analysis:
+            smartcare_form = _build_smartcare_text_table_form(text_tables[0], source_name=source_name or '表格型表单', source_text=source_text)
             smartcare_formatted_text = json.dumps(smartcare_form, ensure_ascii=False, indent=2)
-            return api_response(True, {
-                "data": smartcare_form.get('pages', [{}])[0].get('components', []),
-                "formatted_text": json.dumps([], ensure_ascii=False, indent=2),
+            components = smartcare_form.get('pages', [{}])[0].get('components', [])
+            return True, {
+                "data": components,
+                "formatted_text": json.dumps(components, ensure_ascii=False, indent=2),
                 "smartcare_form": smartcare_form,
                 "smartcare_formatted_text": smartcare_formatted_text,
-                "total_count": len(smartcare_form.get('pages', [{}])[0].get('components', [])),
+                "total_count": len(components),
                 "detected_candidates": candidates,
-                "control_summary": _summarize_generated_controls(smartcare_form.get('pages', [{}])[0].get('components', [])),
+                "control_summary": _summarize_generated_controls(components),
                 "layout_analysis": layout_analysis,
                 "vision_analysis": vision_analysis,
-                "structure_only": True
-            })
+                "generation_strategy": "text_table"
+            }, 200
 
-        prompt = f"""你是一名医疗表单结构化工程师。请根据以下表单文字内容，输出一个“表单控件 JSON 数组”，用于前端表单设计器。
+    if _should_use_semantic_parser_directly(candidates):
+        smartcare_form = _build_smartcare_form(candidates, source_name=source_name or '智能生成表单')
+        smartcare_form = _promote_date_controls_in_smartcare_form(smartcare_form, candidates, vision_analysis)
+        formatted_text = json.dumps(candidates, ensure_ascii=False, indent=2)
+        smartcare_formatted_text = json.dumps(smartcare_form, ensure_ascii=False, indent=2)
+        return True, {
+            "data": candidates,
+            "formatted_text": formatted_text,
+            "smartcare_form": smartcare_form,
+            "smartcare_formatted_text": smartcare_formatted_text,
+            "total_count": len(candidates),
+            "detected_candidates": candidates,
+            "control_summary": _summarize_generated_controls(candidates),
+            "layout_analysis": layout_analysis,
+            "vision_analysis": vision_analysis,
+            "generation_strategy": "semantic"
+        }, 200
+
+    if (not candidates or source_text.startswith('[仅检测到表格结构')) and layout_analysis:
+        smartcare_form = _build_smartcare_table_form_with_ocr(layout_analysis, source_name=source_name or '表格型扫描件', vision_analysis=vision_analysis)
+        smartcare_form = _promote_date_controls_in_smartcare_form(smartcare_form, candidates, vision_analysis)
+        smartcare_formatted_text = json.dumps(smartcare_form, ensure_ascii=False, indent=2)
+        return True, {
+            "data": smartcare_form.get('pages', [{}])[0].get('components', []),
+            "formatted_text": json.dumps([], ensure_ascii=False, indent=2),
+            "smartcare_form": smartcare_form,
+            "smartcare_formatted_text": smartcare_formatted_text,
+            "total_count": len(smartcare_form.get('pages', [{}])[0].get('components', [])),
+            "detected_candidates": candidates,
+            "control_summary": _summarize_generated_controls(smartcare_form.get('pages', [{}])[0].get('components', [])),
+            "layout_analysis": layout_analysis,
+            "vision_analysis": vision_analysis,
+            "structure_only": True
+        }, 200
+
+    prompt = f"""你是一名医疗表单结构化工程师。请根据以下表单文字内容，输出一个“表单控件 JSON 数组”，用于前端表单设计器。
 
 要求：
 1. 只输出 JSON 数组，不要输出解释。
@@ -2136,33 +2135,100 @@ def generate_from_document():
 {source_text[:12000]}
 """
 
-        ai_resp = ai_service.call_ai_api("你是一个只输出合法 JSON 数组的表单结构化引擎。", prompt, task_type="json")
-        result = _extract_json_array(ai_resp or '')
-        if not result:
-            return api_response(False, message="AI 未返回合法的表单 JSON，请重试或缩短文档内容", code=500)
+    ai_resp = ai_service.call_ai_api("你是一个只输出合法 JSON 数组的表单结构化引擎。", prompt, task_type="json")
+    result = _extract_json_array(ai_resp or '')
+    if not result:
+        return False, "AI 未返回合法的表单 JSON，请重试或缩短文档内容", 500
+
+    smartcare_form = _build_smartcare_form(result, source_name=source_name or '智能生成表单')
+    smartcare_form = _promote_date_controls_in_smartcare_form(smartcare_form, candidates, vision_analysis)
+    control_summary = _summarize_generated_controls(result)
+    formatted_text = json.dumps(result, ensure_ascii=False, indent=2)
+    smartcare_formatted_text = json.dumps(smartcare_form, ensure_ascii=False, indent=2)
+    return True, {
+        "data": result,
+        "formatted_text": formatted_text,
+        "smartcare_form": smartcare_form,
+        "smartcare_formatted_text": smartcare_formatted_text,
+        "total_count": len(result),
+        "detected_candidates": candidates,
+        "control_summary": control_summary,
+        "layout_analysis": layout_analysis,
+        "vision_analysis": vision_analysis,
+        "generation_strategy": "ai"
+    }, 200
 
-        smartcare_form = _build_smartcare_form(result, source_name=source_name or '智能生成表单')
-        smartcare_form = _promote_date_controls_in_smartcare_form(smartcare_form, candidates, vision_analysis)
-        control_summary = _summarize_generated_controls(result)
-        formatted_text = json.dumps(result, ensure_ascii=False, indent=2)
-        smartcare_formatted_text = json.dumps(smartcare_form, ensure_ascii=False, indent=2)
-        return api_response(True, {
-            "data": result,
-            "formatted_text": formatted_text,
-            "smartcare_form": smartcare_form,
-            "smartcare_formatted_text": smartcare_formatted_text,
-            "total_count": len(result),
-            "detected_candidates": candidates,
-            "control_summary": control_summary,
-            "layout_analysis": layout_analysis,
-            "vision_analysis": vision_analysis,
-            "generation_strategy": "ai"
-        })
+
+@form_generator_bp.route('/generate-from-document', methods=['POST'])
+def generate_from_document():
+    try:
+        success, result, code = _generate_form_from_document_data(request.json or {})
+        if not success:
+            return api_response(False, message=result, code=code)
+        return api_response(True, result)
     except Exception as e:
         logger.error("Generate form JSON from document failed: %s", e, exc_info=True)
         return api_response(False, message=str(e), code=500)
 
 
+def _reference_fallback_text(source_name, text=''):
+    """文本不可用时以命中的本地参考表单内容代替，与同步提取接口一致；未命中返回 None"""
+    reference_form = _find_reference_form(source_name, text or '')
+    if not reference_form:
+        return None
+    return _reference_form_text(reference_form['data']) or f"已命中本地参考表单: {reference_form['form_name']}"
+
+
+_FORM_JOB_HANDLERS = {
+    'extract_text': extract_text_from_file,
+    'image_text': _infer_image_text,
+    'analyze_tables': _analyze_pdf_tables,
+    'vision_ocr': _call_vision_ocr,
+    'reference_text': _reference_fallback_text,
+    'generate': _generate_form_from_document_data,
+}
+
+
+@form_generator_bp.route('/jobs', methods=['POST'])
+def submit_form_generation_job():
+    """异步提交文档 -> SmartCare 表单生成任务，返回 job_id 供轮询。"""
+    try:
+        if 'file' in request.files:
+            file = request.files['file']
+            if not file or not file.filename:
+                return api_response(False, message="文件为空", code=400)
+            suffix = os.path.splitext(file.filename)[1].lower()
+            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+                file.save(tmp.name)
+                temp_path = tmp.name
+            options = {
+                'source_name': (request.form.get('source_name') or '').strip(),
+                'force_vision': str(request.form.get('force_vision') or '').lower() in ('1', 'true', 'yes'),
+            }
+            job = form_job_service.submit(temp_path, file.filename, _FORM_JOB_HANDLERS, options)
+        else:
+            data = request.get_json(silent=True) or {}
+            source_text = (data.get('source_text') or '').strip()
+            if not source_text:
+                return api_response(False, message="请上传文件或提供表单文本内容", code=400)
+            job = form_job_service.submit(None, data.get('source_name') or '', _FORM_JOB_HANDLERS, {
+                'source_text': source_text,
+                'source_name': (data.get('source_name') or '').strip(),
+            })
+        return api_response(True, job, message="表单生成任务已提交")
+    except Exception as e:
+        logger.error("Submit form generation job failed: %s", e, exc_info=True)
+        return api_response(False, message=str(e), code=500)
+
+
+@form_generator_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_form_generation_job(job_id):
+    job = form_job_service.get_job(job_id)
+    if job is None:
+        return api_response(False, message="任务不存在或已过期", code=404)
+    return api_response(True, job)
+
+
 @form_generator_bp.route('/rebuild-smartcare', methods=['POST'])
 def rebuild_smartcare():
     try:
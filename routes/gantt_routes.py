@@ -1,81 +1,47 @@
 from flask import Blueprint, jsonify, request
-from database import DatabasePool
-from datetime import datetime, timedelta
+from api_utils import api_response
+from services.schedule_engine import schedule_engine
 
 gantt_bp = Blueprint('gantt', __name__)
 
 @gantt_bp.route('/api/projects/<int:project_id>/gantt-data', methods=['GET'])
 def get_gantt_data(project_id):
     """
-    获取项目的甘特图数据
+    获取项目的甘特图数据（由排程引擎按工作日历计算任务起止日期）
     Frappe Gantt 格式: { id, name, start, end, progress, dependencies }
+    ?level=1 时使用按负责人资源平衡后的日期
+    ?since=<版本> 时返回增量 { version, full, changed, removed, order? }；since 为空或版本未知时 full=true 并带全量 tasks
+    响应带 ETag（内容版本号），未变化时返回 304
     """
+    from services.gantt_service import gantt_sync_service
     try:
-        with DatabasePool.get_connection() as conn:
-            # 1. 获取所有阶段及其日期
-            stages = conn.execute(DatabasePool.format_sql('''
-                SELECT id, stage_name, plan_start_date, plan_end_date, progress, stage_order
-                FROM project_stages
-                WHERE project_id = ?
-                ORDER BY stage_order
-            '''), (project_id,)).fetchall()
-            
-            # 2. 获取所有任务及其依赖
-            tasks = conn.execute(DatabasePool.format_sql('''
-                SELECT t.id, t.task_name, t.stage_id, t.is_completed, t.completed_date
-                FROM tasks t
-                JOIN project_stages s ON t.stage_id = s.id
-                WHERE s.project_id = ?
-            '''), (project_id,)).fetchall()
-            
-            # 3. 获取依赖关系
-            deps = conn.execute(DatabasePool.format_sql('''
-                SELECT td.task_id, td.depends_on_task_id
-                FROM task_dependencies td
-                JOIN tasks t ON td.task_id = t.id
-                JOIN project_stages s ON t.stage_id = s.id
-                WHERE s.project_id = ?
-            '''), (project_id,)).fetchall()
+        level = str(request.args.get('level', '')).lower() in ('1', 'true', 'yes')
+        if 'since' in request.args:
+            version, payload = gantt_sync_service.sync(project_id, request.args.get('since', ''), level=level)
+        else:
+            version, payload = gantt_sync_service.snapshot(project_id, level=level)
+
+        response = jsonify(payload)
+        response.set_etag(version)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
 
-        # 整理数据
-        # Frappe Gantt 需要 YYYY-MM-DD
-        gantt_tasks = []
-        
-        # 建立阶段查找表
-        stage_map = {s['id']: dict(s) for s in stages}
-        
-        # 建立任务依赖映射
-        task_deps = {}
-        for d in deps:
-            tid = str(d['task_id'])
-            if tid not in task_deps:
-                task_deps[tid] = []
-            task_deps[tid].append(str(d['depends_on_task_id']))
-            
-        for t in tasks:
-            sid = t['stage_id']
-            stage = stage_map.get(sid)
-            if not stage: continue
-            
-            # 如果阶段没有设置日期，设置默认日期（今天开始，持续3天）
-            start = stage['plan_start_date'] or datetime.now().strftime('%Y-%m-%d')
-            end = stage['plan_end_date'] or (datetime.now() + timedelta(days=3)).strftime('%Y-%m-%d')
-            
-            # 进度：已完成为 100，未完成为 0（或者使用阶段的进度，但任务粒度更细）
-            progress = 100 if t['is_completed'] else 0
-            
-            gantt_tasks.append({
-                'id': str(t['id']),
-                'name': t['task_name'],
-                'start': start,
-                'end': end,
-                'progress': progress,
-                'dependencies': ",".join(task_deps.get(str(t['id']), [])),
-                'custom_class': f'stage-{stage["stage_order"] % 5}' # 简单的颜色区分
-            })
-            
-        return jsonify(gantt_tasks)
-        
     except Exception as e:
         print(f"Gantt Data Error: {e}")
         return jsonify({'error': str(e)}), 500
+
+
+@gantt_bp.route('/api/projects/<int:project_id>/calendar', methods=['GET'])
+def get_project_calendar(project_id):
+    """获取项目工作日历（周末、节假日、调休上班日、人员并行容量）"""
+    return api_response(True, schedule_engine.get_calendar(project_id))
+
+
+@gantt_bp.route('/api/projects/<int:project_id>/calendar', methods=['PUT'])
+def save_project_calendar(project_id):
+    """保存项目工作日历；节假日支持 "2026-10-01~2026-10-07" 区间写法"""
+    try:
+        calendar = schedule_engine.save_calendar(project_id, request.json or {})
+    except (TypeError, ValueError) as e:
+        return api_response(False, message=str(e), code=400)
+    return api_response(True, calendar, message='工作日历已保存')
@@ -3,6 +3,7 @@ import logging
 from flask import Blueprint, request
 from api_utils import api_response
 from services.monitor_service import monitor_service
+from services.notification_stream_service import notification_stream_service
 from services.warning_service import warning_service
 from database import DatabasePool
 
@@ -47,6 +48,27 @@ def get_unread_count():
     current_user = getattr(request, 'current_user', None) or {}
     return api_response(True, data={'count': monitor_service.get_unread_count(user_id=current_user.get('id'))})
 
+@monitor_bp.route('/api/notifications/channel', methods=['GET'])
+def get_notification_channel():
+    """返回 SSE 推送地址；推送由独立的 asyncio 服务承载，不占 WSGI 线程。stream_url 为空时前端走长轮询"""
+    from services.notification_stream_server import notification_stream_server
+    return api_response(True, data={'stream_url': notification_stream_server.stream_url(request.host, request.scheme)})
+
+@monitor_bp.route('/api/notifications/poll', methods=['GET'])
+def poll_notifications():
+    """长轮询：since 为上次返回的 seq，有新事件或超时（最长 25 秒）后返回"""
+    current_user = getattr(request, 'current_user', None) or {}
+    since = request.args.get('since', type=int)
+    timeout = min(max(request.args.get('timeout', notification_stream_service.POLL_TIMEOUT_SECONDS, type=int), 0),
+                  notification_stream_service.POLL_TIMEOUT_SECONDS)
+    return api_response(True, data=notification_stream_service.poll(current_user.get('id'), since, timeout))
+
+@monitor_bp.route('/api/notifications/dispatcher/metrics', methods=['GET'])
+def get_dispatcher_metrics():
+    """通知外发队列指标：队列深度、各渠道外发状态、投递延迟"""
+    from services.notification_dispatcher import notification_dispatcher
+    return api_response(True, data=notification_dispatcher.metrics())
+
 @monitor_bp.route('/api/notifications/<int:nid>', methods=['DELETE'])
 def delete_notification(nid):
     """删除单条通知"""
@@ -67,7 +67,7 @@ def ask_ai(project_id):
             return api_response(success=False, message=error)
             
         # 2. Execute SQL
-        result = nl_query_service.execute_query(project_id, sql)
+        result = nl_query_service.execute_query(project_id, sql, question)
         if 'error' in result:
              return api_response(success=False, message=result['error'], data={"sql": sql})
              
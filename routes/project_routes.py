@@ -76,6 +76,12 @@ def get_project_detail(project_id):
         return api_response(False, error="Project not found", code=404)
     return api_response(True, project)
 
+@project_bp.route('/projects/detail-cache/metrics', methods=['GET'])
+def get_project_detail_cache_metrics():
+    """项目详情缓存命中统计（用于调优缓存容量/TTL）"""
+    from services.project_detail_service import project_detail_loader
+    return api_response(True, project_detail_loader.metrics())
+
 @project_bp.route('/projects/<int:project_id>', methods=['PUT'])
 def update_project(project_id):
     data = request.json or {}
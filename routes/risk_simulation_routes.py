@@ -11,15 +11,52 @@ def simulate_risk():
     project_id = request.args.get('project_id', type=int)
     task_id = request.args.get('task_id', type=int)
     delay_days = request.args.get('delay_days', default=3, type=int)
+    narrate = request.args.get('narrate', '').lower() in ('1', 'true', 'yes')
     
     if not project_id or not task_id:
         return api_response(False, error="Missing project_id or task_id")
         
-    result = risk_simulation_service.calculate_impact_chain(project_id, task_id, delay_days)
+    result = risk_simulation_service.calculate_impact_chain(project_id, task_id, delay_days, narrate=narrate)
     if result:
         return api_response(True, result)
     return api_response(False, error="Simulation failed")
 
+@risk_bp.route('/simulate/narration', methods=['GET'])
+def simulate_risk_narration():
+    """延误影响链的 AI 解读：前端拿到确定性结果后再异步请求，不阻塞主结果"""
+    project_id = request.args.get('project_id', type=int)
+    task_id = request.args.get('task_id', type=int)
+    delay_days = request.args.get('delay_days', default=3, type=int)
+
+    if not project_id or not task_id:
+        return api_response(False, error="Missing project_id or task_id")
+
+    result = risk_simulation_service.calculate_impact_chain(project_id, task_id, delay_days, narrate=True)
+    if result:
+        return api_response(True, {'narration': result['narration']})
+    return api_response(False, error="Simulation failed")
+
+@risk_bp.route('/monte-carlo/<int:project_id>', methods=['GET'])
+def monte_carlo_schedule(project_id):
+    """
+    蒙特卡洛排程风险：各阶段里程碑 P50/P80/P95 完成日期与任务关键度
+    ?iterations=2000&seed=1 可复现；?mode=deterministic 只按计划工期计算一次
+    ?task_id=&delay_days= 可叠加单任务延误
+    """
+    result = risk_simulation_service.simulate_schedule(
+        project_id,
+        iterations=request.args.get('iterations', type=int),
+        task_id=request.args.get('task_id', type=int),
+        delay_days=request.args.get('delay_days', default=0, type=int),
+        seed=request.args.get('seed', type=int),
+        deterministic=request.args.get('mode') == 'deterministic',
+    )
+    if result is None:
+        return api_response(False, error="项目暂无任务")
+    if result.get('cyclic'):
+        return api_response(False, error="任务依赖存在环，无法模拟")
+    return api_response(True, result)
+
 @risk_bp.route('/countdown/<int:project_id>', methods=['GET'])
 def get_death_countdown(project_id):
     prediction = ai_insight_service.predict_future_risks(project_id)
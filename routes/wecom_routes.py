@@ -47,9 +47,9 @@ def verify_callback():
 
 @wecom_bp.route('/callback', methods=['POST'])
 def receive_callback():
-    """接收企业微信回调消息（POST请求）"""
+    """接收企业微信回调消息（POST请求）：解密后立即应答，业务处理异步进行并主动推送回复"""
     from services.wecom_service import wecom_service
-    from services.wecom_msg_handler import wecom_msg_handler
+    from services.wecom_callback_service import wecom_callback_pipeline
     
     if not wecom_service.crypto:
         return "callback not configured", 403
@@ -59,122 +59,32 @@ def receive_callback():
     nonce = request.args.get('nonce', '')
     post_data = request.data.decode('utf-8')
     
-    # 甚至在解密前就开始记录（紧急调试）
-    try:
-        from database import DatabasePool
-        import json
-        with DatabasePool.get_connection() as conn:
-            conn.execute(DatabasePool.format_sql('INSERT INTO wecom_debug_logs (msg_type, raw_xml) VALUES (?, ?)'), 
-                         ('RAW_POST', f"Signature: {msg_signature}, Data: {post_data[:200]}..."))
-            conn.commit()
-    except Exception as e:
-        logger.error("Failed to save raw wecom debug log: %s", e)
+    # 解密前先记录原始请求（进缓冲区，后台批量落库）
+    wecom_callback_pipeline.log_debug('RAW_POST', f"Signature: {msg_signature}, Data: {post_data[:200]}...")
 
     try:
         # 解密
         plain_xml = wecom_service.crypto.decrypt_callback(
             msg_signature, timestamp, nonce, post_data
         )
-        # 加这一行，打印原始解密后的 XML 供调试
         logger.debug("WeCom Decrypted XML: %s", plain_xml)
         
         msg = wecom_service.crypto.parse_msg_xml(plain_xml)
-        
-        # 将原始消息记录到数据库供调试
-        try:
-            from database import DatabasePool
-            import json
-            with DatabasePool.get_connection() as conn:
-                conn.execute(DatabasePool.format_sql('''
-                    INSERT INTO wecom_debug_logs (msg_type, raw_xml, parsed_json)
-                    VALUES (?, ?, ?)
-                '''), (msg.get('MsgType'), plain_xml, json.dumps(msg, ensure_ascii=False)))
-                conn.commit()
-        except Exception as db_err:
-            logger.error("Failed to save wecom debug log: %s", db_err)
+        wecom_callback_pipeline.log_debug(msg.get('MsgType'), plain_xml, msg)
         
         logger.info("收到企业微信回调: MsgType=%s, From=%s", 
                     msg.get('MsgType'), msg.get('FromUserName'))
         
-        msg_type = msg.get('MsgType', '')
-        from_user = msg.get('FromUserName', '')
-        reply_content = ""
-        
-        if msg_type == 'text':
-            content = msg.get('Content', '')
-            reply_content = wecom_msg_handler.handle_text_message(from_user, content)
-            
-        elif msg_type == 'image':
-            media_id = msg.get('MediaId', '')
-            reply_content = wecom_msg_handler.handle_image_message(from_user, media_id)
-            
-        elif msg_type == 'voice':
-            # 优先尝试从消息中获取 Recognition 字段（企业微信某些版本或配置下可能包含）
-            recognition = msg.get('Recognition') or msg.get('recognition') or ''
-            
-            if not recognition:
-                # 如果没有自带识别结果，则手动下载并调用 AI 转录
-                media_id = msg.get('MediaId', '')
-                if media_id:
-                    logger.info("语音消息识别结果为空，尝试手动转录 MediaID: %s", media_id)
-                    import os
-                    # 临时保存路径
-                    save_path = os.path.join('temp', f"voice_{media_id}.amr")
-                    os.makedirs('temp', exist_ok=True)
-                    
-                    try:
-                        downloaded_path = wecom_service.get_media(media_id, save_path)
-                        if downloaded_path:
-                            from services.ai_service import ai_service
-                            recognition = ai_service.transcribe_audio(downloaded_path)
-                            # 删除临时文件
-                            if os.path.exists(downloaded_path):
-                                os.remove(downloaded_path)
-                    except Exception as e:
-                        logger.error("手动转录语音失败: %s", e)
+        # 进入应用的欢迎语无需查库，仍用被动回复
+        if msg.get('MsgType') == 'event' and msg.get('Event') == 'enter_agent':
+            reply_xml = _build_text_reply(
+                msg.get('FromUserName', ''), msg.get('ToUserName', ''),
+                "👋 欢迎使用 ICU-PM 项目管理助手！\n发送「帮助」查看可用命令。"
+            )
+            return wecom_service.crypto.encrypt_reply(reply_xml, nonce, timestamp)
 
-            if recognition:
-                logger.info("识别到语音内容: %s", recognition)
-                # 把识别出的文字当作普通文本消息处理
-                reply_content = wecom_msg_handler.handle_text_message(from_user, recognition)
-            else:
-                logger.warning("语音消息无法转录或未包含有效内容")
-                reply_content = "抱歉，由于企业微信限制，目前无法直接识别该语音内容。建议您在我的“移动端控制台”中使用语音输入，或者发送文字消息。"
-            
-        elif msg_type == 'event':
-            event_type = msg.get('Event', '')
-            if event_type == 'click':
-                # 菜单点击事件
-                event_key = msg.get('EventKey', '')
-                reply_content = _handle_menu_click(from_user, event_key)
-            elif event_type == 'sys_approval_change':
-                # 审批状态变更事件
-                from services.wecom_approval_service import wecom_approval_service
-                approval_info = msg.get('ApprovalInfo', {})
-                wecom_approval_service.handle_approval_callback(approval_info)
-                return "success"
-            elif event_type == 'enter_agent':
-                # 用户进入应用
-                reply_content = "👋 欢迎使用 ICU-PM 项目管理助手！\n发送「帮助」查看可用命令。"
-        
-        # 被动回复消息（5秒内必须响应）
-        if reply_content:
-            # 由于被动回复有长度和格式限制，对于长内容改用主动推送
-            if len(reply_content) > 500:
-                # 先被动回复一个简短提示
-                short_reply = "正在处理，请稍候..."
-                # 异步主动推送完整内容
-                import threading
-                threading.Thread(
-                    target=wecom_service.send_markdown,
-                    args=(from_user, reply_content)
-                ).start()
-                reply_content = short_reply
-            
-            reply_xml = _build_text_reply(from_user, msg.get('ToUserName', ''), reply_content)
-            encrypted_reply = wecom_service.crypto.encrypt_reply(reply_xml, nonce, timestamp)
-            return encrypted_reply
-        
+        # 其余消息去重后交给后台线程池，处理结果通过主动推送回复
+        wecom_callback_pipeline.accept(msg)
         return "success"
         
     except Exception as e:
@@ -198,14 +108,8 @@ def _build_text_reply(to_user: str, from_user: str, content: str) -> str:
 
 def _handle_menu_click(userid: str, event_key: str) -> str:
     """处理自定义菜单点击"""
-    from services.wecom_msg_handler import wecom_msg_handler
-    
-    handlers = {
-        "menu_status": lambda: wecom_msg_handler._handle_status(userid),
-        "menu_help": lambda: wecom_msg_handler._get_help_text(),
-    }
-    handler = handlers.get(event_key)
-    return handler() if handler else f"未知的菜单操作: {event_key}"
+    from services.wecom_callback_service import wecom_callback_pipeline
+    return wecom_callback_pipeline.handle_menu_click(userid, event_key)
 
 # ===== OAuth2 登录 =====
 
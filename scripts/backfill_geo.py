@@ -1,40 +1,25 @@
-
-import sqlite3
 import sys
 import os
 
-# Add parent directory to path to import utils
+# Add parent directory to path to import services
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from utils.geo_service import geo_service
-from database import get_db
+from services.geo_enrichment_service import geo_enrichment_service
 
 def backfill():
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Get members with missing coordinates
-    members = cursor.execute('SELECT id, name, current_city FROM project_members WHERE lng IS NULL OR lat IS NULL').fetchall()
-    print(f"Found {len(members)} members without coordinates.")
-    
-    updated_count = 0
-    for m in members:
-        loc = m['current_city']
-        if not loc:
-            continue
-            
-        print(f"Resolving {loc} for {m['name']}...")
-        coords = geo_service.resolve_coords(loc)
-        
-        if coords:
-            cursor.execute('UPDATE project_members SET lng = ?, lat = ? WHERE id = ?', (coords[0], coords[1], m['id']))
-            updated_count += 1
-            print(f"  -> OK: {coords}")
-        else:
-            print(f"  -> Failed to resolve {loc}")
-            
-    conn.commit()
-    print(f"Successfully updated {updated_count} records.")
+    total = {'projects': 0, 'members': 0}
+    after_project_id = after_member_id = 0
+    while True:
+        # 按 id 游标前进，解析不出的行不会让后续批次原地打转
+        result = geo_enrichment_service.run(after_project_id=after_project_id, after_member_id=after_member_id)
+        print(f"Batch updated {result['projects']} projects, {result['members']} members.")
+        total['projects'] += result['projects']
+        total['members'] += result['members']
+        if result['exhausted']:
+            break
+        after_project_id = result['last_project_id'] or after_project_id
+        after_member_id = result['last_member_id'] or after_member_id
+    print(f"Successfully updated {total['projects']} projects and {total['members']} members.")
 
 if __name__ == "__main__":
     backfill()
@@ -0,0 +1,105 @@
+"""
+冷启动导入耗时分析与预算检查
+
+在全新解释器中以 `python -X importtime` 导入目标模块（默认 app），输出：
+- 导入总耗时与进程总耗时
+- 按累计耗时 / 自身耗时排序的模块列表
+- 启动阶段被加载的重型依赖（应在 LAZY_IMPORTS 模式下延迟到首次使用）
+
+用法：
+    python scripts/startup_profile.py                  # 打印报告
+    python scripts/startup_profile.py --budget-ms 1000 # 导入耗时超出预算时返回非零
+    python scripts/startup_profile.py --json           # 输出 JSON（供测试/CI 解析）
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# 启动时不应加载的重型依赖：只在具体功能中用到
+HEAVY_MODULES = ('numpy', 'docx', 'boto3', 'botocore', 'bypy', 'Cryptodome', 'lxml')
+
+_CHILD = '''
+import json, sys
+import {module}
+print(json.dumps(sorted(m for m in sys.modules if '.' not in m)))
+'''
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 输出，返回 [(模块, 自身微秒, 累计微秒, 层级)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def profile_startup(module='app', lazy=True):
+    env = dict(os.environ, LAZY_IMPORTS='true' if lazy else 'false', PYTHONDONTWRITEBYTECODE='1')
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _CHILD.format(module=module)],
+        cwd=ROOT, env=env, capture_output=True, text=True, encoding='utf-8', errors='replace',
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if completed.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{completed.stderr[-2000:]}")
+
+    rows = parse_importtime(completed.stderr)
+    target = next((r for r in rows if r[0] == module and r[3] == 0), None)
+    loaded = set(json.loads(completed.stdout.strip().splitlines()[-1]))
+    return {
+        'module': module,
+        'lazy': lazy,
+        'import_ms': round(target[2] / 1000, 1) if target else None,
+        'wall_ms': round(wall_ms, 1),
+        'heavy_loaded': [m for m in HEAVY_MODULES if m in loaded],
+        'modules': rows,
+    }
+
+
+def print_report(result, top):
+    rows = result['modules']
+    print(f"模块 {result['module']} (LAZY_IMPORTS={'true' if result['lazy'] else 'false'})")
+    print(f"  导入耗时 {result['import_ms']} ms，进程总耗时 {result['wall_ms']} ms")
+    print(f"  启动时加载的重型依赖: {', '.join(result['heavy_loaded']) or '无'}")
+    for title, index in (('累计耗时', 2), ('自身耗时', 1)):
+        print(f"\n按{title}排序 (前 {top}):")
+        for name, self_us, cumulative_us, depth in sorted(rows, key=lambda r: r[index], reverse=True)[:top]:
+            print(f"  {cumulative_us / 1000:8.1f} ms {self_us / 1000:8.1f} ms  {'  ' * depth}{name}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='冷启动导入耗时分析')
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--eager', action='store_true', help='以 LAZY_IMPORTS=false 测量')
+    parser.add_argument('--top', type=int, default=25)
+    parser.add_argument('--budget-ms', type=float, default=None, help='导入耗时预算，超出时返回 1')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+
+    result = profile_startup(args.module, lazy=not args.eager)
+    if args.json:
+        print(json.dumps({k: v for k, v in result.items() if k != 'modules'}, ensure_ascii=False))
+    else:
+        print_report(result, args.top)
+
+    if args.budget_ms is not None and result['import_ms'] > args.budget_ms:
+        print(f"冷启动导入耗时 {result['import_ms']} ms 超出预算 {args.budget_ms} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,6 +10,10 @@ MAIN_SCRIPT="app.py"
 PID_FILE="$APP_DIR/app.pid"
 LOG_FILE="$APP_DIR/app.log"
 PORT=5000
+# SSE 推送服务端口（与主进程同进程，asyncio 承载，空闲连接不占 WSGI 线程）
+STREAM_PORT="${NOTIFICATION_STREAM_PORT:-5001}"
+# 每条 SSE 连接占一个文件描述符
+OPEN_FILES_LIMIT=65535
 STOP_TIMEOUT=10
 START_WAIT=3
 
@@ -90,13 +94,17 @@ start() {
     # 启动前自动清理端口占用
     kill_port
 
+    if ! ulimit -n $OPEN_FILES_LIMIT 2>/dev/null; then
+        log_warn "无法将文件描述符上限调整为 $OPEN_FILES_LIMIT（当前 $(ulimit -n)），SSE 并发连接数将受限"
+    fi
+
     log_info "正在启动 $APP_NAME..."
-    nohup "$PYTHON_EXEC" "$MAIN_SCRIPT" > "$LOG_FILE" 2>&1 &
+    NOTIFICATION_STREAM_PORT=$STREAM_PORT nohup "$PYTHON_EXEC" "$MAIN_SCRIPT" > "$LOG_FILE" 2>&1 &
     echo $! > "$PID_FILE"
 
     sleep $START_WAIT
     if is_running; then
-        log_info "$APP_NAME 启动成功 (PID: $(cat $PID_FILE)，端口: $PORT)"
+        log_info "$APP_NAME 启动成功 (PID: $(cat $PID_FILE)，端口: $PORT，推送端口: $STREAM_PORT)"
     else
         log_error "$APP_NAME 启动失败，请查看日志："
         echo "----------------------------------------"
@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 from database import DatabasePool
 from services.ai_service import ai_service
+from services.project_similarity_service import project_feature_index
 import json
 import logging
 
@@ -476,58 +477,37 @@ class AIInsightService:
 
     @staticmethod
     def find_similar_projects(project_id, limit=5):
-        """基于地区/规模/状态的轻量相似项目推荐。"""
+        """基于项目特征向量的 k-NN 相似项目推荐（规模/地区/模块/接口/工期/问题/设备），附各特征贡献分。"""
         try:
             limit = max(1, min(int(limit or 5), 10))
             with DatabasePool.get_connection() as conn:
-                current = conn.execute(DatabasePool.format_sql('''
-                    SELECT id, project_name, hospital_name, province, city, status,
-                           COALESCE(icu_beds, 0) as icu_beds,
-                           COALESCE(operating_rooms, 0) as operating_rooms,
-                           COALESCE(pacu_beds, 0) as pacu_beds
-                    FROM projects
-                    WHERE id = ?
-                '''), (project_id,)).fetchone()
-                if not current:
+                project_feature_index.refresh(conn)
+                neighbors = project_feature_index.search(int(project_id), limit)
+                if not neighbors:
                     return []
 
-                current = dict(current)
-                rows = conn.execute(DatabasePool.format_sql('''
+                ids = [pid for pid, _, _ in neighbors]
+                placeholders = ','.join('?' * len(ids))
+                rows = conn.execute(DatabasePool.format_sql(f'''
                     SELECT id, project_name, hospital_name, province, city, status,
                            COALESCE(icu_beds, 0) as icu_beds,
                            COALESCE(operating_rooms, 0) as operating_rooms,
                            COALESCE(pacu_beds, 0) as pacu_beds,
                            progress
                     FROM projects
-                    WHERE id != ?
-                    ORDER BY updated_at DESC NULLS LAST, id DESC
-                    LIMIT 100
-                '''), (project_id,)).fetchall()
-
-            scored = []
-            for row in rows:
-                item = dict(row)
-                score = 0
-                if (item.get('province') or '') == (current.get('province') or '') and current.get('province'):
-                    score += 35
-                if (item.get('city') or '') == (current.get('city') or '') and current.get('city'):
-                    score += 25
-                if (item.get('status') or '') == (current.get('status') or ''):
-                    score += 15
-
-                current_scale = (current.get('icu_beds') or 0) + (current.get('operating_rooms') or 0) * 5 + (current.get('pacu_beds') or 0)
-                item_scale = (item.get('icu_beds') or 0) + (item.get('operating_rooms') or 0) * 5 + (item.get('pacu_beds') or 0)
-                scale_gap = abs(current_scale - item_scale)
-                score += max(0, 25 - min(scale_gap, 25))
-
-                if score <= 0:
+                    WHERE id IN ({placeholders})
+                '''), tuple(ids)).fetchall()
+
+            projects = {r['id']: dict(r) for r in rows}
+            result = []
+            for pid, score, contributions in neighbors:
+                item = projects.get(pid)
+                if not item:
                     continue
-
-                item['similarity_score'] = round(score, 1)
-                scored.append(item)
-
-            scored.sort(key=lambda x: (-(x.get('similarity_score') or 0), -(x.get('progress') or 0), x.get('id') or 0))
-            return scored[:limit]
+                item['similarity_score'] = score
+                item['feature_contributions'] = contributions
+                result.append(item)
+            return result
         except Exception as e:
             logger.error(f"Find Similar Projects Error: {e}")
             return []
@@ -4,10 +4,16 @@
 职责：标准库管理、文档解析、AI对齐、请求生成
 """
 
+import copy
+import difflib
+import hashlib
 import json
 import os
 import re
+import threading
 import xml.etree.ElementTree as ET
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from database import DatabasePool
 from services.ai_service import ai_service
@@ -16,6 +22,18 @@ from services.ai_service import ai_service
 class AlignmentService:
     """接口文档对齐核心服务"""
 
+    # 文档提取/解析结果缓存（按内容哈希）
+    DOC_CACHE_SIZE = 32
+    _doc_cache = OrderedDict()
+    _doc_cache_lock = threading.Lock()
+
+    # 规则预匹配阈值与 AI 分块参数
+    FIELD_OVERLAP_MATCHED = 0.8
+    FIELD_OVERLAP_MIN = 0.5
+    AI_CANDIDATES_PER_SPEC = 8
+    AI_CHUNK_SIZE = 8
+    AI_CONCURRENCY = 3
+
     @staticmethod
     def _table_columns(conn, table_name):
         """Return a set of column names for a table."""
@@ -72,15 +90,21 @@ class AlignmentService:
                     ORDER BY sort_order, id
                 '''), (spec_version,)).fetchall()
 
+                # 字段一次性按版本取回后分组，避免逐接口查询
+                fields_by_iface = defaultdict(list)
+                for f in conn.execute(DatabasePool.format_sql('''
+                    SELECT f.* FROM interface_spec_fields f
+                    JOIN interface_specs s ON f.spec_interface_id = s.id
+                    WHERE s.spec_version = ?
+                    ORDER BY f.sort_order, f.id
+                '''), (spec_version,)).fetchall():
+                    fd = dict(f)
+                    fields_by_iface[fd['spec_interface_id']].append(fd)
+
                 result = []
                 for iface in interfaces:
                     iface_dict = dict(iface)
-                    fields = conn.execute(DatabasePool.format_sql('''
-                        SELECT * FROM interface_spec_fields
-                        WHERE spec_interface_id = ?
-                        ORDER BY sort_order, id
-                    '''), (iface_dict['id'],)).fetchall()
-                    iface_dict['fields'] = [dict(f) for f in fields]
+                    iface_dict['fields'] = fields_by_iface.get(iface_dict['id'], [])
                     result.append(iface_dict)
                 return result
 
@@ -92,18 +116,22 @@ class AlignmentService:
                 ORDER BY interface_name, id
             '''), (spec_version,)).fetchall()
 
+            fields_by_iface = defaultdict(list)
+            for f in conn.execute(DatabasePool.format_sql('''
+                SELECT f.* FROM interface_spec_fields f
+                JOIN interface_specs s ON f.spec_id = s.id
+                WHERE COALESCE(NULLIF(s.category, ''), '默认标准') = ?
+                  AND COALESCE(s.spec_source, 'our') IN ('our', 'standard', 'our_standard')
+                ORDER BY f.field_order, f.id
+            '''), (spec_version,)).fetchall():
+                fd = dict(f)
+                fields_by_iface[fd['spec_id']].append(fd)
+
             result = []
             for iface in interfaces:
                 iface_dict = dict(iface)
-                fields = conn.execute(DatabasePool.format_sql('''
-                    SELECT * FROM interface_spec_fields
-                    WHERE spec_id = ?
-                    ORDER BY field_order, id
-                '''), (iface_dict['id'],)).fetchall()
-
                 normalized_fields = []
-                for f in fields:
-                    fd = dict(f)
+                for fd in fields_by_iface.get(iface_dict['id'], []):
                     normalized_fields.append({
                         **fd,
                         'field_label': fd.get('field_name_cn') or fd.get('description') or '',
@@ -627,21 +655,49 @@ class AlignmentService:
         return interfaces if interfaces else None
 
     @staticmethod
-    def parse_vendor_document(file_path=None, raw_text=None):
-        """
-        解析第三方接口文档 —— 自动检测格式并选择策略
-        返回结构化的接口列表
-        """
+    def _content_key(file_path=None, raw_text=None):
+        """文档内容哈希（文件按扩展名区分，提取方式不同）"""
+        digest = hashlib.sha256()
         if file_path:
-            text = AlignmentService._extract_text(file_path)
-        elif raw_text:
-            text = raw_text
+            digest.update(os.path.splitext(file_path)[1].lower().encode('utf-8'))
+            with open(file_path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(block)
         else:
-            return []
+            digest.update(b'raw:' + (raw_text or '').encode('utf-8'))
+        return digest.hexdigest()
 
-        if not text or not text.strip():
-            return []
+    @staticmethod
+    def load_vendor_document(file_path=None, raw_text=None):
+        """
+        提取并解析第三方文档，返回 (文本, 接口列表)
+        同一内容只提取/解析一次：结果按内容哈希缓存，重复上传同一文档不再调用 AI
+        """
+        if file_path:
+            if not os.path.exists(file_path):
+                return '', []
+        elif not raw_text:
+            return '', []
+
+        key = AlignmentService._content_key(file_path, raw_text)
+        with AlignmentService._doc_cache_lock:
+            cached = AlignmentService._doc_cache.get(key)
+            if cached:
+                AlignmentService._doc_cache.move_to_end(key)
+                return cached[0], copy.deepcopy(cached[1])
+
+        text = AlignmentService._extract_text(file_path) if file_path else raw_text
+        interfaces = AlignmentService.parse_vendor_text(text) if text and text.strip() else []
+        if interfaces:
+            with AlignmentService._doc_cache_lock:
+                AlignmentService._doc_cache[key] = (text, copy.deepcopy(interfaces))
+                while len(AlignmentService._doc_cache) > AlignmentService.DOC_CACHE_SIZE:
+                    AlignmentService._doc_cache.popitem(last=False)
+        return text or '', interfaces
 
+    @staticmethod
+    def parse_vendor_text(text):
+        """按检测到的格式解析文档文本，程序化解析失败时走 AI 提取"""
         fmt = AlignmentService._detect_format(text)
 
         # 优先尝试程序化解析（准确性高、速度快、不消耗 AI 额度）
@@ -661,6 +717,14 @@ class AlignmentService:
         # 程序化解析失败或格式为纯文本 → 走 AI 提取
         return AlignmentService._ai_extract_vendor(text)
 
+    @staticmethod
+    def parse_vendor_document(file_path=None, raw_text=None):
+        """
+        解析第三方接口文档 —— 自动检测格式并选择策略
+        返回结构化的接口列表
+        """
+        return AlignmentService.load_vendor_document(file_path=file_path, raw_text=raw_text)[1]
+
     # ================================================================
     #  AI 调用层
     # ================================================================
@@ -742,7 +806,12 @@ class AlignmentService:
     def run_alignment(project_id, spec_version, vendor_name,
                       file_path=None, raw_text=None, created_by='system'):
         """
-        完整对齐流程：解析 → 对齐 → 持久化
+        分阶段对齐流程：
+        1. 提取/解析对方文档（按内容哈希只做一次）
+        2. 批量加载我方标准及字段
+        3. 按编码/名称/字段重合度做确定性预匹配，结果直接落库
+        4. 仅把不确定的接口分块、有界并发地交给 AI
+        5. 每块完成即落库并更新会话进度，最后汇总统计
         """
         with DatabasePool.get_connection() as conn:
             # 创建会话
@@ -760,8 +829,8 @@ class AlignmentService:
             conn.commit()
 
         try:
-            # Step 1: 解析对方文档
-            vendor_interfaces = AlignmentService.parse_vendor_document(
+            # Step 1: 解析对方文档（文本只提取一次，同时用于解析与留存）
+            doc_text, vendor_interfaces = AlignmentService.load_vendor_document(
                 file_path=file_path, raw_text=raw_text
             )
             if not vendor_interfaces:
@@ -770,12 +839,6 @@ class AlignmentService:
                 return {'success': False, 'session_id': session_id,
                         'message': '未能从文档中解析到任何接口'}
 
-            # 保存解析出的原始文本
-            doc_text = ''
-            if file_path:
-                doc_text = AlignmentService._extract_text(file_path) or ''
-            elif raw_text:
-                doc_text = raw_text
             with DatabasePool.get_connection() as conn:
                 conn.execute(
                     DatabasePool.format_sql('UPDATE alignment_sessions SET vendor_doc_text=?, status=? WHERE id=?'),
@@ -790,17 +853,27 @@ class AlignmentService:
                 return {'success': False, 'session_id': session_id,
                         'message': f'标准 [{spec_version}] 中没有接口，请先维护标准库'}
 
-            # Step 3: AI 对齐
-            alignment_result = AlignmentService._ai_align(
-                spec_interfaces, vendor_interfaces
-            )
-
-            # Step 4: 持久化
-            AlignmentService._save_alignment_results(
-                session_id, spec_interfaces, alignment_result
-            )
-
-            # Step 5: 更新会话统计
+            # Step 3: 确定性预匹配
+            rule_items, ambiguous, claimed = AlignmentService._prematch(spec_interfaces, vendor_interfaces)
+            alignments = list(rule_items)
+            AlignmentService._save_alignment_results(session_id, spec_interfaces, {'alignments': rule_items})
+            AlignmentService._update_progress(session_id, len(alignments), len(spec_interfaces))
+
+            # Step 4: 不确定的接口分块交给 AI，每块完成即落库
+            for chunk_items in AlignmentService._ai_align_chunks(ambiguous, vendor_interfaces):
+                alignments.extend(chunk_items)
+                AlignmentService._save_alignment_results(session_id, spec_interfaces, {'alignments': chunk_items})
+                AlignmentService._update_progress(session_id, len(alignments), len(spec_interfaces))
+
+            # Step 5: 对方多出的接口与会话统计
+            claimed.update(a['vendor_idx'] for a in alignments if a.get('vendor_idx') is not None)
+            extras = [
+                {'vendor_idx': idx, 'name': v.get('interface_name') or v.get('view_name') or '',
+                 'suggestion': '对方提供但我方标准未定义，请确认是否需要对接'}
+                for idx, v in enumerate(vendor_interfaces) if idx not in claimed
+            ]
+            AlignmentService._save_alignment_results(session_id, spec_interfaces, {'alignments': [], 'extras': extras})
+            alignment_result = AlignmentService._summarize(spec_interfaces, alignments, extras)
             AlignmentService._finalize_session(session_id, alignment_result)
 
             return {
@@ -819,9 +892,172 @@ class AlignmentService:
             return {'success': False, 'session_id': session_id,
                     'message': f'对齐过程出错: {str(e)}'}
 
+    # ---------------- 确定性预匹配 ----------------
+
+    @staticmethod
+    def _norm(value):
+        return re.sub(r'[\W_]+', '', str(value or '').lower())
+
+    @staticmethod
+    def _codes(iface):
+        return {
+            AlignmentService._norm(iface.get(key))
+            for key in ('interface_code', 'transcode', 'view_name', 'action_name')
+        } - {''}
+
+    @staticmethod
+    def _field_names(iface):
+        return {AlignmentService._norm(f.get('field_name')): f for f in iface.get('fields') or [] if f.get('field_name')}
+
+    @staticmethod
+    def _pair_score(spec, vendor):
+        """返回 (得分, 编码/名称是否命中, 字段重合度或 None)"""
+        spec_name = AlignmentService._norm(spec.get('interface_name'))
+        vendor_name = AlignmentService._norm(vendor.get('interface_name'))
+        spec_fields = set(AlignmentService._field_names(spec))
+        vendor_fields = set(AlignmentService._field_names(vendor))
+        overlap = len(spec_fields & vendor_fields) / len(spec_fields | vendor_fields) \
+            if spec_fields and vendor_fields else None
+
+        if AlignmentService._codes(spec) & AlignmentService._codes(vendor):
+            return 1.0, True, overlap
+        if spec_name and spec_name == vendor_name:
+            return 0.9, True, overlap
+        name_sim = difflib.SequenceMatcher(None, spec_name, vendor_name).ratio() if spec_name and vendor_name else 0.0
+        return round(0.6 * name_sim + 0.4 * (overlap or 0.0), 4), False, overlap
+
+    @staticmethod
+    def _rule_item(spec, vendor, vendor_idx, overlap):
+        vendor_fields = AlignmentService._field_names(vendor)
+        mappings = []
+        missing_required = []
+        for f in spec.get('fields') or []:
+            vf = vendor_fields.get(AlignmentService._norm(f.get('field_name')))
+            if vf:
+                mappings.append({'spec_field': f.get('field_name'), 'vendor_field': vf.get('field_name'),
+                                 'vendor_type': vf.get('field_type', ''), 'transform': None})
+            elif f.get('is_required'):
+                missing_required.append(f.get('field_name'))
+
+        matched = overlap is None or overlap >= AlignmentService.FIELD_OVERLAP_MATCHED
+        return {
+            'spec_id': spec['id'],
+            'match_status': 'matched' if matched else 'partial',
+            'confidence': 0.95 if matched else 0.8,
+            'vendor_idx': vendor_idx,
+            'vendor_interface_name': vendor.get('interface_name'),
+            'vendor_view_name': vendor.get('view_name'),
+            'vendor_protocol': vendor.get('protocol'),
+            'vendor_description': vendor.get('description'),
+            'diff_summary': '' if matched else f'规则匹配：字段重合度 {overlap:.0%}',
+            'risk_note': f"对方缺少必填字段: {', '.join(missing_required)}" if missing_required else '',
+            'field_mappings': mappings,
+            'match_source': 'rule',
+        }
+
     @staticmethod
-    def _ai_align(spec_interfaces, vendor_interfaces):
-        """调用 AI 进行标准 vs 对方的对齐比对"""
+    def _missing_item(spec, diff_summary='', source='rule'):
+        return {
+            'spec_id': spec['id'],
+            'match_status': 'missing',
+            'confidence': 0,
+            'vendor_idx': None,
+            'diff_summary': diff_summary,
+            'risk_note': '必选接口缺失' if spec.get('is_required') else '',
+            'field_mappings': [],
+            'match_source': source,
+        }
+
+    @staticmethod
+    def _prematch(spec_interfaces, vendor_interfaces):
+        """
+        编码/名称唯一命中且字段重合度达标的接口直接判定；其余为不确定项，
+        附带从未被占用的对方接口中按得分挑出的候选。
+        返回 (规则结果, [(标准接口, 候选序号)], 已占用的对方序号)
+        """
+        scores = {}
+        hits = defaultdict(list)
+        for spec in spec_interfaces:
+            for idx, vendor in enumerate(vendor_interfaces):
+                score, hit, overlap = AlignmentService._pair_score(spec, vendor)
+                scores[(spec['id'], idx)] = (score, overlap)
+                if hit and (overlap is None or overlap >= AlignmentService.FIELD_OVERLAP_MIN):
+                    hits[spec['id']].append(idx)
+
+        confident = sorted(
+            ((spec, hits[spec['id']][0]) for spec in spec_interfaces if len(hits[spec['id']]) == 1),
+            key=lambda pair: -scores[(pair[0]['id'], pair[1])][0]
+        )
+        claimed = set()
+        items = []
+        decided = set()
+        for spec, idx in confident:
+            if idx in claimed:
+                continue
+            claimed.add(idx)
+            decided.add(spec['id'])
+            items.append(AlignmentService._rule_item(spec, vendor_interfaces[idx], idx, scores[(spec['id'], idx)][1]))
+
+        pool = [idx for idx in range(len(vendor_interfaces)) if idx not in claimed]
+        ambiguous = []
+        for spec in spec_interfaces:
+            if spec['id'] in decided:
+                continue
+            if not pool:
+                items.append(AlignmentService._missing_item(spec, '对方接口已全部匹配，未找到候选'))
+                continue
+            candidates = sorted(pool, key=lambda idx: (-scores[(spec['id'], idx)][0], idx))
+            ambiguous.append((spec, candidates[:AlignmentService.AI_CANDIDATES_PER_SPEC]))
+        return items, ambiguous, claimed
+
+    # ---------------- AI 分块对齐 ----------------
+
+    @staticmethod
+    def _ai_align_chunks(ambiguous, vendor_interfaces):
+        """不确定项按块并发调用 AI（并发数有上限），按完成顺序逐块产出结果"""
+        if not ambiguous:
+            return
+        size = AlignmentService.AI_CHUNK_SIZE
+        chunks = [ambiguous[i:i + size] for i in range(0, len(ambiguous), size)]
+        with ThreadPoolExecutor(max_workers=min(AlignmentService.AI_CONCURRENCY, len(chunks))) as executor:
+            futures = {
+                executor.submit(AlignmentService._align_chunk, chunk, vendor_interfaces): chunk
+                for chunk in chunks
+            }
+            for future in as_completed(futures):
+                chunk = futures[future]
+                try:
+                    yield future.result()
+                except Exception as e:
+                    print(f"AI 对齐分块失败: {e}")
+                    yield [AlignmentService._missing_item(spec, 'AI 对齐失败，需人工确认', 'ai') for spec, _ in chunk]
+
+    @staticmethod
+    def _align_chunk(chunk, vendor_interfaces):
+        specs = [spec for spec, _ in chunk]
+        candidate_idx = sorted({idx for _, candidates in chunk for idx in candidates})
+        ai_result = AlignmentService._ai_align(specs, vendor_interfaces, candidate_idx)
+
+        by_spec = {}
+        for item in ai_result.get('alignments', []):
+            try:
+                spec_id = int(item.get('spec_id'))
+            except (TypeError, ValueError):
+                continue
+            vendor_idx = item.get('vendor_idx')
+            if not isinstance(vendor_idx, int) or not 0 <= vendor_idx < len(vendor_interfaces):
+                vendor_idx = None
+            item = dict(item, spec_id=spec_id, vendor_idx=vendor_idx, match_source='ai')
+            if vendor_idx is not None:
+                vendor = vendor_interfaces[vendor_idx]
+                item.setdefault('vendor_protocol', vendor.get('protocol'))
+                item.setdefault('vendor_description', vendor.get('description'))
+            by_spec[spec_id] = item
+        return [by_spec.get(spec['id']) or AlignmentService._missing_item(spec, 'AI 未给出匹配结果', 'ai') for spec in specs]
+
+    @staticmethod
+    def _ai_align(spec_interfaces, vendor_interfaces, candidate_idx=None):
+        """调用 AI 进行标准 vs 对方的对齐比对；candidate_idx 为空时发送全部对方接口"""
         # 精简数据发给 AI，避免超 token
         spec_summary = []
         for s in spec_interfaces:
@@ -837,8 +1073,11 @@ class AlignmentService:
                 'fields': fields_brief,
             })
 
+        if candidate_idx is None:
+            candidate_idx = range(min(len(vendor_interfaces), 50))
         vendor_summary = []
-        for i, v in enumerate(vendor_interfaces[:50]):
+        for i in candidate_idx:
+            v = vendor_interfaces[i]
             fields_brief = [f.get('field_name', '') for f in v.get('fields', [])[:20]]
             vendor_summary.append({
                 'idx': i,
@@ -850,12 +1089,12 @@ class AlignmentService:
                 'fields': fields_brief,
             })
 
-        system_prompt = """你是医疗信息化接口集成专家。将"我方标准接口"与"第三方接口"逐条匹配。
+        system_prompt = """你是医疗信息化接口集成专家。将"我方标准接口"与"第三方候选接口"逐条匹配。
 
 匹配规则：
 - matched: 用途高度一致，可直接对接
 - partial: 用途相似但名称/字段有差异
-- missing: 我方需要但对方未提供
+- missing: 我方需要但候选中没有对应接口
 
 返回 JSON（不要任何多余文字）：
 {
@@ -873,33 +1112,33 @@ class AlignmentService:
         {"spec_field": "我方字段名", "vendor_field": "对方字段名", "transform": "转换说明或null"}
       ]
     }
-  ],
-  "extras": [
-    {"vendor_idx": 对方序号, "name": "对方多出的接口名", "suggestion": "建议"}
-  ],
-  "summary": "一段话总结对齐情况(中文)",
-  "risk_assessment": "关键风险点(中文)"
+  ]
 }"""
 
         user_content = f"""## 我方标准接口 ({len(spec_summary)}个)
 {json.dumps(spec_summary, ensure_ascii=False)}
 
-## 第三方接口 ({len(vendor_summary)}个)
+## 第三方候选接口 ({len(vendor_summary)}个)
 {json.dumps(vendor_summary, ensure_ascii=False)}"""
 
         resp = ai_service.call_ai_api(system_prompt, user_content, task_type="json")
         result = AlignmentService._safe_parse_json(resp)
         if not result:
-            result = {'alignments': [], 'extras': [], 'summary': 'AI 解析失败',
-                      'risk_assessment': ''}
+            result = {'alignments': []}
         return result
 
+    # ---------------- 持久化与统计 ----------------
+
     @staticmethod
     def _save_alignment_results(session_id, spec_interfaces, ai_result):
-        """将 AI 对齐结果存入数据库"""
+        """将一批对齐结果存入数据库（分块调用，每块独立提交）"""
         spec_map = {s['id']: s for s in spec_interfaces}
 
         with DatabasePool.get_connection() as conn:
+            # 旧库字段映射表以 alignment_result_id 关联，新库为 result_id
+            map_cols = AlignmentService._table_columns(conn, 'alignment_field_maps')
+            result_fk = 'alignment_result_id' if 'alignment_result_id' in map_cols else 'result_id'
+
             for item in ai_result.get('alignments', []):
                 spec_id = item.get('spec_id')
                 if spec_id not in spec_map:
@@ -909,8 +1148,8 @@ class AlignmentService:
                     INSERT INTO alignment_results
                     (session_id, spec_interface_id, match_status, confidence,
                      vendor_interface_name, vendor_view_name, vendor_protocol,
-                     vendor_description, diff_summary, risk_note)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                     vendor_description, diff_summary, risk_note, match_source)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 '''
                 if DatabasePool.is_postgres():
                     insert_sql += ' RETURNING id'
@@ -924,51 +1163,83 @@ class AlignmentService:
                     item.get('vendor_description'),
                     item.get('diff_summary', ''),
                     item.get('risk_note', ''),
+                    item.get('match_source', 'ai'),
                 ))
                 result_id = DatabasePool.get_inserted_id(insert_cursor)
 
                 # 保存字段映射
-                for fm in item.get('field_mappings', []):
-                    # 查找 spec_field_id
-                    spec_iface = spec_map.get(spec_id, {})
-                    spec_field_id = None
-                    for f in spec_iface.get('fields', []):
-                        if f['field_name'] == fm.get('spec_field'):
-                            spec_field_id = f['id']
-                            break
-                    if not spec_field_id:
-                        continue
-
-                    conn.execute(DatabasePool.format_sql('''
+                field_ids = {f['field_name']: f['id'] for f in spec_map[spec_id].get('fields', [])}
+                map_rows = [
+                    (result_id, field_ids[fm.get('spec_field')], fm.get('vendor_field', ''),
+                     fm.get('vendor_type', ''), fm.get('transform'), item.get('confidence', 0))
+                    for fm in item.get('field_mappings') or []
+                    if fm.get('spec_field') in field_ids
+                ]
+                if map_rows:
+                    conn.cursor().executemany(DatabasePool.format_sql(f'''
                         INSERT INTO alignment_field_maps
-                        (alignment_result_id, spec_field_id,
+                        ({result_fk}, spec_field_id,
                          vendor_field_name, vendor_field_type,
                          map_status, transform_rule, confidence)
                         VALUES (?, ?, ?, ?, 'auto', ?, ?)
-                    '''), (
-                        result_id, spec_field_id,
-                        fm.get('vendor_field', ''),
-                        fm.get('vendor_type', ''),
-                        fm.get('transform'),
-                        item.get('confidence', 0),
-                    ))
+                    '''), map_rows)
 
             # 处理对方多出的接口
-            for extra in ai_result.get('extras', []):
-                conn.execute(DatabasePool.format_sql('''
+            extra_rows = [(session_id, extra.get('name', ''), extra.get('suggestion', ''), '')
+                          for extra in ai_result.get('extras', [])]
+            if extra_rows:
+                conn.cursor().executemany(DatabasePool.format_sql('''
                     INSERT INTO alignment_results
                     (session_id, spec_interface_id, match_status, confidence,
                      vendor_interface_name, diff_summary, risk_note)
                     VALUES (?, 0, 'extra', 0, ?, ?, ?)
-                '''), (
-                    session_id,
-                    extra.get('name', ''),
-                    extra.get('suggestion', ''),
-                    '',
-                ))
+                '''), extra_rows)
 
             conn.commit()
 
+    @staticmethod
+    def _update_progress(session_id, done, total):
+        with DatabasePool.get_connection() as conn:
+            conn.execute(
+                DatabasePool.format_sql('UPDATE alignment_sessions SET progress_done=?, progress_total=? WHERE id=?'),
+                (done, total, session_id))
+
+    @staticmethod
+    def get_session_progress(session_id):
+        """对齐进度（对齐进行中可轮询）"""
+        with DatabasePool.get_connection() as conn:
+            row = conn.execute(DatabasePool.format_sql('''
+                SELECT id, status, progress_done, progress_total, ai_summary
+                FROM alignment_sessions WHERE id = ?
+            '''), (session_id,)).fetchone()
+        if not row:
+            return None
+        progress = dict(row)
+        total = progress.get('progress_total') or 0
+        progress['percent'] = round((progress.get('progress_done') or 0) * 100 / total) if total else 0
+        return progress
+
+    @staticmethod
+    def _summarize(spec_interfaces, alignments, extras):
+        """汇总各块结果，生成总体结论（不再额外调用 AI）"""
+        counts = defaultdict(int)
+        for item in alignments:
+            counts[item.get('match_status')] += 1
+        rule_count = sum(1 for item in alignments if item.get('match_source') == 'rule')
+        summary = (
+            f"共 {len(spec_interfaces)} 个标准接口：匹配 {counts['matched']} 个、部分匹配 {counts['partial']} 个、"
+            f"缺失 {counts['missing']} 个；对方多出 {len(extras)} 个接口。"
+            f"其中 {rule_count} 个由规则直接判定，{len(alignments) - rule_count} 个经 AI 比对。"
+        )
+        spec_map = {s['id']: s for s in spec_interfaces}
+        risks = [
+            spec_map[item['spec_id']]['interface_name']
+            for item in alignments
+            if item.get('match_status') == 'missing' and spec_map.get(item['spec_id'], {}).get('is_required')
+        ]
+        risk_assessment = f"必选接口缺失：{'、'.join(risks)}" if risks else ''
+        return {'alignments': alignments, 'extras': extras, 'summary': summary, 'risk_assessment': risk_assessment}
+
     @staticmethod
     def _finalize_session(session_id, ai_result):
         """统计并更新会话"""
@@ -6,10 +6,10 @@
 
 from database import DatabasePool
 from services.ai_service import ai_service
+from services.issue_cluster_service import issue_cluster_engine
 import json
 import hashlib
 import os
-import re
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional, Union
 
@@ -622,7 +622,7 @@ class AnalyticsService:
                 ORDER BY risk_score DESC, progress ASC
                 LIMIT 5
             ''')).fetchall()
-            high_risk_projects = [dict(r) for r in high_risk_projects if float(r.get('risk_score') or 0) >= 50]
+            high_risk_projects = [p for p in map(dict, high_risk_projects) if float(p.get('risk_score') or 0) >= 50]
 
         fallback_lines = [
             f"今日全局巡航：高优预警 {len(high_warnings)} 条，沉默人员 {len(silent_people)} 人，高风险项目 {len(high_risk_projects)} 个。"
@@ -902,70 +902,73 @@ class AnalyticsService:
         }
 
     def get_issue_pattern_clusters(self, days: int = 30, min_count: int = 2) -> Dict[str, Any]:
-        """跨项目问题模式识别：对近N天未解决问题做轻量聚类。"""
+        """跨项目问题模式识别：按 MinHash/LSH 相似簇对近N天未解决问题分组。"""
         days = max(1, min(int(days or 30), 180))
         min_count = max(1, min(int(min_count or 2), 20))
         cutoff = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+        sql = DatabasePool.format_sql('''
+            SELECT i.id, i.project_id, i.description, i.severity, i.status, i.created_at, p.project_name,
+                   s.text_hash, s.cluster_id
+            FROM issues i
+            JOIN projects p ON p.id = i.project_id
+            LEFT JOIN issue_signatures s ON s.issue_id = i.id
+            WHERE i.created_at >= ?
+              AND i.status != '已解决'
+            ORDER BY i.created_at DESC
+        ''')
 
         with DatabasePool.get_connection() as conn:
-            rows = conn.execute(DatabasePool.format_sql('''
-                SELECT i.id, i.project_id, i.description, i.severity, i.status, i.created_at, p.project_name
-                FROM issues i
-                JOIN projects p ON p.id = i.project_id
-                WHERE i.created_at >= ?
-                  AND i.status != '已解决'
-                ORDER BY i.created_at DESC
-            '''), (cutoff,)).fetchall()
+            rows = [dict(r) for r in conn.execute(sql, (cutoff,)).fetchall()]
+            # 未经 index_issue 写入（企微/一句话上报等）或描述已修改的问题在此补算签名并归簇
+            if issue_cluster_engine.sync(conn, rows):
+                conn.commit()
+                rows = [dict(r) for r in conn.execute(sql, (cutoff,)).fetchall()]
 
-        stop_words = {'问题', '异常', '失败', '系统', '接口', '项目', '出现', '无法', '进行', '需要', '已经', '相关', '以及'}
         clusters = {}
-        for row in rows:
-            issue = dict(row)
-            text = str(issue.get('description') or '')
-            tokens = re.findall(r'[\u4e00-\u9fa5A-Za-z0-9]{2,}', text)
-            tokens = [t for t in tokens if t not in stop_words]
-            if not tokens:
-                key = '其他'
-            else:
-                # 使用最长词作为简易主题键
-                key = sorted(tokens, key=lambda x: len(x), reverse=True)[0][:20]
-            cluster = clusters.setdefault(key, {
-                'pattern': key,
+        for issue in rows:
+            # cluster_id 为空表示描述中没有可用文本
+            cluster = clusters.setdefault(issue.get('cluster_id'), {
+                'cluster_id': issue.get('cluster_id'),
                 'count': 0,
                 'high_severity_count': 0,
                 'projects': set(),
-                'samples': []
+                'members': []
             })
             cluster['count'] += 1
             if issue.get('severity') == '高':
                 cluster['high_severity_count'] += 1
             cluster['projects'].add(issue.get('project_name'))
-            if len(cluster['samples']) < 3:
-                cluster['samples'].append({
-                    'issue_id': issue.get('id'),
-                    'project_name': issue.get('project_name'),
-                    'description': text[:120]
-                })
+            if len(cluster['members']) < 50:
+                cluster['members'].append(issue)
+
+        qualified = [c for c in clusters.values() if c['count'] >= min_count]
+        qualified.sort(key=lambda c: (-c['count'], -c['high_severity_count'], c['cluster_id'] is None, c['cluster_id'] or 0))
 
         cluster_list = []
-        for _, cluster in clusters.items():
-            if cluster['count'] < min_count:
-                continue
+        for cluster in qualified[:20]:
+            members = cluster['members']
+            pattern = '其他'
+            if cluster['cluster_id'] is not None:
+                pattern = issue_cluster_engine.label(m.get('description') for m in members)
             cluster_list.append({
-                'pattern': cluster['pattern'],
+                'cluster_id': cluster['cluster_id'],
+                'pattern': pattern,
                 'count': cluster['count'],
                 'high_severity_count': cluster['high_severity_count'],
                 'project_count': len(cluster['projects']),
                 'projects': sorted(list(cluster['projects']))[:10],
-                'samples': cluster['samples']
+                'samples': [{
+                    'issue_id': m.get('id'),
+                    'project_name': m.get('project_name'),
+                    'description': str(m.get('description') or '')[:120]
+                } for m in members[:3]]
             })
-        cluster_list.sort(key=lambda x: (-(x.get('count') or 0), -(x.get('high_severity_count') or 0), x.get('pattern') or ''))
 
         return {
             'period_days': days,
             'total_open_issues': len(rows),
-            'cluster_count': len(cluster_list),
-            'clusters': cluster_list[:20]
+            'cluster_count': len(qualified),
+            'clusters': cluster_list
         }
 
     def get_device_failure_patterns(self, days: int = 30) -> Dict[str, Any]:
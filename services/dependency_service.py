@@ -4,9 +4,13 @@
 - 依赖关系CRUD
 - 关键路径计算 (Critical Path Method)
 - 影响分析：当某任务延误时，自动识别下游受影响任务
+- 项目级依赖图内存缓存：在线拓扑序（Pearce–Kelly）增量检测循环依赖；
+  以 project_data_versions（触发器维护）判断是否过期，其他进程的写入也能立即感知
 """
 
 import logging
+import threading
+import time
 from datetime import datetime, timedelta
 from collections import defaultdict, deque
 from database import DatabasePool
@@ -14,6 +18,249 @@ from database import DatabasePool
 logger = logging.getLogger(__name__)
 
 
+class ProjectDependencyGraph:
+    """单个项目的依赖 DAG：前驱/后继邻接表 + 在线维护的拓扑序"""
+
+    def __init__(self, project_id, task_ids, edges, version=0, data_version=0):
+        self.project_id = project_id
+        self.version = version
+        self.data_version = data_version
+        self.loaded_at = time.time()
+        self.succ = {tid: set() for tid in task_ids}
+        self.pred = {tid: set() for tid in task_ids}
+        self.edge_ids = {}
+        self.edge_lookup = {}
+        self.edge_types = {}
+        for dep_id, task_id, depends_on, *rest in edges:
+            if task_id in self.succ and depends_on in self.succ:
+                self._link(dep_id, task_id, depends_on, rest[0] if rest else None)
+        self.ord = {}
+        self.acyclic = self._initial_order(task_ids)
+
+    def _link(self, dep_id, task_id, depends_on, dependency_type=None):
+        self.succ[depends_on].add(task_id)
+        self.pred[task_id].add(depends_on)
+        self.edge_ids[dep_id] = (task_id, depends_on)
+        self.edge_lookup[(task_id, depends_on)] = dep_id
+        self.edge_types[(task_id, depends_on)] = dependency_type or 'finish_to_start'
+
+    def _initial_order(self, task_ids):
+        in_degree = {tid: len(self.pred[tid]) for tid in task_ids}
+        queue = deque([tid for tid in task_ids if in_degree[tid] == 0])
+        order = []
+        while queue:
+            current = queue.popleft()
+            order.append(current)
+            for successor in sorted(self.succ[current]):
+                in_degree[successor] -= 1
+                if in_degree[successor] == 0:
+                    queue.append(successor)
+        self.ord = {tid: idx for idx, tid in enumerate(order)}
+        return len(order) == len(task_ids)
+
+    def has_node(self, task_id):
+        return task_id in self.succ
+
+    def has_edge(self, task_id, depends_on):
+        return (task_id, depends_on) in self.edge_lookup
+
+    def topo_order(self):
+        if not self.acyclic:
+            return None
+        return sorted(self.ord, key=self.ord.get)
+
+    def _forward(self, start, upper):
+        """从 start 沿后继方向搜索拓扑序不超过 upper 的节点"""
+        seen = {start}
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for nxt in self.succ[node]:
+                if nxt not in seen and (upper is None or self.ord[nxt] <= upper):
+                    seen.add(nxt)
+                    stack.append(nxt)
+        return seen
+
+    def _backward(self, start, lower):
+        seen = {start}
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for prv in self.pred[node]:
+                if prv not in seen and self.ord[prv] >= lower:
+                    seen.add(prv)
+                    stack.append(prv)
+        return seen
+
+    def would_create_cycle(self, task_id, depends_on):
+        """添加 depends_on -> task_id 后是否成环：仅搜索拓扑序落在两者之间的受影响子图"""
+        if task_id == depends_on:
+            return True
+        if not self.acyclic:
+            return depends_on in self._forward(task_id, None)
+        if self.ord[depends_on] < self.ord[task_id]:
+            return False
+        return depends_on in self._forward(task_id, self.ord[depends_on])
+
+    def add_edge(self, dep_id, task_id, depends_on, dependency_type=None):
+        """插入边并局部重排拓扑序；若会成环则不修改并返回 False"""
+        if self.would_create_cycle(task_id, depends_on):
+            return False
+        if self.acyclic and self.ord[depends_on] > self.ord[task_id]:
+            lower, upper = self.ord[task_id], self.ord[depends_on]
+            forward = sorted(self._forward(task_id, upper), key=self.ord.get)
+            backward = sorted(self._backward(depends_on, lower), key=self.ord.get)
+            slots = sorted(self.ord[node] for node in forward + backward)
+            for node, slot in zip(backward + forward, slots):
+                self.ord[node] = slot
+        self._link(dep_id, task_id, depends_on, dependency_type)
+        self.version += 1
+        return True
+
+    def remove_edge(self, dep_id):
+        pair = self.edge_ids.pop(dep_id, None)
+        if not pair:
+            return False
+        task_id, depends_on = pair
+        self.edge_lookup.pop(pair, None)
+        self.edge_types.pop(pair, None)
+        self.succ[depends_on].discard(task_id)
+        self.pred[task_id].discard(depends_on)
+        # 删边不会破坏已有拓扑序；原本有环的图则重新判定
+        if not self.acyclic:
+            self.acyclic = self._initial_order(list(self.succ))
+        self.version += 1
+        return True
+
+    def downstream(self, task_id):
+        """按层 BFS 返回 [(task_id, parent_id, depth), ...]"""
+        result = []
+        visited = {task_id}
+        frontier = [task_id]
+        depth = 0
+        while frontier:
+            depth += 1
+            next_frontier = []
+            for current in frontier:
+                for child in sorted(self.succ.get(current, ())):
+                    if child not in visited:
+                        visited.add(child)
+                        result.append((child, current, depth))
+                        next_frontier.append(child)
+            frontier = next_frontier
+        return result
+
+
+class DependencyGraphCache:
+    """按项目缓存依赖图；以 project_data_versions 中的版本号判断失效（覆盖其他进程与旁路写入），
+    graph.version 为进程内版本号，每次增量修改或重新加载时递增，供排程结果缓存作键"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._graphs = {}
+        self._task_projects = {}
+        self._versions = defaultdict(int)
+
+    def version(self, project_id):
+        return self._versions[project_id]
+
+    @staticmethod
+    def data_version(conn, project_id):
+        row = conn.execute(DatabasePool.format_sql(
+            'SELECT version FROM project_data_versions WHERE project_id = ?'
+        ), (project_id,)).fetchone()
+        return row[0] if row else 0
+
+    def _load(self, conn, project_id, data_version):
+        task_rows = conn.execute(DatabasePool.format_sql('''
+            SELECT t.id
+            FROM tasks t
+            JOIN project_stages s ON t.stage_id = s.id
+            WHERE s.project_id = ?
+            ORDER BY s.stage_order, t.id
+        '''), (project_id,)).fetchall()
+        edge_rows = conn.execute(DatabasePool.format_sql('''
+            SELECT td.id, td.task_id, td.depends_on_task_id, td.dependency_type
+            FROM task_dependencies td
+            JOIN tasks t ON td.task_id = t.id
+            JOIN project_stages s ON t.stage_id = s.id
+            WHERE s.project_id = ?
+        '''), (project_id,)).fetchall()
+        task_ids = [row['id'] for row in task_rows]
+        edges = [(row['id'], row['task_id'], row['depends_on_task_id'], row['dependency_type']) for row in edge_rows]
+        self._versions[project_id] += 1
+        graph = ProjectDependencyGraph(project_id, task_ids, edges, self._versions[project_id], data_version)
+        for tid in task_ids:
+            self._task_projects[tid] = project_id
+        return graph
+
+    def get(self, conn, project_id, required_tasks=()):
+        """取项目依赖图；数据版本号变化、缺少所需任务（新建任务）或被失效时重新加载"""
+        data_version = self.data_version(conn, project_id)
+        with self._lock:
+            graph = self._graphs.get(project_id)
+            stale = (
+                graph is None
+                or graph.version != self._versions[project_id]
+                or graph.data_version != data_version
+                or any(not graph.has_node(tid) for tid in required_tasks)
+            )
+            if stale:
+                graph = self._load(conn, project_id, data_version)
+                self._graphs[project_id] = graph
+            return graph
+
+    def project_of(self, conn, task_id):
+        with self._lock:
+            project_id = self._task_projects.get(task_id)
+        if project_id is not None:
+            return project_id
+        row = conn.execute(DatabasePool.format_sql('''
+            SELECT s.project_id FROM tasks t JOIN project_stages s ON t.stage_id = s.id WHERE t.id = ?
+        '''), (task_id,)).fetchone()
+        return row['project_id'] if row else None
+
+    def add_edge(self, project_id, dep_id, task_id, depends_on, dependency_type=None, data_version=None):
+        """把本进程刚写入的边应用到缓存图；data_version 为写入后的数据版本号，
+        只有恰好比缓存图新一个版本（期间没有其他写入）时才增量更新，否则失效重载"""
+        with self._lock:
+            graph = self._graphs.get(project_id)
+            if (graph and data_version == graph.data_version + 1
+                    and graph.add_edge(dep_id, task_id, depends_on, dependency_type)):
+                graph.data_version = data_version
+                self._versions[project_id] = graph.version
+            else:
+                self.invalidate(project_id)
+
+    def remove_edge(self, dep_id):
+        with self._lock:
+            for project_id, graph in self._graphs.items():
+                if dep_id in graph.edge_ids:
+                    graph.remove_edge(dep_id)
+                    self._versions[project_id] = graph.version
+                    return True
+        return False
+
+    def invalidate(self, project_id=None):
+        with self._lock:
+            if project_id is None:
+                for pid in list(self._graphs):
+                    self._versions[pid] += 1
+                self._graphs.clear()
+                return
+            self._versions[project_id] += 1
+            self._graphs.pop(project_id, None)
+
+    def invalidate_for_task(self, task_id):
+        with self._lock:
+            project_id = self._task_projects.get(task_id)
+        if project_id is not None:
+            self.invalidate(project_id)
+
+
+dependency_graph_cache = DependencyGraphCache()
+
+
 class DependencyService:
 
     @staticmethod
@@ -43,22 +290,49 @@ class DependencyService:
             return {'success': False, 'message': '任务不能依赖自身'}
     
         with DatabasePool.get_connection() as conn:
-            # 检查是否已存在
-            sql_check = DatabasePool.format_sql('SELECT id FROM task_dependencies WHERE task_id = ? AND depends_on_task_id = ?')
-            existing = conn.execute(sql_check, (task_id, depends_on_task_id)).fetchone()
-            if existing:
-                return {'success': False, 'message': '该依赖关系已存在'}
-    
-            # 检测循环依赖
-            if DependencyService._would_create_cycle(conn, task_id, depends_on_task_id):
-                return {'success': False, 'message': '添加该依赖会导致循环依赖'}
+            project_id = dependency_graph_cache.project_of(conn, task_id)
+            graph = None
+            if project_id is not None:
+                graph = dependency_graph_cache.get(conn, project_id, required_tasks=(task_id,))
+                if not graph.has_node(depends_on_task_id):
+                    graph = None
+
+            if graph:
+                # 同项目：内存图判重与增量环检测（图已按数据版本号校验过新鲜度）
+                if graph.has_edge(task_id, depends_on_task_id):
+                    return {'success': False, 'message': '该依赖关系已存在'}
+                if graph.would_create_cycle(task_id, depends_on_task_id):
+                    return {'success': False, 'message': '添加该依赖会导致循环依赖'}
+            else:
+                # 跨项目或未知任务：退回数据库逐层检查
+                sql_check = DatabasePool.format_sql('SELECT id FROM task_dependencies WHERE task_id = ? AND depends_on_task_id = ?')
+                existing = conn.execute(sql_check, (task_id, depends_on_task_id)).fetchone()
+                if existing:
+                    return {'success': False, 'message': '该依赖关系已存在'}
+                if DependencyService._would_create_cycle(conn, task_id, depends_on_task_id):
+                    return {'success': False, 'message': '添加该依赖会导致循环依赖'}
     
             sql_ins = DatabasePool.format_sql('''
                 INSERT INTO task_dependencies (task_id, depends_on_task_id, dependency_type)
                 VALUES (?, ?, ?)
             ''')
-            conn.execute(sql_ins, (task_id, depends_on_task_id, dependency_type))
+            cursor = conn.execute(sql_ins, (task_id, depends_on_task_id, dependency_type))
+            dep_id = DatabasePool.get_inserted_id(cursor)
+            data_version = None
+            if graph:
+                data_version = dependency_graph_cache.data_version(conn, project_id)
+                if data_version != graph.data_version + 1 and DependencyService._would_create_cycle(
+                        conn, task_id, depends_on_task_id, exclude_dep_id=dep_id):
+                    # 校验之后有其他写入：在同一事务内以数据库为准复查，成环则撤销
+                    conn.rollback()
+                    dependency_graph_cache.invalidate(project_id)
+                    return {'success': False, 'message': '添加该依赖会导致循环依赖'}
             conn.commit()
+
+        if graph:
+            dependency_graph_cache.add_edge(
+                project_id, dep_id, task_id, depends_on_task_id, dependency_type, data_version=data_version
+            )
         return {'success': True, 'message': '依赖关系已添加'}
 
     @staticmethod
@@ -68,16 +342,38 @@ class DependencyService:
             sql = DatabasePool.format_sql('DELETE FROM task_dependencies WHERE id = ?')
             conn.execute(sql, (dep_id,))
             conn.commit()
+        if not dependency_graph_cache.remove_edge(dep_id):
+            dependency_graph_cache.invalidate()
         return {'success': True}
 
     @staticmethod
-    def _would_create_cycle(conn, task_id, depends_on_task_id):
-        """检测添加依赖后是否会形成环"""
+    def _fetch_task_rows(conn, task_ids):
+        """批量取任务展示信息：{task_id: row}"""
+        rows = {}
+        task_ids = list(task_ids)
+        for i in range(0, len(task_ids), 500):
+            chunk = task_ids[i:i + 500]
+            placeholders = ','.join('?' for _ in chunk)
+            sql = DatabasePool.format_sql(f'''
+                SELECT t.id, t.task_name, t.is_completed, s.stage_name, s.plan_end_date
+                FROM tasks t
+                JOIN project_stages s ON t.stage_id = s.id
+                WHERE t.id IN ({placeholders})
+            ''')
+            for row in conn.execute(sql, chunk).fetchall():
+                rows[row['id']] = dict(row)
+        return rows
+
+    @staticmethod
+    def _would_create_cycle(conn, task_id, depends_on_task_id, exclude_dep_id=None):
+        """检测添加依赖后是否会形成环；exclude_dep_id 为已写入、待复查的那条依赖"""
         # 从 depends_on_task_id 出发，看能否通过已有依赖回到 task_id
         # 等价于：task_id 的下游链条中是否包含 depends_on_task_id
         visited = set()
         queue = deque([task_id])
-        sql = DatabasePool.format_sql('SELECT task_id FROM task_dependencies WHERE depends_on_task_id = ?')
+        sql = DatabasePool.format_sql(
+            'SELECT task_id FROM task_dependencies WHERE depends_on_task_id = ? AND id != ?'
+        )
         while queue:
             current = queue.popleft()
             if current == depends_on_task_id:
@@ -86,122 +382,48 @@ class DependencyService:
                 continue
             visited.add(current)
             # 查找 current 的下游任务（谁依赖 current）
-            downstream = conn.execute(sql, (current,)).fetchall()
+            downstream = conn.execute(sql, (current, exclude_dep_id or 0)).fetchall()
             for row in downstream:
                 queue.append(row['task_id'])
         return False
 
     @staticmethod
-    def get_critical_path(project_id):
-        """计算项目关键路径 (CPM)"""
-        with DatabasePool.get_connection() as conn:
-            # 获取所有任务
-            sql_tasks = DatabasePool.format_sql('''
-                SELECT t.id, t.task_name, t.is_completed, t.completed_date, t.estimated_duration,
-                       s.stage_name, s.stage_order, s.plan_start_date, s.plan_end_date
-                FROM tasks t
-                JOIN project_stages s ON t.stage_id = s.id
-                WHERE s.project_id = ?
-                ORDER BY s.stage_order, t.id
-            ''')
-            tasks = conn.execute(sql_tasks, (project_id,)).fetchall()
-    
-            # 获取依赖关系
-            sql_deps = DatabasePool.format_sql('''
-                SELECT td.task_id, td.depends_on_task_id
-                FROM task_dependencies td
-                JOIN tasks t ON td.task_id = t.id
-                JOIN project_stages s ON t.stage_id = s.id
-                WHERE s.project_id = ?
-            ''')
-            deps = conn.execute(sql_deps, (project_id,)).fetchall()
+    def get_critical_path(project_id, level=False):
+        """计算项目关键路径 (CPM)：工作日历 + 四类依赖，可选按负责人资源平衡"""
+        from services.schedule_engine import schedule_engine
 
-        if not tasks:
+        schedule = schedule_engine.schedule_project(project_id, level=level)
+        if not schedule:
             return {'critical_path': [], 'all_tasks': [], 'summary': '暂无任务数据'}
-
-        # 构建邻接表
-        task_map = {}
-        for t in tasks:
-            task_map[t['id']] = {
-                'id': t['id'],
-                'name': t['task_name'],
-                'stage': t['stage_name'],
-                'stage_order': t['stage_order'],
-                'completed': bool(t['is_completed']),
-                'duration': int(t['estimated_duration'] or 1),
-                'predecessors': [],
-                'successors': [],
-                'early_start': 0,
-                'early_finish': 0,
-                'late_start': float('inf'),
-                'late_finish': float('inf'),
-                'slack': 0,
-                'is_critical': False
-            }
-
-        for d in deps:
-            if d['task_id'] in task_map and d['depends_on_task_id'] in task_map:
-                task_map[d['task_id']]['predecessors'].append(d['depends_on_task_id'])
-                task_map[d['depends_on_task_id']]['successors'].append(d['task_id'])
-
-        # 拓扑排序
-        in_degree = defaultdict(int)
-        for tid in task_map:
-            in_degree[tid] = len(task_map[tid]['predecessors'])
-
-        queue = deque([tid for tid in task_map if in_degree[tid] == 0])
-        topo_order = []
-
-        while queue:
-            current = queue.popleft()
-            topo_order.append(current)
-            for successor in task_map[current]['successors']:
-                in_degree[successor] -= 1
-                if in_degree[successor] == 0:
-                    queue.append(successor)
-
-        if len(topo_order) != len(task_map):
-            return {'critical_path': [], 'all_tasks': list(task_map.values()),
+        if schedule['cyclic']:
+            return {'critical_path': [], 'all_tasks': schedule['tasks'],
                     'summary': '存在循环依赖，无法计算关键路径'}
 
-        # 正向传递：计算最早开始/完成时间
-        for tid in topo_order:
-            task = task_map[tid]
-            if task['predecessors']:
-                task['early_start'] = max(
-                    task_map[p]['early_finish'] for p in task['predecessors']
-                )
-            task['early_finish'] = task['early_start'] + task['duration']
-
-        # 项目总工期
-        project_duration = max(task_map[tid]['early_finish'] for tid in task_map) if task_map else 0
-
-        # 逆向传递：计算最晚开始/完成时间
-        for tid in reversed(topo_order):
-            task = task_map[tid]
-            if not task['successors']:
-                task['late_finish'] = project_duration
-            else:
-                task['late_finish'] = min(
-                    task_map[s]['late_start'] for s in task['successors']
-                )
-            task['late_start'] = task['late_finish'] - task['duration']
-            task['slack'] = task['late_start'] - task['early_start']
-            task['is_critical'] = (task['slack'] == 0)
-
-        # 提取关键路径
-        critical_path = [task_map[tid] for tid in topo_order if task_map[tid]['is_critical']]
-        all_tasks_result = [task_map[tid] for tid in topo_order]
+        all_tasks_result = schedule['tasks']
+        critical_path = [task for task in all_tasks_result if task['is_critical']]
+        project_duration = schedule['project_duration']
 
         completed_critical = sum(1 for t in critical_path if t['completed'])
-        summary = f"关键路径共 {len(critical_path)} 个任务，已完成 {completed_critical} 个，项目最短工期 {project_duration} 个任务单位"
+        summary = (
+            f"关键路径共 {len(critical_path)} 个任务，已完成 {completed_critical} 个，"
+            f"项目最短工期 {project_duration} 个工作日（{schedule['project_start']} ~ {schedule['project_finish']}）"
+        )
+        if schedule.get('overrun_workdays'):
+            summary += f"，较计划完工日超出 {schedule['overrun_workdays']} 个工作日"
 
-        return {
+        result = {
             'critical_path': critical_path,
             'all_tasks': all_tasks_result,
             'project_duration': project_duration,
+            'project_start': schedule['project_start'],
+            'project_finish': schedule['project_finish'],
+            'calendar': schedule['calendar'],
             'summary': summary
         }
+        if level:
+            result['leveled_duration'] = schedule['leveled_duration']
+            result['leveled_finish'] = schedule['leveled_finish']
+        return result
 
     @staticmethod
     def get_impact_analysis(task_id):
@@ -217,41 +439,23 @@ class DependencyService:
             if not task:
                 return {'affected': [], 'message': '任务不存在'}
     
-            # BFS 找到所有下游任务
-            affected = []
-            visited = set()
-            queue = deque([task_id])
-            depth = 0
-            
-            sql_downstream = DatabasePool.format_sql('''
-                SELECT td.task_id, t.task_name, t.is_completed, s.stage_name
-                FROM task_dependencies td
-                JOIN tasks t ON td.task_id = t.id
-                JOIN project_stages s ON t.stage_id = s.id
-                WHERE td.depends_on_task_id = ?
-            ''')
-    
-            while queue:
-                level_size = len(queue)
-                depth += 1
-                for _ in range(level_size):
-                    current = queue.popleft()
-                    if current in visited:
-                        continue
-                    visited.add(current)
-    
-                    downstream = conn.execute(sql_downstream, (current,)).fetchall()
-    
-                    for d in downstream:
-                        if d['task_id'] not in visited:
-                            affected.append({
-                                'task_id': d['task_id'],
-                                'task_name': d['task_name'],
-                                'stage_name': d['stage_name'],
-                                'is_completed': bool(d['is_completed']),
-                                'impact_depth': depth
-                            })
-                            queue.append(d['task_id'])
+            # 在缓存图上按层 BFS 找到所有下游任务，再一次性取展示信息
+            graph = dependency_graph_cache.get(conn, task['project_id'], required_tasks=(task_id,))
+            chain = graph.downstream(task_id)
+            task_rows = DependencyService._fetch_task_rows(conn, [child for child, _, _ in chain])
+
+        affected = []
+        for child, _, depth in chain:
+            row = task_rows.get(child)
+            if not row:
+                continue
+            affected.append({
+                'task_id': child,
+                'task_name': row['task_name'],
+                'stage_name': row['stage_name'],
+                'is_completed': bool(row['is_completed']),
+                'impact_depth': depth
+            })
     
         return {
             'source_task': dict(task),
@@ -0,0 +1,304 @@
+# services/form_job_service.py
+"""
+表单生成后台任务流水线
+- 提交后立即返回 job_id，前端轮询进度
+- PDF 分页渲染 + OCR 在进程池中并行执行
+- 按文件内容哈希缓存文本/表格结构分析结果
+- 视觉识别阶段运行期间即可返回文本与表格结构等阶段性结果
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SUFFIXES = {'.png', '.jpg', '.jpeg', '.bmp', '.webp'}
+
+
+def _now_iso():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _is_usable_text(text):
+    return bool(text) and not str(text).startswith('[')
+
+
+def _remove_quietly(path):
+    if not path:
+        return
+    try:
+        os.remove(path)
+    except Exception:
+        pass
+
+
+# ---------------------------------------------------------------
+# 进程池工作函数：必须是模块级函数才能被子进程 pickle
+# ---------------------------------------------------------------
+
+def count_pdf_pages(file_path):
+    try:
+        import fitz
+        with fitz.open(file_path) as pdf:
+            return pdf.page_count
+    except Exception as e:
+        logger.warning("Count PDF pages failed: %s", e)
+        return 0
+
+
+def render_pdf_page(file_path, page_index, zoom=2.0):
+    """把 PDF 指定页渲染成临时 PNG，返回图片路径。"""
+    try:
+        import fitz
+        import tempfile
+        with fitz.open(file_path) as pdf:
+            if page_index >= pdf.page_count:
+                return None
+            pix = pdf[page_index].get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            tmp = tempfile.NamedTemporaryFile(delete=False, suffix=f'_p{page_index + 1}.png')
+            tmp.close()
+            pix.save(tmp.name)
+            return tmp.name
+    except Exception as e:
+        logger.warning("Render PDF page %s failed: %s", page_index + 1, e)
+        return None
+
+
+def ocr_image_text(image_path):
+    try:
+        from PIL import Image
+        import pytesseract
+        return pytesseract.image_to_string(Image.open(image_path), lang='chi_sim+eng').strip()
+    except Exception as e:
+        logger.warning("Image OCR unavailable or failed: %s", e)
+        return ''
+
+
+def render_and_ocr_page(file_path, page_index, zoom=2.0):
+    """单页渲染 + OCR，OCR 完成后删除渲染图片。"""
+    image_path = render_pdf_page(file_path, page_index, zoom)
+    if not image_path:
+        return {'page': page_index + 1, 'text': ''}
+    try:
+        return {'page': page_index + 1, 'text': ocr_image_text(image_path)}
+    finally:
+        _remove_quietly(image_path)
+
+
+class FormJobService:
+    """表单生成任务调度与阶段性结果存储"""
+
+    MAX_JOBS = 200
+    JOB_TTL_SECONDS = 3600
+    LAYOUT_CACHE_SIZE = 64
+    MAX_OCR_PAGES = 30
+
+    def __init__(self, job_workers=2, page_workers=None):
+        self._jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._layout_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._job_executor = ThreadPoolExecutor(max_workers=job_workers, thread_name_prefix='form-job')
+        self._page_workers = page_workers or int(os.environ.get('FORM_OCR_PROCESSES') or min(4, os.cpu_count() or 1))
+        self._page_pool = None
+        self._page_pool_lock = threading.Lock()
+
+    # ---------------- 缓存 ----------------
+
+    @staticmethod
+    def file_digest(file_path):
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def get_cached_analysis(self, digest):
+        with self._cache_lock:
+            cached = self._layout_cache.get(digest)
+            if cached is not None:
+                self._layout_cache.move_to_end(digest)
+            return cached
+
+    def _store_analysis(self, digest, analysis):
+        with self._cache_lock:
+            self._layout_cache[digest] = analysis
+            self._layout_cache.move_to_end(digest)
+            while len(self._layout_cache) > self.LAYOUT_CACHE_SIZE:
+                self._layout_cache.popitem(last=False)
+
+    # ---------------- 分页并行 OCR ----------------
+
+    def _get_page_pool(self):
+        with self._page_pool_lock:
+            if self._page_pool is None:
+                try:
+                    self._page_pool = ProcessPoolExecutor(max_workers=self._page_workers)
+                except Exception as e:
+                    # 受限环境（无 fork/semaphore）退化为线程池
+                    logger.warning("Process pool unavailable, falling back to threads: %s", e)
+                    self._page_pool = ThreadPoolExecutor(max_workers=self._page_workers, thread_name_prefix='form-ocr')
+            return self._page_pool
+
+    def ocr_pdf_pages(self, file_path):
+        page_count = min(count_pdf_pages(file_path), self.MAX_OCR_PAGES)
+        if not page_count:
+            return []
+        pool = self._get_page_pool()
+        futures = [pool.submit(render_and_ocr_page, file_path, index) for index in range(page_count)]
+        pages = []
+        for future in futures:
+            try:
+                pages.append(future.result())
+            except Exception as e:
+                logger.warning("Page OCR worker failed: %s", e)
+        return sorted(pages, key=lambda p: p['page'])
+
+    # ---------------- 任务管理 ----------------
+
+    def _prune_jobs(self):
+        cutoff = time.time() - self.JOB_TTL_SECONDS
+        for job_id, job in list(self._jobs.items()):
+            if job['status'] == 'processing':
+                continue
+            if job['_finished_ts'] < cutoff or len(self._jobs) > self.MAX_JOBS:
+                self._jobs.pop(job_id, None)
+
+    def _update_job(self, job_id, **fields):
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields)
+            job['updated_at'] = _now_iso()
+            if fields.get('status') in ('completed', 'failed'):
+                job['_finished_ts'] = time.time()
+
+    def get_job(self, job_id):
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {k: v for k, v in job.items() if not k.startswith('_')}
+
+    def submit(self, file_path, filename, handlers, options=None):
+        """
+        提交表单生成任务。file_path 归任务所有，任务结束后删除；
+        file_path 为空时直接以 options['source_text'] 进入生成阶段。
+        handlers: extract_text / image_text / analyze_tables / vision_ocr / reference_text / generate 阶段回调。
+        """
+        job_id = str(uuid.uuid4())
+        now = _now_iso()
+        with self._jobs_lock:
+            self._prune_jobs()
+            self._jobs[job_id] = {
+                'job_id': job_id,
+                'source': filename,
+                'status': 'processing',
+                'stage': 'queued',
+                'partial': None,
+                'result': None,
+                'error': None,
+                'created_at': now,
+                'updated_at': now,
+                '_finished_ts': None,
+            }
+        # 在交给线程池前取快照，返回的总是刚入队的状态
+        job = self.get_job(job_id)
+        self._job_executor.submit(self._run_job, job_id, file_path, filename, handlers, dict(options or {}))
+        return job
+
+    def _analyze_document(self, file_path, suffix, handlers):
+        digest = self.file_digest(file_path)
+        cached = self.get_cached_analysis(digest)
+        if cached is not None:
+            return dict(cached, cache_hit=True)
+
+        pages = []
+        layout_analysis = []
+        if suffix in IMAGE_SUFFIXES:
+            text = handlers['image_text'](file_path)
+        else:
+            text = handlers['extract_text'](file_path)
+            if suffix == '.pdf':
+                layout_analysis = handlers['analyze_tables'](file_path) or []
+                if not _is_usable_text(text):
+                    pages = self.ocr_pdf_pages(file_path)
+                    ocr_text = '\n\n'.join(
+                        f"--- 第{p['page']}页 ---\n{p['text']}" for p in pages if p.get('text')
+                    )
+                    text = ocr_text or text
+
+        analysis = {
+            'digest': digest,
+            'text': text or '',
+            'layout_analysis': layout_analysis,
+            'pages': [{'page': p['page'], 'length': len(p.get('text') or '')} for p in pages],
+        }
+        self._store_analysis(digest, analysis)
+        return dict(analysis, cache_hit=False)
+
+    def _run_job(self, job_id, file_path, filename, handlers, options):
+        image_path = None
+        try:
+            suffix = os.path.splitext(filename or file_path or '')[1].lower()
+            self._update_job(job_id, stage='extract')
+            if file_path:
+                analysis = self._analyze_document(file_path, suffix, handlers)
+            else:
+                source_text = options.get('source_text') or ''
+                analysis = {'text': source_text, 'layout_analysis': [], 'pages': [], 'cache_hit': False}
+            text = analysis['text']
+            layout_analysis = analysis['layout_analysis']
+            needs_vision = bool(file_path) and (options.get('force_vision') or not _is_usable_text(text)) \
+                and (suffix in IMAGE_SUFFIXES or bool(layout_analysis))
+            self._update_job(job_id, stage='vision' if needs_vision else 'generate', partial={
+                'text': text,
+                'length': len(text),
+                'layout_analysis': layout_analysis,
+                'pages': analysis['pages'],
+                'cache_hit': analysis['cache_hit'],
+            })
+
+            vision_analysis = None
+            if needs_vision:
+                if suffix in IMAGE_SUFFIXES:
+                    vision_analysis = handlers['vision_ocr'](file_path, [])
+                else:
+                    image_path = render_pdf_page(file_path, 0)
+                    if image_path:
+                        vision_analysis = handlers['vision_ocr'](image_path, layout_analysis)
+                if vision_analysis and not _is_usable_text(text):
+                    text = vision_analysis.get('text') or text
+                self._update_job(job_id, stage='generate')
+
+            if file_path and not _is_usable_text(text):
+                # 与同步提取接口一致：识别不出文本时回退到按文件名命中的本地参考表单
+                text = handlers['reference_text'](filename, text) or text
+
+            success, result, code = handlers['generate']({
+                'source_text': text,
+                'source_name': options.get('source_name') or filename or '',
+                'layout_analysis': layout_analysis,
+                'vision_analysis': vision_analysis or {},
+            })
+            if success:
+                self._update_job(job_id, status='completed', stage='done', result=result)
+            else:
+                self._update_job(job_id, status='failed', stage='done', error=result, error_code=code)
+        except Exception as e:
+            logger.error("Form generation job %s failed: %s", job_id, e, exc_info=True)
+            self._update_job(job_id, status='failed', stage='done', error=str(e), error_code=500)
+        finally:
+            _remove_quietly(image_path)
+            _remove_quietly(file_path)
+
+
+form_job_service = FormJobService()
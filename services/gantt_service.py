@@ -0,0 +1,106 @@
+# services/gantt_service.py
+"""
+甘特图数据版本化与增量同步
+- 任务条由排程引擎结果生成，内容确定，版本号取内容哈希，可直接作为 ETag
+- 每个项目在内存中保留最近若干版本的任务快照；客户端带 ?since=<版本> 时只返回
+  新增/变化的任务与被删除的任务 ID（依赖边随任务的 dependencies 字段一起下发）
+- 基准版本不在快照中（过期、其他进程生成）时退回全量
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from services.schedule_engine import schedule_engine
+
+
+class GanttSyncService:
+    HISTORY_VERSIONS = 8
+    MAX_PROJECTS = 128
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._history = OrderedDict()
+
+    @staticmethod
+    def build_tasks(schedule, level=False):
+        """排程结果 → Frappe Gantt 任务条 { id, name, start, end, progress, dependencies }"""
+        if not schedule:
+            return []
+        gantt_tasks = []
+        for t in schedule['tasks']:
+            # 进度：已完成为 100，未完成为 0（或者使用阶段的进度，但任务粒度更细）
+            custom_class = f'stage-{(t["stage_order"] or 0) % 5}'  # 简单的颜色区分
+            if t['is_critical']:
+                custom_class += ' critical'
+            gantt_tasks.append({
+                'id': str(t['id']),
+                'name': t['name'],
+                'start': t['leveled_start_date'] if level else t['start_date'],
+                'end': t['leveled_end_date'] if level else t['end_date'],
+                'progress': 100 if t['completed'] else 0,
+                'dependencies': ",".join(str(p) for p in t['predecessors']),
+                'is_critical': t['is_critical'],
+                'slack': t['slack'],
+                'custom_class': custom_class
+            })
+        return gantt_tasks
+
+    @staticmethod
+    def version_of(tasks):
+        canonical = json.dumps(tasks, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+        return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:16]
+
+    def _remember(self, key, version, tasks):
+        with self._lock:
+            versions = self._history.get(key)
+            if versions is None:
+                versions = self._history[key] = OrderedDict()
+            self._history.move_to_end(key)
+            if version not in versions:
+                versions[version] = tasks
+                while len(versions) > self.HISTORY_VERSIONS:
+                    versions.popitem(last=False)
+            else:
+                versions.move_to_end(version)
+            while len(self._history) > self.MAX_PROJECTS:
+                self._history.popitem(last=False)
+
+    def _recall(self, key, version):
+        with self._lock:
+            versions = self._history.get(key)
+            return versions.get(version) if versions else None
+
+    def snapshot(self, project_id, level=False):
+        """返回 (版本号, 任务条列表)，并记入版本快照"""
+        tasks = self.build_tasks(schedule_engine.schedule_project(project_id, level=level), level)
+        version = self.version_of(tasks)
+        self._remember((project_id, bool(level)), version, tasks)
+        return version, tasks
+
+    @staticmethod
+    def diff(base_tasks, tasks):
+        base = {t['id']: t for t in base_tasks}
+        current_ids = {t['id'] for t in tasks}
+        delta = {
+            'changed': [t for t in tasks if base.get(t['id']) != t],
+            'removed': [tid for tid in base if tid not in current_ids],
+        }
+        order = [t['id'] for t in tasks]
+        if order != [t['id'] for t in base_tasks]:
+            delta['order'] = order
+        return delta
+
+    def sync(self, project_id, since, level=False):
+        """增量同步：since 命中历史版本时返回差量，否则返回全量"""
+        version, tasks = self.snapshot(project_id, level)
+        base = self._recall((project_id, bool(level)), since) if since else None
+        if base is None:
+            return version, {'version': version, 'full': True, 'tasks': tasks}
+        payload = {'version': version, 'full': False}
+        payload.update(self.diff(base, tasks) if since != version else {'changed': [], 'removed': []})
+        return version, payload
+
+
+gantt_sync_service = GanttSyncService()
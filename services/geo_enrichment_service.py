@@ -0,0 +1,239 @@
+# services/geo_enrichment_service.py
+"""
+地理信息后台补全服务
+- 读路径（地图/资源总览）只读库，不做地理编码和写回
+- 缺失省市/坐标的项目与成员由后台任务按 id 游标分批补全（解析不出的行不会卡住后续批次）
+- 同一地名在一批内只解析一次；解析结果与失败记录都落在 geo_cache，失败在冷却期内不重复请求
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from database import DatabasePool
+from utils.geo_service import geo_service
+
+logger = logging.getLogger(__name__)
+
+UNRESOLVED_PROVIDER = 'unresolved'
+
+
+def normalize_region_name(value):
+    if not value:
+        return ''
+    return str(value).strip().replace('省', '').replace('市', '').replace('自治区', '').replace('特别行政区', '')
+
+
+class GeoEnrichmentService:
+    BATCH_SIZE = 200
+    UNRESOLVED_RETRY_DAYS = 7
+    MIN_INTERVAL_SECONDS = 300
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = False
+        self._pending = False
+        self._last_started = 0
+        self.last_run = None
+
+    # ---------------- 调度 ----------------
+
+    def request_enrichment(self, force=False):
+        """非阻塞地触发一次补全；已有任务运行时只标记待办，结束后再跑一轮。"""
+        with self._lock:
+            if self._running:
+                self._pending = True
+                return False
+            if not force and time.time() - self._last_started < self.MIN_INTERVAL_SECONDS:
+                return False
+            self._running = True
+            self._last_started = time.time()
+        threading.Thread(target=self._run_loop, name='geo-enrichment', daemon=True).start()
+        return True
+
+    def _run_loop(self):
+        try:
+            while True:
+                try:
+                    self.run_all()
+                except Exception as e:
+                    logger.error("Geo enrichment failed: %s", e, exc_info=True)
+                with self._lock:
+                    if not self._pending:
+                        self._running = False
+                        return
+                    self._pending = False
+        except Exception:
+            with self._lock:
+                self._running = False
+            raise
+
+    # ---------------- 批量解析 ----------------
+
+    def _load_cache(self, conn, names):
+        """一次查询取回候选地名的缓存（含失败记录）。"""
+        cache = {}
+        names = list(names)
+        for i in range(0, len(names), 500):
+            chunk = names[i:i + 500]
+            placeholders = ','.join('?' for _ in chunk)
+            rows = conn.execute(DatabasePool.format_sql(f'''
+                SELECT location_name, province, city, lng, lat, provider, updated_at
+                FROM geo_cache WHERE location_name IN ({placeholders})
+            '''), chunk).fetchall()
+            for row in rows:
+                cache[row['location_name']] = dict(row)
+        return cache
+
+    def _is_fresh_failure(self, entry):
+        if not entry or entry.get('provider') != UNRESOLVED_PROVIDER:
+            return False
+        updated_at = str(entry.get('updated_at') or '')[:19]
+        try:
+            ts = datetime.strptime(updated_at, '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            return False
+        return datetime.now() - ts < timedelta(days=self.UNRESOLVED_RETRY_DAYS)
+
+    def _save_failures(self, conn, names):
+        if not names:
+            return
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        DatabasePool.executemany(conn, '''
+            INSERT INTO geo_cache (location_name, provider, updated_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT (location_name) DO UPDATE SET
+                provider = EXCLUDED.provider,
+                updated_at = EXCLUDED.updated_at
+        ''', [(name, UNRESOLVED_PROVIDER, now) for name in names])
+
+    def resolve_many(self, conn, names):
+        """批量解析地名：内存启发式 -> geo_cache -> 外部地理编码（每个地名最多一次）。"""
+        names = {n.strip() for n in names if n and n.strip()}
+        resolved = {}
+        remaining = set()
+        for name in names:
+            details = geo_service.resolve_offline(name)
+            if details:
+                resolved[name] = details
+            else:
+                remaining.add(name)
+
+        cache = self._load_cache(conn, remaining) if remaining else {}
+        failures = []
+        for name in remaining:
+            entry = cache.get(name)
+            if entry and entry.get('lng') is not None:
+                resolved[name] = entry
+                continue
+            if self._is_fresh_failure(entry):
+                continue
+            details = geo_service.resolve_address_details(name)
+            if details:
+                resolved[name] = details
+            else:
+                failures.append(name)
+        self._save_failures(conn, failures)
+        return resolved
+
+    @staticmethod
+    def _first_match(resolved, candidates):
+        for candidate in candidates:
+            candidate = (candidate or '').strip()
+            if candidate and candidate in resolved:
+                return resolved[candidate]
+        return None
+
+    def run_all(self, limit=None):
+        """按 id 游标遍历全部待补全的项目与成员，返回累计更新行数。"""
+        totals = {'projects': 0, 'members': 0}
+        after_project_id = after_member_id = 0
+        while True:
+            result = self.run(limit, after_project_id, after_member_id)
+            totals['projects'] += result['projects']
+            totals['members'] += result['members']
+            if result['exhausted']:
+                return totals
+            after_project_id = result['last_project_id'] or after_project_id
+            after_member_id = result['last_member_id'] or after_member_id
+
+    def run(self, limit=None, after_project_id=0, after_member_id=0):
+        """补全 id 游标之后的一批缺失项目省市与成员坐标，返回更新行数与本批最后的 id。"""
+        limit = limit or self.BATCH_SIZE
+        with DatabasePool.get_connection() as conn:
+            projects = [dict(r) for r in conn.execute(DatabasePool.format_sql('''
+                SELECT id, province, city, hospital_name, project_name
+                FROM projects
+                WHERE status != '已终止'
+                  AND (province IS NULL OR province = '' OR city IS NULL OR city = '')
+                  AND id > ?
+                ORDER BY id
+                LIMIT ?
+            '''), (after_project_id, limit)).fetchall()]
+            members = [dict(r) for r in conn.execute(DatabasePool.format_sql('''
+                SELECT m.id, m.lng, m.lat, m.current_city,
+                       p.city as project_city, p.province as project_province,
+                       p.hospital_name, p.project_name
+                FROM project_members m
+                JOIN projects p ON m.project_id = p.id
+                WHERE m.status = '在岗'
+                  AND (m.lng IS NULL OR m.lat IS NULL OR m.current_city IS NULL OR m.current_city = '')
+                  AND m.id > ?
+                ORDER BY m.id
+                LIMIT ?
+            '''), (after_member_id, limit)).fetchall()]
+
+            names = set()
+            for p in projects:
+                names.update([p['hospital_name'], p['project_name'], p['city']])
+            for m in members:
+                names.update([m['current_city'], m['project_city'], m['hospital_name'], m['project_name']])
+            resolved = self.resolve_many(conn, [n for n in names if n])
+
+            project_updates = []
+            for p in projects:
+                province = normalize_region_name(p['province'])
+                city = normalize_region_name(p['city'])
+                details = self._first_match(resolved, [p['hospital_name'], p['project_name'], p['city']])
+                if details:
+                    province = province or normalize_region_name(details.get('province'))
+                    city = city or normalize_region_name(details.get('city'))
+                if (province or city) and (province != normalize_region_name(p['province']) or city != normalize_region_name(p['city'])):
+                    project_updates.append((province or p['province'], city or p['city'], p['id']))
+
+            member_updates = []
+            for m in members:
+                lng, lat = m['lng'], m['lat']
+                city = normalize_region_name(m['current_city']) or normalize_region_name(m['project_city'])
+                details = self._first_match(
+                    resolved, [m['current_city'], m['project_city'], m['hospital_name'], m['project_name']]
+                )
+                if details:
+                    city = city or normalize_region_name(details.get('city'))
+                    if lng is None or lat is None:
+                        lng, lat = details.get('lng'), details.get('lat')
+                changed = (lng, lat) != (m['lng'], m['lat']) or city != normalize_region_name(m['current_city'])
+                if changed and ((lng is not None and lat is not None) or city):
+                    member_updates.append((lng, lat, city or m['current_city'], m['id']))
+
+            DatabasePool.executemany(
+                conn, 'UPDATE projects SET province = ?, city = ? WHERE id = ?', project_updates
+            )
+            DatabasePool.executemany(
+                conn, 'UPDATE project_members SET lng = ?, lat = ?, current_city = ? WHERE id = ?', member_updates
+            )
+            conn.commit()
+
+        self.last_run = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        logger.info("Geo enrichment updated %d projects, %d members", len(project_updates), len(member_updates))
+        return {
+            'projects': len(project_updates),
+            'members': len(member_updates),
+            'last_project_id': projects[-1]['id'] if projects else None,
+            'last_member_id': members[-1]['id'] if members else None,
+            'exhausted': len(projects) < limit and len(members) < limit,
+        }
+
+
+geo_enrichment_service = GeoEnrichmentService()
@@ -4,10 +4,17 @@
 1. 基于项目接口对照上下文的智能问答
 2. 自动生成可复制的接口请求内容（XML/JSON/SQL）
 3. 字段映射查询、对接指导
+
+上下文与标准库检索均有进程内缓存：
+- 渲染好的项目上下文按 (project_id, category) 缓存，以 projects / interface_data_versions
+  中的版本号（由触发器在接口规范、对照、字段映射写入时递增）判断是否失效；
+- 标准接口按分类建立 1~2 字符 gram 倒排索引，检索时先查候选再逐条校验命中。
 """
 import json
 import re
 import logging
+import threading
+from collections import OrderedDict
 from database import DatabasePool
 from services.ai_service import ai_service
 
@@ -15,16 +22,21 @@ logger = logging.getLogger(__name__)
 
 
 class InterfaceChatService:
+    CONTEXT_CACHE_SIZE = 128
+    GAP_FIELDS_PER_COMPARISON = 10
+    STANDARD_PROJECT_ID = 0  # interface_data_versions 中标准接口库的版本键
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._context_cache = OrderedDict()  # (project_id, category) -> (version, context)
+        self._standard_index = {}  # category -> (version, index)
 
     def chat(self, project_id: int, message: str, category: str = '手麻标准', standard_only: bool = False) -> dict:
         """
         接口 AI 助手主入口。
         根据用户消息 + 项目接口上下文，返回 AI 回复。
         """
-        # 1. 构建项目接口上下文
-        context = self._build_context(project_id, category)
-
-        # 2. 检测意图：是否是"生成请求"类指令
+        # 1. 检测意图：是否是"生成请求"类指令
         intent = self._detect_intent(message)
 
         standard_answer = self._answer_from_standard_specs(message, category, intent)
@@ -36,6 +48,9 @@ class InterfaceChatService:
                 'intent': 'standard_not_found'
             }
 
+        # 2. 构建项目接口上下文（标准库直接命中时无需构建）
+        context = self._build_context(project_id, category)
+
         # 3. 根据意图构造不同的 prompt
         if intent == 'generate_request':
             return self._handle_generate_request(message, context, project_id)
@@ -176,105 +191,155 @@ class InterfaceChatService:
 
     # ========== 内部方法 ==========
 
+    def _data_versions(self, conn, project_id: int) -> tuple:
+        """读取项目及接口数据版本号，任一相关写入都会使其变化"""
+        rows = conn.execute(DatabasePool.format_sql('''
+            SELECT 'project' AS scope, project_id, version FROM project_data_versions WHERE project_id = ?
+            UNION ALL
+            SELECT 'interface' AS scope, project_id, version FROM interface_data_versions WHERE project_id IN (?, ?)
+        '''), (project_id, project_id, self.STANDARD_PROJECT_ID)).fetchall()
+        return tuple(sorted((r['scope'], r['project_id'], r['version']) for r in rows))
+
     def _build_context(self, project_id: int, category: str) -> str:
+        """获取项目接口上下文摘要，数据版本未变时直接复用缓存"""
+        key = (project_id, category)
+        with DatabasePool.get_connection() as conn:
+            version = self._data_versions(conn, project_id)
+            with self._lock:
+                cached = self._context_cache.get(key)
+                if cached and cached[0] == version:
+                    self._context_cache.move_to_end(key)
+                    return cached[1]
+
+            context = self._render_context(conn, project_id, category)
+
+        with self._lock:
+            self._context_cache[key] = (version, context)
+            self._context_cache.move_to_end(key)
+            while len(self._context_cache) > self.CONTEXT_CACHE_SIZE:
+                self._context_cache.popitem(last=False)
+        return context
+
+    def invalidate_context(self, project_id: int = None):
+        """丢弃上下文缓存（不传 project_id 时全部清空）"""
+        with self._lock:
+            if project_id is None:
+                self._context_cache.clear()
+                return
+            for key in [k for k in self._context_cache if k[0] == project_id]:
+                del self._context_cache[key]
+
+    def _render_context(self, conn, project_id: int, category: str) -> str:
         """构建项目接口上下文摘要，作为 AI 对话的背景信息"""
         lines = []
 
-        with DatabasePool.get_connection() as conn:
-            # 项目信息
-            project = conn.execute(
-                DatabasePool.format_sql('SELECT project_name, hospital_name FROM projects WHERE id = ?'),
-                (project_id,)
-            ).fetchone()
-            if project:
-                lines.append(f"项目: {project['project_name']} ({project['hospital_name']})")
-
-            # 我方标准接口摘要
-            our_specs = conn.execute(DatabasePool.format_sql('''
-                SELECT id, interface_name, transcode, system_type, protocol, 
-                       view_name, action_name, endpoint_url, data_direction, description
-                FROM interface_specs
-                WHERE (project_id = ? OR project_id IS NULL) 
-                  AND spec_source IN ('our_standard', 'our', 'standard')
-                  AND (category = ? OR category IS NULL)
-                ORDER BY system_type
-            '''), (project_id, category)).fetchall()
-
-            if our_specs:
-                lines.append(f"\n=== 我方标准接口 ({len(our_specs)} 个) ===")
-                for s in our_specs:
-                    s = dict(s)
-                    lines.append(
-                        f"- [{s.get('system_type','')}] {s['interface_name']} "
-                        f"(transcode: {s.get('transcode','')}, "
-                        f"protocol: {s.get('protocol','')}, "
-                        f"view: {s.get('view_name','')}, "
-                        f"action: {s.get('action_name','')})"
-                    )
-
-            # 对方接口摘要
-            vendor_specs = conn.execute(DatabasePool.format_sql('''
-                SELECT id, interface_name, transcode, system_type, protocol,
-                       view_name, action_name, endpoint_url, vendor_name, description
-                FROM interface_specs
-                WHERE project_id = ? AND spec_source = 'vendor'
-                ORDER BY system_type
-            '''), (project_id,)).fetchall()
-
-            if vendor_specs:
-                lines.append(f"\n=== 对方接口 ({len(vendor_specs)} 个) ===")
-                for s in vendor_specs:
-                    s = dict(s)
-                    lines.append(
-                        f"- [{s.get('system_type','')}] {s['interface_name']} "
-                        f"(transcode: {s.get('transcode','')}, "
-                        f"protocol: {s.get('protocol','')}, "
-                        f"vendor: {s.get('vendor_name','')}, "
-                        f"endpoint: {s.get('endpoint_url','')})"
-                    )
-
-            # 对照结果摘要
-            comparisons = conn.execute(DatabasePool.format_sql('''
-                SELECT ic.id, ic.gap_count, ic.transform_count, ic.match_confidence,
-                       os.interface_name as our_name, os.transcode as our_transcode,
-                       vs.interface_name as vendor_name, vs.transcode as vendor_transcode
-                FROM interface_comparisons ic
-                LEFT JOIN interface_specs os ON ic.our_spec_id = os.id
-                LEFT JOIN interface_specs vs ON ic.vendor_spec_id = vs.id
-                WHERE ic.project_id = ? AND (ic.category = ? OR ic.category IS NULL)
-            '''), (project_id, category)).fetchall()
-
-            if comparisons:
-                lines.append(f"\n=== 对照结果 ({len(comparisons)} 对) ===")
-                for c in comparisons:
-                    c = dict(c)
-                    status = '✅' if c['gap_count'] == 0 and c['transform_count'] == 0 else '⚠️'
-                    vendor_info = c.get('vendor_name', '❌缺失')
-                    lines.append(
-                        f"- {status} {c.get('our_name','')}({c.get('our_transcode','')}) "
-                        f"↔ {vendor_info}({c.get('vendor_transcode','')}) "
-                        f"[差异:{c['gap_count']}, 转换:{c['transform_count']}, "
-                        f"置信度:{c.get('match_confidence',0):.0%}]"
-                    )
-
-                    # 对有差异的接口，加载字段映射摘要
-                    if c['gap_count'] > 0 or c['transform_count'] > 0:
-                        field_maps = conn.execute(DatabasePool.format_sql('''
-                            SELECT our_field_name, vendor_field_name, mapping_status, transform_rule
-                            FROM field_mappings
-                            WHERE comparison_id = ? AND mapping_status != 'matched'
-                            LIMIT 10
-                        '''), (c['id'],)).fetchall()
-                        for fm in field_maps:
-                            fm = dict(fm)
-                            lines.append(
-                                f"    {fm['mapping_status']}: "
-                                f"{fm.get('our_field_name','?')} → {fm.get('vendor_field_name','?')} "
-                                f"{fm.get('transform_rule','') or ''}"
-                            )
+        # 项目信息
+        project = conn.execute(
+            DatabasePool.format_sql('SELECT project_name, hospital_name FROM projects WHERE id = ?'),
+            (project_id,)
+        ).fetchone()
+        if project:
+            lines.append(f"项目: {project['project_name']} ({project['hospital_name']})")
+
+        # 我方标准接口摘要
+        our_specs = conn.execute(DatabasePool.format_sql('''
+            SELECT id, interface_name, transcode, system_type, protocol, 
+                   view_name, action_name, endpoint_url, data_direction, description
+            FROM interface_specs
+            WHERE (project_id = ? OR project_id IS NULL) 
+              AND spec_source IN ('our_standard', 'our', 'standard')
+              AND (category = ? OR category IS NULL)
+            ORDER BY system_type
+        '''), (project_id, category)).fetchall()
+
+        if our_specs:
+            lines.append(f"\n=== 我方标准接口 ({len(our_specs)} 个) ===")
+            for s in our_specs:
+                s = dict(s)
+                lines.append(
+                    f"- [{s.get('system_type','')}] {s['interface_name']} "
+                    f"(transcode: {s.get('transcode','')}, "
+                    f"protocol: {s.get('protocol','')}, "
+                    f"view: {s.get('view_name','')}, "
+                    f"action: {s.get('action_name','')})"
+                )
+
+        # 对方接口摘要
+        vendor_specs = conn.execute(DatabasePool.format_sql('''
+            SELECT id, interface_name, transcode, system_type, protocol,
+                   view_name, action_name, endpoint_url, vendor_name, description
+            FROM interface_specs
+            WHERE project_id = ? AND spec_source = 'vendor'
+            ORDER BY system_type
+        '''), (project_id,)).fetchall()
+
+        if vendor_specs:
+            lines.append(f"\n=== 对方接口 ({len(vendor_specs)} 个) ===")
+            for s in vendor_specs:
+                s = dict(s)
+                lines.append(
+                    f"- [{s.get('system_type','')}] {s['interface_name']} "
+                    f"(transcode: {s.get('transcode','')}, "
+                    f"protocol: {s.get('protocol','')}, "
+                    f"vendor: {s.get('vendor_name','')}, "
+                    f"endpoint: {s.get('endpoint_url','')})"
+                )
+
+        # 对照结果摘要
+        comparisons = conn.execute(DatabasePool.format_sql('''
+            SELECT ic.id, ic.gap_count, ic.transform_count, ic.match_confidence,
+                   os.interface_name as our_name, os.transcode as our_transcode,
+                   vs.interface_name as vendor_name, vs.transcode as vendor_transcode
+            FROM interface_comparisons ic
+            LEFT JOIN interface_specs os ON ic.our_spec_id = os.id
+            LEFT JOIN interface_specs vs ON ic.vendor_spec_id = vs.id
+            WHERE ic.project_id = ? AND (ic.category = ? OR ic.category IS NULL)
+        '''), (project_id, category)).fetchall()
+
+        if comparisons:
+            gaps = self._load_mapping_gaps(conn, project_id, category)
+            lines.append(f"\n=== 对照结果 ({len(comparisons)} 对) ===")
+            for c in comparisons:
+                c = dict(c)
+                status = '✅' if c['gap_count'] == 0 and c['transform_count'] == 0 else '⚠️'
+                vendor_info = c.get('vendor_name', '❌缺失')
+                lines.append(
+                    f"- {status} {c.get('our_name','')}({c.get('our_transcode','')}) "
+                    f"↔ {vendor_info}({c.get('vendor_transcode','')}) "
+                    f"[差异:{c['gap_count']}, 转换:{c['transform_count']}, "
+                    f"置信度:{c.get('match_confidence',0):.0%}]"
+                )
+
+                # 对有差异的接口，附上字段映射摘要
+                if c['gap_count'] > 0 or c['transform_count'] > 0:
+                    for fm in gaps.get(c['id'], []):
+                        lines.append(
+                            f"    {fm['mapping_status']}: "
+                            f"{fm.get('our_field_name','?')} → {fm.get('vendor_field_name','?')} "
+                            f"{fm.get('transform_rule','') or ''}"
+                        )
 
         return '\n'.join(lines)
 
+    def _load_mapping_gaps(self, conn, project_id: int, category: str) -> dict:
+        """一次查出项目下所有有差异对照的未匹配字段，按 comparison_id 分组（每组最多 GAP_FIELDS_PER_COMPARISON 条）"""
+        rows = conn.execute(DatabasePool.format_sql('''
+            SELECT fm.comparison_id, fm.our_field_name, fm.vendor_field_name,
+                   fm.mapping_status, fm.transform_rule
+            FROM field_mappings fm
+            JOIN interface_comparisons ic ON fm.comparison_id = ic.id
+            WHERE ic.project_id = ? AND (ic.category = ? OR ic.category IS NULL)
+              AND (ic.gap_count > 0 OR ic.transform_count > 0)
+              AND fm.mapping_status != 'matched'
+            ORDER BY fm.comparison_id, fm.id
+        '''), (project_id, category)).fetchall()
+        gaps = {}
+        for row in rows:
+            group = gaps.setdefault(row['comparison_id'], [])
+            if len(group) < self.GAP_FIELDS_PER_COMPARISON:
+                group.append(dict(row))
+        return gaps
+
     def _answer_from_standard_specs(self, message: str, category: str, intent: str) -> dict:
         """Answer common standard-interface questions without calling AI."""
         specs = self._find_standard_specs(message, category)
@@ -315,46 +380,98 @@ class InterfaceChatService:
     def _find_standard_specs(self, message: str, category: str) -> list:
         keywords = self._message_keywords(message)
         with DatabasePool.get_connection() as conn:
-            rows = conn.execute(DatabasePool.format_sql('''
-                SELECT id, interface_name, transcode, system_type, protocol,
-                       view_name, action_name, endpoint_url, data_direction,
-                       request_sample, response_sample, description
-                FROM interface_specs
-                WHERE project_id IS NULL
-                  AND spec_source IN ('our_standard', 'our', 'standard')
-                  AND category = ?
-            '''), (category,)).fetchall()
-
-            scored = []
-            for row in rows:
-                spec = dict(row)
-                haystack = ' '.join([
-                    spec.get('interface_name') or '',
-                    spec.get('transcode') or '',
-                    spec.get('description') or '',
-                    spec.get('view_name') or '',
-                    spec.get('action_name') or '',
-                ]).lower()
-                score = sum(1 for k in keywords if k and k.lower() in haystack)
-                if '病人' in message or '患者' in message:
-                    if any(k in haystack for k in ['病人', '患者', 'patient', 'zybr']):
-                        score += 5
-                if '医嘱' in message and any(k in haystack for k in ['医嘱', 'zyyz', 'order']):
-                    score += 5
-                if score > 0:
-                    scored.append((score, spec))
-
-            scored.sort(key=lambda item: item[0], reverse=True)
-            result = []
-            for _, spec in scored[:5]:
-                fields = conn.execute(
-                    DatabasePool.format_sql('SELECT * FROM interface_spec_fields WHERE spec_id = ? ORDER BY field_order'),
-                    (spec['id'],)
-                ).fetchall()
-                spec['fields'] = [dict(f) for f in fields]
-                result.append(spec)
+            index = self._get_standard_index(conn, category)
+            scores = {}
+            for k in keywords:
+                if not k:
+                    continue
+                for i in self._index_lookup(index, k.lower()):
+                    scores[i] = scores.get(i, 0) + 1
+            bonus_groups = []
+            if '病人' in message or '患者' in message:
+                bonus_groups.append(['病人', '患者', 'patient', 'zybr'])
+            if '医嘱' in message:
+                bonus_groups.append(['医嘱', 'zyyz', 'order'])
+            for group in bonus_groups:
+                hits = set()
+                for term in group:
+                    hits.update(self._index_lookup(index, term))
+                for i in hits:
+                    scores[i] = scores.get(i, 0) + 5
+
+            ranked = sorted((i for i, score in scores.items() if score > 0), key=lambda i: (-scores[i], i))
+            result = [dict(index['specs'][i]) for i in ranked[:5]]
+            if not result:
+                return result
+
+            placeholders = ','.join('?' * len(result))
+            fields = {}
+            for f in conn.execute(DatabasePool.format_sql(
+                f'SELECT * FROM interface_spec_fields WHERE spec_id IN ({placeholders}) ORDER BY spec_id, field_order'
+            ), tuple(spec['id'] for spec in result)).fetchall():
+                f = dict(f)
+                fields.setdefault(f['spec_id'], []).append(f)
+            for spec in result:
+                spec['fields'] = fields.get(spec['id'], [])
             return result
 
+    def _get_standard_index(self, conn, category: str) -> dict:
+        """获取某分类标准接口的 gram 倒排索引，标准库版本号变化时重建"""
+        row = conn.execute(DatabasePool.format_sql(
+            'SELECT version FROM interface_data_versions WHERE project_id = ?'
+        ), (self.STANDARD_PROJECT_ID,)).fetchone()
+        version = row['version'] if row else 0
+        with self._lock:
+            cached = self._standard_index.get(category)
+            if cached and cached[0] == version:
+                return cached[1]
+
+        rows = conn.execute(DatabasePool.format_sql('''
+            SELECT id, interface_name, transcode, system_type, protocol,
+                   view_name, action_name, endpoint_url, data_direction,
+                   request_sample, response_sample, description
+            FROM interface_specs
+            WHERE project_id IS NULL
+              AND spec_source IN ('our_standard', 'our', 'standard')
+              AND category = ?
+            ORDER BY id
+        '''), (category,)).fetchall()
+        index = {'specs': [], 'haystacks': [], 'grams': {}}
+        for i, row in enumerate(rows):
+            spec = dict(row)
+            haystack = ' '.join([
+                spec.get('interface_name') or '',
+                spec.get('transcode') or '',
+                spec.get('description') or '',
+                spec.get('view_name') or '',
+                spec.get('action_name') or '',
+            ]).lower()
+            index['specs'].append(spec)
+            index['haystacks'].append(haystack)
+            for gram in set(haystack) | self._bigrams(haystack):
+                index['grams'].setdefault(gram, set()).add(i)
+
+        with self._lock:
+            self._standard_index[category] = (version, index)
+        return index
+
+    @staticmethod
+    def _bigrams(text: str) -> set:
+        return {text[i:i + 2] for i in range(len(text) - 1)}
+
+    def _index_lookup(self, index: dict, term: str) -> list:
+        """返回 haystack 包含 term 的标准接口下标：先按 gram 求交得到候选，再做子串校验"""
+        grams = self._bigrams(term) or {term}
+        candidates = None
+        for gram in grams:
+            postings = index['grams'].get(gram)
+            if not postings:
+                return []
+            candidates = set(postings) if candidates is None else candidates & postings
+            if not candidates:
+                return []
+        return [i for i in candidates if term in index['haystacks'][i]]
+
     def _message_keywords(self, message: str) -> list:
         base = re.findall(r'[A-Za-z0-9_]+|[\u4e00-\u9fff]{2,}', message)
         synonyms = []
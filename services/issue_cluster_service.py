@@ -0,0 +1,240 @@
+# services/issue_cluster_service.py
+"""
+问题相似聚类引擎（MinHash + LSH）
+- 问题描述规整后切成字符 n-gram（shingle），以 NUM_PERM 个哈希函数计算 MinHash 签名
+- 签名切成 BANDS 段，每段哈希成一个桶键；同桶即候选，再用签名估计的 Jaccard 相似度校验，
+  通过校验的候选以并查集合并成簇
+- 签名、桶键与簇号在写入问题时增量落库（issue_signatures / issue_lsh_buckets），
+  新问题只需与同桶的已有簇比较；聚类查询直接按簇号分组，无需重新分词
+"""
+
+import hashlib
+import re
+import unicodedata
+import zlib
+from collections import Counter
+
+from database import DatabasePool
+from utils.lazy import LazyProxy, lazy_import
+
+np = lazy_import('numpy')
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        root = x
+        while self.parent.setdefault(root, root) != root:
+            root = self.parent[root]
+        while x != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[rb] = ra
+
+    def groups(self):
+        result = {}
+        for node in list(self.parent):
+            result.setdefault(self.find(node), []).append(node)
+        return list(result.values())
+
+
+class IssueClusterEngine:
+    SHINGLE_SIZE = 2
+    NUM_PERM = 64
+    BANDS = 16  # 每段 4 行，估计相似度约 0.5 起大概率落入同一桶
+    JACCARD_THRESHOLD = 0.5
+    KEY_CHUNK = 400
+    PRIME = (1 << 31) - 1
+    STOP_WORDS = ('问题', '异常', '失败', '系统', '接口', '项目', '出现', '无法', '进行', '需要', '已经', '相关', '以及')
+    TOKEN_RE = re.compile(r'[\u4e00-\u9fa5A-Za-z0-9]{2,}')
+
+    def __init__(self, seed=20240601):
+        # 固定种子：签名需要跨进程、跨重启保持一致
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, self.PRIME, size=self.NUM_PERM).astype(np.uint64)
+        self._b = rng.randint(0, self.PRIME, size=self.NUM_PERM).astype(np.uint64)
+
+    # ========== 签名 ==========
+
+    @staticmethod
+    def text_hash(text):
+        return hashlib.sha1(str(text or '').encode('utf-8')).hexdigest()[:16]
+
+    def shingles(self, text):
+        """规整（NFKC、小写、去停用词与标点）后按片段切字符 n-gram"""
+        text = unicodedata.normalize('NFKC', str(text or '')).lower()
+        for word in self.STOP_WORDS:
+            text = text.replace(word, ' ')
+        result = set()
+        n = self.SHINGLE_SIZE
+        for segment in re.findall(r'[\u4e00-\u9fa5a-z0-9]+', text):
+            if len(segment) <= n:
+                result.add(segment)
+            else:
+                result.update(segment[i:i + n] for i in range(len(segment) - n + 1))
+        return result
+
+    def signature(self, text):
+        """MinHash 签名（uint32 数组）；无有效文本时返回 None"""
+        shingles = self.shingles(text)
+        if not shingles:
+            return None
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles),
+                             dtype=np.uint64, count=len(shingles)) % self.PRIME
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % self.PRIME).min(axis=1).astype(np.uint32)
+
+    def band_keys(self, signature):
+        rows = self.NUM_PERM // self.BANDS
+        return [
+            f'{band:02d}{zlib.crc32(signature[band * rows:(band + 1) * rows].tobytes()):08x}'
+            for band in range(self.BANDS)
+        ]
+
+    @staticmethod
+    def encode(signature):
+        return signature.astype('<u4').tobytes().hex()
+
+    @staticmethod
+    def decode(text):
+        return np.frombuffer(bytes.fromhex(text), dtype='<u4')
+
+    @staticmethod
+    def similarity(a, b):
+        """两签名相同位置的占比，即 Jaccard 相似度的估计"""
+        return float(np.count_nonzero(a == b)) / len(a)
+
+    # ========== 聚类 ==========
+
+    def cluster(self, signatures, uf=None):
+        """
+        {节点: 签名} → 并查集。
+        每个桶只保留各连通分量的一个锚点，新节点与桶内锚点逐一校验相似度，
+        避免大量重复描述落在同一桶时退化为两两比较。
+        """
+        uf = uf or _UnionFind()
+        anchors = {}
+        for node, sig in signatures.items():
+            uf.find(node)
+            for band in self.band_keys(sig):
+                members = anchors.setdefault(band, [])
+                joined = False
+                for anchor in members:
+                    if uf.find(anchor) == uf.find(node):
+                        joined = True
+                    elif self.similarity(sig, signatures[anchor]) >= self.JACCARD_THRESHOLD:
+                        uf.union(anchor, node)
+                        joined = True
+                if not joined:
+                    members.append(node)
+        return uf
+
+    def assign(self, conn, items):
+        """
+        为一批问题计算签名并增量归簇，返回 {issue_id: cluster_id}。
+        候选只取同桶内每个已有簇的一个代表；新问题连通多个已有簇时把这些簇合并到最小簇号。
+        """
+        entries = {}
+        for issue_id, text in items:
+            entries[issue_id] = (self.text_hash(text), self.signature(text))
+        if not entries:
+            return {}
+
+        cursor = conn.cursor()
+        cursor.executemany(DatabasePool.format_sql('DELETE FROM issue_lsh_buckets WHERE issue_id = ?'),
+                           [(issue_id,) for issue_id in entries])
+
+        bands = {issue_id: self.band_keys(sig) for issue_id, (_, sig) in entries.items() if sig is not None}
+        all_keys = sorted({key for keys in bands.values() for key in keys})
+        uf = _UnionFind()
+        signatures = {}
+        for start in range(0, len(all_keys), self.KEY_CHUNK):
+            chunk = all_keys[start:start + self.KEY_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(DatabasePool.format_sql(f'''
+                SELECT r.cluster_id, r.issue_id, s.signature
+                FROM (
+                    SELECT b.band_key, s2.cluster_id, MIN(b.issue_id) AS issue_id
+                    FROM issue_lsh_buckets b
+                    JOIN issue_signatures s2 ON s2.issue_id = b.issue_id
+                    WHERE b.band_key IN ({placeholders}) AND s2.cluster_id IS NOT NULL
+                    GROUP BY b.band_key, s2.cluster_id
+                ) r
+                JOIN issue_signatures s ON s.issue_id = r.issue_id
+            '''), tuple(chunk)).fetchall()
+            for row in rows:
+                node = ('issue', row['issue_id'])
+                if node not in signatures and row['signature']:
+                    signatures[node] = self.decode(row['signature'])
+                    uf.union(('cluster', row['cluster_id']), node)
+        for issue_id, (_, sig) in entries.items():
+            if sig is not None:
+                signatures[('new', issue_id)] = sig
+        self.cluster(signatures, uf)
+
+        assigned = {}
+        merges = []
+        for nodes in uf.groups():
+            cluster_ids = sorted(n[1] for n in nodes if n[0] == 'cluster')
+            new_ids = [n[1] for n in nodes if n[0] == 'new']
+            if not new_ids and len(cluster_ids) <= 1:
+                continue
+            target = cluster_ids[0] if cluster_ids else min(new_ids)
+            merges.extend((target, cid) for cid in cluster_ids[1:])
+            for issue_id in new_ids:
+                assigned[issue_id] = target
+
+        if merges:
+            cursor.executemany(DatabasePool.format_sql(
+                'UPDATE issue_signatures SET cluster_id = ? WHERE cluster_id = ?'
+            ), merges)
+        cursor.executemany(DatabasePool.format_sql('''
+            INSERT INTO issue_signatures (issue_id, text_hash, signature, cluster_id, updated_at)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (issue_id) DO UPDATE SET
+                text_hash = excluded.text_hash, signature = excluded.signature,
+                cluster_id = excluded.cluster_id, updated_at = excluded.updated_at
+        '''), [
+            (issue_id, text_hash, self.encode(sig) if sig is not None else None, assigned.get(issue_id))
+            for issue_id, (text_hash, sig) in entries.items()
+        ])
+        cursor.executemany(DatabasePool.format_sql(
+            'INSERT INTO issue_lsh_buckets (band_key, issue_id) VALUES (?, ?)'
+        ), [(key, issue_id) for issue_id, keys in bands.items() for key in keys])
+        return assigned
+
+    def index_issue(self, conn, issue_id, description):
+        """问题新增/描述修改时调用（与问题写入同一事务）"""
+        return self.assign(conn, [(issue_id, description)]).get(issue_id)
+
+    def forget(self, conn, issue_id):
+        conn.execute(DatabasePool.format_sql('DELETE FROM issue_lsh_buckets WHERE issue_id = ?'), (issue_id,))
+        conn.execute(DatabasePool.format_sql('DELETE FROM issue_signatures WHERE issue_id = ?'), (issue_id,))
+
+    def sync(self, conn, rows):
+        """补齐签名缺失或描述已变化的问题（其他写入入口未经 index_issue 时兜底），返回处理条数"""
+        stale = [
+            (row['id'], row.get('description'))
+            for row in rows
+            if row.get('text_hash') != self.text_hash(row.get('description'))
+        ]
+        if stale:
+            self.assign(conn, stale)
+        return len(stale)
+
+    def label(self, texts):
+        """簇标题：成员描述中出现最多的词（同频取更长者）"""
+        counter = Counter()
+        for text in texts:
+            counter.update(set(t for t in self.TOKEN_RE.findall(str(text or '')) if t not in self.STOP_WORDS))
+        if not counter:
+            return '其他'
+        return max(counter.items(), key=lambda item: (item[1], len(item[0])))[0][:20]
+
+
+issue_cluster_engine = LazyProxy(IssueClusterEngine, 'issue_cluster_engine')
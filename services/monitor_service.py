@@ -4,9 +4,9 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
-from threading import Thread
 from database import DatabasePool
 from app_config import NOTIFICATION_CONFIG
+from services.notification_stream_service import notification_stream_service
 
 class MonitorService:
     """监控与通知服务"""
@@ -46,7 +46,7 @@ class MonitorService:
             DatabasePool.format_sql('SELECT value FROM system_config WHERE config_key = ?'),
             (key,)
         ).fetchone()
-        if row and row.get('value'):
+        if row and row['value']:
             return str(row['value'])
         return self.DEFAULT_ROUTING.get(ntype, 'project_manager')
 
@@ -92,8 +92,8 @@ class MonitorService:
         return uniq or [None]
 
 
-    def send_wecom_message(self, title, content, msg_type='text', allow_fallback=True):
-        """发送企业微信通知（优先自建应用，降级到Webhook）"""
+    def send_wecom_message(self, title, content, msg_type='text', allow_fallback=True, timeout=30, attempts=3):
+        """发送企业微信通知（优先自建应用，降级到Webhook）；timeout/attempts 控制 Webhook 单次超时与重试次数"""
         from services.wecom_service import wecom_service
         
         # 优先使用自建应用推送（支持定向、卡片等能力）
@@ -121,17 +121,17 @@ class MonitorService:
             else:
                 payload = {"msgtype": "text", "text": {"content": f"【{title}】\n{content}"}}
             
-            for attempt in range(3):
+            for attempt in range(attempts):
                 try:
-                    response = requests.post(webhook_url, json=payload, timeout=30)
+                    response = requests.post(webhook_url, json=payload, timeout=timeout)
                     result = response.json()
                     if result.get('errcode') == 0:
                         return True, result.get('errmsg', 'ok')
                     else:
                         return False, f"WeChat API Error: {result.get('errmsg')}"
                 except requests.exceptions.Timeout:
-                    if attempt == 2:
-                        return False, "WeChat API Timeout (3 attempts)"
+                    if attempt == attempts - 1:
+                        return False, f"WeChat API Timeout ({attempts} attempts)"
                     continue
                 except Exception as e:
                     return False, str(e)
@@ -140,8 +140,8 @@ class MonitorService:
         except Exception as e:
             return False, str(e)
 
-    def send_email(self, subject, html_content, to_emails=None):
-        """发送邮件通知"""
+    def send_email(self, subject, html_content, to_emails=None, session=None):
+        """发送邮件通知；session 为可复用的 SMTP 会话（通知调度器传入），为空时单独建连"""
         if not NOTIFICATION_CONFIG.get('ENABLE_EMAIL'):
             return False, "邮件通知未启用"
         if not NOTIFICATION_CONFIG.get('SMTP_USER') or not NOTIFICATION_CONFIG.get('SMTP_PASSWORD'):
@@ -173,6 +173,9 @@ class MonitorService:
             """
             msg.attach(MIMEText(html_body, 'html', 'utf-8'))
             
+            if session is not None:
+                session.sendmail(NOTIFICATION_CONFIG['SMTP_USER'], receivers, msg.as_string())
+                return True, "发送成功"
             with smtplib.SMTP_SSL(NOTIFICATION_CONFIG['SMTP_SERVER'], NOTIFICATION_CONFIG['SMTP_PORT']) as server:
                 server.login(NOTIFICATION_CONFIG['SMTP_USER'], NOTIFICATION_CONFIG['SMTP_PASSWORD'])
                 server.sendmail(NOTIFICATION_CONFIG['SMTP_USER'], receivers, msg.as_string())
@@ -181,25 +184,23 @@ class MonitorService:
             return False, str(e)
 
     def send_notification_async(self, title, content, notification_type='info', project_id=None):
-        """异步发送通知（WeCom + Email）"""
-        def _send():
-            if NOTIFICATION_CONFIG.get('ENABLE_WECOM'):
-                # 如果是项目相关通知，定向推送给项目经理个人
-                if project_id:
-                    from services.wecom_push_service import wecom_push_service
-                    severity_map = {'danger': 'high', 'warning': 'medium', 'info': 'low'}
-                    severity = severity_map.get(notification_type, 'low')
-                    wecom_push_service.push_warning_to_manager(project_id, title, content, severity)
-                else:
-                    # 非项目通知 → 推送到群
-                    type_emoji = {'danger': '🚨', 'warning': '⚠️', 'info': 'ℹ️'}.get(notification_type, 'ℹ️')
-                    self.send_wecom_message(f"{type_emoji} {title}", content, 'markdown')
-            if NOTIFICATION_CONFIG.get('ENABLE_EMAIL'):
-                html = f"<h3>{title}</h3><p>{content.replace(chr(10), '<br>')}</p>"
-                self.send_email(title, html)
-        
-        thread = Thread(target=_send)
-        thread.start()
+        """异步发送通知（WeCom + Email）：写入外发队列，由通知调度器限流、合并与重试"""
+        from services.notification_dispatcher import (
+            CHANNEL_EMAIL, CHANNEL_WECOM_GROUP, CHANNEL_WECOM_MANAGER, notification_dispatcher
+        )
+        if NOTIFICATION_CONFIG.get('ENABLE_WECOM'):
+            # 如果是项目相关通知，定向推送给项目经理个人
+            if project_id:
+                severity_map = {'danger': 'high', 'warning': 'medium', 'info': 'low'}
+                severity = severity_map.get(notification_type, 'low')
+                notification_dispatcher.enqueue(CHANNEL_WECOM_MANAGER, title, content, project_id=project_id, severity=severity)
+            else:
+                # 非项目通知 → 推送到群
+                type_emoji = {'danger': '🚨', 'warning': '⚠️', 'info': 'ℹ️'}.get(notification_type, 'ℹ️')
+                notification_dispatcher.enqueue(CHANNEL_WECOM_GROUP, f"{type_emoji} {title}", content, msg_type='markdown')
+        if NOTIFICATION_CONFIG.get('ENABLE_EMAIL'):
+            html = f"<h3>{title}</h3><p>{content.replace(chr(10), '<br>')}</p>"
+            notification_dispatcher.enqueue(CHANNEL_EMAIL, title, html)
 
     def get_notifications(self, limit=50, user_id=None):
         """获取通知列表"""
@@ -288,6 +289,7 @@ class MonitorService:
                     data.get('remind_type', 'once')
                 ))
             conn.commit()
+        notification_stream_service.notifications_created(targets)
         self.send_notification_async(data['title'], data.get('content', ''), data.get('type', 'info'), data.get('project_id'))
         return True
 
@@ -309,6 +311,7 @@ class MonitorService:
                     sql = DatabasePool.format_sql('UPDATE notifications SET is_read = ? WHERE is_read = ?')
                     conn.execute(sql, (True, False))
             conn.commit()
+        notification_stream_service.notifications_changed()
         return True
 
     def delete_notifications(self, nid=None):
@@ -321,6 +324,7 @@ class MonitorService:
                 sql = DatabasePool.format_sql('DELETE FROM notifications')
                 conn.execute(sql)
             conn.commit()
+        notification_stream_service.notifications_changed()
         return True
 
     def get_unread_count(self, user_id=None):
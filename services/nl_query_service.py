@@ -1,11 +1,26 @@
-import json
+import hashlib
 import re
+import threading
+import unicodedata
+import uuid
+from collections import OrderedDict
+
 from services.ai_service import ai_service
 from database import DatabasePool
 
 
 class NLQueryService:
+    # 执行沙箱：只读连接 + 语句超时，逐批读取并在读取过程中执行行数/字节上限
+    STATEMENT_TIMEOUT_SECONDS = 5
+    MAX_ROWS = 100
+    MAX_BYTES = 256 * 1024
+    FETCH_BATCH = 50
+    # 问题 → 已校验 SQL 的计划缓存（按 schema 版本与项目隔离）
+    PLAN_CACHE_SIZE = 512
+
     def __init__(self):
+        self._plan_lock = threading.Lock()
+        self._plan_cache = OrderedDict()
         self.schema_summary = """
 Table: projects
 Columns: id, project_no, project_name, hospital_name, status, progress, risk_score, created_at, plan_start_date, plan_end_date
@@ -25,6 +40,44 @@ Table: project_risk_history
 Columns: id, project_id, risk_score, sentiment_score, record_date
 """
 
+    @property
+    def schema_version(self):
+        """schema 说明或数据库类型变化时计划缓存自动失效"""
+        flavor = 'postgres' if DatabasePool.is_postgres() else 'sqlite'
+        return hashlib.sha1(f"{flavor}\n{self.schema_summary}".encode('utf-8')).hexdigest()[:12]
+
+    @staticmethod
+    def normalize_question(question):
+        """归一化问题文本：全角转半角、忽略大小写、空白与标点，使近似重复的问法命中同一缓存"""
+        text = unicodedata.normalize('NFKC', question or '').lower()
+        return ''.join(
+            ch for ch in text
+            if not ch.isspace() and not unicodedata.category(ch).startswith('P')
+        )
+
+    def _plan_key(self, project_id, question):
+        return (self.schema_version, project_id, self.normalize_question(question))
+
+    def get_cached_plan(self, project_id, question):
+        key = self._plan_key(project_id, question)
+        with self._plan_lock:
+            sql = self._plan_cache.get(key)
+            if sql is not None:
+                self._plan_cache.move_to_end(key)
+            return sql
+
+    def cache_plan(self, project_id, question, sql):
+        key = self._plan_key(project_id, question)
+        with self._plan_lock:
+            self._plan_cache[key] = sql
+            self._plan_cache.move_to_end(key)
+            while len(self._plan_cache) > self.PLAN_CACHE_SIZE:
+                self._plan_cache.popitem(last=False)
+
+    def evict_plan(self, project_id, question):
+        with self._plan_lock:
+            self._plan_cache.pop(self._plan_key(project_id, question), None)
+
     def validate_generated_sql(self, sql):
         """校验 AI 生成 SQL 的安全性，仅允许单条只读查询"""
         if not sql or not sql.strip():
@@ -63,13 +116,17 @@ Columns: id, project_id, risk_score, sentiment_score, record_date
         return True, normalized_sql
 
     def ensure_limit(self, sql):
-        """如果查询未显式限制返回数量，则自动追加 LIMIT 100"""
+        """如果查询未显式限制返回数量，则自动追加 LIMIT（显式 LIMIT 过大时由执行时的行数上限兜底）"""
         if re.search(r"\bLIMIT\b", sql, flags=re.IGNORECASE):
             return sql
-        return f"{sql.rstrip()} LIMIT 100"
+        return f"{sql.rstrip()} LIMIT {self.MAX_ROWS}"
 
     def convert_to_sql(self, project_id, question):
-        """将自然语言转换为 SQL"""
+        """将自然语言转换为 SQL；同一 schema 版本下重复或近似的问题直接复用已校验的 SQL"""
+        cached_sql = self.get_cached_plan(project_id, question)
+        if cached_sql:
+            return cached_sql, None
+
         db_flavor = "PostgreSQL" if DatabasePool.is_postgres() else "SQLite"
 
         system_prompt = f"""You are a {db_flavor} expert. Your task is to convert the user's question into a READ-ONLY SQL query based on the following schema:
@@ -94,12 +151,44 @@ Rules:
             if not is_valid:
                 return None, validated_sql
 
+            self.cache_plan(project_id, question, validated_sql)
             return validated_sql, None
         except Exception as e:
             return None, f"SQL 生成失败: {e}"
 
-    def execute_query(self, project_id, sql):
-        """执行 SQL 并返回结果"""
+    @staticmethod
+    def _row_bytes(values):
+        return sum(len(str(v).encode('utf-8')) for v in values if v is not None)
+
+    def _stream_rows(self, conn, sql):
+        """逐批读取结果，达到行数或字节上限即停止；返回 (列名, 行, 是否截断)"""
+        if DatabasePool.is_postgres():
+            # 服务端游标，按批从数据库拉取，不会一次性把结果集读进内存
+            cursor = conn.cursor(name=f"nlq_{uuid.uuid4().hex}")
+            cursor.itersize = self.FETCH_BATCH
+        else:
+            cursor = conn.cursor()
+        try:
+            cursor.execute(sql)
+            rows, total_bytes, truncated = [], 0, False
+            batch = cursor.fetchmany(self.FETCH_BATCH)
+            columns = [description[0] for description in cursor.description or []]
+            while batch and not truncated:
+                for row in batch:
+                    values = list(row)
+                    total_bytes += self._row_bytes(values)
+                    if len(rows) >= self.MAX_ROWS or total_bytes > self.MAX_BYTES:
+                        truncated = True
+                        break
+                    rows.append(dict(zip(columns, values)))
+                else:
+                    batch = cursor.fetchmany(self.FETCH_BATCH)
+            return columns, rows, truncated
+        finally:
+            cursor.close()
+
+    def execute_query(self, project_id, sql, question=None):
+        """在只读沙箱中执行 SQL 并返回结果；传入 question 时执行失败会清除对应的计划缓存"""
         is_valid, validated_sql = self.validate_generated_sql(sql)
         if not is_valid:
             return {"error": validated_sql, "sql": sql}
@@ -108,17 +197,17 @@ Rules:
         formatted_sql = DatabasePool.format_sql(safe_sql)
 
         try:
-            with DatabasePool.get_connection() as conn:
-                cursor = conn.execute(formatted_sql)
-                columns = [description[0] for description in cursor.description]
-                rows = cursor.fetchall()
-                results = [dict(r) for r in rows]
-                return {
-                    "columns": columns,
-                    "rows": results,
-                    "sql": formatted_sql
-                }
+            with DatabasePool.get_readonly_connection(self.STATEMENT_TIMEOUT_SECONDS) as conn:
+                columns, rows, truncated = self._stream_rows(conn, formatted_sql)
+            return {
+                "columns": columns,
+                "rows": rows,
+                "truncated": truncated,
+                "sql": formatted_sql
+            }
         except Exception:
+            if question:
+                self.evict_plan(project_id, question)
             return {
                 "error": "查询执行失败，请检查查询条件或换一种问法。",
                 "sql": formatted_sql
@@ -0,0 +1,361 @@
+# services/notification_dispatcher.py
+"""
+通知外发调度器（企业微信群 / 项目经理定向 / 邮件）
+- 先落 notification_outbox 再入有界队列，固定数量的工作线程发送，进程重启或队列满时由巡检线程从库里补捞
+  （后台任务进程启动时即调用 start()，重启前遗留的记录无需等新消息入队即可补发）
+- 相同渠道 + 内容的消息在待发送或刚发送（COALESCE_SECONDS 内）时合并为一条，只累加 coalesced_count
+- 每个渠道令牌桶限流；失败按指数退避重试，超过 MAX_ATTEMPTS 记为 failed
+- 邮件复用同一个 SMTP 会话，空闲超时后关闭
+- 认领用条件 UPDATE（pending -> sending），多进程同时巡检也不会重复发送
+"""
+
+import hashlib
+import json
+import logging
+import queue
+import smtplib
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from database import DatabasePool
+from app_config import NOTIFICATION_CONFIG
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_WECOM_GROUP = 'wecom_group'
+CHANNEL_WECOM_MANAGER = 'wecom_manager'
+CHANNEL_EMAIL = 'email'
+
+
+def _now_str(offset_seconds=0):
+    return (datetime.now() + timedelta(seconds=offset_seconds)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class _RateLimiter:
+    """令牌桶：每分钟 rate 条，允许 burst 条突发"""
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst or max(1, rate_per_minute // 4))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """占用一个令牌，返回需要等待的秒数"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class _SmtpSession:
+    """复用 SMTP_SSL 连接；发送失败时重连一次"""
+
+    IDLE_SECONDS = 60
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.server = None
+        self.last_used = 0
+
+    def _close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+        self.server = None
+
+    def _connect(self):
+        server = smtplib.SMTP_SSL(NOTIFICATION_CONFIG['SMTP_SERVER'], NOTIFICATION_CONFIG['SMTP_PORT'], timeout=30)
+        server.login(NOTIFICATION_CONFIG['SMTP_USER'], NOTIFICATION_CONFIG['SMTP_PASSWORD'])
+        return server
+
+    def sendmail(self, sender, receivers, message):
+        with self.lock:
+            if self.server is not None and time.monotonic() - self.last_used > self.IDLE_SECONDS:
+                self._close()
+            for attempt in range(2):
+                if self.server is None:
+                    self.server = self._connect()
+                try:
+                    self.server.sendmail(sender, receivers, message)
+                    self.last_used = time.monotonic()
+                    return
+                except (smtplib.SMTPServerDisconnected, OSError):
+                    self._close()
+                    if attempt:
+                        raise
+
+    def close_if_idle(self):
+        with self.lock:
+            if self.server is not None and time.monotonic() - self.last_used > self.IDLE_SECONDS:
+                self._close()
+
+
+class NotificationDispatcher:
+    WORKERS = 4
+    QUEUE_SIZE = 1000
+    MAX_ATTEMPTS = 5
+    BACKOFF_BASE_SECONDS = 30
+    BACKOFF_MAX_SECONDS = 3600
+    COALESCE_SECONDS = 600
+    SWEEP_SECONDS = 30
+    STALE_SENDING_SECONDS = 600
+    RATE_LIMITS = {
+        CHANNEL_WECOM_GROUP: 20,
+        CHANNEL_WECOM_MANAGER: 60,
+        CHANNEL_EMAIL: 10,
+    }
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._started = False
+        self._stop = threading.Event()
+        self._limiters = {channel: _RateLimiter(rate) for channel, rate in self.RATE_LIMITS.items()}
+        self._handlers = {
+            CHANNEL_WECOM_GROUP: self._send_wecom_group,
+            CHANNEL_WECOM_MANAGER: self._send_wecom_manager,
+            CHANNEL_EMAIL: self._send_email,
+        }
+        self.smtp = _SmtpSession()
+        self._latencies = deque(maxlen=500)
+        self._stats = {'enqueued': 0, 'coalesced': 0, 'sent': 0, 'retried': 0, 'failed': 0, 'dropped_to_outbox': 0}
+
+    # ---------------- 入队 ----------------
+
+    @staticmethod
+    def dedupe_key(channel, title, content, payload):
+        raw = json.dumps([channel, title, content, payload], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def enqueue(self, channel, title, content='', **payload):
+        """写入外发队列；重复消息合并，返回 outbox id（合并时返回已有记录 id）"""
+        if channel not in self._handlers:
+            raise ValueError(f'未知通知渠道: {channel}')
+        key = self.dedupe_key(channel, title, content, payload)
+        with DatabasePool.get_connection() as conn:
+            existing = conn.execute(DatabasePool.format_sql('''
+                SELECT id FROM notification_outbox
+                WHERE dedupe_key = ?
+                  AND (status IN ('pending', 'sending') OR (status = 'sent' AND sent_at >= ?))
+                ORDER BY id DESC LIMIT 1
+            '''), (key, _now_str(-self.COALESCE_SECONDS))).fetchone()
+            if existing:
+                conn.execute(DatabasePool.format_sql(
+                    'UPDATE notification_outbox SET coalesced_count = coalesced_count + 1 WHERE id = ?'
+                ), (existing['id'],))
+                conn.commit()
+                self._bump('coalesced')
+                return existing['id']
+
+            sql = '''
+                INSERT INTO notification_outbox
+                (channel, dedupe_key, title, content, payload, status, attempts, next_attempt_at, enqueued_at)
+                VALUES (?, ?, ?, ?, ?, 'pending', 0, ?, ?)
+            '''
+            if DatabasePool.is_postgres():
+                sql += ' RETURNING id'
+            cursor = conn.execute(DatabasePool.format_sql(sql), (
+                channel, key, title, content, json.dumps(payload, ensure_ascii=False, default=str),
+                _now_str(), time.time(),
+            ))
+            outbox_id = DatabasePool.get_inserted_id(cursor)
+            conn.commit()
+
+        self._bump('enqueued')
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(outbox_id)
+        except queue.Full:
+            # 队列满时记录留在库里，由巡检线程稍后补发
+            self._bump('dropped_to_outbox')
+        return outbox_id
+
+    # ---------------- 工作线程 ----------------
+
+    def _bump(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def start(self):
+        """启动工作线程与巡检线程；在后台任务进程启动时调用，以便补发重启前遗留的待发送记录"""
+        self._ensure_started()
+
+    def _ensure_started(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for i in range(self.WORKERS):
+            threading.Thread(target=self._worker_loop, name=f'notify-worker-{i}', daemon=True).start()
+        threading.Thread(target=self._sweep_loop, name='notify-sweeper', daemon=True).start()
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            try:
+                outbox_id = self._queue.get(timeout=5)
+            except queue.Empty:
+                self.smtp.close_if_idle()
+                continue
+            try:
+                self.deliver(outbox_id)
+            except Exception as e:
+                logger.error("通知外发异常 #%s: %s", outbox_id, e, exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    def _sweep_loop(self):
+        # 启动后立即巡检一次，补捞重启前遗留的 pending 与退避到期记录
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.warning("通知外发巡检失败: %s", e)
+            self._stop.wait(self.SWEEP_SECONDS)
+
+    def sweep(self, limit=200):
+        """补捞到期的待发送记录，并把卡在 sending 的记录放回 pending"""
+        with DatabasePool.get_connection() as conn:
+            conn.execute(DatabasePool.format_sql('''
+                UPDATE notification_outbox SET status = 'pending'
+                WHERE status = 'sending' AND next_attempt_at < ?
+            '''), (_now_str(-self.STALE_SENDING_SECONDS),))
+            conn.commit()
+            rows = conn.execute(DatabasePool.format_sql('''
+                SELECT id FROM notification_outbox
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at, id LIMIT ?
+            '''), (_now_str(), limit)).fetchall()
+        queued = 0
+        for row in rows:
+            try:
+                self._queue.put_nowait(row['id'])
+                queued += 1
+            except queue.Full:
+                break
+        return queued
+
+    def _claim(self, outbox_id):
+        with DatabasePool.get_connection() as conn:
+            cursor = conn.execute(DatabasePool.format_sql('''
+                UPDATE notification_outbox SET status = 'sending', next_attempt_at = ?
+                WHERE id = ? AND status = 'pending' AND next_attempt_at <= ?
+            '''), (_now_str(), outbox_id, _now_str()))
+            conn.commit()
+            if cursor.rowcount != 1:
+                return None
+            row = conn.execute(DatabasePool.format_sql(
+                'SELECT * FROM notification_outbox WHERE id = ?'
+            ), (outbox_id,)).fetchone()
+        return dict(row) if row else None
+
+    def deliver(self, outbox_id):
+        """认领并发送一条记录；返回最终状态（未认领到返回 None）"""
+        row = self._claim(outbox_id)
+        if not row:
+            return None
+        channel = row['channel']
+        wait = self._limiters[channel].reserve() if channel in self._limiters else 0
+        if wait > 0:
+            time.sleep(wait)
+
+        try:
+            payload = json.loads(row['payload'] or '{}')
+            ok, message = self._handlers[channel](row['title'], row['content'] or '', payload)
+        except Exception as e:
+            ok, message = False, str(e)
+
+        attempts = (row['attempts'] or 0) + 1
+        with DatabasePool.get_connection() as conn:
+            if ok:
+                status = 'sent'
+                conn.execute(DatabasePool.format_sql('''
+                    UPDATE notification_outbox
+                    SET status = 'sent', attempts = ?, sent_at = ?, last_error = NULL
+                    WHERE id = ?
+                '''), (attempts, _now_str(), outbox_id))
+                self._bump('sent')
+                if row.get('enqueued_at'):
+                    with self._lock:
+                        self._latencies.append(max(0.0, time.time() - float(row['enqueued_at'])))
+            elif attempts >= self.MAX_ATTEMPTS:
+                status = 'failed'
+                conn.execute(DatabasePool.format_sql('''
+                    UPDATE notification_outbox SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?
+                '''), (attempts, str(message)[:500], outbox_id))
+                self._bump('failed')
+                logger.warning("通知外发最终失败 #%s (%s): %s", outbox_id, channel, message)
+            else:
+                status = 'pending'
+                delay = min(self.BACKOFF_MAX_SECONDS, self.BACKOFF_BASE_SECONDS * (2 ** (attempts - 1)))
+                conn.execute(DatabasePool.format_sql('''
+                    UPDATE notification_outbox
+                    SET status = 'pending', attempts = ?, last_error = ?, next_attempt_at = ?
+                    WHERE id = ?
+                '''), (attempts, str(message)[:500], _now_str(delay), outbox_id))
+                self._bump('retried')
+            conn.commit()
+        return status
+
+    # ---------------- 渠道实现 ----------------
+
+    @staticmethod
+    def _send_wecom_group(title, content, payload):
+        from services.monitor_service import monitor_service
+        # 单次短超时，重试交给调度器退避，避免工作线程被 3×30 秒的超时拖住
+        return monitor_service.send_wecom_message(
+            title, content, payload.get('msg_type', 'markdown'), timeout=10, attempts=1
+        )
+
+    @staticmethod
+    def _send_wecom_manager(title, content, payload):
+        from services.wecom_push_service import wecom_push_service
+        severity = payload.get('severity', 'low')
+        ok, message = wecom_push_service.push_warning_to_manager(payload.get('project_id'), title, content, severity)
+        # 非高危消息在经理未绑定时按设计跳过群兜底，不算失败
+        return (ok or severity != 'high'), message
+
+    def _send_email(self, title, content, payload):
+        from services.monitor_service import monitor_service
+        return monitor_service.send_email(title, content, to_emails=payload.get('to_emails'), session=self.smtp)
+
+    # ---------------- 指标 ----------------
+
+    def metrics(self):
+        with DatabasePool.get_connection() as conn:
+            rows = conn.execute(DatabasePool.format_sql(
+                'SELECT channel, status, COUNT(*) AS c FROM notification_outbox GROUP BY channel, status'
+            )).fetchall()
+        outbox = {}
+        for row in rows:
+            outbox.setdefault(row['channel'], {})[row['status']] = row['c']
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = dict(self._stats)
+        latency = {}
+        if latencies:
+            latency = {
+                'avg_seconds': round(sum(latencies) / len(latencies), 3),
+                'p95_seconds': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+                'samples': len(latencies),
+            }
+        return {
+            'queue_depth': self._queue.qsize(),
+            'queue_capacity': self.QUEUE_SIZE,
+            'workers': self.WORKERS if self._started else 0,
+            'outbox': outbox,
+            'delivery_latency': latency,
+            'counters': stats,
+        }
+
+
+notification_dispatcher = NotificationDispatcher()
@@ -0,0 +1,296 @@
+# services/notification_stream_server.py
+"""
+通知 SSE 推送服务（独立端口，asyncio）
+WSGI 服务（app.run / gunicorn 同步 worker）下一条 SSE 连接要占住一个线程直到断开，无法支撑上千条空闲连接。
+这里在后台线程中运行一个 asyncio 事件循环专门承载 SSE：
+- 每条连接只是一个协程加一个 socket，空闲时不占线程；连接数上限由 MAX_CONNECTIONS 与进程文件描述符上限决定
+- NotificationStreamService 发布事件时通过 call_soon_threadsafe 唤醒事件循环，不轮询
+- 鉴权、未读数等需要查库的调用放到小线程池执行，执行完即释放线程
+- 浏览器通过 /api/notifications/channel 取得推送地址；与主站不同端口时按 CORS 携带 Cookie，
+  只接受与推送服务同主机名的 Origin；经反向代理同源转发时配置 PUBLIC_URL 即可
+"""
+
+import asyncio
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import urlsplit
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+from app_config import NOTIFICATION_STREAM_CONFIG
+from services.notification_stream_service import notification_stream_service
+
+logger = logging.getLogger(__name__)
+
+STREAM_PATH = '/api/notifications/stream'
+
+
+class NotificationStreamServer:
+    HEADER_TIMEOUT_SECONDS = 10
+    HEADER_LIMIT = 16 * 1024
+    DB_WORKERS = 4
+
+    def __init__(self, service=None, enabled=None, host=None, port=None, max_connections=None, public_url=None):
+        self.service = service or notification_stream_service
+        self.enabled = NOTIFICATION_STREAM_CONFIG['ENABLED'] if enabled is None else enabled
+        self.host = host if host is not None else NOTIFICATION_STREAM_CONFIG['HOST']
+        self.port = port if port is not None else NOTIFICATION_STREAM_CONFIG['PORT']
+        self.max_connections = max_connections or NOTIFICATION_STREAM_CONFIG['MAX_CONNECTIONS']
+        self.public_url = NOTIFICATION_STREAM_CONFIG['PUBLIC_URL'] if public_url is None else public_url
+        self._lock = threading.Lock()
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._executor = None
+        self._wakeup = None
+        self._connections = 0
+
+    # ---------------- 生命周期 ----------------
+
+    @property
+    def running(self):
+        return self._server is not None
+
+    @property
+    def connections(self):
+        return self._connections
+
+    def start(self):
+        """在后台线程中启动事件循环并监听端口（幂等）；port=0 时由系统分配端口"""
+        with self._lock:
+            if self._thread is not None or not self.enabled:
+                return self.running
+            self._raise_open_files_limit()
+            ready = threading.Event()
+            self._executor = ThreadPoolExecutor(max_workers=self.DB_WORKERS, thread_name_prefix='sse-db')
+            self._thread = threading.Thread(target=self._run, args=(ready,), name='notification-sse', daemon=True)
+            self._thread.start()
+        ready.wait(5)
+        return self.running
+
+    def stop(self):
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if loop is None:
+                return
+            loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        with self._lock:
+            self._thread = None
+            self._loop = None
+            self._server = None
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _raise_open_files_limit(self):
+        """每条连接占一个文件描述符：把软上限提到 MAX_CONNECTIONS 加余量（不超过硬上限）"""
+        if resource is None:
+            return
+        try:
+            soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+            wanted = self.max_connections + 1024
+            if hard != resource.RLIM_INFINITY:
+                wanted = min(wanted, hard)
+            if soft != resource.RLIM_INFINITY and soft < wanted:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+        except (ValueError, OSError) as e:
+            logger.warning('调整文件描述符上限失败: %s', e)
+
+    def _run(self, ready):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        try:
+            server = loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port, limit=self.HEADER_LIMIT)
+            )
+        except OSError as e:
+            logger.error('通知推送服务监听 %s:%s 失败: %s', self.host, self.port, e)
+            self._loop = None
+            ready.set()
+            loop.close()
+            return
+        self.port = server.sockets[0].getsockname()[1]
+        self._server = server
+        self.service.add_listener(self._on_publish)
+        logger.info('通知推送服务已启动: %s:%s', self.host, self.port)
+        ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            self.service.remove_listener(self._on_publish)
+            server.close()
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.close()
+
+    def stream_url(self, host, scheme='http'):
+        """浏览器使用的推送地址；未启用时返回 None，前端改走长轮询。
+        多 worker 部署时推送服务只在后台任务进程中运行，其余进程同样返回该地址"""
+        if not self.enabled:
+            return None
+        if self.public_url:
+            return self.public_url
+        hostname = urlsplit(f'//{host}').hostname or 'localhost'
+        if ':' in hostname:
+            hostname = f'[{hostname}]'
+        return f'{scheme}://{hostname}:{self.port}{STREAM_PATH}'
+
+    # ---------------- 事件唤醒 ----------------
+
+    def _on_publish(self, seq):
+        # 由发布方线程调用，只把唤醒投递给事件循环
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        # 置位当前 Event 唤醒所有等待者，再换一个新的供下一轮等待
+        wakeup, self._wakeup = self._wakeup, asyncio.Event()
+        wakeup.set()
+
+    async def _wait(self, seq, timeout):
+        """等到序号大于 seq 或超时，返回当前序号"""
+        wakeup = self._wakeup
+        if self.service.current_seq == seq:
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.service.current_seq
+
+    async def _call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    # ---------------- HTTP ----------------
+
+    async def _handle(self, reader, writer):
+        try:
+            try:
+                head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.HEADER_TIMEOUT_SECONDS)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+            method, path, headers = self._parse_head(head)
+            cors = self._cors_headers(headers)
+            if method == 'OPTIONS':
+                await self._send_json(writer, 204, None, cors)
+                return
+            if method != 'GET' or path != STREAM_PATH:
+                await self._send_json(writer, 404, {'success': False, 'message': 'Not Found', 'code': 404}, cors)
+                return
+            user = await self._call(self._authenticate, headers)
+            if not user:
+                await self._send_json(writer, 401, {'success': False, 'message': 'Unauthorized', 'code': 401, 'silent': True}, cors)
+                return
+            if self._connections >= self.max_connections:
+                await self._send_json(writer, 503, {'success': False, 'data': {'fallback': 'poll'},
+                                                    'message': '推送连接已满，请使用轮询', 'code': 503}, cors)
+                return
+            self._connections += 1
+            try:
+                await self._stream(writer, user.get('id'), self._last_event_id(headers), cors)
+            finally:
+                self._connections -= 1
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        except Exception as e:
+            logger.warning('通知推送连接异常: %s', e)
+        finally:
+            writer.close()
+
+    async def _stream(self, writer, user_id, last_seq, cors):
+        loop = asyncio.get_running_loop()
+        service = self.service
+        deadline = loop.time() + service.STREAM_SECONDS
+        headers = dict(cors, **{
+            'Content-Type': 'text/event-stream; charset=utf-8',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        })
+        writer.write(self._status_line(200, headers) + b'retry: 3000\n\n')
+        seq = service.current_seq
+        if last_seq is not None and last_seq < seq:
+            messages, seq = await self._call(service._collect, user_id, last_seq)
+        else:
+            messages = [('unread', {'count': await self._call(service.unread_count, user_id)})]
+        while True:
+            for name, data in messages:
+                writer.write(service._format_sse(name, data, seq).encode('utf-8'))
+            await writer.drain()
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            if await self._wait(seq, min(service.KEEPALIVE_SECONDS, remaining)) == seq:
+                writer.write(b': keepalive\n\n')
+                messages = []
+                continue
+            messages, seq = await self._call(service._collect, user_id, seq)
+
+    @staticmethod
+    def _parse_head(head):
+        lines = head.decode('latin-1').split('\r\n')
+        parts = lines[0].split(' ')
+        method = parts[0].upper() if parts else ''
+        path = urlsplit(parts[1]).path if len(parts) > 1 else ''
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                key, value = line.split(':', 1)
+                headers[key.strip().lower()] = value.strip()
+        return method, path, headers
+
+    @staticmethod
+    def _authenticate(headers):
+        from services.auth_service import auth_service
+        token = headers.get('authorization', '').replace('Bearer ', '')
+        if not token and headers.get('cookie'):
+            morsel = SimpleCookie(headers['cookie']).get('auth_token')
+            token = morsel.value if morsel else ''
+        return auth_service.validate_token(token) if token else None
+
+    @staticmethod
+    def _last_event_id(headers):
+        try:
+            return int(headers['last-event-id'])
+        except (KeyError, ValueError):
+            return None
+
+    @staticmethod
+    def _cors_headers(headers):
+        """跨端口访问时只放行与推送服务同主机名的页面，避免其他站点借用户 Cookie 读取推送"""
+        origin = headers.get('origin')
+        if not origin or urlsplit(origin).hostname != urlsplit(f"//{headers.get('host', '')}").hostname:
+            return {}
+        return {
+            'Access-Control-Allow-Origin': origin,
+            'Access-Control-Allow-Credentials': 'true',
+            'Access-Control-Allow-Headers': 'Last-Event-ID, Cache-Control',
+            'Vary': 'Origin',
+        }
+
+    @staticmethod
+    def _status_line(status, headers):
+        reasons = {200: 'OK', 204: 'No Content', 401: 'Unauthorized', 404: 'Not Found', 503: 'Service Unavailable'}
+        lines = [f'HTTP/1.1 {status} {reasons[status]}', 'Connection: close']
+        lines.extend(f'{key}: {value}' for key, value in headers.items())
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def _send_json(self, writer, status, payload, cors):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8') if payload is not None else b''
+        headers = dict(cors, **{'Content-Length': str(len(body))})
+        if payload is not None:
+            headers['Content-Type'] = 'application/json; charset=utf-8'
+        writer.write(self._status_line(status, headers) + body)
+        await writer.drain()
+
+
+notification_stream_server = NotificationStreamServer()
@@ -0,0 +1,162 @@
+# services/notification_stream_service.py
+"""
+通知/后台任务推送通道
+- 进程内发布/订阅：create_notification、mark_as_read 与后台任务登记发布事件
+- 每用户未读数缓存在内存中，新通知增量 +1，已读时失效，按 RECONCILE_SECONDS 与库对账
+- SSE 流由独立端口的 asyncio 服务承载（services/notification_stream_server.py），通过发布监听被唤醒，
+  空闲连接不占 WSGI 线程；单条流有时长上限，客户端（EventSource）自动重连
+- 长轮询在 Condition 上等待，不查库、不忙等，供不支持或连不上 SSE 的客户端使用
+多进程（gunicorn 多 worker）下其他进程的写入不会即时推送，由周期对账兜底。
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+TOPIC_NOTIFICATIONS = 'notifications'
+TOPIC_TASKS = 'tasks'
+
+
+class NotificationStreamService:
+    HISTORY_SIZE = 1000
+    RECONCILE_SECONDS = 60
+    STREAM_SECONDS = 55
+    KEEPALIVE_SECONDS = 15
+    POLL_TIMEOUT_SECONDS = 25
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._events = deque(maxlen=self.HISTORY_SIZE)
+        self._counts_lock = threading.Lock()
+        self._counts = {}
+        self._listeners = []
+
+    # ---------------- 发布/订阅 ----------------
+
+    @property
+    def current_seq(self):
+        return self._seq
+
+    def publish(self, topic, payload=None, user_ids=None):
+        """发布事件；user_ids 为 None 表示广播给所有人"""
+        with self._cond:
+            self._seq += 1
+            self._events.append((self._seq, topic, frozenset(user_ids) if user_ids is not None else None, payload or {}))
+            self._cond.notify_all()
+            seq = self._seq
+        for listener in list(self._listeners):
+            try:
+                listener(seq)
+            except Exception as e:
+                logger.warning("通知推送监听回调失败: %s", e)
+        return seq
+
+    def add_listener(self, callback):
+        """注册发布回调 callback(seq)；在发布方线程中调用，回调只应做投递唤醒之类的轻量操作"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def wait(self, after_seq, timeout):
+        """阻塞直到有序号大于 after_seq 的事件或超时，返回当前序号"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after_seq, timeout)
+            return self._seq
+
+    def events_since(self, after_seq, user_id):
+        """返回 (是否需要全量刷新, 与该用户相关的事件, 已读到的序号)；历史被挤出时需全量刷新"""
+        with self._cond:
+            events = list(self._events)
+            latest = self._seq
+        resync = bool(events) and after_seq < events[0][0] - 1
+        relevant = [
+            (seq, topic, payload) for seq, topic, users, payload in events
+            if seq > after_seq and (users is None or user_id in users)
+        ]
+        return resync, relevant, latest
+
+    # ---------------- 未读数 ----------------
+
+    def unread_count(self, user_id):
+        now = time.time()
+        with self._counts_lock:
+            cached = self._counts.get(user_id)
+            if cached and now - cached[1] < self.RECONCILE_SECONDS:
+                return cached[0]
+        from services.monitor_service import monitor_service
+        count = monitor_service.get_unread_count(user_id=user_id)
+        with self._counts_lock:
+            self._counts[user_id] = (count, now)
+        return count
+
+    def notifications_created(self, target_user_ids):
+        """新通知写库后调用；target_user_ids 含 None 表示全员可见"""
+        targets = set(target_user_ids)
+        broadcast = None in targets
+        with self._counts_lock:
+            for uid, (count, loaded_at) in list(self._counts.items()):
+                if broadcast or uid in targets:
+                    self._counts[uid] = (count + 1, loaded_at)
+        self.publish(TOPIC_NOTIFICATIONS, {'reason': 'created'}, None if broadcast else targets)
+
+    def notifications_changed(self):
+        """已读/删除后调用：公共通知的已读状态影响所有人，统一失效后重新计数"""
+        with self._counts_lock:
+            self._counts.clear()
+        self.publish(TOPIC_NOTIFICATIONS, {'reason': 'changed'})
+
+    def task_updated(self, task):
+        self.publish(TOPIC_TASKS, {
+            key: task.get(key)
+            for key in ('task_id', 'task_type', 'title', 'project_id', 'status', 'updated_at', 'error')
+        })
+
+    # ---------------- 推送通道 ----------------
+
+    def _collect(self, user_id, after_seq):
+        """把 after_seq 之后的事件整理成客户端消息：未读数只发最新值，任务事件逐条发；
+        返回 (消息列表, 已读到的序号)"""
+        resync, events, latest = self.events_since(after_seq, user_id)
+        messages = []
+        if resync:
+            messages.append(('resync', {}))
+        if resync or any(topic == TOPIC_NOTIFICATIONS for _, topic, _ in events):
+            messages.append(('unread', {'count': self.unread_count(user_id)}))
+        messages.extend(('task', payload) for _, topic, payload in events if topic == TOPIC_TASKS)
+        return messages, latest
+
+    def poll(self, user_id, since=None, timeout=None):
+        """长轮询：since 为空时立即返回当前状态；否则等到有新事件或超时"""
+        if since is None:
+            return {'seq': self.current_seq, 'events': [{'event': 'unread', 'data': {'count': self.unread_count(user_id)}}]}
+        timeout = self.POLL_TIMEOUT_SECONDS if timeout is None else timeout
+        deadline = time.time() + timeout
+        seq = since
+        messages = []
+        while not messages:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            if self.wait(seq, remaining) == seq:
+                break
+            messages, seq = self._collect(user_id, seq)
+        return {'seq': seq, 'events': [{'event': name, 'data': data} for name, data in messages]}
+
+    @staticmethod
+    def _format_sse(event, data, seq=None):
+        lines = []
+        if seq is not None:
+            lines.append(f'id: {seq}')
+        lines.append(f'event: {event}')
+        lines.append(f'data: {json.dumps(data, ensure_ascii=False, default=str)}')
+        return '\n'.join(lines) + '\n\n'
+
+
+notification_stream_service = NotificationStreamService()
@@ -7,9 +7,6 @@ from typing import Any, Dict, List, Optional
 
 from ai_utils import call_ai
 from database import DatabasePool
-from docx import Document
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.shared import Pt
 from services.audit_service import audit_service
 
 
@@ -202,15 +199,19 @@ class PerformanceReviewService:
     @staticmethod
     def list_cycles(limit: int = 16) -> List[Dict[str, Any]]:
         with DatabasePool.get_connection() as conn:
-            rows = conn.execute(
-                DatabasePool.format_sql('''
-                    SELECT * FROM performance_review_cycles
-                    ORDER BY start_date DESC
-                    LIMIT ?
-                '''),
-                (limit,),
-            ).fetchall()
-            return [dict(row) for row in rows]
+            return PerformanceReviewService._list_cycles(conn, limit)
+
+    @staticmethod
+    def _list_cycles(conn, limit: int = 16) -> List[Dict[str, Any]]:
+        rows = conn.execute(
+            DatabasePool.format_sql('''
+                SELECT * FROM performance_review_cycles
+                ORDER BY start_date DESC
+                LIMIT ?
+            '''),
+            (limit,),
+        ).fetchall()
+        return [dict(row) for row in rows]
 
     @staticmethod
     def _get_cycle(conn, cycle_id: Optional[int] = None, ref_date: Optional[str] = None):
@@ -224,12 +225,83 @@ class PerformanceReviewService:
         return PerformanceReviewService.ensure_cycle(ref_date=ref_date)
 
     @staticmethod
-    def _sync_targets_for_cycle(conn, cycle: Dict[str, Any], project_id: Optional[int] = None) -> List[Dict[str, Any]]:
-        cycle_id = cycle['id']
+    def _load_cycle_signals(conn, cycle: Dict[str, Any], project_id: Optional[int] = None) -> Dict[str, Dict[Any, Any]]:
+        """每张表一次分组聚合，取回周期内全部成员的日志/任务/阶段/问题信号"""
         start_date = str(cycle['start_date'])
         end_date = str(cycle['end_date'])
         start_dt, end_exclusive_dt, _ = PerformanceReviewService._date_window_bounds(start_date, end_date)
+        scope = (project_id,) if project_id else ()
+
+        log_rows = conn.execute(DatabasePool.format_sql(f'''
+            SELECT project_id, member_id, member_name, COUNT(*) AS c
+            FROM work_logs
+            WHERE log_date BETWEEN ? AND ?
+              {'AND project_id = ?' if project_id else ''}
+            GROUP BY project_id, member_id, member_name
+        '''), (start_date, end_date) + scope).fetchall()
+        logs: Dict[Any, List[Any]] = {}
+        for row in log_rows:
+            logs.setdefault(row['project_id'], []).append((row['member_id'], row['member_name'], int(row['c'] or 0)))
+
+        task_rows = conn.execute(DatabasePool.format_sql(f'''
+            SELECT s.project_id, COALESCE(t.assigned_to, '') AS assignee, COUNT(*) AS c
+            FROM tasks t
+            JOIN project_stages s ON s.id = t.stage_id
+            WHERE (
+                (t.completed_date BETWEEN ? AND ?)
+                OR (t.updated_at IS NOT NULL AND t.updated_at >= ? AND t.updated_at < ?)
+                OR t.is_completed = 0
+              )
+              {'AND s.project_id = ?' if project_id else ''}
+            GROUP BY s.project_id, COALESCE(t.assigned_to, '')
+        '''), (start_date, end_date, start_dt, end_exclusive_dt) + scope).fetchall()
+
+        stage_rows = conn.execute(DatabasePool.format_sql(f'''
+            SELECT project_id, COALESCE(responsible_person, '') AS owner, COUNT(*) AS c
+            FROM project_stages
+            {'WHERE project_id = ?' if project_id else ''}
+            GROUP BY project_id, COALESCE(responsible_person, '')
+        '''), scope).fetchall()
+
+        issue_rows = conn.execute(DatabasePool.format_sql(f'''
+            SELECT project_id, owner_member_id, COUNT(*) AS c
+            FROM issues
+            WHERE owner_member_id IS NOT NULL
+              AND created_at < ?
+              AND (
+                resolved_at IS NULL
+                OR resolved_at >= ?
+              )
+              {'AND project_id = ?' if project_id else ''}
+            GROUP BY project_id, owner_member_id
+        '''), (end_exclusive_dt, start_dt) + scope).fetchall()
+
+        return {
+            'logs': logs,
+            'tasks': {(row['project_id'], row['assignee']): int(row['c'] or 0) for row in task_rows},
+            'stages': {(row['project_id'], row['owner']): int(row['c'] or 0) for row in stage_rows},
+            'issues': {(row['project_id'], row['owner_member_id']): int(row['c'] or 0) for row in issue_rows},
+        }
 
+    @staticmethod
+    def _member_signals(signal_index: Dict[str, Dict[Any, Any]], member: Dict[str, Any]) -> Dict[str, int]:
+        project_id = member['project_id']
+        name = member.get('name') or ''
+        # 日志按 member_id 或 member_name 任一命中计数，与逐人 COUNT 口径一致
+        log_count = sum(
+            count for member_id, member_name, count in signal_index['logs'].get(project_id, [])
+            if member_id == member['id'] or member_name == name
+        )
+        return {
+            'logs': int(log_count),
+            'tasks': signal_index['tasks'].get((project_id, name), 0),
+            'stages': signal_index['stages'].get((project_id, name), 0),
+            'issues': signal_index['issues'].get((project_id, member['id']), 0),
+        }
+
+    @staticmethod
+    def _sync_targets_for_cycle(conn, cycle: Dict[str, Any], project_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        cycle_id = cycle['id']
         project_filter = 'AND pm.project_id = ?' if project_id else ''
         active_members = conn.execute(DatabasePool.format_sql(f'''
             SELECT
@@ -256,82 +328,30 @@ class PerformanceReviewService:
                 ('inactive', cycle_id),
             )
 
+        signal_index = PerformanceReviewService._load_cycle_signals(conn, cycle, project_id)
+        # 以冲突键去重（同名成员后者覆盖前者，与逐行 upsert 结果一致），批量 upsert 要求一批内键唯一
+        upserts = {}
         for member in active_members:
             member_dict = dict(member)
-            log_signal = conn.execute(DatabasePool.format_sql('''
-                SELECT COUNT(*) AS c
-                FROM work_logs
-                WHERE project_id = ?
-                  AND log_date BETWEEN ? AND ?
-                  AND (
-                    member_id = ?
-                    OR member_name = ?
-                  )
-            '''), (
+            signals = PerformanceReviewService._member_signals(signal_index, member_dict)
+            if not PerformanceReviewService._is_rnd_target_member(member_dict, signals):
+                continue
+            upserts[(member_dict['project_id'], member_dict['name'])] = (
+                cycle_id,
                 member_dict['project_id'],
-                start_date,
-                end_date,
                 member_dict['id'],
                 member_dict['name'],
-            )).fetchone()['c'] or 0
-
-            task_signal = conn.execute(DatabasePool.format_sql('''
-                SELECT COUNT(*) AS c
-                FROM tasks t
-                JOIN project_stages s ON s.id = t.stage_id
-                WHERE s.project_id = ?
-                  AND COALESCE(t.assigned_to, '') = ?
-                  AND (
-                    (t.completed_date BETWEEN ? AND ?)
-                    OR (t.updated_at IS NOT NULL AND t.updated_at >= ? AND t.updated_at < ?)
-                    OR t.is_completed = 0
-                  )
-            '''), (
-                member_dict['project_id'],
-                member_dict['name'],
-                start_date,
-                end_date,
-                start_dt,
-                end_exclusive_dt,
-            )).fetchone()['c'] or 0
-
-            stage_signal = conn.execute(DatabasePool.format_sql('''
-                SELECT COUNT(*) AS c
-                FROM project_stages
-                WHERE project_id = ?
-                  AND COALESCE(responsible_person, '') = ?
-            '''), (
-                member_dict['project_id'],
-                member_dict['name'],
-            )).fetchone()['c'] or 0
-
-            issue_signal = conn.execute(DatabasePool.format_sql('''
-                SELECT COUNT(*) AS c
-                FROM issues
-                WHERE project_id = ?
-                  AND owner_member_id = ?
-                  AND created_at < ?
-                  AND (
-                    resolved_at IS NULL
-                    OR resolved_at >= ?
-                  )
-            '''), (
-                member_dict['project_id'],
-                member_dict['id'],
-                end_exclusive_dt,
-                start_dt,
-            )).fetchone()['c'] or 0
-
-            signals = {
-                'logs': int(log_signal),
-                'tasks': int(task_signal),
-                'stages': int(stage_signal),
-                'issues': int(issue_signal),
-            }
-            if not PerformanceReviewService._is_rnd_target_member(member_dict, signals):
-                continue
+                member_dict.get('role') or '',
+                bool(PerformanceReviewService._as_bool(member_dict.get('is_onsite'))),
+                'active',
+                signals['logs'],
+                signals['tasks'],
+                signals['stages'],
+                signals['issues'],
+            )
 
-            conn.execute(DatabasePool.format_sql('''
+        if upserts:
+            DatabasePool.executemany(conn, '''
                 INSERT INTO performance_review_targets (
                     cycle_id, project_id, member_id, member_name, member_role, is_onsite, status,
                     signal_logs, signal_tasks, signal_stages, signal_issues, created_at, updated_at
@@ -348,19 +368,7 @@ class PerformanceReviewService:
                     signal_stages = excluded.signal_stages,
                     signal_issues = excluded.signal_issues,
                     updated_at = CURRENT_TIMESTAMP
-            '''), (
-                cycle_id,
-                member_dict['project_id'],
-                member_dict['id'],
-                member_dict['name'],
-                member_dict.get('role') or '',
-                bool(PerformanceReviewService._as_bool(member_dict.get('is_onsite'))),
-                'active',
-                signals['logs'],
-                signals['tasks'],
-                signals['stages'],
-                signals['issues'],
-            ))
+            ''', upserts.values())
 
         conn.commit()
         rows_filter = 'AND t.project_id = ?' if project_id else ''
@@ -1078,6 +1086,93 @@ class PerformanceReviewService:
         )
         return {'created': created, 'message': f'已发送 {created} 条提醒', 'project_name': project_name}
 
+    @staticmethod
+    def _group_rows_by_target(rows, drop_keys=('rn',)) -> Dict[int, List[Dict[str, Any]]]:
+        grouped: Dict[int, List[Dict[str, Any]]] = {}
+        for row in rows:
+            item = dict(row)
+            for key in drop_keys:
+                item.pop(key, None)
+            grouped.setdefault(item['target_id'], []).append(item)
+        return grouped
+
+    @staticmethod
+    def _load_overview_relations(conn, cycle_id: int, project_id: Optional[int], reviewer_name: str) -> Dict[str, Any]:
+        """按周期一次性取回总览所需的感谢卡、我的评分表、申诉与可评分项目，查询次数与成员数无关"""
+        project_clause = 'AND t.project_id = ?' if project_id else ''
+        scope_params = (cycle_id, project_id) if project_id else (cycle_id,)
+
+        recognition_rows = conn.execute(DatabasePool.format_sql(f'''
+            SELECT * FROM (
+                SELECT r.*,
+                       ROW_NUMBER() OVER (PARTITION BY r.target_id ORDER BY r.created_at DESC, r.id DESC) AS rn
+                FROM performance_recognition r
+                JOIN performance_review_targets t ON t.id = r.target_id
+                WHERE r.cycle_id = ?
+                  AND t.status = 'active'
+                  {project_clause}
+            ) ranked
+            WHERE rn <= 4
+            ORDER BY target_id, rn
+        '''), scope_params).fetchall()
+
+        form_rows = []
+        if reviewer_name:
+            form_rows = conn.execute(DatabasePool.format_sql(f'''
+                SELECT * FROM (
+                    SELECT f.*,
+                           ROW_NUMBER() OVER (PARTITION BY f.target_id ORDER BY f.updated_at DESC, f.id DESC) AS rn
+                    FROM performance_review_forms f
+                    JOIN performance_review_targets t ON t.id = f.target_id
+                    WHERE f.cycle_id = ?
+                      AND f.reviewer_name = ?
+                      AND t.status = 'active'
+                      {project_clause}
+                ) ranked
+                WHERE rn = 1
+            '''), (cycle_id, reviewer_name, project_id) if project_id else (cycle_id, reviewer_name)).fetchall()
+
+        appeal_rows = conn.execute(DatabasePool.format_sql(f'''
+            SELECT a.*,
+                   ROW_NUMBER() OVER (PARTITION BY a.target_id, a.status ORDER BY a.created_at DESC, a.id DESC) AS status_rank
+            FROM performance_appeals a
+            JOIN performance_review_targets t ON t.id = a.target_id
+            WHERE a.cycle_id = ?
+              AND t.status = 'active'
+              {project_clause}
+            ORDER BY a.target_id, a.created_at DESC, a.id DESC
+        '''), scope_params).fetchall()
+
+        latest_pending: Dict[int, Dict[str, Any]] = {}
+        appeals: Dict[int, List[Dict[str, Any]]] = {}
+        for row in appeal_rows:
+            item = dict(row)
+            status_rank = item.pop('status_rank', None)
+            if item.get('status') == 'pending' and int(status_rank or 0) == 1:
+                latest_pending[item['target_id']] = item
+            appeals.setdefault(item['target_id'], []).append(item)
+
+        reviewable_projects = set()
+        if reviewer_name:
+            member_rows = conn.execute(DatabasePool.format_sql('''
+                SELECT *
+                FROM project_members
+                WHERE status = '在岗'
+                  AND name = ?
+            '''), (reviewer_name,)).fetchall()
+            reviewable_projects = {
+                row['project_id'] for row in member_rows
+                if PerformanceReviewService._is_onsite_reviewer(dict(row))
+            }
+
+        return {
+            'recognitions': PerformanceReviewService._group_rows_by_target(recognition_rows),
+            'my_forms': {target_id: rows[0] for target_id, rows in PerformanceReviewService._group_rows_by_target(form_rows).items()},
+            'appeals': appeals,
+            'latest_pending_appeals': latest_pending,
+            'reviewable_projects': reviewable_projects,
+        }
+
     @staticmethod
     def _ensure_cycle_editable(conn, cycle_id: int):
         row = conn.execute(
@@ -1162,33 +1257,18 @@ class PerformanceReviewService:
             pending_appeals = []
             reviewer_name = str(current_user.get('display_name') or current_user.get('username') or '').strip()
             cycle_locked = str(cycle.get('status') or '') == 'locked'
+            relations = PerformanceReviewService._load_overview_relations(conn, cycle['id'], project_id, reviewer_name)
             for row in cycle_rows:
                 item = dict(row)
-                project_id = item['project_id']
-                project_can_review = PerformanceReviewService._current_user_can_review_project(conn, current_user, project_id)
+                row_project_id = item['project_id']
+                project_can_review = row_project_id in relations['reviewable_projects']
                 member_can_appeal = PerformanceReviewService._current_user_matches_member(current_user, item['member_name'])
                 formula = PerformanceReviewService._json_load(item.get('formula_json'), {})
                 evidence = PerformanceReviewService._json_load(item.get('evidence_json'), {})
-                recognitions = conn.execute(DatabasePool.format_sql('''
-                    SELECT * FROM performance_recognition
-                    WHERE cycle_id = ? AND target_id = ?
-                    ORDER BY created_at DESC
-                    LIMIT 4
-                '''), (cycle['id'], item['id'])).fetchall()
-                recognitions = [dict(rec) for rec in recognitions]
-                my_form = conn.execute(DatabasePool.format_sql('''
-                    SELECT * FROM performance_review_forms
-                    WHERE cycle_id = ? AND target_id = ? AND reviewer_name = ?
-                    ORDER BY updated_at DESC LIMIT 1
-                '''), (cycle['id'], item['id'], reviewer_name)).fetchone()
-                my_form = dict(my_form) if my_form else None
-                appeals = conn.execute(DatabasePool.format_sql('''
-                    SELECT * FROM performance_appeals
-                    WHERE cycle_id = ? AND target_id = ?
-                    ORDER BY created_at DESC
-                '''), (cycle['id'], item['id'])).fetchall()
-                appeals = [dict(appeal) for appeal in appeals]
-                latest_pending_appeal = next((appeal for appeal in appeals if appeal.get('status') == 'pending'), None)
+                recognitions = relations['recognitions'].get(item['id'], [])
+                my_form = relations['my_forms'].get(item['id'])
+                appeals = relations['appeals'].get(item['id'], [])
+                latest_pending_appeal = relations['latest_pending_appeals'].get(item['id'])
 
                 member_payload = {
                     'target_id': item['id'],
@@ -1260,8 +1340,8 @@ class PerformanceReviewService:
                     for rec in recognitions[:2]
                 ])
 
-                project_entry = projects_map.setdefault(project_id, {
-                    'project_id': project_id,
+                project_entry = projects_map.setdefault(row_project_id, {
+                    'project_id': row_project_id,
                     'project_name': item['project_name'],
                     'hospital_name': item['hospital_name'],
                     'members': [],
@@ -1282,7 +1362,7 @@ class PerformanceReviewService:
             return {
                 'cycle': cycle,
                 'project_id': project_id,
-                'cycles': PerformanceReviewService.list_cycles(),
+                'cycles': PerformanceReviewService._list_cycles(conn),
                 'summary': {
                     'member_count': len(all_members),
                     'project_count': len(projects_map),
@@ -1913,7 +1993,9 @@ class PerformanceReviewService:
         return temp_dir
 
     @staticmethod
-    def _set_doc_normal_style(doc: Document):
+    def _set_doc_normal_style(doc):
+        from docx.shared import Pt
+
         style = doc.styles['Normal']
         style.font.name = '微软雅黑'
         style.font.size = Pt(10.5)
@@ -1928,6 +2010,9 @@ class PerformanceReviewService:
         filename = f"performance-review-{cycle.get('cycle_key') or cycle_id}{scope_suffix}.docx"
         file_path = os.path.join(temp_dir, filename)
 
+        from docx import Document
+        from docx.enum.text import WD_ALIGN_PARAGRAPH
+
         doc = Document()
         PerformanceReviewService._set_doc_normal_style(doc)
 
@@ -2006,6 +2091,9 @@ class PerformanceReviewService:
         filename = f"performance-profile-{project_id}-{safe_name}.docx"
         file_path = os.path.join(temp_dir, filename)
 
+        from docx import Document
+        from docx.enum.text import WD_ALIGN_PARAGRAPH
+
         doc = Document()
         PerformanceReviewService._set_doc_normal_style(doc)
 
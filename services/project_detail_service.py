@@ -0,0 +1,163 @@
+# services/project_detail_service.py
+"""
+项目详情加载与缓存（GET /projects/<id>）
+- 单连接、固定条数查询取齐所有子集合（任务一次性按项目取回后按阶段分组，不再逐阶段查询）
+- 组装结果按项目缓存，以 project_data_versions 中的版本号判断是否失效；
+  版本号由数据库触发器在项目及其子表写入时递增，多进程与所有写入路径都能感知
+- TTL 兜底触发器缺失（如旧版 SQLite 不支持触发器内 UPSERT）的情况
+"""
+
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from database import DatabasePool
+
+logger = logging.getLogger(__name__)
+
+
+class ProjectDetailLoader:
+    CACHE_SIZE = 256
+    TTL_SECONDS = 300
+
+    # 可选子集合：表缺失或查询失败时返回空列表，不影响主体数据
+    OPTIONAL_COLLECTIONS = (
+        ('contacts', 'SELECT * FROM customer_contacts WHERE project_id = ? ORDER BY is_primary DESC, name'),
+        ('departures', 'SELECT * FROM project_departures WHERE project_id = ? ORDER BY created_at DESC'),
+        ('devices', 'SELECT * FROM medical_devices WHERE project_id = ?'),
+        ('dependencies', '''
+            SELECT td.id, td.task_id, td.depends_on_task_id, t1.task_name as task_name, t2.task_name as depends_on_task_name
+            FROM task_dependencies td
+            JOIN tasks t1 ON td.task_id = t1.id
+            JOIN tasks t2 ON td.depends_on_task_id = t2.id
+            JOIN project_stages s ON t1.stage_id = s.id
+            WHERE s.project_id = ?
+        '''),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0}
+
+    # ---------------- 版本号 ----------------
+
+    @staticmethod
+    def data_version(conn, project_id):
+        row = conn.execute(DatabasePool.format_sql(
+            'SELECT version FROM project_data_versions WHERE project_id = ?'
+        ), (project_id,)).fetchone()
+        return row[0] if row else 0
+
+    # ---------------- 加载 ----------------
+
+    @staticmethod
+    def _rows(conn, sql, params):
+        return [dict(r) for r in conn.execute(DatabasePool.format_sql(sql), params).fetchall()]
+
+    @classmethod
+    def _optional_rows(cls, conn, sql, params):
+        """PostgreSQL 中失败的查询会中止事务，用 SAVEPOINT 隔离，不再另开连接"""
+        is_pg = DatabasePool.is_postgres()
+        try:
+            if is_pg:
+                conn.execute('SAVEPOINT sp_project_detail')
+            rows = cls._rows(conn, sql, params)
+            if is_pg:
+                conn.execute('RELEASE SAVEPOINT sp_project_detail')
+            return rows
+        except Exception as e:
+            logger.debug("项目详情可选集合加载失败: %s", e)
+            if is_pg:
+                try:
+                    conn.execute('ROLLBACK TO SAVEPOINT sp_project_detail')
+                except Exception:
+                    pass
+            return []
+
+    @classmethod
+    def load(cls, conn, project_id):
+        """在同一连接上用固定条数查询组装项目详情；项目不存在返回 None"""
+        project = conn.execute(DatabasePool.format_sql('SELECT * FROM projects WHERE id = ?'), (project_id,)).fetchone()
+        if not project:
+            return None
+        project_dict = dict(project)
+
+        stages = cls._rows(conn, 'SELECT * FROM project_stages WHERE project_id = ? ORDER BY stage_order', (project_id,))
+        tasks_by_stage = defaultdict(list)
+        for task in cls._rows(conn, '''
+            SELECT t.* FROM tasks t
+            JOIN project_stages s ON t.stage_id = s.id
+            WHERE s.project_id = ?
+            ORDER BY t.id
+        ''', (project_id,)):
+            tasks_by_stage[task['stage_id']].append(task)
+
+        total_tasks = 0
+        completed_tasks = 0
+        for stage in stages:
+            stage['tasks'] = tasks_by_stage.get(stage['id'], [])
+            # 阶段进度按任务完成情况计算
+            stage_total = len(stage['tasks'])
+            stage_done = sum(1 for t in stage['tasks'] if t['is_completed'])
+            stage['progress'] = round(stage_done / stage_total * 100) if stage_total > 0 else 0
+            total_tasks += stage_total
+            completed_tasks += stage_done
+        project_dict['stages'] = stages
+        project_dict['progress'] = round(completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
+
+        project_dict['milestones'] = cls._rows(conn, 'SELECT * FROM milestones WHERE project_id = ? ORDER BY target_date', (project_id,))
+        project_dict['interfaces'] = cls._rows(conn, 'SELECT * FROM interfaces WHERE project_id = ? ORDER BY id', (project_id,))
+        project_dict['issues'] = cls._rows(conn, 'SELECT * FROM issues WHERE project_id = ? ORDER BY created_at DESC', (project_id,))
+        project_dict['members'] = cls._rows(conn, 'SELECT * FROM project_members WHERE project_id = ? ORDER BY role, name', (project_id,))
+        for key, sql in cls.OPTIONAL_COLLECTIONS:
+            project_dict[key] = cls._optional_rows(conn, sql, (project_id,))
+        return project_dict
+
+    # ---------------- 缓存 ----------------
+
+    def get(self, project_id):
+        """读穿缓存：版本号未变且未过期时直接返回缓存副本"""
+        with DatabasePool.get_connection() as conn:
+            # 先读版本号再加载数据：加载期间发生的写入会让下次请求看到更高版本而重新加载
+            version = self.data_version(conn, project_id)
+            now = time.time()
+            with self._lock:
+                cached = self._cache.get(project_id)
+                if cached and cached[0] == version and now - cached[1] < self.TTL_SECONDS:
+                    self._cache.move_to_end(project_id)
+                    self._stats['hits'] += 1
+                    return copy.deepcopy(cached[2])
+                self._stats['stale' if cached else 'misses'] += 1
+
+            payload = self.load(conn, project_id)
+
+        with self._lock:
+            if payload is None:
+                self._cache.pop(project_id, None)
+                return None
+            self._cache[project_id] = (version, now, payload)
+            self._cache.move_to_end(project_id)
+            while len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return copy.deepcopy(payload)
+
+    def invalidate(self, project_id=None):
+        with self._lock:
+            if project_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(project_id, None)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._cache)
+        lookups = stats['hits'] + stats['misses'] + stats['stale']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+project_detail_loader = ProjectDetailLoader()
@@ -0,0 +1,333 @@
+# services/project_export_service.py
+"""
+项目数据导出 / 导入服务
+- 每张表以 NDJSON 流式写入 ZIP，边查边写，内存占用与项目规模无关
+- PostgreSQL 使用服务端游标分批拉取，SQLite 使用 fetchmany
+- 导入时按 manifest 重建项目（restore 保留原名，clone 生成副本），自动重映射阶段/成员 ID
+"""
+
+import io
+import json
+import logging
+import os
+import tempfile
+import uuid
+import zipfile
+from datetime import datetime
+
+from api_utils import json_safe
+from database import DatabasePool
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMAT_VERSION = 1
+FETCH_BATCH_SIZE = 500
+
+# (归档内表名, 取数范围)。顺序即导入顺序：被引用的表必须在前。
+EXPORT_TABLES = [
+    ('projects', 'self'),
+    ('project_stages', 'project'),
+    ('tasks', 'stage'),
+    ('project_members', 'project'),
+    ('interfaces', 'project'),
+    ('issues', 'project'),
+    ('milestones', 'project'),
+    ('customer_contacts', 'project'),
+    ('project_departures', 'project'),
+    ('work_logs', 'project'),
+    ('project_documents', 'project'),
+    ('project_expenses', 'project'),
+    ('project_changes', 'project'),
+    ('project_acceptances', 'project'),
+    ('customer_satisfaction', 'project'),
+    ('follow_up_records', 'project'),
+    ('medical_devices', 'project'),
+]
+
+# 导入时需要重映射的外键列 -> 被引用表
+ID_REMAP_COLUMNS = {
+    'tasks': {'stage_id': 'project_stages'},
+    'work_logs': {'stage_id': 'project_stages', 'member_id': 'project_members'},
+    'project_expenses': {'stage_id': 'project_stages'},
+    'issues': {'owner_member_id': 'project_members', 'closed_by_member_id': 'project_members'},
+}
+# 其它表会引用其新 ID，因此必须逐行插入拿回主键
+ROW_BY_ROW_TABLES = {'projects', 'project_stages', 'project_members'}
+# 克隆/恢复时不应沿用的唯一列
+RESET_PROJECT_COLUMNS = ('project_no', 'share_token', 'share_enabled', 'data_hash')
+
+
+class _ChunkSink(io.RawIOBase):
+    """不可 seek 的写入端，zipfile 会自动改用 data descriptor 以支持流式输出"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ProjectExportService:
+
+    @staticmethod
+    def _table_query(table, scope):
+        if scope == 'self':
+            return 'SELECT * FROM projects WHERE id = ?'
+        if scope == 'stage':
+            return f'''
+                SELECT t.* FROM {table} t
+                JOIN project_stages s ON t.stage_id = s.id
+                WHERE s.project_id = ?
+                ORDER BY t.id
+            '''
+        return f'SELECT * FROM {table} WHERE project_id = ? ORDER BY id'
+
+    @staticmethod
+    def _iter_rows(conn, sql, params, batch_size=FETCH_BATCH_SIZE):
+        """分批迭代查询结果；PostgreSQL 走命名（服务端）游标，避免一次性拉全表。"""
+        if DatabasePool.is_postgres():
+            from psycopg2.extras import RealDictCursor
+            raw_conn = conn._conn
+            cursor = raw_conn.cursor(name=f"export_{uuid.uuid4().hex[:12]}", cursor_factory=RealDictCursor)
+            cursor.itersize = batch_size
+            try:
+                cursor.execute(DatabasePool.format_sql(sql), params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield dict(row)
+            finally:
+                cursor.close()
+            return
+
+        cursor = conn.execute(DatabasePool.format_sql(sql), params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+
+    @staticmethod
+    def _dump_line(row):
+        return (json.dumps(json_safe(row), ensure_ascii=False, default=str) + '\n').encode('utf-8')
+
+    def project_exists(self, project_id):
+        with DatabasePool.get_connection() as conn:
+            row = conn.execute(
+                DatabasePool.format_sql('SELECT id, project_name FROM projects WHERE id = ?'),
+                (project_id,),
+            ).fetchone()
+            return dict(row) if row else None
+
+    def iter_zip(self, project_id):
+        """生成 ZIP 字节流：每张表一个 <table>.ndjson，最后写入 manifest.json。"""
+        sink = _ChunkSink()
+        counts = {}
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            with DatabasePool.get_connection() as conn:
+                existing_tables = [t for t in EXPORT_TABLES if DatabasePool.table_exists(conn, t[0])]
+                for table, scope in existing_tables:
+                    count = 0
+                    with zf.open(f'{table}.ndjson', 'w', force_zip64=True) as member:
+                        for row in self._iter_rows(conn, self._table_query(table, scope), (project_id,)):
+                            member.write(self._dump_line(row))
+                            count += 1
+                            if count % FETCH_BATCH_SIZE == 0:
+                                chunk = sink.drain()
+                                if chunk:
+                                    yield chunk
+                    counts[table] = count
+                    chunk = sink.drain()
+                    if chunk:
+                        yield chunk
+            manifest = {
+                'format_version': EXPORT_FORMAT_VERSION,
+                'project_id': project_id,
+                'exported_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'tables': counts,
+            }
+            zf.writestr('manifest.json', json.dumps(manifest, ensure_ascii=False, indent=2))
+        yield sink.drain()
+
+    def iter_ndjson(self, project_id):
+        """单流 NDJSON：每行 {"table": ..., "row": {...}}。"""
+        with DatabasePool.get_connection() as conn:
+            for table, scope in EXPORT_TABLES:
+                if not DatabasePool.table_exists(conn, table):
+                    continue
+                for row in self._iter_rows(conn, self._table_query(table, scope), (project_id,)):
+                    yield self._dump_line({'table': table, 'row': row})
+
+    def build_json(self, project_id):
+        """兼容旧版 JSON 导出结构（任务按阶段嵌套），查询次数固定。"""
+        tables = {}
+        with DatabasePool.get_connection() as conn:
+            for table, scope in EXPORT_TABLES:
+                if not DatabasePool.table_exists(conn, table):
+                    tables[table] = []
+                    continue
+                tables[table] = list(self._iter_rows(conn, self._table_query(table, scope), (project_id,)))
+
+        tasks_by_stage = {}
+        for task in tables['tasks']:
+            tasks_by_stage.setdefault(task.get('stage_id'), []).append(task)
+        stages = tables['project_stages']
+        for stage in stages:
+            stage['tasks'] = tasks_by_stage.get(stage['id'], [])
+
+        return {
+            'export_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'project': tables['projects'][0] if tables['projects'] else None,
+            'stages': stages,
+            'interfaces': tables['interfaces'],
+            'issues': tables['issues'],
+            'milestones': tables['milestones'],
+            'members': tables['project_members'],
+            'contacts': tables['customer_contacts'],
+            'departures': tables['project_departures'],
+            'work_logs': tables['work_logs'],
+            'documents': tables['project_documents'],
+            'expenses': tables['project_expenses'],
+            'changes': tables['project_changes'],
+            'acceptances': tables['project_acceptances'],
+            'satisfaction': tables['customer_satisfaction'],
+            'follow_ups': tables['follow_up_records'],
+            'devices': tables['medical_devices'],
+        }
+
+    def export_to_storage(self, project_id):
+        """异步模式：写入临时 ZIP 后上传到当前存储后端。"""
+        from werkzeug.datastructures import FileStorage
+        from storage_service import storage_service
+
+        filename = f"project_{project_id}_export_{datetime.now().strftime('%Y%m%d%H%M%S')}.zip"
+        fd, temp_path = tempfile.mkstemp(suffix='.zip')
+        try:
+            size = 0
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in self.iter_zip(project_id):
+                    f.write(chunk)
+                    size += len(chunk)
+            with open(temp_path, 'rb') as f:
+                remote_path = storage_service.upload_file(
+                    FileStorage(stream=f, filename=filename), f'exports/{project_id}', filename=filename
+                )
+            return {'remote_path': remote_path, 'filename': filename, 'size': size}
+        finally:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    # ---------------- 导入 ----------------
+
+    @staticmethod
+    def _iter_archive_rows(zf, table):
+        with zf.open(f'{table}.ndjson') as raw:
+            for line in io.TextIOWrapper(raw, encoding='utf-8'):
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+    @staticmethod
+    def _insert_row(conn, table, row):
+        columns = list(row.keys())
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+        if DatabasePool.is_postgres():
+            sql += ' RETURNING id'
+        cursor = conn.execute(DatabasePool.format_sql(sql), [row[c] for c in columns])
+        return DatabasePool.get_inserted_id(cursor)
+
+    @staticmethod
+    def _insert_batch(conn, table, columns, batch):
+        sql = DatabasePool.format_sql(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+        )
+        conn.cursor().executemany(sql, batch)
+
+    def import_archive(self, fileobj, mode='clone'):
+        """
+        从导出 ZIP 恢复/克隆项目，返回新项目 ID 与各表导入行数。
+        mode: restore 保留项目名称与状态；clone 生成 “(副本)” 项目。
+        所有行均分配新主键，不会覆盖现有数据。
+        """
+        if mode not in ('restore', 'clone'):
+            raise ValueError(f"不支持的导入模式: {mode}")
+
+        with zipfile.ZipFile(fileobj) as zf:
+            names = set(zf.namelist())
+            if 'manifest.json' not in names or 'projects.ndjson' not in names:
+                raise ValueError("不是有效的项目导出包（缺少 manifest.json 或 projects.ndjson）")
+            manifest = json.loads(zf.read('manifest.json').decode('utf-8'))
+            if manifest.get('format_version') != EXPORT_FORMAT_VERSION:
+                raise ValueError(f"不支持的导出包版本: {manifest.get('format_version')}")
+
+            id_maps = {}
+            counts = {}
+            with DatabasePool.get_connection() as conn:
+                for table, _ in EXPORT_TABLES:
+                    if f'{table}.ndjson' not in names or not DatabasePool.table_exists(conn, table):
+                        continue
+                    target_columns = DatabasePool.get_table_columns(conn, table)
+                    remap = ID_REMAP_COLUMNS.get(table, {})
+                    id_map = id_maps.setdefault(table, {})
+                    batch_columns = None
+                    batch = []
+                    count = 0
+
+                    for row in self._iter_archive_rows(zf, table):
+                        old_id = row.get('id')
+                        row = {k: v for k, v in row.items() if k in target_columns and k != 'id'}
+                        if table == 'projects':
+                            for col in RESET_PROJECT_COLUMNS:
+                                row.pop(col, None)
+                            if mode == 'clone':
+                                row['project_name'] = f"{row.get('project_name') or '项目'}(副本)"
+                        else:
+                            if 'project_id' in row:
+                                row['project_id'] = id_maps['projects'][manifest['project_id']]
+                            for col, ref_table in remap.items():
+                                if row.get(col) is not None:
+                                    row[col] = id_maps.get(ref_table, {}).get(row[col])
+
+                        if table in ROW_BY_ROW_TABLES:
+                            id_map[old_id] = self._insert_row(conn, table, row)
+                        else:
+                            columns = sorted(row.keys())
+                            if batch_columns is not None and columns != batch_columns:
+                                self._insert_batch(conn, table, batch_columns, batch)
+                                batch = []
+                            batch_columns = columns
+                            batch.append([row[c] for c in columns])
+                            if len(batch) >= FETCH_BATCH_SIZE:
+                                self._insert_batch(conn, table, batch_columns, batch)
+                                batch = []
+                        count += 1
+
+                    if batch:
+                        self._insert_batch(conn, table, batch_columns, batch)
+                    counts[table] = count
+                conn.commit()
+
+        new_project_id = id_maps.get('projects', {}).get(manifest['project_id'])
+        return {'project_id': new_project_id, 'mode': mode, 'tables': counts}
+
+
+project_export_service = ProjectExportService()
@@ -3,7 +3,10 @@ from database import DatabasePool
 from services.monitor_service import monitor_service
 from services.ai_service import ai_service
 from utils.geo_service import geo_service
+from services.geo_enrichment_service import geo_enrichment_service, normalize_region_name
+from services.dependency_service import dependency_graph_cache
 from services.kb_service import kb_service
+from services.issue_cluster_service import issue_cluster_engine
 from services.wecom_push_service import wecom_push_service
 
 class ProjectService:
@@ -553,6 +556,7 @@ class ProjectService:
                 )
             )
             issue_id = DatabasePool.get_inserted_id(cursor)
+            issue_cluster_engine.index_issue(conn, issue_id, data['description'])
             
             if data.get('severity') == '高':
                 sql_p = DatabasePool.format_sql('SELECT project_name FROM projects WHERE id = ?')
@@ -622,6 +626,8 @@ class ProjectService:
             # Wrap dynamic SQL with format_sql
             sql = DatabasePool.format_sql(f'UPDATE issues SET {", ".join(set_parts)} WHERE id=?')
             conn.execute(sql, tuple(params))
+            if 'description' in data and data['description'] != existing.get('description'):
+                issue_cluster_engine.index_issue(conn, issue_id, data['description'])
             conn.commit()
             if data.get('push_to_wecom'):
                 try:
@@ -635,6 +641,7 @@ class ProjectService:
         with DatabasePool.get_connection() as conn:
             sql = DatabasePool.format_sql('DELETE FROM issues WHERE id = ?')
             conn.execute(sql, (issue_id,))
+            issue_cluster_engine.forget(conn, issue_id)
             conn.commit()
             return True
 
@@ -1229,101 +1236,9 @@ class ProjectService:
             return True
     @staticmethod
     def get_project_detail(project_id, user_id=None):
-        with DatabasePool.get_connection() as conn:
-            sql_p = DatabasePool.format_sql('SELECT * FROM projects WHERE id = ?')
-            project = conn.execute(sql_p, (project_id,)).fetchone()
-            if not project:
-                return None
-            
-            project_dict = dict(project)
-            
-            # Fetch stages with their tasks
-            sql_s = DatabasePool.format_sql('SELECT * FROM project_stages WHERE project_id = ? ORDER BY stage_order')
-            stages_rows = conn.execute(sql_s, (project_id,)).fetchall()
-            stages = []
-            total_tasks = 0
-            completed_tasks = 0
-            for s_row in stages_rows:
-                s_dict = dict(s_row)
-                sql_t = DatabasePool.format_sql('SELECT * FROM tasks WHERE stage_id = ? ORDER BY id')
-                tasks = conn.execute(sql_t, (s_dict['id'],)).fetchall()
-                s_dict['tasks'] = [dict(t) for t in tasks]
-                # Compute per-stage progress
-                stage_total = len(s_dict['tasks'])
-                stage_done = sum(1 for t in s_dict['tasks'] if t['is_completed'])
-                s_dict['progress'] = round(stage_done / stage_total * 100) if stage_total > 0 else 0
-                total_tasks += stage_total
-                completed_tasks += stage_done
-                stages.append(s_dict)
-            project_dict['stages'] = stages
-            project_dict['progress'] = round(completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
-            
-            # Fetch milestones
-            sql_m = DatabasePool.format_sql('SELECT * FROM milestones WHERE project_id = ? ORDER BY target_date')
-            milestones = conn.execute(sql_m, (project_id,)).fetchall()
-            project_dict['milestones'] = [dict(m) for m in milestones]
-            
-            # Fetch interfaces
-            sql_i = DatabasePool.format_sql('SELECT * FROM interfaces WHERE project_id = ? ORDER BY id')
-            interfaces = conn.execute(sql_i, (project_id,)).fetchall()
-            project_dict['interfaces'] = [dict(i) for i in interfaces]
-            
-            # Fetch issues
-            sql_iss = DatabasePool.format_sql('SELECT * FROM issues WHERE project_id = ? ORDER BY created_at DESC')
-            issues = conn.execute(sql_iss, (project_id,)).fetchall()
-            project_dict['issues'] = [dict(i) for i in issues]
-            
-            # Fetch members
-            sql_mem = DatabasePool.format_sql('SELECT * FROM project_members WHERE project_id = ? ORDER BY role, name')
-            members = conn.execute(sql_mem, (project_id,)).fetchall()
-            project_dict['members'] = [dict(m) for m in members]
-            # Fetch contacts - Using separate context to avoid poisoning main transaction
-            project_dict['contacts'] = []
-            try:
-                with DatabasePool.get_connection() as conn_sub:
-                    sql_con = DatabasePool.format_sql('SELECT * FROM customer_contacts WHERE project_id = ? ORDER BY is_primary DESC, name')
-                    contacts = conn_sub.execute(sql_con, (project_id,)).fetchall()
-                    project_dict['contacts'] = [dict(c) for c in contacts]
-            except Exception:
-                pass
-
-            # Fetch departures - Using separate context to avoid poisoning main transaction
-            project_dict['departures'] = []
-            try:
-                with DatabasePool.get_connection() as conn_sub:
-                    sql_dep = DatabasePool.format_sql('SELECT * FROM project_departures WHERE project_id = ? ORDER BY created_at DESC')
-                    departures = conn_sub.execute(sql_dep, (project_id,)).fetchall()
-                    project_dict['departures'] = [dict(d) for d in departures]
-            except Exception:
-                pass
-            
-            # Fetch devices (Fixes "disappearing" devices issue)
-            try:
-                sql_dev = DatabasePool.format_sql('SELECT * FROM medical_devices WHERE project_id = ?')
-                devices = conn.execute(sql_dev, (project_id,)).fetchall()
-                project_dict['devices'] = [dict(d) for d in devices]
-            except Exception:
-                project_dict['devices'] = []
-
-            # Fetch dependencies
-            try:
-                sql_deps = DatabasePool.format_sql('''
-                    SELECT td.id, td.task_id, td.depends_on_task_id, t1.task_name as task_name, t2.task_name as depends_on_task_name
-                    FROM task_dependencies td
-                    JOIN tasks t1 ON td.task_id = t1.id
-                    JOIN tasks t2 ON td.depends_on_task_id = t2.id
-                    JOIN project_stages s ON t1.stage_id = s.id
-                    WHERE s.project_id = ?
-                ''')
-                deps = conn.execute(sql_deps, (project_id,)).fetchall()
-                project_dict['dependencies'] = [dict(d) for d in deps]
-            except Exception:
-                project_dict['dependencies'] = []
-
-            # Health score and risk analysis are already in project_dict from 'SELECT *'
-            # No longer doing synchronous analysis here for performance
-            
-            return project_dict
+        """项目详情（读穿缓存，子表写入后经版本号自动失效）"""
+        from services.project_detail_service import project_detail_loader
+        return project_detail_loader.get(project_id)
 
     @staticmethod
     def update_project(project_id, data):
@@ -1485,17 +1400,14 @@ class ProjectService:
             sql = DatabasePool.format_sql('INSERT INTO task_dependencies (task_id, depends_on_task_id, dependency_type) VALUES (?, ?, ?)')
             conn.execute(sql, (data['task_id'], data['depends_on_task_id'], data.get('dependency_type', 'finish_to_start')))
             conn.commit()
-            return True
+        dependency_graph_cache.invalidate_for_task(data['task_id'])
+        return True
 
     @staticmethod
     def get_geo_stats():
-        """获取地理分布统计数据 - 采用动态 API 推断"""
+        """获取地理分布统计数据（只读：缺失的省市/坐标交给后台补全任务）"""
+        needs_enrichment = False
         with DatabasePool.get_connection() as conn:
-            def normalize_region_name(value):
-                if not value:
-                    return ''
-                return str(value).strip().replace('省', '').replace('市', '').replace('自治区', '').replace('特别行政区', '')
-
             # 1. Project stats by province
             sql = DatabasePool.format_sql("SELECT id, province, city, hospital_name, progress, project_name FROM projects WHERE status != '已终止'")
             all_projects = conn.execute(sql).fetchall()
@@ -1506,39 +1418,17 @@ class ProjectService:
                 province = normalize_region_name(p['province'])
                 city = normalize_region_name(p['city'])
                 
-                # 如果省份或城市缺失，尝试动态解析
+                # 缺失时仅做内存推断，并登记后台补全
                 if not province or not city:
-                    candidates = [
-                        (p['hospital_name'] or '').strip(),
-                        (p['project_name'] or '').strip(),
-                        city
-                    ]
+                    needs_enrichment = True
                     geo_details = None
-                    for candidate in candidates:
-                        if not candidate:
-                            continue
-                        geo_details = geo_service.resolve_address_details(candidate)
+                    for candidate in [p['hospital_name'], p['project_name'], city]:
+                        geo_details = geo_service.resolve_offline(candidate)
                         if geo_details:
                             break
-
                     if geo_details:
                         province = province or normalize_region_name(geo_details.get('province'))
                         city = city or normalize_region_name(geo_details.get('city'))
-
-                # 如果只有城市，还尝试由城市反推省份
-                if not province and city:
-                    city_details = geo_service.resolve_address_details(city)
-                    if city_details:
-                        province = normalize_region_name(city_details.get('province'))
-                        city = city or normalize_region_name(city_details.get('city'))
-
-                # 尝试把解析结果写回数据库，提升后续性能
-                if province or city:
-                    try:
-                        sql_up_p = DatabasePool.format_sql('UPDATE projects SET province = ?, city = ? WHERE id = ?')
-                        conn.execute(sql_up_p, (province or p['province'], city or p['city'], p['id']))
-                    except Exception:
-                        pass
                 
                 if not province: province = '未知'
                 
@@ -1560,6 +1450,7 @@ class ProjectService:
                 })
 
             # 2. Member locations with workload assessment
+            # 在岗项目数 / 未完成任务数 先按姓名聚合再关联，避免逐行相关子查询
             members = []
             sql_mems = DatabasePool.format_sql('''
                 SELECT m.id, m.name, m.role, m.lng, m.lat,
@@ -1570,13 +1461,23 @@ class ProjectService:
                            ELSE p.hospital_name 
                        END as current_city,
                        p.project_name, p.city as project_city, p.province as project_province, p.hospital_name,
-                       (SELECT COUNT(DISTINCT project_id) FROM project_members 
-                        WHERE name = m.name AND status = '在岗') as project_count,
-                       (SELECT COUNT(*) FROM tasks t 
-                        JOIN project_stages s ON t.stage_id = s.id 
-                        WHERE s.responsible_person = m.name AND t.is_completed = ?) as task_count
+                       COALESCE(pc.project_count, 0) as project_count,
+                       COALESCE(tc.task_count, 0) as task_count
                 FROM project_members m
                 JOIN projects p ON m.project_id = p.id
+                LEFT JOIN (
+                    SELECT name, COUNT(DISTINCT project_id) as project_count
+                    FROM project_members
+                    WHERE status = '在岗'
+                    GROUP BY name
+                ) pc ON pc.name = m.name
+                LEFT JOIN (
+                    SELECT s.responsible_person, COUNT(*) as task_count
+                    FROM tasks t
+                    JOIN project_stages s ON t.stage_id = s.id
+                    WHERE t.is_completed = ?
+                    GROUP BY s.responsible_person
+                ) tc ON tc.responsible_person = m.name
                 WHERE m.status = '在岗'
             ''')
             m_rows = conn.execute(sql_mems, (False,)).fetchall()
@@ -1589,41 +1490,19 @@ class ProjectService:
                 city = normalize_region_name(row['member_city']) or normalize_region_name(row['project_city']) or normalize_region_name(row['current_city'])
                 province = normalize_region_name(row['project_province'])
                 
-                # On-the-fly resolution if missing
                 if (lng is None or lat is None) or not city or not province:
-                    member_candidates = [
-                        (row['member_city'] or '').strip(),
-                        (row['project_city'] or '').strip(),
-                        (row['hospital_name'] or '').strip(),
-                        (row['project_name'] or '').strip(),
-                    ]
+                    needs_enrichment = True
                     geo_details = None
-                    for candidate in member_candidates:
-                        if not candidate:
-                            continue
-                        geo_details = geo_service.resolve_address_details(candidate)
+                    for candidate in [row['member_city'], row['project_city'], row['hospital_name'], row['project_name']]:
+                        geo_details = geo_service.resolve_offline(candidate)
                         if geo_details:
                             break
-
                     if geo_details:
                         province = province or normalize_region_name(geo_details.get('province'))
                         city = city or normalize_region_name(geo_details.get('city'))
                         if lng is None or lat is None:
                             lng, lat = geo_details.get('lng'), geo_details.get('lat')
 
-                if (lng is None or lat is None) and city:
-                    coords = geo_service.resolve_coords(city)
-                    if coords:
-                        lng, lat = coords[0], coords[1]
-
-                # Optional: Lazy update back to DB for performance
-                if city or (lng is not None and lat is not None):
-                    try:
-                        sql_up_m = DatabasePool.format_sql('UPDATE project_members SET lng = ?, lat = ?, current_city = ? WHERE id = ?')
-                        conn.execute(sql_up_m, (lng, lat, city or row['member_city'], row['id']))
-                    except Exception:
-                        pass
-
                 members.append({
                     'name': row['name'],
                     'role': row['role'],
@@ -1637,12 +1516,10 @@ class ProjectService:
                     'load_score': load_score
                 })
 
-            try:
-                conn.commit()
-            except Exception:
-                pass
+        if needs_enrichment:
+            geo_enrichment_service.request_enrichment()
 
-            return {'stats': stats, 'members': members}
+        return {'stats': stats, 'members': members}
 
     @staticmethod
     def get_pending_celebrations(project_id):
@@ -1701,6 +1578,8 @@ class ProjectService:
             sql = DatabasePool.format_sql('DELETE FROM task_dependencies WHERE id = ?')
             conn.execute(sql, (dep_id,))
             conn.commit()
-            return True
+        if not dependency_graph_cache.remove_edge(dep_id):
+            dependency_graph_cache.invalidate()
+        return True
 
 project_service = ProjectService()
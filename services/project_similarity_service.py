@@ -0,0 +1,235 @@
+# services/project_similarity_service.py
+"""
+项目特征向量与相似项目 k-NN 检索
+- 每个项目一条定长 float32 特征向量，按特征块拼接：规模、地区、产品模块、接口构成、
+  阶段工期、问题类别分布、设备类型；类别型取值用 crc32 哈希到固定维度，无需维护词表
+- 每块先单位化再乘以 sqrt(权重)，两向量点积即各块余弦相似度的加权和（0~1），
+  按块切片求点积即可得到每个特征块的贡献分
+- 向量落库 project_feature_vectors，以 project_data_versions（触发器维护）判断是否过期，
+  过期项目按批重算；内存中保留整份矩阵，查询为一次矩阵-向量乘法
+"""
+
+import logging
+import math
+import threading
+import zlib
+from datetime import date, datetime
+
+from database import DatabasePool
+from utils.lazy import LazyProxy, lazy_import
+from utils.vector_utils import vector_utils
+
+np = lazy_import('numpy')
+
+logger = logging.getLogger(__name__)
+
+
+def _bucket(value, size):
+    return zlib.crc32(str(value).encode('utf-8')) % size
+
+
+def _unit(vec):
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm else vec
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+class ProjectFeatureIndex:
+    FEATURE_SCHEMA = 'v1'
+    ID_CHUNK = 500
+    # (块名, 维度, 权重, 展示名)
+    BLOCKS = (
+        ('scale', 10, 0.20, '规模'),
+        ('region', 96, 0.20, '地区'),
+        ('modules', 6, 0.10, '产品模块'),
+        ('interfaces', 32, 0.15, '接口构成'),
+        ('stages', 16, 0.10, '阶段工期'),
+        ('issues', 16, 0.15, '问题类别'),
+        ('devices', 16, 0.10, '设备类型'),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slices = {}
+        offset = 0
+        for name, size, _, _ in self.BLOCKS:
+            self._slices[name] = slice(offset, offset + size)
+            offset += size
+        self.dimension = offset
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._matrix = np.zeros((0, self.dimension), dtype=np.float32)
+        self._versions = {}
+
+    # ---------------- 特征构建 ----------------
+
+    def _blocks(self, project, interfaces, stages, issues, devices):
+        icu = float(project.get('icu_beds') or 0)
+        rooms = float(project.get('operating_rooms') or 0)
+        pacu = float(project.get('pacu_beds') or 0)
+
+        # 规模：log2(折算床位) 落到高斯软分箱，相近规模相似度高
+        scale = np.zeros(10, dtype=np.float32)
+        level = math.log2(icu + rooms * 5 + pacu + 1)
+        for i in range(10):
+            scale[i] = math.exp(-((level - i) ** 2) / 2)
+
+        region = np.zeros(96, dtype=np.float32)
+        if project.get('province'):
+            region[_bucket(project['province'], 32)] = 1.0
+        if project.get('city'):
+            region[32 + _bucket(project['city'], 64)] = 1.0
+
+        # 产品模块：ICU / 手麻 / PACU 是否上线及其规模占比
+        total = icu + rooms + pacu
+        modules = np.array([
+            icu > 0, rooms > 0, pacu > 0,
+            icu / total if total else 0, rooms / total if total else 0, pacu / total if total else 0,
+        ], dtype=np.float32)
+
+        interface_mix = np.zeros(32, dtype=np.float32)
+        for item in interfaces:
+            interface_mix[_bucket(item.get('system_name') or item.get('interface_name') or '', 32)] += 1
+
+        stage_days = np.zeros(16, dtype=np.float32)
+        for stage in stages:
+            start = _to_date(stage.get('actual_start_date') or stage.get('plan_start_date'))
+            end = _to_date(stage.get('actual_end_date') or stage.get('plan_end_date'))
+            if start and end and end >= start:
+                stage_days[_bucket(stage.get('stage_name') or '', 16)] += math.log1p((end - start).days)
+
+        issue_mix = np.zeros(16, dtype=np.float32)
+        for item in issues:
+            issue_mix[_bucket(item.get('issue_type') or '', 16)] += 1
+
+        device_mix = np.zeros(16, dtype=np.float32)
+        for item in devices:
+            device_mix[_bucket(item.get('device_type') or '', 16)] += 1
+
+        return {
+            'scale': scale, 'region': region, 'modules': modules, 'interfaces': interface_mix,
+            'stages': stage_days, 'issues': issue_mix, 'devices': device_mix,
+        }
+
+    def build_vector(self, project, interfaces=(), stages=(), issues=(), devices=()):
+        blocks = self._blocks(project, interfaces, stages, issues, devices)
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for name, _, weight, _ in self.BLOCKS:
+            vector[self._slices[name]] = _unit(blocks[name]) * math.sqrt(weight)
+        return vector
+
+    def _load_features(self, conn, project_ids):
+        """按批取回项目及其子表，返回 {project_id: vector}"""
+        vectors = {}
+        for start in range(0, len(project_ids), self.ID_CHUNK):
+            chunk = project_ids[start:start + self.ID_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            projects = conn.execute(DatabasePool.format_sql(f'''
+                SELECT id, province, city, icu_beds, operating_rooms, pacu_beds
+                FROM projects WHERE id IN ({placeholders})
+            '''), tuple(chunk)).fetchall()
+            children = {}
+            for key, sql in (
+                ('interfaces', 'SELECT project_id, system_name, interface_name FROM interfaces'),
+                ('stages', 'SELECT project_id, stage_name, plan_start_date, plan_end_date, actual_start_date, actual_end_date FROM project_stages'),
+                ('issues', 'SELECT project_id, issue_type FROM issues'),
+                ('devices', 'SELECT project_id, device_type FROM medical_devices'),
+            ):
+                grouped = {}
+                for row in conn.execute(DatabasePool.format_sql(f'{sql} WHERE project_id IN ({placeholders})'), tuple(chunk)).fetchall():
+                    row = dict(row)
+                    grouped.setdefault(row['project_id'], []).append(row)
+                children[key] = grouped
+            for project in projects:
+                project = dict(project)
+                pid = project['id']
+                vectors[pid] = self.build_vector(
+                    project,
+                    children['interfaces'].get(pid, []), children['stages'].get(pid, []),
+                    children['issues'].get(pid, []), children['devices'].get(pid, []),
+                )
+        return vectors
+
+    # ---------------- 存储与索引 ----------------
+
+    def refresh(self, conn):
+        """重算过期/缺失的向量并同步内存矩阵，返回重算的项目数"""
+        rows = conn.execute(DatabasePool.format_sql('''
+            SELECT p.id, COALESCE(v.version, 0) AS version, f.data_version, f.feature_schema
+            FROM projects p
+            LEFT JOIN project_data_versions v ON v.project_id = p.id
+            LEFT JOIN project_feature_vectors f ON f.project_id = p.id
+        ''')).fetchall()
+        current = {r['id']: r['version'] for r in rows}
+        stale = [r['id'] for r in rows if r['data_version'] != r['version'] or r['feature_schema'] != self.FEATURE_SCHEMA]
+
+        if stale:
+            vectors = self._load_features(conn, stale)
+            conn.cursor().executemany(DatabasePool.format_sql('''
+                INSERT INTO project_feature_vectors (project_id, data_version, feature_schema, vector, updated_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (project_id) DO UPDATE SET
+                    data_version = excluded.data_version, feature_schema = excluded.feature_schema,
+                    vector = excluded.vector, updated_at = excluded.updated_at
+            '''), [(pid, current[pid], self.FEATURE_SCHEMA, vector_utils.encode_vector(vec)) for pid, vec in vectors.items()])
+            conn.commit()
+
+        with self._lock:
+            if not stale and self._versions == current:
+                return 0
+        self._load_matrix(conn, current)
+        return len(stale)
+
+    def _load_matrix(self, conn, versions):
+        rows = conn.execute(DatabasePool.format_sql(
+            'SELECT project_id, vector FROM project_feature_vectors WHERE feature_schema = ? ORDER BY project_id'
+        ), (self.FEATURE_SCHEMA,)).fetchall()
+        ids, vectors = [], []
+        for row in rows:
+            if row['project_id'] in versions and row['vector'] is not None:
+                ids.append(row['project_id'])
+                vectors.append(np.frombuffer(bytes(row['vector']), dtype=np.float32))
+        matrix = np.vstack(vectors) if vectors else np.zeros((0, self.dimension), dtype=np.float32)
+        with self._lock:
+            self._ids = np.array(ids, dtype=np.int64)
+            self._matrix = matrix
+            self._versions = dict(versions)
+
+    def contributions(self, a, b):
+        """各特征块对相似度的贡献（0~100 分制，合计即总分）"""
+        return {
+            label: round(float(np.dot(a[self._slices[name]], b[self._slices[name]])) * 100, 1)
+            for name, _, _, label in self.BLOCKS
+        }
+
+    def search(self, project_id, k=5):
+        """返回 [(project_id, score, contributions)]，score 为 0~100 的加权余弦相似度"""
+        with self._lock:
+            ids, matrix = self._ids, self._matrix
+        positions = np.nonzero(ids == project_id)[0]
+        if not len(positions):
+            return []
+        query = matrix[positions[0]]
+        scores = matrix @ query
+        scores[positions[0]] = -1.0
+        k = min(k, len(ids) - 1)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((ids[top], -scores[top]))]
+        return [
+            (int(ids[i]), round(float(scores[i]) * 100, 1), self.contributions(query, matrix[i]))
+            for i in top if scores[i] > 0
+        ]
+
+
+project_feature_index = LazyProxy(ProjectFeatureIndex, 'project_feature_index')
@@ -1,8 +1,5 @@
 import os
 from datetime import datetime, timedelta
-from docx import Document
-from docx.shared import Pt, Inches, RGBColor
-from docx.enum.text import WD_ALIGN_PARAGRAPH
 from database import DatabasePool
 from services.ai_service import AIService
 
@@ -23,7 +20,11 @@ class ReportGenerationService:
         # 2. 调用 AI 生成专业摘要和分析
         ai_analysis = ReportGenerationService._get_ai_report_content(data, report_type)
         
-        # 3. 创建 Word 文档
+        # 3. 创建 Word 文档（python-docx 只在生成报告时加载）
+        from docx import Document
+        from docx.shared import Pt
+        from docx.enum.text import WD_ALIGN_PARAGRAPH
+
         temp_dir = 'temp_reports'
         if not os.path.exists(temp_dir):
             os.makedirs(temp_dir)
@@ -1,72 +1,315 @@
 
 from database import DatabasePool
 from services.ai_service import AIService
+from services.dependency_service import DependencyService, dependency_graph_cache
+from services.schedule_engine import FS, SS, FF, ScheduleEngine, _parse_day, schedule_engine
 from datetime import datetime, timedelta
 import json
+import threading
+import time
+
+from utils.lazy import lazy_import
+
+np = lazy_import('numpy')
+
 
 class RiskSimulationService:
+    DEFAULT_ITERATIONS = 2000
+    MAX_ITERATIONS = 10000
+    # 迭代数 × 任务数上限，控制单次模拟内存（float32 约 5 个同形数组）
+    MAX_CELLS = 4000000
+    PERCENTILES = (50, 80, 95)
+    # 历史样本不足时使用的工期倍率 (乐观, 最可能, 悲观)
+    DEFAULT_RATIO = (0.9, 1.0, 1.5)
+    MIN_HISTORY_SAMPLES = 8
+    HISTORY_TTL_SECONDS = 3600
+
+    def __init__(self):
+        self._history_lock = threading.Lock()
+        self._history = None
+        self._history_loaded_at = 0
+
+    # ---------------- 历史工期偏差 ----------------
+
+    def duration_ratio_profile(self):
+        """
+        由已完成阶段估计工期倍率的 PERT 三点：实际工作日 / 计划工作日
+        计划工作日优先取阶段计划起止，缺失时取阶段内任务 estimated_duration 之和
+        """
+        with self._history_lock:
+            if self._history and time.time() - self._history_loaded_at < self.HISTORY_TTL_SECONDS:
+                return self._history
+        with DatabasePool.get_connection() as conn:
+            rows = conn.execute(DatabasePool.format_sql('''
+                SELECT s.plan_start_date, s.plan_end_date, s.actual_start_date, s.actual_end_date,
+                       COALESCE(t.estimated_total, 0) AS estimated_total
+                FROM project_stages s
+                LEFT JOIN (
+                    SELECT stage_id, SUM(COALESCE(estimated_duration, 1)) AS estimated_total
+                    FROM tasks GROUP BY stage_id
+                ) t ON t.stage_id = s.id
+                WHERE s.actual_start_date IS NOT NULL AND s.actual_end_date IS NOT NULL
+            ''')).fetchall()
+
+        actual_start, actual_end, planned = [], [], []
+        for row in rows:
+            a_start, a_end = _parse_day(row['actual_start_date']), _parse_day(row['actual_end_date'])
+            if not a_start or not a_end or a_end < a_start:
+                continue
+            p_start, p_end = _parse_day(row['plan_start_date']), _parse_day(row['plan_end_date'])
+            if p_start and p_end and p_end >= p_start:
+                plan_days = int(np.busday_count(p_start, p_end + timedelta(days=1)))
+            else:
+                plan_days = int(row['estimated_total'] or 0)
+            if plan_days <= 0:
+                continue
+            actual_start.append(a_start)
+            actual_end.append(a_end + timedelta(days=1))
+            planned.append(plan_days)
+
+        profile = {'source': 'default', 'samples': len(planned), 'ratio': self.DEFAULT_RATIO}
+        if len(planned) >= self.MIN_HISTORY_SAMPLES:
+            actual = np.maximum(np.busday_count(
+                np.array(actual_start, dtype='datetime64[D]'), np.array(actual_end, dtype='datetime64[D]')
+            ), 1)
+            ratios = np.clip(actual / np.array(planned, dtype=float), 0.5, 4.0)
+            low, mode, high = (float(v) for v in np.percentile(ratios, [10, 50, 90]))
+            if high - low < 0.05:
+                high = low + 0.05
+            profile = {
+                'source': 'history',
+                'samples': len(planned),
+                'ratio': (round(low, 3), round(min(max(mode, low), high), 3), round(high, 3)),
+            }
+        with self._history_lock:
+            self._history = profile
+            self._history_loaded_at = time.time()
+        return profile
+
+    # ---------------- 向量化传播 ----------------
+
+    @staticmethod
+    def _sample_ratios(rng, ratio, shape):
+        """PERT(Beta) 抽样工期倍率"""
+        low, mode, high = ratio
+        alpha = 1 + 4 * (mode - low) / (high - low)
+        beta = 1 + 4 * (high - mode) / (high - low)
+        return low + (high - low) * rng.beta(alpha, beta, size=shape)
+
+    @staticmethod
+    def _propagate(durations, release, preds, succs):
+        """
+        对 K 次迭代同时做 CPM 正/逆向传递；durations 形状为 (K, n)，任务按拓扑序排列
+        返回 (es, ef, slack, finish)，finish 为每次迭代的项目完工（工作日序号）
+        """
+        k, n = durations.shape
+        es = np.empty((k, n), dtype=durations.dtype)
+        ef = np.empty((k, n), dtype=durations.dtype)
+        for i in range(n):
+            d = durations[:, i]
+            start = np.full(k, release[i], dtype=durations.dtype)
+            for j, dep_type in preds[i]:
+                if dep_type == FS:
+                    bound = ef[:, j]
+                elif dep_type == SS:
+                    bound = es[:, j]
+                elif dep_type == FF:
+                    bound = ef[:, j] - d
+                else:
+                    bound = es[:, j] - d
+                np.maximum(start, bound, out=start)
+            es[:, i] = start
+            ef[:, i] = start + d
+        finish = ef.max(axis=1) if n else np.zeros(k, dtype=durations.dtype)
+
+        ls = np.empty((k, n), dtype=durations.dtype)
+        lf = np.empty((k, n), dtype=durations.dtype)
+        for i in range(n - 1, -1, -1):
+            d = durations[:, i]
+            end = finish.copy()
+            for m, dep_type in succs[i]:
+                if dep_type == FS:
+                    bound = ls[:, m]
+                elif dep_type == SS:
+                    bound = ls[:, m] + d
+                elif dep_type == FF:
+                    bound = lf[:, m]
+                else:
+                    bound = lf[:, m] + d
+                np.minimum(end, bound, out=end)
+            lf[:, i] = end
+            ls[:, i] = end - d
+        del lf
+        np.subtract(ls, es, out=ls)
+        return es, ef, ls, finish
+
+    def simulate_schedule(self, project_id, iterations=None, task_id=None, delay_days=0, seed=None, deterministic=False):
+        """
+        蒙特卡洛排程风险模拟：按历史偏差抽样未完成任务工期，沿依赖图向量化传播
+        返回项目与各阶段里程碑的 P50/P80/P95 完成日期及任务关键度（位于关键路径的迭代占比）
+        deterministic=True 时只按计划工期跑一次（可叠加 task_id 的延误），不抽样
+        """
+        loaded = schedule_engine.load_project(project_id)
+        if not loaded:
+            return None
+        tasks, graph, calendar = loaded['tasks'], loaded['graph'], loaded['calendar']
+        if graph.topo_order() is None:
+            return {'cyclic': True}
+
+        order, by_id, duration, release, preds, succs = ScheduleEngine.build_network(tasks, graph, calendar)
+        n = len(order)
+        base = np.array(duration, dtype=np.float32)
+        open_mask = np.array([not by_id[tid].get('is_completed') for tid in order], dtype=bool)
+
+        profile = self.duration_ratio_profile()
+        if deterministic:
+            k = 1
+            durations = base[None, :].copy()
+        else:
+            k = max(1, min(int(iterations or self.DEFAULT_ITERATIONS), self.MAX_ITERATIONS, self.MAX_CELLS // max(n, 1)))
+            rng = np.random.default_rng(seed)
+            durations = np.repeat(base[None, :], k, axis=0)
+            open_idx = np.flatnonzero(open_mask)
+            if open_idx.size:
+                durations[:, open_idx] *= self._sample_ratios(rng, profile['ratio'], (k, open_idx.size))
+
+        delay_pos = {tid: i for i, tid in enumerate(order)}.get(task_id) if delay_days else None
+        if delay_pos is not None:
+            durations[:, delay_pos] += float(delay_days)
+
+        _, ef, slack, finish = self._propagate(durations, release, preds, succs)
+        criticality = (slack <= 1e-3).mean(axis=0) if n else np.zeros(0)
+
+        def summarize(samples):
+            # 工作日序号区间 [0, x)，完成日为第 ceil(x)-1 个工作日
+            idx = np.maximum(np.ceil(samples - 1e-3).astype(int) - 1, 0)
+            values = np.percentile(idx, self.PERCENTILES, method='higher') if k > 1 else np.repeat(idx, len(self.PERCENTILES))
+            return {f'p{p}': calendar.to_date(int(v)).isoformat() for p, v in zip(self.PERCENTILES, values)}, idx
+
+        project_summary, project_idx = summarize(finish)
+
+        milestones = {}
+        with DatabasePool.get_connection() as conn:
+            for row in conn.execute(DatabasePool.format_sql(
+                'SELECT name, target_date, is_completed FROM milestones WHERE project_id = ?'
+            ), (project_id,)).fetchall():
+                milestones[row['name']] = dict(row)
+
+        stage_columns = {}
+        for i, tid in enumerate(order):
+            task = by_id[tid]
+            stage_columns.setdefault(task['stage_id'], (task['stage_name'], task['stage_order'], []))[2].append(i)
+
+        milestone_results = []
+        for stage_id, (stage_name, stage_order, columns) in sorted(stage_columns.items(), key=lambda kv: (kv[1][1] or 0, kv[0])):
+            summary, idx = summarize(ef[:, columns].max(axis=1))
+            milestone = milestones.get(f"{stage_name}完成") or {}
+            target = _parse_day(milestone.get('target_date'))
+            item = {
+                'stage_id': stage_id,
+                'stage_name': stage_name,
+                'milestone': milestone.get('name') or f"{stage_name}完成",
+                'target_date': target.isoformat() if target else None,
+                'is_completed': bool(milestone.get('is_completed')),
+                **summary,
+            }
+            if target:
+                item['on_time_probability'] = round(float((idx <= calendar.to_index(target + timedelta(days=1)) - 1).mean()), 3)
+            milestone_results.append(item)
+
+        task_results = sorted((
+            {
+                'task_id': tid,
+                'task_name': by_id[tid]['task_name'],
+                'stage_name': by_id[tid]['stage_name'],
+                'criticality': round(float(criticality[i]), 3),
+                'completed': not bool(open_mask[i]),
+            }
+            for i, tid in enumerate(order)
+        ), key=lambda t: (-t['criticality'], t['task_id']))
+
+        result = {
+            'cyclic': False,
+            'mode': 'deterministic' if deterministic else 'monte_carlo',
+            'iterations': k,
+            'duration_ratio': {'source': profile['source'], 'samples': profile['samples'], 'pert': list(profile['ratio'])},
+            'project_start': calendar.anchor.isoformat(),
+            'project_finish': project_summary,
+            'project_duration_mean': round(float(finish.mean()), 2),
+            'milestones': milestone_results,
+            'tasks': task_results,
+        }
+        plan_end = _parse_day(loaded['project'].get('plan_end_date'))
+        if plan_end:
+            result['plan_end_date'] = plan_end.isoformat()
+            result['on_time_probability'] = round(float((project_idx <= calendar.to_index(plan_end + timedelta(days=1)) - 1).mean()), 3)
+        if delay_pos is not None:
+            result['delayed_task_id'] = task_id
+            result['delay_days'] = delay_days
+            if deterministic:
+                baseline = self._propagate(base[None, :], release, preds, succs)[3][0]
+                result['finish_delay_workdays'] = int(round(float(finish[0] - baseline)))
+        return result
+
+    # ---------------- 单任务延误影响链 ----------------
+
     @staticmethod
-    def calculate_impact_chain(project_id, task_id, delay_days):
+    def calculate_impact_chain(project_id, task_id, delay_days, narrate=False):
         """
-        通过任务依赖图模拟延迟的连锁反应
+        通过任务依赖图模拟延迟的连锁反应；默认只做确定性计算，narrate=True 时才同步生成 AI 解读
         """
         try:
             with DatabasePool.get_connection() as conn:
-                # 1. 获取所有任务依赖关系
-                all_deps = conn.execute(DatabasePool.format_sql('''
-                    SELECT td.task_id, td.depends_on_task_id, t.task_name, t.is_completed, 
-                           s.stage_name, s.plan_end_date
-                    FROM task_dependencies td
-                    JOIN tasks t ON td.task_id = t.id
-                    JOIN project_stages s ON t.stage_id = s.id
-                    WHERE s.project_id = ?
-                '''), (project_id,)).fetchall()
-                
-                # 2. 获取初始任务信息
+                # 1. 获取初始任务信息
                 root_task = conn.execute(DatabasePool.format_sql('SELECT task_name FROM tasks WHERE id = ?'), (task_id,)).fetchone()
                 if not root_task: return None
                 
-                # 3. 广度优先搜索 (BFS) 构建影响链
-                impacted_tasks = []
-                queue = [(task_id, delay_days)]
-                visited = {task_id}
-                
-                # 构建邻接表 (depends_on_task_id -> [task_id, ...])
-                adj = {}
-                for d in all_deps:
-                    parent = d['depends_on_task_id']
-                    child = d['task_id']
-                    if parent not in adj: adj[parent] = []
-                    adj[parent].append(d)
+                # 2. 在缓存的项目依赖图上广度优先搜索 (BFS) 构建影响链
+                graph = dependency_graph_cache.get(conn, project_id)
+                chain = graph.downstream(task_id)
                 
-                while queue:
-                    curr_id, curr_delay = queue.pop(0)
-                    if curr_id in adj:
-                        for child_info in adj[curr_id]:
-                            child_id = child_info['task_id']
-                            if child_id not in visited:
-                                visited.add(child_id)
-                                queue.append((child_id, curr_delay))
-                                impacted_tasks.append(dict(child_info))
+                # 3. 一次性取回受影响任务的展示信息
+                task_rows = DependencyService._fetch_task_rows(conn, [child for child, _, _ in chain])
+                impacted_tasks = []
+                for child_id, parent_id, _ in chain:
+                    row = task_rows.get(child_id)
+                    if not row: continue
+                    impacted_tasks.append({
+                        'task_id': child_id,
+                        'depends_on_task_id': parent_id,
+                        'task_name': row['task_name'],
+                        'is_completed': row['is_completed'],
+                        'stage_name': row['stage_name'],
+                        'plan_end_date': row['plan_end_date'],
+                    })
                 
                 # 4. 获取受影响的里程碑
-                milestones = conn.execute(DatabasePool.format_sql('''
+                milestones = [dict(m) for m in conn.execute(DatabasePool.format_sql('''
                     SELECT * FROM milestones 
                     WHERE project_id = ? AND is_completed = ?
-                '''), (project_id, False)).fetchall()
-                
-                # 5. 调用 AI 生成“蝴蝶效应”描述
+                '''), (project_id, False)).fetchall()]
+
+            # 5. 按计划工期确定性重算完工日，得到延误对总工期的实际冲击（不调用 AI）
+            schedule = risk_simulation_service.simulate_schedule(
+                project_id, task_id=task_id, delay_days=delay_days, deterministic=True
+            ) or {}
+
+            # 6. AI “蝴蝶效应”解读为可选项，默认由前端另行异步请求
+            narration = None
+            if narrate:
                 narration = RiskSimulationService._generate_ai_narration(
                     root_task['task_name'], delay_days, impacted_tasks, milestones
                 )
-                
-                return {
-                    "root_task": root_task['task_name'],
-                    "delay_days": delay_days,
-                    "impacted_count": len(impacted_tasks),
-                    "impacted_tasks": impacted_tasks[:10], # 仅返回前10个展示
-                    "narration": narration
-                }
+
+            return {
+                "root_task": root_task['task_name'],
+                "delay_days": delay_days,
+                "impacted_count": len(impacted_tasks),
+                "impacted_tasks": impacted_tasks[:10], # 仅返回前10个展示
+                "finish_delay_workdays": schedule.get('finish_delay_workdays', 0),
+                "project_finish": (schedule.get('project_finish') or {}).get('p50'),
+                "narration": narration
+            }
         except Exception as e:
             print(f"Impact Chain Error: {e}")
             return None
@@ -0,0 +1,490 @@
+# services/schedule_engine.py
+"""
+日历感知的 CPM 排程引擎
+- 工作日历：周末 + 项目节假日 + 调休上班日，日期与工作日序号互转
+- 支持 task_dependencies 中的四类依赖：FS / SS / FF / SF
+- 按拓扑序做数组化正向/逆向传递；可选按负责人（assigned_to）做资源平衡
+- 结果按（依赖图版本, 任务指纹, 日历指纹）缓存，甘特图与关键路径接口共用
+"""
+
+import bisect
+import hashlib
+import heapq
+import json
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import date, datetime, timedelta
+
+from database import DatabasePool
+from services.dependency_service import dependency_graph_cache
+
+logger = logging.getLogger(__name__)
+
+FS, SS, FF, SF = range(4)
+DEPENDENCY_TYPES = {
+    'finish_to_start': FS,
+    'start_to_start': SS,
+    'finish_to_finish': FF,
+    'start_to_finish': SF,
+}
+DEFAULT_WEEKEND = (5, 6)
+
+
+def _parse_day(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value).strip()[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def _parse_day_list(value):
+    """节假日/调休配置：JSON 数组或逗号分隔；支持 "2026-10-01~2026-10-07" 区间"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        try:
+            items = json.loads(value)
+        except ValueError:
+            items = [part for part in value.replace('\n', ',').split(',')]
+    else:
+        items = list(value)
+    days = []
+    for item in items:
+        text = str(item or '').strip()
+        if not text:
+            continue
+        if '~' in text:
+            start, end = (_parse_day(part) for part in text.split('~', 1))
+            if start and end and start <= end:
+                days.extend(start + timedelta(days=i) for i in range((end - start).days + 1))
+            continue
+        day = _parse_day(text)
+        if day:
+            days.append(day)
+    return days
+
+
+class WorkCalendar:
+    """工作日历：第 0 个工作日为锚点当天或其后首个工作日"""
+
+    MAX_HORIZON_DAYS = 366 * 30
+
+    def __init__(self, anchor, weekend_days=DEFAULT_WEEKEND, holidays=(), extra_workdays=()):
+        self.weekend = frozenset(int(d) for d in weekend_days if 0 <= int(d) <= 6)
+        self.holidays = frozenset(d.toordinal() for d in holidays)
+        self.extra_workdays = frozenset(d.toordinal() for d in extra_workdays)
+        if len(self.weekend) == 7 and not self.extra_workdays:
+            raise ValueError('工作日历不能把一周七天都设为休息日')
+        self._days = []
+        self._iso = []
+        self._cursor = anchor.toordinal()
+        self._extend(1)
+        self.anchor = date.fromordinal(self._days[0])
+
+    def is_workday(self, ordinal):
+        if ordinal in self.extra_workdays:
+            return True
+        if ordinal in self.holidays:
+            return False
+        return date.fromordinal(ordinal).weekday() not in self.weekend
+
+    def _extend(self, count=None, until_ordinal=None):
+        limit = self._cursor + self.MAX_HORIZON_DAYS
+        while (count is not None and len(self._days) < count) or \
+                (until_ordinal is not None and (not self._days or self._days[-1] < until_ordinal)):
+            if self._cursor > limit:
+                raise ValueError('工作日历超出可排程范围')
+            if self.is_workday(self._cursor):
+                self._days.append(self._cursor)
+            self._cursor += 1
+
+    def to_date(self, index):
+        index = max(0, int(index))
+        self._extend(count=index + 1)
+        return date.fromordinal(self._days[index])
+
+    def iso_dates(self, count):
+        """前 count 个工作日的 YYYY-MM-DD 列表（批量输出日期时避免逐个换算）"""
+        self._extend(count=max(1, count))
+        if len(self._iso) < count:
+            self._iso.extend(date.fromordinal(o).isoformat() for o in self._days[len(self._iso):count])
+        return self._iso
+
+    def to_index(self, day):
+        """日期 -> 当天（或其后首个工作日）的工作日序号；锚点之前记为 0"""
+        ordinal = day.toordinal()
+        if ordinal <= self._days[0]:
+            return 0
+        self._extend(until_ordinal=ordinal)
+        return bisect.bisect_left(self._days, ordinal)
+
+    def fingerprint(self):
+        return (
+            self.anchor.toordinal(),
+            tuple(sorted(self.weekend)),
+            hash(self.holidays),
+            hash(self.extra_workdays),
+        )
+
+
+class ScheduleEngine:
+    CACHE_SIZE = 64
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+
+    # ---------------- 日历配置 ----------------
+
+    @staticmethod
+    def _calendar_row(conn, project_id):
+        row = conn.execute(DatabasePool.format_sql(
+            'SELECT * FROM project_calendars WHERE project_id = ?'
+        ), (project_id,)).fetchone()
+        return dict(row) if row else {}
+
+    @staticmethod
+    def _calendar_payload(row):
+        weekend = [int(d) for d in str(row.get('weekend_days') or '').split(',') if d.strip().isdigit()] \
+            if row.get('weekend_days') is not None else list(DEFAULT_WEEKEND)
+        return {
+            'weekend_days': weekend,
+            'holidays': [d.isoformat() for d in _parse_day_list(row.get('holidays'))],
+            'extra_workdays': [d.isoformat() for d in _parse_day_list(row.get('extra_workdays'))],
+            'default_capacity': max(1, int(row.get('default_capacity') or 1)),
+        }
+
+    def get_calendar(self, project_id):
+        with DatabasePool.get_connection() as conn:
+            return self._calendar_payload(self._calendar_row(conn, project_id))
+
+    def save_calendar(self, project_id, data):
+        data = data or {}
+        weekend = data.get('weekend_days', list(DEFAULT_WEEKEND))
+        if isinstance(weekend, str):
+            weekend = [part for part in weekend.split(',') if part.strip()]
+        weekend = sorted({int(d) for d in weekend if 0 <= int(d) <= 6})
+        holidays = [d.isoformat() for d in _parse_day_list(data.get('holidays'))]
+        extra_workdays = [d.isoformat() for d in _parse_day_list(data.get('extra_workdays'))]
+        if len(weekend) == 7 and not extra_workdays:
+            raise ValueError('工作日历不能把一周七天都设为休息日')
+        capacity = max(1, int(data.get('default_capacity') or 1))
+        with DatabasePool.get_connection() as conn:
+            conn.execute(DatabasePool.format_sql('''
+                INSERT INTO project_calendars (project_id, weekend_days, holidays, extra_workdays, default_capacity, updated_at)
+                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (project_id) DO UPDATE SET
+                    weekend_days = EXCLUDED.weekend_days,
+                    holidays = EXCLUDED.holidays,
+                    extra_workdays = EXCLUDED.extra_workdays,
+                    default_capacity = EXCLUDED.default_capacity,
+                    updated_at = CURRENT_TIMESTAMP
+            '''), (
+                project_id,
+                ','.join(str(d) for d in weekend),
+                json.dumps(holidays),
+                json.dumps(extra_workdays),
+                capacity,
+            ))
+            conn.commit()
+        return self.get_calendar(project_id)
+
+    # ---------------- 排程 ----------------
+
+    def load_project(self, project_id):
+        """读取排程所需的任务、依赖图与工作日历；无任务时返回 None"""
+        with DatabasePool.get_connection() as conn:
+            project = conn.execute(DatabasePool.format_sql(
+                'SELECT plan_start_date, plan_end_date FROM projects WHERE id = ?'
+            ), (project_id,)).fetchone()
+            rows = conn.execute(DatabasePool.format_sql('''
+                SELECT t.id, t.task_name, t.is_completed, t.completed_date, t.estimated_duration, t.assigned_to,
+                       s.id AS stage_id, s.stage_name, s.stage_order, s.plan_start_date, s.plan_end_date
+                FROM tasks t
+                JOIN project_stages s ON t.stage_id = s.id
+                WHERE s.project_id = ?
+                ORDER BY s.stage_order, t.id
+            '''), (project_id,)).fetchall()
+            if not rows:
+                return None
+            tasks = [dict(row) for row in rows]
+            graph = dependency_graph_cache.get(conn, project_id, required_tasks=[t['id'] for t in tasks])
+            calendar_config = self._calendar_payload(self._calendar_row(conn, project_id))
+
+        project = dict(project) if project else {}
+        stage_starts = [d for d in (_parse_day(t['plan_start_date']) for t in tasks) if d]
+        anchor = _parse_day(project.get('plan_start_date')) or (min(stage_starts) if stage_starts else date.today())
+        calendar = WorkCalendar(
+            anchor,
+            calendar_config['weekend_days'],
+            _parse_day_list(calendar_config['holidays']),
+            _parse_day_list(calendar_config['extra_workdays']),
+        )
+        return {
+            'project': project,
+            'tasks': tasks,
+            'graph': graph,
+            'calendar': calendar,
+            'calendar_config': calendar_config,
+        }
+
+    def schedule_project(self, project_id, level=False):
+        """返回项目排程结果；无任务时返回 None。结果为缓存共享对象，调用方不要修改。"""
+        loaded = self.load_project(project_id)
+        if not loaded:
+            return None
+        project, tasks, graph = loaded['project'], loaded['tasks'], loaded['graph']
+        calendar, calendar_config = loaded['calendar'], loaded['calendar_config']
+
+        task_fingerprint = hashlib.sha1(repr([
+            (t['id'], t['estimated_duration'], t['assigned_to'], str(t['plan_start_date'] or ''),
+             bool(t['is_completed']), t['task_name'], t['stage_id'], t['stage_order'])
+            for t in tasks
+        ]).encode('utf-8')).hexdigest()
+        key = (project_id, graph.version, task_fingerprint, calendar.fingerprint(),
+               calendar_config['default_capacity'], str(project.get('plan_end_date') or ''), bool(level))
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        result = self.compute(
+            tasks, graph, calendar,
+            level=level,
+            capacity=calendar_config['default_capacity'],
+            deadline=_parse_day(project.get('plan_end_date')),
+        )
+        result['calendar'] = calendar_config
+        result['graph_version'] = graph.version
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return result
+
+    @staticmethod
+    def build_network(tasks, graph, calendar):
+        """按拓扑序展开为数组：返回 (order, by_id, duration, release, preds, succs)；
+        preds/succs 为 [(下标, 依赖类型)]，调用方需先确认 graph 无环"""
+        by_id = {t['id']: t for t in tasks}
+        order = [tid for tid in graph.topo_order() or () if tid in by_id]
+        n = len(order)
+        pos = {tid: i for i, tid in enumerate(order)}
+
+        duration = [0] * n
+        release = [0] * n
+        preds = [[] for _ in range(n)]
+        succs = [[] for _ in range(n)]
+        for i, tid in enumerate(order):
+            task = by_id[tid]
+            duration[i] = max(0, int(task.get('estimated_duration') or 1))
+            stage_start = _parse_day(task.get('plan_start_date'))
+            release[i] = calendar.to_index(stage_start) if stage_start else 0
+            for parent in graph.pred.get(tid, ()):
+                j = pos.get(parent)
+                if j is None:
+                    continue
+                dep_type = DEPENDENCY_TYPES.get(graph.edge_types.get((tid, parent)), FS)
+                preds[i].append((j, dep_type))
+                succs[j].append((i, dep_type))
+        return order, by_id, duration, release, preds, succs
+
+    @staticmethod
+    def _unscheduled_item(task, graph):
+        """无法排程（依赖成环）的任务：日期取所在阶段的计划日期，未设置时默认今天起 3 天"""
+        tid = task['id']
+        start = _parse_day(task.get('plan_start_date')) or date.today()
+        end = _parse_day(task.get('plan_end_date')) or start + timedelta(days=3)
+        return {
+            'id': tid,
+            'name': task['task_name'],
+            'task_name': task['task_name'],
+            'stage_id': task['stage_id'],
+            'stage': task['stage_name'],
+            'stage_name': task['stage_name'],
+            'stage_order': task['stage_order'],
+            'assigned_to': task.get('assigned_to') or '',
+            'completed': bool(task.get('is_completed')),
+            'duration': max(0, int(task.get('estimated_duration') or 1)),
+            'predecessors': sorted(graph.pred.get(tid, ())),
+            'successors': sorted(graph.succ.get(tid, ())),
+            'slack': None,
+            'is_critical': False,
+            'start_date': start.isoformat(),
+            'end_date': end.isoformat(),
+            'leveled_start_date': start.isoformat(),
+            'leveled_end_date': end.isoformat(),
+        }
+
+    @staticmethod
+    def compute(tasks, graph, calendar, level=False, capacity=1, deadline=None):
+        """纯计算：tasks 为任务行列表，graph 为 ProjectDependencyGraph"""
+        if graph.topo_order() is None:
+            # 有环时无法排程，仍返回任务清单（含前后置关系），供甘特图与任务表展示
+            return {'cyclic': True, 'tasks': [ScheduleEngine._unscheduled_item(t, graph) for t in tasks]}
+
+        order, by_id, duration, release, preds, succs = ScheduleEngine.build_network(tasks, graph, calendar)
+        n = len(order)
+
+        # 正向传递：最早开始/完成（工作日序号，区间 [es, ef)）
+        es = [0] * n
+        ef = [0] * n
+        for i in range(n):
+            start = release[i]
+            d = duration[i]
+            for j, dep_type in preds[i]:
+                if dep_type == FS:
+                    bound = ef[j]
+                elif dep_type == SS:
+                    bound = es[j]
+                elif dep_type == FF:
+                    bound = ef[j] - d
+                else:
+                    bound = es[j] - d
+                if bound > start:
+                    start = bound
+            es[i] = start
+            ef[i] = start + d
+
+        finish = max(ef) if n else 0
+
+        # 逆向传递：最晚开始/完成
+        ls = [0] * n
+        lf = [0] * n
+        for i in range(n - 1, -1, -1):
+            end = finish
+            d = duration[i]
+            for k, dep_type in succs[i]:
+                if dep_type == FS:
+                    bound = ls[k]
+                elif dep_type == SS:
+                    bound = ls[k] + d
+                elif dep_type == FF:
+                    bound = lf[k]
+                else:
+                    bound = lf[k] + d
+                if bound < end:
+                    end = bound
+            lf[i] = end
+            ls[i] = end - d
+
+        leveled_start = leveled_finish = None
+        if level:
+            leveled_start, leveled_finish = ScheduleEngine._level_resources(
+                order, by_id, duration, release, preds, succs, ls, capacity
+            )
+
+        horizon = max(max(lf, default=0), max(leveled_finish or [0])) + 1
+        labels = calendar.iso_dates(horizon)
+
+        def finish_date(start_idx, end_idx):
+            return labels[max(0, end_idx - 1 if end_idx > start_idx else start_idx)]
+
+        results = []
+        for i, tid in enumerate(order):
+            task = by_id[tid]
+            slack = ls[i] - es[i]
+            item = {
+                'id': tid,
+                'name': task['task_name'],
+                'task_name': task['task_name'],
+                'stage_id': task['stage_id'],
+                'stage': task['stage_name'],
+                'stage_name': task['stage_name'],
+                'stage_order': task['stage_order'],
+                'assigned_to': task.get('assigned_to') or '',
+                'completed': bool(task.get('is_completed')),
+                'duration': duration[i],
+                'predecessors': sorted(order[j] for j, _ in preds[i]),
+                'successors': sorted(order[k] for k, _ in succs[i]),
+                'early_start': es[i],
+                'early_finish': ef[i],
+                'late_start': ls[i],
+                'late_finish': lf[i],
+                'slack': slack,
+                'is_critical': slack <= 0,
+                'start_date': labels[max(0, es[i])],
+                'end_date': finish_date(es[i], ef[i]),
+                'late_start_date': labels[max(0, ls[i])],
+                'late_end_date': finish_date(ls[i], lf[i]),
+            }
+            if level:
+                item.update({
+                    'leveled_start': leveled_start[i],
+                    'leveled_finish': leveled_finish[i],
+                    'leveled_start_date': labels[leveled_start[i]],
+                    'leveled_end_date': finish_date(leveled_start[i], leveled_finish[i]),
+                    'resource_delay': leveled_start[i] - es[i],
+                })
+            results.append(item)
+
+        result = {
+            'cyclic': False,
+            'tasks': results,
+            'project_duration': finish,
+            'project_start': calendar.anchor.isoformat(),
+            'project_finish': finish_date(0, finish) if n else calendar.anchor.isoformat(),
+        }
+        if level:
+            leveled_total = max(leveled_finish) if n else 0
+            result['leveled_duration'] = leveled_total
+            result['leveled_finish'] = finish_date(0, leveled_total) if n else calendar.anchor.isoformat()
+        if deadline:
+            result['plan_end_date'] = deadline.isoformat()
+            result['overrun_workdays'] = max(0, finish - calendar.to_index(deadline + timedelta(days=1)))
+        return result
+
+    @staticmethod
+    def _level_resources(order, by_id, duration, release, preds, succs, late_start, capacity):
+        """串行进度生成：就绪任务按最晚开始排序，同一负责人同一工作日最多 capacity 个任务"""
+        n = len(order)
+        remaining = [len(p) for p in preds]
+        start = [0] * n
+        end = [0] * n
+        usage = defaultdict(lambda: defaultdict(int))
+        ready = [(late_start[i], i) for i in range(n) if remaining[i] == 0]
+        heapq.heapify(ready)
+        while ready:
+            _, i = heapq.heappop(ready)
+            d = duration[i]
+            t = release[i]
+            for j, dep_type in preds[i]:
+                if dep_type == FS:
+                    bound = end[j]
+                elif dep_type == SS:
+                    bound = start[j]
+                elif dep_type == FF:
+                    bound = end[j] - d
+                else:
+                    bound = start[j] - d
+                if bound > t:
+                    t = bound
+            t = max(0, t)
+            owner = str(by_id[order[i]].get('assigned_to') or '').strip()
+            if owner and d > 0:
+                days = usage[owner]
+                while True:
+                    busy = next((day for day in range(t, t + d) if days[day] >= capacity), None)
+                    if busy is None:
+                        break
+                    t = busy + 1
+                for day in range(t, t + d):
+                    days[day] += 1
+            start[i] = t
+            end[i] = t + d
+            for k, _ in succs[i]:
+                remaining[k] -= 1
+                if remaining[k] == 0:
+                    heapq.heappush(ready, (late_start[k], k))
+        return start, end
+
+
+schedule_engine = ScheduleEngine()
@@ -10,8 +10,8 @@ scheduler_service.py - 自动日报/周报定时生成与归档服务
 
 ⚠️ 部署注意事项:
   - threading.Timer 在进程被 OOM kill 或 worker 重启后不会自动恢复
-  - 多 worker 部署时 (gunicorn --workers > 1) 会导致定时任务多次执行
-  - 推荐: gunicorn --workers 1 --threads 4 (单 worker 多线程) 或 --preload
+  - 多 worker 部署时 (gunicorn --workers > 1) 由 utils/background_role.py 以文件锁选出一个 worker 启动调度器，
+    该 worker 退出后其他 worker 会在后续请求中接管；也可设 BACKGROUND_TASKS=false 交给独立进程
 """
 
 import threading
@@ -232,8 +232,10 @@ class ReportScheduler:
         try:
             logger.info("⏰ 开始执行夜间风险快照与向量同步...")
             self._snapshot_project_risks()
+            self._capture_progress_snapshots()
             self._sync_kb_embeddings()
             self._sync_payment_milestones()
+            self._sync_geo_enrichment()
         except Exception as e:
             logger.error("夜间任务异常: %s", e, exc_info=True)
         finally:
@@ -288,6 +290,14 @@ class ReportScheduler:
                 logger.warning("项目 %s 风险快照失败: %s", project['id'], ex)
         logger.info("夜间风险快照完成: %d/%d", ok_count, len(projects))
 
+    def _capture_progress_snapshots(self):
+        try:
+            from services.snapshot_service import snapshot_service
+            results = snapshot_service.capture_all_snapshots()
+            logger.info("进度快照完成: %d 个项目", sum(1 for r in results if r['success']))
+        except Exception as ex:
+            logger.warning("进度快照失败: %s", ex)
+
     def _sync_kb_embeddings(self):
         try:
             from rag_service import rag_service
@@ -311,6 +321,14 @@ class ReportScheduler:
         )
         monitor_service.send_wecom_message("周一全线经营摘要", content, msg_type='markdown')
 
+    def _sync_geo_enrichment(self):
+        try:
+            from services.geo_enrichment_service import geo_enrichment_service
+            result = geo_enrichment_service.run_all()
+            logger.info("✅ 地理信息补全完成: %s", result)
+        except Exception as e:
+            logger.error("地理信息补全失败: %s", e)
+
     def _sync_payment_milestones(self):
         try:
             from services.project_service import project_service
@@ -7,7 +7,6 @@
 """
 
 import logging
-import json
 from datetime import datetime, timedelta
 from database import DatabasePool
 
@@ -16,141 +15,207 @@ logger = logging.getLogger(__name__)
 
 class SnapshotService:
 
+    CHUNK_SIZE = 500
+
     @staticmethod
-    def capture_snapshot(project_id, snapshot_type='manual'):
-        """为项目拍摄进度快照"""
+    def _grouped(conn, sql, project_ids, params=()):
+        """按项目分块执行 IN 查询，返回 {project_id: [row, ...]}"""
+        grouped = {}
+        for i in range(0, len(project_ids), SnapshotService.CHUNK_SIZE):
+            chunk = project_ids[i:i + SnapshotService.CHUNK_SIZE]
+            placeholders = ','.join('?' for _ in chunk)
+            rows = conn.execute(DatabasePool.format_sql(sql.format(ids=placeholders)), tuple(params) + tuple(chunk)).fetchall()
+            for row in rows:
+                grouped.setdefault(row['project_id'], []).append(row)
+        return grouped
+
+    @staticmethod
+    def capture_snapshots(project_ids=None, snapshot_type='auto'):
+        """
+        批量拍摄进度快照：阶段/任务/问题/接口各一条分组查询，一次批量 upsert
+        project_ids 为空时覆盖全部活跃项目；返回 {project_id: snapshot_data}
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
         with DatabasePool.get_connection() as conn:
-            sql_p = DatabasePool.format_sql('SELECT id, project_name, status, progress FROM projects WHERE id = ?')
-            project = conn.execute(sql_p, (project_id,)).fetchone()
-    
-            if not project:
-                return None
-    
-            # 获取每个阶段的进度
-            sql_st = DatabasePool.format_sql('''
-                SELECT id, stage_name, stage_order, progress, status
+            if project_ids is None:
+                projects = conn.execute(DatabasePool.format_sql(
+                    'SELECT id, project_name, status, progress FROM projects WHERE status NOT IN (\'已完成\', \'已终止\')'
+                )).fetchall()
+            else:
+                projects = [row for rows in SnapshotService._grouped(conn, '''
+                    SELECT id AS project_id, id, project_name, status, progress FROM projects WHERE id IN ({ids})
+                ''', list(project_ids)).values() for row in rows]
+            if not projects:
+                return {}
+            ids = [p['id'] for p in projects]
+
+            stages = SnapshotService._grouped(conn, '''
+                SELECT project_id, id, stage_name, stage_order, progress, status
                 FROM project_stages
-                WHERE project_id = ?
-                ORDER BY stage_order
-            ''')
-            stages = conn.execute(sql_st, (project_id,)).fetchall()
-    
-            # 获取任务统计
-            sql_ts = DatabasePool.format_sql('''
-                SELECT
+                WHERE project_id IN ({ids})
+                ORDER BY project_id, stage_order
+            ''', ids)
+            task_stats = SnapshotService._grouped(conn, '''
+                SELECT s.project_id,
                     COUNT(*) as total,
                     SUM(CASE WHEN t.is_completed = ? THEN 1 ELSE 0 END) as completed
                 FROM tasks t
                 JOIN project_stages s ON t.stage_id = s.id
-                WHERE s.project_id = ?
-            ''')
-            task_stats = conn.execute(sql_ts, (True, project_id)).fetchone()
-    
-            # 获取问题统计
-            sql_is = DatabasePool.format_sql('''
-                SELECT
+                WHERE s.project_id IN ({ids})
+                GROUP BY s.project_id
+            ''', ids, (True,))
+            issue_stats = SnapshotService._grouped(conn, '''
+                SELECT project_id,
                     COUNT(*) as total,
                     SUM(CASE WHEN status NOT IN ('已解决', '已关闭') THEN 1 ELSE 0 END) as open_count
                 FROM issues
-                WHERE project_id = ?
-            ''')
-            issue_stats = conn.execute(sql_is, (project_id,)).fetchone()
-    
-            # 获取接口统计
-            sql_if = DatabasePool.format_sql('''
-                SELECT
+                WHERE project_id IN ({ids})
+                GROUP BY project_id
+            ''', ids)
+            interface_stats = SnapshotService._grouped(conn, '''
+                SELECT project_id,
                     COUNT(*) as total,
                     SUM(CASE WHEN status = '已完成' THEN 1 ELSE 0 END) as completed
                 FROM interfaces
-                WHERE project_id = ?
-            ''')
-            interface_stats = conn.execute(sql_if, (project_id,)).fetchone()
-    
-            # 构建快照数据
-            snapshot_data = {
-                'overall_progress': project['progress'],
-                'status': project['status'],
-                'stages': [{
-                    'stage_name': s['stage_name'],
-                    'stage_order': s['stage_order'],
-                    'progress': s['progress'],
-                    'status': s['status']
-                } for s in stages],
-                'tasks': {
-                    'total': task_stats['total'] or 0,
-                    'completed': task_stats['completed'] or 0
-                },
-                'issues': {
-                    'total': issue_stats['total'] or 0,
-                    'open': issue_stats['open_count'] or 0
-                },
-                'interfaces': {
-                    'total': interface_stats['total'] or 0,
-                    'completed': interface_stats['completed'] or 0
+                WHERE project_id IN ({ids})
+                GROUP BY project_id
+            ''', ids)
+
+            snapshots = {}
+            snapshot_rows = []
+            stage_rows = []
+            for project in projects:
+                pid = project['id']
+                tasks = dict((task_stats.get(pid) or [{}])[0])
+                issues = dict((issue_stats.get(pid) or [{}])[0])
+                interfaces = dict((interface_stats.get(pid) or [{}])[0])
+                data = {
+                    'overall_progress': project['progress'],
+                    'status': project['status'],
+                    'stages': [{
+                        'stage_name': st['stage_name'],
+                        'stage_order': st['stage_order'],
+                        'progress': st['progress'],
+                        'status': st['status']
+                    } for st in stages.get(pid, [])],
+                    'tasks': {
+                        'total': tasks.get('total') or 0,
+                        'completed': tasks.get('completed') or 0
+                    },
+                    'issues': {
+                        'total': issues.get('total') or 0,
+                        'open': issues.get('open_count') or 0
+                    },
+                    'interfaces': {
+                        'total': interfaces.get('total') or 0,
+                        'completed': interfaces.get('completed') or 0
+                    }
                 }
-            }
-    
-            today = datetime.now().strftime('%Y-%m-%d')
-    
-            # 检查今天是否已有快照，有则更新
-            sql_check = DatabasePool.format_sql('SELECT id FROM progress_snapshots WHERE project_id = ? AND snapshot_date = ?')
-            existing = conn.execute(sql_check, (project_id, today)).fetchone()
-    
-            if existing:
-                sql_up = DatabasePool.format_sql('''
-                    UPDATE progress_snapshots
-                    SET snapshot_data = ?, overall_progress = ?, snapshot_type = ?, updated_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                ''')
-                conn.execute(sql_up, (json.dumps(snapshot_data, ensure_ascii=False), project['progress'], snapshot_type, existing['id']))
-            else:
-                sql_ins = DatabasePool.format_sql('''
-                    INSERT INTO progress_snapshots (project_id, snapshot_date, overall_progress, snapshot_data, snapshot_type)
-                    VALUES (?, ?, ?, ?, ?)
-                ''')
-                conn.execute(sql_ins, (project_id, today, project['progress'], json.dumps(snapshot_data, ensure_ascii=False), snapshot_type))
-    
+                snapshots[pid] = data
+                snapshot_rows.append((
+                    pid, today, project['progress'] or 0, snapshot_type, project['status'],
+                    data['tasks']['total'], data['tasks']['completed'],
+                    data['issues']['total'], data['issues']['open'],
+                    data['interfaces']['total'], data['interfaces']['completed'],
+                ))
+                stage_rows.extend(
+                    (pid, today, st['id'], st['stage_name'], st['stage_order'], st['progress'] or 0, st['status'])
+                    for st in stages.get(pid, [])
+                )
+
+            # PostgreSQL 下合并为多行 VALUES 的单条 upsert（execute_values）
+            DatabasePool.executemany(conn, '''
+                INSERT INTO progress_snapshots
+                (project_id, snapshot_date, overall_progress, snapshot_type, project_status,
+                 tasks_total, tasks_completed, issues_total, issues_open, interfaces_total, interfaces_completed,
+                 created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                ON CONFLICT (project_id, snapshot_date) DO UPDATE SET
+                    overall_progress = EXCLUDED.overall_progress,
+                    snapshot_type = EXCLUDED.snapshot_type,
+                    project_status = EXCLUDED.project_status,
+                    tasks_total = EXCLUDED.tasks_total,
+                    tasks_completed = EXCLUDED.tasks_completed,
+                    issues_total = EXCLUDED.issues_total,
+                    issues_open = EXCLUDED.issues_open,
+                    interfaces_total = EXCLUDED.interfaces_total,
+                    interfaces_completed = EXCLUDED.interfaces_completed,
+                    snapshot_data = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+            ''', snapshot_rows)
+            cursor = conn.cursor()
+            # 当天阶段明细整体替换（阶段可能被删改）
+            for i in range(0, len(ids), SnapshotService.CHUNK_SIZE):
+                chunk = ids[i:i + SnapshotService.CHUNK_SIZE]
+                cursor.execute(DatabasePool.format_sql(
+                    f"DELETE FROM progress_snapshot_stages WHERE snapshot_date = ? AND project_id IN ({','.join('?' for _ in chunk)})"
+                ), (today, *chunk))
+            DatabasePool.executemany(conn, '''
+                INSERT INTO progress_snapshot_stages
+                (project_id, snapshot_date, stage_id, stage_name, stage_order, progress, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', stage_rows)
             conn.commit()
-            return snapshot_data
+        return snapshots
+
+    @staticmethod
+    def capture_snapshot(project_id, snapshot_type='manual'):
+        """为项目拍摄进度快照"""
+        return SnapshotService.capture_snapshots([project_id], snapshot_type).get(project_id)
 
     @staticmethod
     def capture_all_snapshots():
         """为所有活跃项目拍摄快照"""
-        with DatabasePool.get_connection() as conn:
-            sql = DatabasePool.format_sql('SELECT id FROM projects WHERE status NOT IN (\'已完成\', \'已终止\')')
-            projects = conn.execute(sql).fetchall()
-    
-        results = []
-        for p in projects:
-            try:
-                SnapshotService.capture_snapshot(p['id'], 'auto')
-                results.append({'project_id': p['id'], 'success': True})
-            except Exception as e:
-                results.append({'project_id': p['id'], 'success': False, 'error': str(e)})
-    
-        return results
+        try:
+            captured = SnapshotService.capture_snapshots(snapshot_type='auto')
+        except Exception as e:
+            logger.error("批量快照失败: %s", e, exc_info=True)
+            return [{'project_id': None, 'success': False, 'error': str(e)}]
+        return [{'project_id': pid, 'success': True} for pid in captured]
 
     @staticmethod
     def get_snapshots(project_id, weeks=8):
-        """获取项目最近N周的快照数据"""
+        """获取项目最近N周的快照数据（读定长列与阶段明细，不解析 JSON）"""
         with DatabasePool.get_connection() as conn:
             sql = DatabasePool.format_sql('''
-                SELECT id, snapshot_date, overall_progress, snapshot_data, snapshot_type, created_at
+                SELECT id, snapshot_date, overall_progress, snapshot_type, created_at, project_status,
+                       tasks_total, tasks_completed, issues_total, issues_open, interfaces_total, interfaces_completed
                 FROM progress_snapshots
                 WHERE project_id = ?
                 ORDER BY snapshot_date DESC
                 LIMIT ?
             ''')
             snapshots = conn.execute(sql, (project_id, weeks * 7)).fetchall()
+            stage_map = {}
+            if snapshots:
+                stage_rows = conn.execute(DatabasePool.format_sql('''
+                    SELECT snapshot_date, stage_name, stage_order, progress, status
+                    FROM progress_snapshot_stages
+                    WHERE project_id = ? AND snapshot_date >= ?
+                    ORDER BY snapshot_date, stage_order, id
+                '''), (project_id, snapshots[-1]['snapshot_date'])).fetchall()
+                for st in stage_rows:
+                    stage_map.setdefault(str(st['snapshot_date']), []).append({
+                        'stage_name': st['stage_name'],
+                        'stage_order': st['stage_order'],
+                        'progress': st['progress'],
+                        'status': st['status']
+                    })
     
         result = []
         for s in snapshots:
-            data = json.loads(s['snapshot_data']) if s['snapshot_data'] else {}
             result.append({
                 'id': s['id'],
                 'date': s['snapshot_date'],
                 'overall_progress': s['overall_progress'],
-                'data': data,
+                'data': {
+                    'overall_progress': s['overall_progress'],
+                    'status': s['project_status'],
+                    'stages': stage_map.get(str(s['snapshot_date']), []),
+                    'tasks': {'total': s['tasks_total'] or 0, 'completed': s['tasks_completed'] or 0},
+                    'issues': {'total': s['issues_total'] or 0, 'open': s['issues_open'] or 0},
+                    'interfaces': {'total': s['interfaces_total'] or 0, 'completed': s['interfaces_completed'] or 0},
+                },
                 'type': s['snapshot_type']
             })
     
@@ -0,0 +1,283 @@
+# services/wecom_callback_service.py
+"""
+企业微信回调异步处理管线
+- 回调路由解密后立即应答 "success"，业务处理交给有界线程池，结果通过主动推送回复
+- 按 MsgId（事件按 发送人+时间+事件+Key）在短 TTL 内去重，企业微信超时重试不会被重复处理；
+  重试可能落到另一个 worker，因此以数据库 wecom_callback_dedup 的主键冲突为准，进程内缓存只挡同进程的重复
+- 需要转写的语音、图片识别各走独立的小线程池和排队上限，突发的慢任务不会占用文本消息的线程
+- 调试日志先进内存缓冲，后台批量写入 wecom_debug_logs
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from database import DatabasePool
+
+logger = logging.getLogger(__name__)
+
+VOICE_FALLBACK_REPLY = "抱歉，由于企业微信限制，目前无法直接识别该语音内容。建议您在我的“移动端控制台”中使用语音输入，或者发送文字消息。"
+BUSY_REPLY = "当前消息较多，请稍后再试。"
+
+
+class WecomCallbackPipeline:
+    WORKERS = 8
+    MAX_PENDING = 200
+    VOICE_CONCURRENCY = 2
+    IMAGE_CONCURRENCY = 2
+    MEDIA_MAX_PENDING = 20
+    DEDUP_TTL_SECONDS = 300
+    DEDUP_MAX_KEYS = 10000
+    DEDUP_PURGE_SECONDS = 60
+    LOG_FLUSH_SECONDS = 2
+    LOG_BATCH_SIZE = 50
+    LOG_BUFFER_SIZE = 2000
+
+    def __init__(self):
+        self._executors = {}
+        self._executor_lock = threading.Lock()
+        # 各通道：(线程数, 排队上限)
+        self._lanes = {
+            'text': (self.WORKERS, self.MAX_PENDING),
+            'voice': (self.VOICE_CONCURRENCY, self.MEDIA_MAX_PENDING),
+            'image': (self.IMAGE_CONCURRENCY, self.MEDIA_MAX_PENDING),
+        }
+        self._slots = {lane: threading.BoundedSemaphore(pending) for lane, (_, pending) in self._lanes.items()}
+        self._seen_lock = threading.Lock()
+        self._seen = OrderedDict()
+        self._last_purge = 0
+        self._log_lock = threading.Lock()
+        self._log_buffer = deque(maxlen=self.LOG_BUFFER_SIZE)
+        self._log_event = threading.Event()
+        self._flusher_started = False
+
+    # ---------------- 去重 ----------------
+
+    @staticmethod
+    def dedup_key(msg):
+        if msg.get('MsgId'):
+            return f"msg:{msg['MsgId']}"
+        return 'event:{}:{}:{}:{}'.format(
+            msg.get('FromUserName', ''), msg.get('CreateTime', ''), msg.get('Event', ''), msg.get('EventKey', '')
+        )
+
+    def first_seen(self, key):
+        """TTL 内第一次出现返回 True，重复返回 False；跨 worker 以数据库为准，数据库不可用时退回进程内判断"""
+        if not self._first_seen_locally(key):
+            return False
+        try:
+            return self._claim(key)
+        except Exception as e:
+            logger.warning("企业微信回调去重记录写入失败，按进程内去重处理: %s", e)
+            return True
+
+    def _claim(self, key):
+        """插入去重记录；已存在且未过期时主键冲突不更新，rowcount 为 0"""
+        now = time.time()
+        expired_before = now - self.DEDUP_TTL_SECONDS
+        with DatabasePool.get_connection() as conn:
+            if now - self._last_purge >= self.DEDUP_PURGE_SECONDS:
+                self._last_purge = now
+                conn.execute(DatabasePool.format_sql(
+                    'DELETE FROM wecom_callback_dedup WHERE seen_at < ?'
+                ), (expired_before,))
+            cursor = conn.execute(DatabasePool.format_sql('''
+                INSERT INTO wecom_callback_dedup (dedup_key, seen_at) VALUES (?, ?)
+                ON CONFLICT (dedup_key) DO UPDATE SET seen_at = excluded.seen_at
+                WHERE wecom_callback_dedup.seen_at < ?
+            '''), (key, now, expired_before))
+            claimed = cursor.rowcount == 1
+            conn.commit()
+        return claimed
+
+    def _first_seen_locally(self, key):
+        now = time.monotonic()
+        with self._seen_lock:
+            while self._seen:
+                _, seen_at = next(iter(self._seen.items()))
+                if now - seen_at < self.DEDUP_TTL_SECONDS and len(self._seen) < self.DEDUP_MAX_KEYS:
+                    break
+                self._seen.popitem(last=False)
+            if key in self._seen:
+                return False
+            self._seen[key] = now
+            return True
+
+    # ---------------- 调试日志 ----------------
+
+    def log_debug(self, msg_type, raw_xml, parsed=None):
+        """调试日志只进缓冲区，由后台线程批量落库"""
+        parsed_json = json.dumps(parsed, ensure_ascii=False) if parsed is not None else None
+        with self._log_lock:
+            self._log_buffer.append((msg_type, raw_xml, parsed_json))
+            if not self._flusher_started:
+                self._flusher_started = True
+                threading.Thread(target=self._flush_loop, name='wecom-log-flusher', daemon=True).start()
+            if len(self._log_buffer) >= self.LOG_BATCH_SIZE:
+                self._log_event.set()
+
+    def flush_logs(self):
+        with self._log_lock:
+            rows = list(self._log_buffer)
+            self._log_buffer.clear()
+        if not rows:
+            return 0
+        try:
+            with DatabasePool.get_connection() as conn:
+                conn.cursor().executemany(DatabasePool.format_sql(
+                    'INSERT INTO wecom_debug_logs (msg_type, raw_xml, parsed_json) VALUES (?, ?, ?)'
+                ), rows)
+                conn.commit()
+        except Exception as e:
+            logger.error("Failed to save wecom debug logs: %s", e)
+            return 0
+        return len(rows)
+
+    def _flush_loop(self):
+        while True:
+            self._log_event.wait(self.LOG_FLUSH_SECONDS)
+            self._log_event.clear()
+            self.flush_logs()
+
+    # ---------------- 派发 ----------------
+
+    @staticmethod
+    def lane(msg):
+        """需要下载转写的语音、图片识别走各自的通道，其余（含自带识别结果的语音）走文本通道"""
+        msg_type = msg.get('MsgType', '')
+        if msg_type == 'image':
+            return 'image'
+        if msg_type == 'voice' and msg.get('MediaId') and not (msg.get('Recognition') or msg.get('recognition')):
+            return 'voice'
+        return 'text'
+
+    def _get_executor(self, lane):
+        executor = self._executors.get(lane)
+        if executor is None:
+            with self._executor_lock:
+                executor = self._executors.get(lane)
+                if executor is None:
+                    executor = ThreadPoolExecutor(max_workers=self._lanes[lane][0], thread_name_prefix=f'wecom-{lane}')
+                    self._executors[lane] = executor
+        return executor
+
+    def shutdown(self, wait=True):
+        with self._executor_lock:
+            executors, self._executors = list(self._executors.values()), {}
+        for executor in executors:
+            executor.shutdown(wait=wait)
+
+    def accept(self, msg):
+        """去重后提交后台处理；返回 'accepted' / 'duplicate' / 'busy'"""
+        if not self.first_seen(self.dedup_key(msg)):
+            logger.info("忽略重复的企业微信回调: %s", self.dedup_key(msg))
+            return 'duplicate'
+        lane = self.lane(msg)
+        slots = self._slots[lane]
+        if not slots.acquire(blocking=False):
+            logger.warning("企业微信回调 %s 通道队列已满，丢弃消息: %s", lane, self.dedup_key(msg))
+            self._reply(msg.get('FromUserName', ''), BUSY_REPLY)
+            return 'busy'
+        try:
+            self._get_executor(lane).submit(self._run, msg, slots)
+        except Exception:
+            slots.release()
+            raise
+        return 'accepted'
+
+    def _run(self, msg, slots):
+        try:
+            reply = self.handle(msg)
+            if reply:
+                self._reply(msg.get('FromUserName', ''), reply)
+        except Exception as e:
+            logger.error("处理企业微信回调消息异常: %s", e, exc_info=True)
+        finally:
+            slots.release()
+
+    @staticmethod
+    def _reply(userid, content):
+        if not userid or not content:
+            return
+        from services.wecom_service import wecom_service
+        try:
+            # 与原被动回复一致：长内容用 markdown，短内容用文本
+            if len(content) > 500:
+                wecom_service.send_markdown(userid, content)
+            else:
+                wecom_service.send_text(userid, content)
+        except Exception as e:
+            logger.error("企业微信主动推送回复失败: %s", e)
+
+    # ---------------- 业务处理 ----------------
+
+    def handle(self, msg):
+        """按消息类型处理，返回需要推送给用户的回复（无需回复时返回空）"""
+        from services.wecom_msg_handler import wecom_msg_handler
+
+        msg_type = msg.get('MsgType', '')
+        from_user = msg.get('FromUserName', '')
+
+        if msg_type == 'text':
+            return wecom_msg_handler.handle_text_message(from_user, msg.get('Content', ''))
+
+        if msg_type == 'image':
+            return wecom_msg_handler.handle_image_message(from_user, msg.get('MediaId', ''))
+
+        if msg_type == 'voice':
+            # 优先使用消息自带的 Recognition 字段，没有时再下载并调用 AI 转录
+            recognition = msg.get('Recognition') or msg.get('recognition') or ''
+            if not recognition and msg.get('MediaId'):
+                recognition = self._transcribe(msg['MediaId'])
+            if recognition:
+                logger.info("识别到语音内容: %s", recognition)
+                return wecom_msg_handler.handle_text_message(from_user, recognition)
+            logger.warning("语音消息无法转录或未包含有效内容")
+            return VOICE_FALLBACK_REPLY
+
+        if msg_type == 'event':
+            event_type = msg.get('Event', '')
+            if event_type == 'click':
+                return self.handle_menu_click(from_user, msg.get('EventKey', ''))
+            if event_type == 'sys_approval_change':
+                from services.wecom_approval_service import wecom_approval_service
+                wecom_approval_service.handle_approval_callback(msg.get('ApprovalInfo', {}))
+        return ''
+
+    @staticmethod
+    def _transcribe(media_id):
+        from services.wecom_service import wecom_service
+        logger.info("语音消息识别结果为空，尝试手动转录 MediaID: %s", media_id)
+        os.makedirs('temp', exist_ok=True)
+        save_path = os.path.join('temp', f"voice_{media_id}.amr")
+        downloaded_path = None
+        try:
+            downloaded_path = wecom_service.get_media(media_id, save_path)
+            if downloaded_path:
+                from services.ai_service import ai_service
+                return ai_service.transcribe_audio(downloaded_path)
+        except Exception as e:
+            logger.error("手动转录语音失败: %s", e)
+        finally:
+            if downloaded_path and os.path.exists(downloaded_path):
+                os.remove(downloaded_path)
+        return ''
+
+    @staticmethod
+    def handle_menu_click(userid, event_key):
+        """处理自定义菜单点击"""
+        from services.wecom_msg_handler import wecom_msg_handler
+
+        handlers = {
+            "menu_status": lambda: wecom_msg_handler._handle_status(userid),
+            "menu_help": lambda: wecom_msg_handler._get_help_text(),
+        }
+        handler = handlers.get(event_key)
+        return handler() if handler else f"未知的菜单操作: {event_key}"
+
+
+wecom_callback_pipeline = WecomCallbackPipeline()
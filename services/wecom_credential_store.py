@@ -0,0 +1,156 @@
+# services/wecom_credential_store.py
+"""
+企业微信凭据（access_token / jsapi_ticket）跨进程共享存储
+- 每个凭据一个 JSON 文件，同目录下配一个 .lock 文件；刷新时持有 fcntl 排他锁，
+  同一台机器上的所有 worker、调度进程和脚本只会有一个真正请求企业微信，其余进程等锁后直接读到新值
+- 进程内再缓存一份，未临近过期时不读文件
+- 取得凭据后按过期时间挂一个后台定时器，在到期前 RENEW_BEFORE 秒提前续期（多进程同时触发时由文件锁去重）
+- 接口返回凭据过期错误码时由调用方 invalidate，仅当文件中仍是同一个失效值时才清除，避免误删他人刚刷新的值
+- 无 fcntl 的平台（Windows 开发环境）退化为仅进程内单飞
+"""
+
+import hashlib
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class WecomCredentialStore:
+    HARD_MARGIN = 60     # 剩余有效期低于此值视为不可用，必须同步刷新
+    RENEW_BEFORE = 600   # 剩余有效期低于此值时由后台定时器提前续期
+    RENEW_JITTER = 30
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.environ.get(
+            'WECOM_CREDENTIAL_DIR', os.path.join(tempfile.gettempdir(), 'icu_pm_wecom')
+        )
+        self._guard = threading.Lock()
+        self._key_locks = {}
+        self._memory = {}   # key -> {'value', 'expires_at'}
+        self._timers = {}
+
+    # ---------------- 文件 ----------------
+
+    def _file(self, key, suffix):
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()[:24]
+        return os.path.join(self.directory, f'{name}{suffix}')
+
+    def _key_lock(self, key):
+        with self._guard:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    @contextmanager
+    def _file_lock(self, key):
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        fd = os.open(self._file(key, '.lock'), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _read(self, key):
+        try:
+            with open(self._file(key, '.json'), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            return entry if entry.get('value') else None
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, key, entry):
+        path = self._file(key, '.json')
+        tmp = f'{path}.{os.getpid()}.tmp'
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _valid(entry, min_ttl):
+        return bool(entry and entry.get('value') and time.time() < entry.get('expires_at', 0) - min_ttl)
+
+    # ---------------- 读取 / 刷新 ----------------
+
+    def get(self, key, fetcher, min_ttl=None):
+        """
+        取凭据；不可用时单飞刷新。
+        fetcher() 返回 (value, expires_in) 或 None（刷新失败）。
+        """
+        min_ttl = self.HARD_MARGIN if min_ttl is None else min_ttl
+        entry = self._memory.get(key)
+        if self._valid(entry, min_ttl):
+            return entry['value']
+
+        with self._key_lock(key):
+            entry = self._memory.get(key)
+            if self._valid(entry, min_ttl):
+                return entry['value']
+            with self._file_lock(key):
+                entry = self._read(key)
+                if not self._valid(entry, min_ttl):
+                    result = fetcher()
+                    if not result:
+                        return None
+                    value, expires_in = result
+                    entry = {'value': value, 'expires_at': time.time() + int(expires_in or 7200)}
+                    self._write(key, entry)
+            self._memory[key] = entry
+        self._schedule_renewal(key, fetcher, entry['expires_at'])
+        return entry['value']
+
+    def invalidate(self, key, value):
+        """凭据被企业微信判定过期/无效时调用；只清除与 value 相同的缓存值"""
+        with self._key_lock(key):
+            if (self._memory.get(key) or {}).get('value') == value:
+                self._memory.pop(key, None)
+            with self._file_lock(key):
+                entry = self._read(key)
+                if entry and entry.get('value') == value:
+                    try:
+                        os.remove(self._file(key, '.json'))
+                    except OSError:
+                        pass
+
+    # ---------------- 后台续期 ----------------
+
+    def _schedule_renewal(self, key, fetcher, expires_at):
+        delay = max(expires_at - self.RENEW_BEFORE - time.time(), 5) + random.uniform(0, self.RENEW_JITTER)
+        timer = threading.Timer(delay, self._renew, args=(key, fetcher))
+        timer.daemon = True
+        with self._guard:
+            previous = self._timers.get(key)
+            if previous:
+                previous.cancel()
+            self._timers[key] = timer
+        timer.start()
+
+    def _renew(self, key, fetcher):
+        try:
+            if not self.get(key, fetcher, min_ttl=self.RENEW_BEFORE):
+                logger.warning("企业微信凭据提前续期失败，将在下次使用时重试: %s", key.split(':')[0])
+        except Exception as e:
+            logger.error("企业微信凭据续期异常: %s", e)
+
+    def stop(self):
+        with self._guard:
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers.clear()
+
+
+wecom_credential_store = WecomCredentialStore()
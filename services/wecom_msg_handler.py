@@ -88,7 +88,7 @@ class WeComMsgHandler:
                 return f"❌ 无法理解你的问题：{error}"
             
             # 执行
-            result = nl_query_service.execute_query(project_id, sql)
+            result = nl_query_service.execute_query(project_id, sql, question)
             if 'error' in result:
                 return f"❌ 查询执行失败：{result['error']}"
             
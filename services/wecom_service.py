@@ -1,7 +1,7 @@
 # services/wecom_service.py
 """
 企业微信自建应用核心服务
-- Access Token 管理（带缓存和自动续期）
+- Access Token / JS-API Ticket 管理（跨进程共享缓存、单飞刷新、到期前后台续期、过期错误码自动重试）
 - 应用消息推送（文本、Markdown、模板卡片）
 - 用户身份查询（OAuth2 code 换 userid）
 - 通讯录查询
@@ -11,12 +11,12 @@ import time
 import json
 import logging
 import requests
-import threading
 import random
 import string
 import hashlib
 from app_config import WECOM_CONFIG, NOTIFICATION_CONFIG
 from utils.wecom_crypto import WeComCrypto
+from services.wecom_credential_store import wecom_credential_store
 
 logger = logging.getLogger(__name__)
 
@@ -25,16 +25,11 @@ class WeComService:
     """企业微信核心服务"""
     
     BASE_URL = "https://qyapi.weixin.qq.com/cgi-bin"
+    # access_token 过期 / 无效，需要作废缓存并重新获取
+    TOKEN_EXPIRED_ERRCODES = (40014, 42001)
     
     def __init__(self):
-        self._access_token = None
-        self._token_expires_at = 0
-        self._token_lock = threading.Lock()
-        
-        self._jsapi_ticket = None
-        self._ticket_expires_at = 0
-        self._ticket_lock = threading.Lock()
-        
+        self._credentials = wecom_credential_store
         self._crypto = None
         
         # 初始加载配置
@@ -114,20 +109,21 @@ class WeComService:
     
     # ===== Access Token 管理 =====
     
+    def _credential_key(self, kind: str) -> str:
+        """凭据缓存键：区分企业、应用与 Secret，配置变更后不会复用旧凭据"""
+        secret_tag = hashlib.sha1(str(WECOM_CONFIG.get("SECRET", "")).encode('utf-8')).hexdigest()[:8]
+        return f"{kind}:{WECOM_CONFIG.get('CORP_ID', '')}:{WECOM_CONFIG.get('AGENT_ID', '')}:{secret_tag}"
+    
     def get_access_token(self) -> str:
-        """获取 access_token（带缓存，线程安全）"""
-        if self._access_token and time.time() < self._token_expires_at - 300:
-            return self._access_token
-        
-        with self._token_lock:
-            # Double-check
-            if self._access_token and time.time() < self._token_expires_at - 300:
-                return self._access_token
-            
-            return self._refresh_token()
+        """获取 access_token（多进程共享缓存，单飞刷新）"""
+        return self._credentials.get(self._credential_key('access_token'), self._fetch_access_token)
+    
+    def invalidate_access_token(self, token: str):
+        """企业微信判定 token 过期/无效时作废缓存"""
+        self._credentials.invalidate(self._credential_key('access_token'), token)
     
-    def _refresh_token(self) -> str:
-        """刷新 access_token"""
+    def _fetch_access_token(self):
+        """向企业微信请求新的 access_token，返回 (token, expires_in)"""
         try:
             url = f"{self.BASE_URL}/gettoken"
             resp = requests.get(url, params={
@@ -137,10 +133,8 @@ class WeComService:
             data = resp.json()
             
             if data.get("errcode") == 0:
-                self._access_token = data["access_token"]
-                self._token_expires_at = time.time() + data.get("expires_in", 7200)
                 logger.info("企业微信 access_token 刷新成功，有效期 %ds", data.get("expires_in", 7200))
-                return self._access_token
+                return data["access_token"], data.get("expires_in", 7200)
             else:
                 logger.error("获取 access_token 失败: %s", data)
                 return None
@@ -148,38 +142,55 @@ class WeComService:
             logger.error("获取 access_token 异常: %s", e)
             return None
     
+    def _request(self, method: str, path: str, params: dict = None, **kwargs):
+        """
+        带 access_token 调用企业微信接口。
+        返回 token 过期错误码时作废缓存、重新获取 token 后重试一次；无法获取 token 时返回 None。
+        """
+        token = self.get_access_token()
+        if not token:
+            return None
+        for attempt in range(2):
+            query = dict(params or {}, access_token=token)
+            resp = requests.request(method, f"{self.BASE_URL}{path}", params=query, **kwargs)
+            if attempt or 'json' not in resp.headers.get('Content-Type', 'application/json'):
+                return resp
+            try:
+                errcode = resp.json().get("errcode")
+            except ValueError:
+                return resp
+            if errcode not in self.TOKEN_EXPIRED_ERRCODES:
+                return resp
+            logger.warning("企业微信 access_token 已失效 (errcode=%s)，刷新后重试", errcode)
+            self.invalidate_access_token(token)
+            token = self.get_access_token()
+            if not token:
+                return resp
+        return resp
+    
     # ===== JS-SDK 签名 =====
     
     def get_jsapi_ticket(self) -> str:
-        """获取 jsapi_ticket（带缓存，线程安全）"""
-        if self._jsapi_ticket and time.time() < self._ticket_expires_at - 300:
-            return self._jsapi_ticket
-            
-        with self._ticket_lock:
-            # Double check
-            if self._jsapi_ticket and time.time() < self._ticket_expires_at - 300:
-                return self._jsapi_ticket
-                
-            token = self.get_access_token()
-            if not token:
+        """获取 jsapi_ticket（多进程共享缓存，单飞刷新）"""
+        return self._credentials.get(self._credential_key('jsapi_ticket'), self._fetch_jsapi_ticket)
+    
+    def _fetch_jsapi_ticket(self):
+        """向企业微信请求新的 jsapi_ticket，返回 (ticket, expires_in)"""
+        try:
+            resp = self._request('GET', '/get_jsapi_ticket', timeout=10)
+            if resp is None:
                 return None
-                
-            try:
-                url = f"{self.BASE_URL}/get_jsapi_ticket"
-                resp = requests.get(url, params={"access_token": token}, timeout=10)
-                data = resp.json()
-                
-                if data.get("errcode") == 0:
-                    self._jsapi_ticket = data["ticket"]
-                    self._ticket_expires_at = time.time() + data.get("expires_in", 7200)
-                    logger.info("企业微信 jsapi_ticket 刷新成功")
-                    return self._jsapi_ticket
-                else:
-                    logger.error("获取 jsapi_ticket 失败: %s", data)
-                    return None
-            except Exception as e:
-                logger.error("获取 jsapi_ticket 异常: %s", e)
+            data = resp.json()
+            
+            if data.get("errcode") == 0:
+                logger.info("企业微信 jsapi_ticket 刷新成功")
+                return data["ticket"], data.get("expires_in", 7200)
+            else:
+                logger.error("获取 jsapi_ticket 失败: %s", data)
                 return None
+        except Exception as e:
+            logger.error("获取 jsapi_ticket 异常: %s", e)
+            return None
                 
     def get_jssdk_config(self, url: str) -> dict:
         """生成 JS-SDK 权限验证配置"""
@@ -251,13 +262,10 @@ class WeComService:
     
     def _send_message(self, payload: dict) -> dict:
         """发送应用消息（内部通用方法）"""
-        token = self.get_access_token()
-        if not token:
-            return {"errcode": -1, "errmsg": "access_token 获取失败"}
-        
         try:
-            url = f"{self.BASE_URL}/message/send?access_token={token}"
-            resp = requests.post(url, json=payload, timeout=10)
+            resp = self._request('POST', '/message/send', json=payload, timeout=10)
+            if resp is None:
+                return {"errcode": -1, "errmsg": "access_token 获取失败"}
             result = resp.json()
             
             if result.get("errcode") == 0:
@@ -299,16 +307,10 @@ class WeComService:
     
     def get_user_by_code(self, code: str) -> dict:
         """通过 OAuth2 code 获取用户身份"""
-        token = self.get_access_token()
-        if not token:
-            return None
-        
         try:
-            url = f"{self.BASE_URL}/auth/getuserinfo"
-            resp = requests.get(url, params={
-                "access_token": token,
-                "code": code
-            }, timeout=10)
+            resp = self._request('GET', '/auth/getuserinfo', params={"code": code}, timeout=10)
+            if resp is None:
+                return None
             data = resp.json()
             
             if data.get("errcode") == 0 and data.get("userid"):
@@ -332,16 +334,10 @@ class WeComService:
     
     def get_user_detail(self, userid: str) -> dict:
         """查询通讯录中用户的详细信息"""
-        token = self.get_access_token()
-        if not token:
-            return {}
-        
         try:
-            url = f"{self.BASE_URL}/user/get"
-            resp = requests.get(url, params={
-                "access_token": token,
-                "userid": userid
-            }, timeout=10)
+            resp = self._request('GET', '/user/get', params={"userid": userid}, timeout=10)
+            if resp is None:
+                return {}
             data = resp.json()
             return data if data.get("errcode") == 0 else {}
         except Exception as e:
@@ -352,16 +348,10 @@ class WeComService:
     
     def get_media(self, media_id: str, save_path: str) -> str:
         """下载临时素材（用于接收用户发送的图片等）"""
-        token = self.get_access_token()
-        if not token:
-            return None
-        
         try:
-            url = f"{self.BASE_URL}/media/get"
-            resp = requests.get(url, params={
-                "access_token": token,
-                "media_id": media_id
-            }, timeout=30, stream=True)
+            resp = self._request('GET', '/media/get', params={"media_id": media_id}, timeout=30, stream=True)
+            if resp is None:
+                return None
             
             if resp.status_code == 200 and 'application/json' not in resp.headers.get('Content-Type', ''):
                 with open(save_path, 'wb') as f:
@@ -381,10 +371,6 @@ class WeComService:
                         applicant_userid: str, approver_userids: list,
                         summary: list = None) -> dict:
         """提交审批申请"""
-        token = self.get_access_token()
-        if not token:
-            return {"errcode": -1, "errmsg": "token获取失败"}
-        
         payload = {
             "creator_userid": applicant_userid,
             "template_id": template_id,
@@ -399,21 +385,19 @@ class WeComService:
             payload["summary_list"] = [{"summary_info": [{"text": s} for s in summary]}]
         
         try:
-            url = f"{self.BASE_URL}/oa/applyevent?access_token={token}"
-            resp = requests.post(url, json=payload, timeout=10)
+            resp = self._request('POST', '/oa/applyevent', json=payload, timeout=10)
+            if resp is None:
+                return {"errcode": -1, "errmsg": "token获取失败"}
             return resp.json()
         except Exception as e:
             return {"errcode": -1, "errmsg": str(e)}
     
     def get_approval_detail(self, sp_no: str) -> dict:
         """查询审批详情"""
-        token = self.get_access_token()
-        if not token:
-            return {}
-        
         try:
-            url = f"{self.BASE_URL}/oa/getapprovaldetail?access_token={token}"
-            resp = requests.post(url, json={"sp_no": sp_no}, timeout=10)
+            resp = self._request('POST', '/oa/getapprovaldetail', json={"sp_no": sp_no}, timeout=10)
+            if resp is None:
+                return {}
             return resp.json()
         except Exception as e:
             return {"errcode": -1, "errmsg": str(e)}
@@ -422,13 +406,11 @@ class WeComService:
     
     def create_menu(self, menu_data: dict) -> dict:
         """创建应用自定义菜单"""
-        token = self.get_access_token()
-        if not token:
-            return {"errcode": -1, "errmsg": "access_token 获取失败"}
-        
         try:
-            url = f"{self.BASE_URL}/menu/create?access_token={token}&agentid={WECOM_CONFIG['AGENT_ID']}"
-            resp = requests.post(url, json=menu_data, timeout=10)
+            resp = self._request('POST', '/menu/create', params={"agentid": WECOM_CONFIG['AGENT_ID']},
+                                 json=menu_data, timeout=10)
+            if resp is None:
+                return {"errcode": -1, "errmsg": "access_token 获取失败"}
             result = resp.json()
             if result.get("errcode") == 0:
                 logger.info("创建应用菜单成功")
@@ -82,6 +82,7 @@ window.initializeAuthenticatedShell = function (options = {}) {
     if (!currentUser) return;
 
     loadUnreadCount();
+    startNotificationChannel();
     loadReminderBadge();
     loadWarningCount();
     ensureAiHealthPolling();
@@ -185,12 +186,24 @@ async function loadSimilarProjects(projectId) {
             container.innerHTML = '<div class="empty-state"><p>暂无相似项目</p></div>';
             return;
         }
-        container.innerHTML = projects.map(item => `
+        container.innerHTML = projects.map(item => {
+            const reasons = Object.entries(item.feature_contributions || {})
+                .filter(([, score]) => score > 0)
+                .sort((a, b) => b[1] - a[1])
+                .slice(0, 3)
+                .map(([label, score]) => `${label} ${score}`)
+                .join(' · ');
+            return `
             <div style="padding:12px 14px;border:1px solid #e5e7eb;border-radius:10px;background:#fff;margin-bottom:10px;cursor:pointer;" onclick="loadProjectDetail(${item.id})">
-                <div style="font-weight:700;color:#111827;">${item.project_name || '未命名项目'}</div>
+                <div style="display:flex;justify-content:space-between;gap:8px;">
+                    <span style="font-weight:700;color:#111827;">${item.project_name || '未命名项目'}</span>
+                    ${item.similarity_score != null ? `<span style="font-size:12px;color:#2563eb;">相似度 ${item.similarity_score}</span>` : ''}
+                </div>
                 <div style="font-size:12px;color:#64748b;margin-top:4px;">${item.hospital_name || '-'}</div>
+                ${reasons ? `<div style="font-size:12px;color:#94a3b8;margin-top:4px;">${reasons}</div>` : ''}
             </div>
-        `).join('');
+        `;
+        }).join('');
     } catch (e) {
         container.innerHTML = `<div class="empty-state"><p>加载相似项目失败</p><div class="empty-state-hint">${e.message}</div></div>`;
     }
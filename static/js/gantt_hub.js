@@ -11,6 +11,30 @@ function renderGanttLegend(containerId) {
     `).join('');
 }
 
+// 甘特图增量同步：按项目缓存上次的版本与任务条，刷新时只拉取差量并在本地合并
+const ganttSyncState = new Map();
+
+function mergeGanttDelta(state, payload) {
+    if (payload.full) {
+        return { version: payload.version, order: payload.tasks.map(t => t.id), tasks: new Map(payload.tasks.map(t => [t.id, t])) };
+    }
+    const tasks = new Map(state.tasks);
+    (payload.removed || []).forEach(id => tasks.delete(id));
+    (payload.changed || []).forEach(t => tasks.set(t.id, t));
+    const order = payload.order || state.order.filter(id => tasks.has(id));
+    return { version: payload.version, order, tasks };
+}
+
+async function fetchGanttTasks(projectId) {
+    const previous = ganttSyncState.get(projectId);
+    const since = previous ? encodeURIComponent(previous.version) : '';
+    const payload = await api.get(`/projects/${projectId}/gantt-data?since=${since}`, { silent: true });
+    if (!payload || !payload.version) return [];
+    const state = mergeGanttDelta(previous, payload);
+    ganttSyncState.set(projectId, state);
+    return state.order.map(id => state.tasks.get(id)).filter(Boolean);
+}
+
 async function renderProjectGantt(project) {
     const chartDom = document.getElementById('projectGanttChart');
     if (!chartDom) return;
@@ -24,7 +48,7 @@ async function renderProjectGantt(project) {
 
     try {
         const [ganttTasks, baselines] = await Promise.all([
-            api.get(`/projects/${project.id}/gantt-data`, { silent: true }),
+            fetchGanttTasks(project.id),
             api.get('/operational/stage-baselines', { silent: true, cacheTtlMs: 30000 }).catch(() => [])
         ]);
 
@@ -36,8 +60,8 @@ async function renderProjectGantt(project) {
         const baselineHint = document.getElementById('baselineHint');
         if (baselineHint) {
             baselineHint.textContent = baselines && baselines.length
-                ? `已加载 ${baselines.length} 个阶段基线，红框任务表示存在依赖关系`
-                : '暂无阶段基线数据，红框任务表示存在依赖关系';
+                ? `已加载 ${baselines.length} 个阶段基线，红框任务为关键路径任务`
+                : '暂无阶段基线数据，红框任务为关键路径任务';
         }
 
         if (!document.getElementById('projectGanttChart')) return;
@@ -57,7 +81,7 @@ async function renderProjectGantt(project) {
             if (!maxDate || end > maxDate) maxDate = end;
 
             const color = STAGE_COLORS[project.stages?.[0]?.stage_name] || '#5B8FF9';
-            const isCritical = !!(t.dependencies || '').trim();
+            const isCritical = t.is_critical !== undefined ? !!t.is_critical : !!(t.dependencies || '').trim();
             seriesData.push({
                 name: t.name,
                 value: [idx, start.getTime(), end.getTime(), t.progress, t.id, isCritical ? 1 : 0],
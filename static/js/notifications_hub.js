@@ -2,16 +2,67 @@
 
 async function loadUnreadCount() {
     const data = await api.get('/notifications/unread-count', { silent: true }).catch(() => ({ count: 0 }));
+    renderUnreadBadge(data.count);
+}
+
+function renderUnreadBadge(count) {
     const badge = document.getElementById('notifBadge');
     if (!badge) return;
-    if ((data.count || 0) > 0) {
-        badge.textContent = data.count;
+    if ((count || 0) > 0) {
+        badge.textContent = count;
         badge.style.display = 'inline';
     } else {
         badge.style.display = 'none';
     }
 }
 
+function handleNotificationEvent(event, data) {
+    if (event === 'unread') {
+        renderUnreadBadge(data.count);
+    } else if (event === 'task') {
+        window.dispatchEvent(new CustomEvent('background-task-updated', { detail: data }));
+    } else if (event === 'resync') {
+        loadUnreadCount();
+    }
+}
+
+// 推送通道：优先 SSE（独立推送端口，按 Cookie 鉴权，约 1 分钟断开后自动重连），失败时退回长轮询
+async function startNotificationChannel() {
+    if (window.__notificationChannel) return;
+    window.__notificationChannel = true;
+    const channel = typeof EventSource === 'undefined'
+        ? {}
+        : await api.get('/notifications/channel', { silent: true }).catch(() => ({}));
+    if (!channel.stream_url) {
+        pollNotificationEvents();
+        return;
+    }
+    const source = new EventSource(channel.stream_url, { withCredentials: true });
+    ['unread', 'task', 'resync'].forEach(name => {
+        source.addEventListener(name, e => handleNotificationEvent(name, JSON.parse(e.data || '{}')));
+    });
+    source.onerror = () => {
+        // 连接被拒（401/503）时浏览器不再重连，改走长轮询
+        if (source.readyState === EventSource.CLOSED) {
+            pollNotificationEvents();
+        }
+    };
+}
+
+async function pollNotificationEvents() {
+    let since = null;
+    while (typeof currentUser === 'undefined' || currentUser) {
+        try {
+            const query = since === null ? '' : `?since=${since}`;
+            const data = await api.get(`/notifications/poll${query}`, { silent: true, dedupe: false });
+            since = data.seq;
+            (data.events || []).forEach(item => handleNotificationEvent(item.event, item.data || {}));
+        } catch (e) {
+            await new Promise(resolve => setTimeout(resolve, 15000));
+        }
+    }
+}
+
 function buildNotificationQuery() {
     const params = new URLSearchParams();
     const type = document.getElementById('notificationTypeFilter')?.value || '';
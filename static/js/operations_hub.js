@@ -345,7 +345,14 @@ async function runRiskSimulation() {
                 list.innerHTML = '<div style="padding:20px; text-align:center; color:#10b981;">✅ 暂未发现下游强依赖受波及</div>';
             }
 
-            narration.innerHTML = renderAiMarkdown(res.narration || '分析完成');
+            if (res.finish_delay_workdays > 0) {
+                list.innerHTML = `<div style="padding:8px 14px; color:#b91c1c; font-size:12px; background:#fef2f2;">项目完工预计推迟 ${res.finish_delay_workdays} 个工作日（${res.project_finish}）</div>` + list.innerHTML;
+            }
+
+            // AI 解读单独异步请求，不阻塞传播路径的展示
+            api.get(`/risk/simulate/narration?project_id=${currentProjectId}&task_id=${taskId}&delay_days=${delay}`)
+                .then(r => { narration.innerHTML = renderAiMarkdown((r && r.narration) || '分析完成'); })
+                .catch(() => { narration.innerHTML = '<div style="color:#94a3b8;">AI 模拟分析暂时不可用。</div>'; });
         }
     } catch (e) {
         console.error('Simulation failed', e);
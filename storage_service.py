@@ -2,38 +2,190 @@
 import os
 import shutil
 import time
-import bypy.const
 import json
 import logging
-# 修复: 强制将 AppPcsPath 设置为应用的专属目录
-# 必须在实例化 ByPy 之前设置
-bypy.const.AppPcsPath = '/apps/MyProjectManager'
-
-from bypy import ByPy
 import uuid
+import hashlib
+import tempfile
+import threading
+from functools import lru_cache
+from urllib.parse import quote
 from werkzeug.utils import secure_filename
 
+from utils.lazy import LazyProxy
+
 logger = logging.getLogger(__name__)
 
-class NonInteractiveByPy(ByPy):
-    def __init__(self, *args, **kwargs):
-        # 强制设置超时时间 (秒)，避免网络请求无限挂起
-        if 'timeout' not in kwargs:
-            kwargs['timeout'] = 30 
-        super().__init__(*args, **kwargs)
-
-    def _auth(self):
-        # Override to disable interactive authentication on startup
-        # We try to load the token, but if it fails, we simply return failure
-        # instead of asking for user input.
-        # This allows the backend to start without hanging.
+STREAM_CHUNK_SIZE = 1024 * 1024
+# S3/R2 要求除最后一片外每片至少 5MB
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+TEMP_ROOT_DIRS = ('temp_uploads', 'temp_downloads')
+TEMP_FILE_MAX_AGE_SECONDS = 3600
+TEMP_SWEEP_INTERVAL_SECONDS = 600
+
+
+def _read_exact(stream, size):
+    """从流中读取最多 size 字节，兼容单次 read 返回不足的情况。"""
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = stream.read(size - len(buf))
+        if not chunk:
+            break
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def _make_temp_dir(root):
+    os.makedirs(root, exist_ok=True)
+    return tempfile.mkdtemp(prefix=f"{int(time.time())}_", dir=root)
+
+
+def _remove_temp_path(local_path):
+    """删除临时文件及其所在的临时目录。"""
+    if not local_path:
+        return
+    temp_dir = os.path.dirname(local_path)
+    try:
+        if os.path.isdir(temp_dir) and os.path.basename(os.path.dirname(temp_dir)) in TEMP_ROOT_DIRS:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        elif os.path.exists(local_path):
+            os.remove(local_path)
+    except Exception as e:
+        logger.warning(f"Remove temp file failed: {e}")
+
+
+def _content_disposition(download_name):
+    ascii_name = secure_filename(download_name) or 'download'
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(download_name)}"
+
+
+class StreamedObject:
+    """远端对象的流式读取句柄"""
+
+    def __init__(self, chunks, total_size, length, close=None, content_type=None):
+        self.chunks = chunks
+        self.total_size = total_size
+        self.length = length
+        self.content_type = content_type
+        self._close = close
+
+    def close(self):
+        if self._close:
+            try:
+                self._close()
+            except Exception:
+                pass
+
+
+class AttachmentDiskCache:
+    """按总字节数限额的本地 LRU 磁盘缓存（以访问时间排序淘汰）"""
+
+    def __init__(self, cache_dir='storage_cache', max_bytes=1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path_for(self, remote_path):
+        ext = os.path.splitext(remote_path)[1][:16]
+        digest = hashlib.sha1(remote_path.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}{ext}")
+
+    def get(self, remote_path):
+        path = self._path_for(remote_path)
+        if os.path.exists(path):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            self.hits += 1
+            return path
+        self.misses += 1
+        return None
+
+    def put(self, remote_path, local_path):
+        """把已下载的临时文件移入缓存，返回缓存内路径。"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        target = self._path_for(remote_path)
+        shutil.move(local_path, target)
+        self._evict(keep=target)
+        return target
+
+    def invalidate(self, remote_path):
+        path = self._path_for(remote_path)
         try:
-            self._load_local_json()
-            if self._access_token:
-                return 1 # Success
-            return 0 # Fail silently
-        except Exception:
-            return 0
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            logger.warning(f"Invalidate cached attachment failed: {e}")
+
+    def _evict(self, keep=None):
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.cache_dir):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'max_bytes': self.max_bytes}
+
+def _bypy_const():
+    """bypy 导入较重，只在使用百度网盘后端时加载"""
+    import bypy.const
+    # 修复: 强制将 AppPcsPath 设置为应用的专属目录
+    # 必须在实例化 ByPy 之前设置
+    bypy.const.AppPcsPath = '/apps/MyProjectManager'
+    return bypy.const
+
+
+@lru_cache(maxsize=None)
+def _non_interactive_bypy_class():
+    _bypy_const()
+    from bypy import ByPy
+
+    class NonInteractiveByPy(ByPy):
+        def __init__(self, *args, **kwargs):
+            # 强制设置超时时间 (秒)，避免网络请求无限挂起
+            if 'timeout' not in kwargs:
+                kwargs['timeout'] = 30 
+            super().__init__(*args, **kwargs)
+
+        def _auth(self):
+            # Override to disable interactive authentication on startup
+            # We try to load the token, but if it fails, we simply return failure
+            # instead of asking for user input.
+            # This allows the backend to start without hanging.
+            try:
+                self._load_local_json()
+                if self._access_token:
+                    return 1 # Success
+                return 0 # Fail silently
+            except Exception:
+                return 0
+
+    return NonInteractiveByPy
+
+
+def NonInteractiveByPy(*args, **kwargs):
+    return _non_interactive_bypy_class()(*args, **kwargs)
 
 class BaiduStorage:
     def __init__(self, root_path='icu_projects', client_id=None, client_secret=None):
@@ -69,7 +221,7 @@ class BaiduStorage:
         if self.client_id:
             return f"https://openapi.baidu.com/oauth/2.0/authorize?scope=basic+netdisk&redirect_uri=oob&response_type=code&client_id={self.client_id}"
         else:
-            default_client_id = bypy.const.ApiKey 
+            default_client_id = _bypy_const().ApiKey
             return f"https://openapi.baidu.com/oauth/2.0/authorize?scope=basic+netdisk&redirect_uri=oob&response_type=code&client_id={default_client_id}"
 
     def authenticate(self, code):
@@ -182,10 +334,8 @@ class BaiduStorage:
             ext = os.path.splitext(file_obj.filename)[1]
             filename = f"{int(time.time())}_{str(uuid.uuid4())[:8]}{ext}"
         
-        temp_dir = os.path.join('temp_uploads', str(project_id))
-        if not os.path.exists(temp_dir):
-            os.makedirs(temp_dir)
-        temp_path = os.path.join(temp_dir, filename)
+        # bypy 只能上传本地文件，这里落盘到独立临时目录并在 finally 中整体删除
+        temp_path = os.path.join(_make_temp_dir('temp_uploads'), filename)
         file_obj.save(temp_path)
         
         remote_dir = f"{self.root_path}/{project_id}"
@@ -215,14 +365,11 @@ class BaiduStorage:
                     return remote_path
                 raise Exception(f"Bypy upload failed with code {ret}")
         finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+            _remove_temp_path(temp_path)
 
     def download_file(self, remote_path):
         filename = os.path.basename(remote_path)
-        temp_dir = os.path.join('temp_downloads', str(int(time.time())))
-        if not os.path.exists(temp_dir):
-            os.makedirs(temp_dir)
+        temp_dir = _make_temp_dir('temp_downloads')
         local_path = os.path.join(temp_dir, filename)
         
         try:
@@ -282,23 +429,77 @@ class R2Storage:
             filename = f"{int(time.time())}_{str(uuid.uuid4())[:8]}{ext}"
             
         key = f"{project_id}/{filename}"
-        
-        # S3 upload_fileobj requires a defined seek position, ensuring 0
-        file_obj.seek(0)
-        
+        stream = getattr(file_obj, 'stream', file_obj)
+        try:
+            stream.seek(0)
+        except Exception:
+            pass
+
         try:
-            self.s3_client.upload_fileobj(file_obj, self.bucket_name, key)
+            self.upload_stream(stream, key)
             return key
         except Exception as e:
             logger.error(f"R2 upload failed: {e}")
             raise e
 
+    def upload_stream(self, stream, key, part_size=MULTIPART_PART_SIZE):
+        """分片上传：每次只在内存中保留一个分片，小文件直接 put_object。"""
+        chunk = _read_exact(stream, part_size)
+        if len(chunk) < part_size:
+            self.s3_client.put_object(Bucket=self.bucket_name, Key=key, Body=chunk)
+            return len(chunk)
+
+        upload_id = self.s3_client.create_multipart_upload(Bucket=self.bucket_name, Key=key)['UploadId']
+        parts = []
+        total = 0
+        try:
+            while chunk:
+                part_number = len(parts) + 1
+                resp = self.s3_client.upload_part(
+                    Bucket=self.bucket_name, Key=key, PartNumber=part_number,
+                    UploadId=upload_id, Body=chunk,
+                )
+                parts.append({'ETag': resp['ETag'], 'PartNumber': part_number})
+                total += len(chunk)
+                chunk = _read_exact(stream, part_size)
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket_name, Key=key, UploadId=upload_id,
+                MultipartUpload={'Parts': parts},
+            )
+            return total
+        except Exception:
+            try:
+                self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=key, UploadId=upload_id)
+            except Exception as abort_err:
+                logger.warning(f"R2 abort multipart upload failed: {abort_err}")
+            raise
+
+    def get_size(self, remote_path):
+        return self.s3_client.head_object(Bucket=self.bucket_name, Key=remote_path)['ContentLength']
+
+    def open_stream(self, remote_path, start=None, end=None):
+        """按字节区间流式读取对象，end 为包含端点。"""
+        kwargs = {'Bucket': self.bucket_name, 'Key': remote_path}
+        if start is not None:
+            kwargs['Range'] = f"bytes={start}-{'' if end is None else end}"
+        obj = self.s3_client.get_object(**kwargs)
+        body = obj['Body']
+        total = obj['ContentLength']
+        content_range = obj.get('ContentRange') or ''
+        if '/' in content_range:
+            total = int(content_range.rsplit('/', 1)[1])
+        return StreamedObject(
+            body.iter_chunks(STREAM_CHUNK_SIZE),
+            total_size=total,
+            length=obj['ContentLength'],
+            close=body.close,
+            content_type=obj.get('ContentType'),
+        )
+
     def download_file(self, remote_path):
         """remote_path is the S3 key"""
         filename = os.path.basename(remote_path)
-        temp_dir = os.path.join('temp_downloads', str(int(time.time())))
-        if not os.path.exists(temp_dir):
-            os.makedirs(temp_dir)
+        temp_dir = _make_temp_dir('temp_downloads')
         local_path = os.path.join(temp_dir, filename)
         
         try:
@@ -328,6 +529,12 @@ class StorageService:
         self.active_backend = None
         self.config = self._load_config()
         self._init_backend()
+        cache_conf = self.config.get('cache') or {}
+        self.attachment_cache = AttachmentDiskCache(
+            cache_dir=cache_conf.get('dir', 'storage_cache'),
+            max_bytes=int(cache_conf.get('max_mb', 1024)) * 1024 * 1024,
+        )
+        self._last_temp_sweep = 0
 
     def _load_config(self):
         if os.path.exists(self.CONFIG_FILE):
@@ -398,12 +605,101 @@ class StorageService:
     def download_file(self, *args, **kwargs):
         return self.active_backend.download_file(*args, **kwargs)
 
-    def delete_file(self, *args, **kwargs):
-        return self.active_backend.delete_file(*args, **kwargs)
+    def delete_file(self, remote_path, *args, **kwargs):
+        self.attachment_cache.invalidate(remote_path)
+        return self.active_backend.delete_file(remote_path, *args, **kwargs)
 
     def list_files(self, *args, **kwargs):
         return self.active_backend.list_files(*args, **kwargs)
 
+    # --- Streaming Download ---
+
+    def sweep_temp_files(self, max_age_seconds=TEMP_FILE_MAX_AGE_SECONDS, force=False):
+        """清理遗留的上传/下载临时目录（进程崩溃或旧版本残留）。"""
+        now = time.time()
+        if not force and now - self._last_temp_sweep < TEMP_SWEEP_INTERVAL_SECONDS:
+            return 0
+        self._last_temp_sweep = now
+        removed = 0
+        for root in TEMP_ROOT_DIRS:
+            if not os.path.isdir(root):
+                continue
+            for name in os.listdir(root):
+                path = os.path.join(root, name)
+                try:
+                    if now - os.path.getmtime(path) < max_age_seconds:
+                        continue
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    else:
+                        os.remove(path)
+                    removed += 1
+                except OSError:
+                    continue
+        return removed
+
+    def get_cached_file(self, remote_path):
+        """返回远端文件的本地缓存路径，未命中时下载并放入 LRU 缓存。"""
+        cached = self.attachment_cache.get(remote_path)
+        if cached:
+            return cached
+        local_path = self.active_backend.download_file(remote_path)
+        try:
+            return self.attachment_cache.put(remote_path, local_path)
+        finally:
+            _remove_temp_path(local_path)
+
+    def stream_response(self, remote_path, download_name, range_header=None, use_cache=False):
+        """
+        构造流式下载响应，支持 HTTP Range。
+        - use_cache: 热点附件走本地 LRU 磁盘缓存
+        - R2: 直接把对象流转发给客户端，不落盘
+        - 百度网盘: 下载到临时目录，响应结束后自动删除
+        """
+        from flask import Response, send_file
+        from werkzeug.http import parse_range_header
+
+        self.sweep_temp_files()
+
+        if use_cache:
+            return send_file(self.get_cached_file(remote_path), as_attachment=True,
+                             download_name=download_name, conditional=True)
+
+        backend = self.active_backend
+        if not hasattr(backend, 'open_stream'):
+            local_path = backend.download_file(remote_path)
+            try:
+                response = send_file(local_path, as_attachment=True, download_name=download_name, conditional=True)
+            except Exception:
+                _remove_temp_path(local_path)
+                raise
+            response.call_on_close(lambda: _remove_temp_path(local_path))
+            return response
+
+        total_size = backend.get_size(remote_path)
+        status = 200
+        start, end = None, None
+        byte_range = parse_range_header(range_header) if range_header else None
+        if byte_range is not None:
+            bounds = byte_range.range_for_length(total_size)
+            if bounds is None:
+                response = Response(status=416)
+                response.headers['Content-Range'] = f"bytes */{total_size}"
+                return response
+            start, end = bounds[0], bounds[1] - 1
+            status = 206
+
+        obj = backend.open_stream(remote_path, start, end)
+        response = Response(obj.chunks, status=status, mimetype=obj.content_type or 'application/octet-stream',
+                            direct_passthrough=True)
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.headers['Content-Length'] = str(obj.length)
+        response.headers['Content-Disposition'] = _content_disposition(download_name)
+        if status == 206:
+            response.headers['Content-Range'] = f"bytes {start}-{end}/{total_size}"
+        response.call_on_close(obj.close)
+        return response
+
     # Baidu specific
     def get_auth_url(self):
         if isinstance(self.active_backend, BaiduStorage):
@@ -420,4 +716,5 @@ class StorageService:
             return self.active_backend.save_manual_token(token)
         return False, "Current storage is not Baidu"
 
-storage_service = StorageService()
+# 首次使用时才加载存储配置并创建 R2 客户端 / 百度网盘实例
+storage_service = LazyProxy(StorageService, 'storage_service')
@@ -0,0 +1,107 @@
+import json
+import unittest
+import uuid
+from unittest import mock
+
+from database import DatabasePool
+from db_init import init_db
+from services.alignment_service import AlignmentService
+
+
+# 每次运行使用独立的标准分类，共享数据库重复运行时计数不受历史数据影响
+SPEC_VERSION = f'对齐引擎测试标准-{uuid.uuid4().hex[:8]}'
+
+
+class AlignmentEngineTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+        specs = [
+            ('医嘱视图', 'V_ICU_ORDER', ['patient_id', 'order_no', 'order_text']),
+            ('检验结果', 'V_LIS_RESULT', ['patient_id', 'item_code', 'result_value']),
+            ('生命体征', 'V_VITAL', ['patient_id', 'hr', 'bp']),
+        ]
+        cls.spec_ids = {}
+        with DatabasePool.get_connection() as conn:
+            cursor = conn.execute(DatabasePool.format_sql(
+                'INSERT INTO projects (project_name, hospital_name) VALUES (?, ?)'
+            ), ('对齐项目', '对齐医院'))
+            cls.project_id = DatabasePool.get_inserted_id(cursor)
+            for name, code, fields in specs:
+                cursor = conn.execute(DatabasePool.format_sql('''
+                    INSERT INTO interface_specs (spec_source, category, system_type, interface_name, transcode)
+                    VALUES ('our', ?, 'HIS', ?, ?)
+                '''), (SPEC_VERSION, name, code))
+                spec_id = DatabasePool.get_inserted_id(cursor)
+                cls.spec_ids[code] = spec_id
+                for order, field in enumerate(fields):
+                    conn.execute(DatabasePool.format_sql(
+                        'INSERT INTO interface_spec_fields (spec_id, field_name, field_order, is_required) VALUES (?, ?, ?, ?)'
+                    ), (spec_id, field, order, 1))
+            conn.commit()
+
+    def test_spec_fields_are_bulk_loaded(self):
+        statements = []
+        with DatabasePool.get_connection() as conn:
+            conn.set_trace_callback(statements.append)
+            try:
+                specs = AlignmentService.get_spec_interfaces(SPEC_VERSION)
+            finally:
+                conn.set_trace_callback(None)
+        self.assertEqual(len(specs), 3)
+        self.assertEqual(sum(1 for s in statements if 'interface_spec_fields f' in s), 1)
+        self.assertEqual([f['field_name'] for f in specs[0]['fields']][:1], ['patient_id'])
+
+    def test_vendor_document_is_extracted_once_per_content(self):
+        vendor = [{'interface_name': '医嘱', 'view_name': 'V_ORDER', 'fields': []}]
+        with mock.patch.object(AlignmentService, '_ai_extract_vendor', return_value=vendor) as extract:
+            text = f'第三方医嘱接口说明，视图 V_ORDER，唯一文档内容 {uuid.uuid4().hex}'
+            self.assertEqual(AlignmentService.parse_vendor_document(raw_text=text), vendor)
+            self.assertEqual(AlignmentService.parse_vendor_document(raw_text=text), vendor)
+            self.assertEqual(extract.call_count, 1)
+
+    def test_only_ambiguous_interfaces_reach_ai_and_chunks_are_persisted(self):
+        vendor_interfaces = [
+            {'interface_name': '医嘱信息', 'view_name': 'v_icu_order', 'protocol': '视图',
+             'fields': [{'field_name': 'PATIENT_ID'}, {'field_name': 'order_no'}, {'field_name': 'order_text'}]},
+            {'interface_name': '化验报告', 'view_name': 'LAB_REPORT',
+             'fields': [{'field_name': 'pid'}, {'field_name': 'code'}, {'field_name': 'value'}]},
+        ]
+        prompts = []
+
+        def fake_ai(system_prompt, user_content, task_type=None):
+            prompts.append(user_content)
+            return json.dumps({'alignments': [{
+                'spec_id': self.spec_ids['V_LIS_RESULT'], 'match_status': 'partial', 'confidence': 0.7,
+                'vendor_idx': 1, 'vendor_interface_name': '化验报告', 'vendor_view_name': 'LAB_REPORT',
+                'field_mappings': [{'spec_field': 'result_value', 'vendor_field': 'value'}],
+            }]}, ensure_ascii=False)
+
+        with mock.patch.object(AlignmentService, 'load_vendor_document', return_value=('doc', vendor_interfaces)), \
+                mock.patch('services.alignment_service.ai_service.call_ai_api', side_effect=fake_ai):
+            result = AlignmentService.run_alignment(self.project_id, SPEC_VERSION, '测试厂商', raw_text='doc')
+
+        self.assertTrue(result['success'], result)
+        self.assertEqual(len(prompts), 1)
+        self.assertNotIn('V_ICU_ORDER', prompts[0])
+        self.assertIn('V_LIS_RESULT', prompts[0])
+
+        session_id = result['session_id']
+        progress = AlignmentService.get_session_progress(session_id)
+        self.assertEqual((progress['status'], progress['progress_done'], progress['progress_total']), ('completed', 3, 3))
+        with DatabasePool.get_connection() as conn:
+            rows = {r['spec_interface_id']: dict(r) for r in conn.execute(DatabasePool.format_sql(
+                'SELECT * FROM alignment_results WHERE session_id = ?'
+            ), (session_id,)).fetchall()}
+            maps = conn.execute(DatabasePool.format_sql(
+                'SELECT COUNT(*) FROM alignment_field_maps WHERE result_id = ?'
+            ), (rows[self.spec_ids['V_ICU_ORDER']]['id'],)).fetchone()[0]
+        self.assertEqual(rows[self.spec_ids['V_ICU_ORDER']]['match_source'], 'rule')
+        self.assertEqual(rows[self.spec_ids['V_ICU_ORDER']]['match_status'], 'matched')
+        self.assertEqual(maps, 3)
+        self.assertEqual(rows[self.spec_ids['V_LIS_RESULT']]['match_status'], 'partial')
+        self.assertEqual(rows[self.spec_ids['V_VITAL']]['match_status'], 'missing')
+
+
+if __name__ == '__main__':
+    unittest.main()
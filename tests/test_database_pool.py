@@ -1,9 +1,10 @@
 import threading
 import time
 import unittest
+from unittest import mock
 
 import database
-from database import DatabasePool, close_db
+from database import DatabasePool, SchemaCatalog, close_db
 
 
 class _FakeRawConnection:
@@ -116,6 +117,82 @@ class DatabasePoolTests(unittest.TestCase):
         self.assertEqual(fake_pool.getconn_calls, 2)
         self.assertEqual(fake_pool.putconn_calls, 2)
 
+    def test_executemany_batches_postgres_writes(self):
+        class FakeConnection:
+            def cursor(self):
+                return 'cursor'
+
+        rows = [(1, 'a'), (2, 'b')]
+        with mock.patch('psycopg2.extras.execute_values') as execute_values, \
+                mock.patch('psycopg2.extras.execute_batch') as execute_batch:
+            DatabasePool.executemany(FakeConnection(), '''
+                INSERT INTO t (id, name, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (id) DO UPDATE SET name = excluded.name
+            ''', rows)
+            DatabasePool.executemany(FakeConnection(), 'UPDATE t SET name = ? WHERE id = ?', rows)
+
+        (_, query, values), kwargs = execute_values.call_args
+        self.assertIn('VALUES %s', query)
+        self.assertIn('ON CONFLICT (id)', query)
+        self.assertEqual(kwargs['template'], '(%s, %s, CURRENT_TIMESTAMP)')
+        self.assertEqual(values, rows)
+        self.assertEqual(execute_batch.call_args[0][1], 'UPDATE t SET name = %s WHERE id = %s')
+
+
+class SchemaCatalogTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from db_init import init_db
+        init_db()
+
+    def _count_statements(self, func):
+        statements = []
+        with DatabasePool.get_connection() as conn:
+            conn.set_trace_callback(statements.append)
+            try:
+                result = func(conn)
+            finally:
+                conn.set_trace_callback(None)
+        # pragma_table_info 的内部子语句以 -- 开头，不是独立往返
+        return result, sum(1 for s in statements if not s.startswith('--'))
+
+    def test_catalog_loads_once_and_exposes_types(self):
+        catalog = SchemaCatalog()
+
+        def lookups(conn):
+            return [catalog.columns(conn, table) for table in ('projects', 'tasks', 'interface_specs', 'projects')]
+
+        (projects, tasks, _, _), first = self._count_statements(lookups)
+        _, second = self._count_statements(lookups)
+        self.assertEqual(first, 2)  # 目录 + 版本号
+        self.assertEqual(second, 0)
+        self.assertEqual(projects['project_name'], 'text')
+        self.assertIn('stage_id', tasks)
+        with DatabasePool.get_connection() as conn:
+            self.assertIn('transcode', DatabasePool.get_column_types(conn, 'interface_specs'))
+
+        _, missing = self._count_statements(lambda conn: [catalog.columns(conn, 'no_such_table') for _ in range(3)])
+        self.assertEqual(missing, 1)
+
+    def test_schema_version_change_reloads_other_catalogs(self):
+        catalog = SchemaCatalog()
+        with DatabasePool.get_connection() as conn:
+            conn.execute('DROP TABLE IF EXISTS catalog_probe')
+            conn.execute('CREATE TABLE catalog_probe (id INTEGER PRIMARY KEY)')
+            DatabasePool.refresh_schema_version(conn)
+            conn.commit()
+            try:
+                self.assertNotIn('probe', catalog.columns(conn, 'catalog_probe'))
+                conn.execute('ALTER TABLE catalog_probe ADD COLUMN probe TEXT')
+                DatabasePool.refresh_schema_version(conn)
+                conn.commit()
+                self.assertNotIn('probe', catalog.columns(conn, 'catalog_probe'))
+                catalog._checked_at -= SchemaCatalog.CHECK_INTERVAL_SECONDS + 1
+                self.assertEqual(catalog.columns(conn, 'catalog_probe')['probe'], 'text')
+            finally:
+                conn.execute('DROP TABLE IF EXISTS catalog_probe')
+                DatabasePool.refresh_schema_version(conn)
+                conn.commit()
 
 if __name__ == '__main__':
     unittest.main()
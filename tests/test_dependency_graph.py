@@ -0,0 +1,101 @@
+import random
+import unittest
+
+from database import DatabasePool
+from db_init import init_db
+from services.dependency_service import ProjectDependencyGraph, dependency_service
+
+
+class ProjectDependencyGraphTests(unittest.TestCase):
+    def _assert_topological(self, graph):
+        order = graph.topo_order()
+        position = {tid: idx for idx, tid in enumerate(order)}
+        for (task_id, depends_on) in graph.edge_lookup:
+            self.assertLess(position[depends_on], position[task_id])
+
+    def test_incremental_order_matches_reachability(self):
+        rng = random.Random(7)
+        nodes = list(range(1, 41))
+        graph = ProjectDependencyGraph(1, nodes, [])
+        dep_id = 0
+        for _ in range(300):
+            task_id, depends_on = rng.sample(nodes, 2)
+            if graph.has_edge(task_id, depends_on):
+                continue
+            # 成环 <=> 当前 depends_on 已可由 task_id 到达
+            reachable = depends_on in graph._forward(task_id, None)
+            dep_id += 1
+            self.assertEqual(graph.add_edge(dep_id, task_id, depends_on), not reachable)
+            self._assert_topological(graph)
+
+    def test_remove_edge_allows_reverse_dependency(self):
+        graph = ProjectDependencyGraph(1, [1, 2, 3], [(10, 2, 1), (11, 3, 2)])
+        self.assertTrue(graph.would_create_cycle(1, 3))
+        graph.remove_edge(11)
+        self.assertFalse(graph.would_create_cycle(1, 3))
+        self.assertTrue(graph.add_edge(12, 1, 3))
+        self.assertEqual(graph.topo_order(), [3, 1, 2])
+
+
+class DependencyServiceCacheTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+        with DatabasePool.get_connection() as conn:
+            cursor = conn.execute(DatabasePool.format_sql(
+                'INSERT INTO projects (project_name, hospital_name, status) VALUES (?, ?, ?)'
+            ), ('依赖图项目', '依赖图医院', '实施中'))
+            cls.project_id = DatabasePool.get_inserted_id(cursor)
+            cursor = conn.execute(DatabasePool.format_sql(
+                'INSERT INTO project_stages (project_id, stage_name, stage_order) VALUES (?, ?, ?)'
+            ), (cls.project_id, '实施', 1))
+            stage_id = DatabasePool.get_inserted_id(cursor)
+            cls.task_ids = []
+            for i in range(4):
+                cursor = conn.execute(DatabasePool.format_sql(
+                    'INSERT INTO tasks (stage_id, task_name, estimated_duration) VALUES (?, ?, ?)'
+                ), (stage_id, f'任务{i}', i + 1))
+                cls.task_ids.append(DatabasePool.get_inserted_id(cursor))
+            conn.commit()
+
+    def test_cycle_rejected_and_critical_path_uses_cached_graph(self):
+        a, b, c, d = self.task_ids
+        self.assertTrue(dependency_service.add_dependency(b, a)['success'])
+        self.assertTrue(dependency_service.add_dependency(c, b)['success'])
+        self.assertFalse(dependency_service.add_dependency(c, b)['success'])
+
+        statements = []
+        with DatabasePool.get_connection() as conn:
+            conn.set_trace_callback(statements.append)
+            try:
+                result = dependency_service.add_dependency(a, c)
+            finally:
+                conn.set_trace_callback(None)
+        self.assertFalse(result['success'])
+        # 只查一次数据版本号确认缓存图新鲜，判环本身不访问数据库
+        self.assertEqual(len(statements), 1)
+        self.assertIn('project_data_versions', statements[0])
+
+        path = dependency_service.get_critical_path(self.project_id)
+        self.assertEqual([t['id'] for t in path['critical_path']], [a, b, c])
+        self.assertEqual(path['project_duration'], 1 + 2 + 3)
+
+        impact = dependency_service.get_impact_analysis(a)
+        self.assertEqual([(t['task_id'], t['impact_depth']) for t in impact['affected']], [(b, 1), (c, 2)])
+
+    def test_writes_from_other_processes_invalidate_cached_graph(self):
+        a, b, c, d = self.task_ids
+        dependency_service.add_dependency(b, a)
+        # 绕过本进程缓存直接写库，模拟另一个 worker 添加 a 依赖 d
+        with DatabasePool.get_connection() as conn:
+            conn.execute(DatabasePool.format_sql(
+                'INSERT INTO task_dependencies (task_id, depends_on_task_id, dependency_type) VALUES (?, ?, ?)'
+            ), (a, d, 'finish_to_start'))
+            conn.commit()
+        result = dependency_service.add_dependency(d, b)
+        self.assertFalse(result['success'])
+        self.assertIn('循环', result['message'])
+
+
+if __name__ == '__main__':
+    unittest.main()
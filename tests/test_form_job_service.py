@@ -0,0 +1,98 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from services.form_job_service import FormJobService
+
+
+def _temp_file(suffix, data):
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        tmp.write(data)
+        return tmp.name
+
+
+class FormJobServiceTests(unittest.TestCase):
+    def setUp(self):
+        self.service = FormJobService(job_workers=1, page_workers=1)
+        self.calls = []
+        self.generated = []
+        self.handlers = {
+            'extract_text': lambda path: self._record('extract_text') or '护理记录单 体温 脉搏',
+            'image_text': lambda path: self._record('image_text') or '',
+            'analyze_tables': lambda path: self._record('analyze_tables') or [],
+            'vision_ocr': lambda path, layout: self._record('vision_ocr') or None,
+            'reference_text': lambda name, text: self._record('reference_text') or None,
+            'generate': self._generate,
+        }
+
+    def _record(self, name):
+        self.calls.append(name)
+
+    def _generate(self, data):
+        self.generated.append(data)
+        return True, {'source_text': data['source_text']}, 200
+
+    def _wait(self, job_id, timeout=5):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = self.service.get_job(job_id)
+            if job['status'] != 'processing':
+                return job
+            time.sleep(0.01)
+        self.fail(f'job {job_id} did not finish')
+
+    def test_document_job_completes_and_removes_owned_file(self):
+        path = _temp_file('.docx', b'docx-bytes')
+        job = self.service.submit(path, '记录单.docx', self.handlers)
+        self.assertEqual(job['status'], 'processing')
+
+        done = self._wait(job['job_id'])
+        self.assertEqual(done['status'], 'completed')
+        self.assertEqual(done['result'], {'source_text': '护理记录单 体温 脉搏'})
+        self.assertEqual(done['partial']['text'], '护理记录单 体温 脉搏')
+        self.assertNotIn('vision_ocr', self.calls)
+        self.assertFalse(os.path.exists(path))
+
+    def test_partial_result_is_visible_during_vision_stage(self):
+        release = threading.Event()
+        reached = threading.Event()
+
+        def slow_vision(path, layout):
+            reached.set()
+            release.wait(5)
+            return {'text': '视觉识别文本'}
+
+        self.handlers['vision_ocr'] = slow_vision
+        path = _temp_file('.png', b'png-bytes')
+        job = self.service.submit(path, '表单.png', self.handlers)
+        self.assertTrue(reached.wait(5))
+        running = self.service.get_job(job['job_id'])
+        self.assertEqual((running['status'], running['stage']), ('processing', 'vision'))
+        self.assertEqual(running['partial']['text'], '')
+        release.set()
+
+        done = self._wait(job['job_id'])
+        self.assertEqual(done['result'], {'source_text': '视觉识别文本'})
+        self.assertEqual(self.calls[:1], ['image_text'])
+
+    def test_same_content_reuses_cached_analysis(self):
+        first = self._wait(self.service.submit(_temp_file('.docx', b'same'), 'a.docx', self.handlers)['job_id'])
+        second = self._wait(self.service.submit(_temp_file('.docx', b'same'), 'b.docx', self.handlers)['job_id'])
+        self.assertFalse(first['partial']['cache_hit'])
+        self.assertTrue(second['partial']['cache_hit'])
+        self.assertEqual(self.calls.count('extract_text'), 1)
+
+    def test_unreadable_image_falls_back_to_reference_form(self):
+        self.handlers['reference_text'] = lambda name, text: f'参考表单:{name}'
+        path = _temp_file('.png', b'blank')
+        done = self._wait(self.service.submit(path, '压疮评估.png', self.handlers)['job_id'])
+        self.assertEqual(done['status'], 'completed')
+        self.assertEqual(self.generated[0]['source_text'], '参考表单:压疮评估.png')
+        self.assertIn('vision_ocr', self.calls)
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import json
+import unittest
+from datetime import date
+from unittest import mock
+
+from flask import Flask
+
+from routes.gantt_routes import gantt_bp
+from services.dependency_service import ProjectDependencyGraph
+from services.gantt_service import GanttSyncService
+from services.schedule_engine import ScheduleEngine, WorkCalendar
+
+
+def _schedule(durations, edges):
+    tasks = [{
+        'id': tid, 'task_name': f'任务{tid}', 'is_completed': False, 'estimated_duration': duration,
+        'assigned_to': None, 'stage_id': 1, 'stage_name': '实施', 'stage_order': 1, 'plan_start_date': None,
+    } for tid, duration in durations.items()]
+    graph = ProjectDependencyGraph(1, list(durations), [
+        (i, task_id, depends_on, 'finish_to_start') for i, (task_id, depends_on) in enumerate(edges, 1)
+    ])
+    return ScheduleEngine.compute(tasks, graph, WorkCalendar(date(2026, 1, 5)))
+
+
+class GanttSyncTests(unittest.TestCase):
+    def test_delta_contains_only_changed_and_removed_tasks(self):
+        service = GanttSyncService()
+        schedules = [
+            _schedule({1: 2, 2: 3, 3: 1, 4: 1}, [(2, 1)]),
+            _schedule({1: 2, 2: 3, 3: 4}, [(2, 1)]),
+        ]
+        with mock.patch('services.gantt_service.schedule_engine.schedule_project', side_effect=schedules * 2):
+            version, tasks = service.snapshot(1)
+            self.assertEqual(version, service.version_of(tasks))
+            new_version, delta = service.sync(1, version)
+
+        self.assertNotEqual(new_version, version)
+        self.assertFalse(delta['full'])
+        self.assertEqual([t['id'] for t in delta['changed']], ['3'])
+        self.assertEqual(delta['removed'], ['4'])
+        self.assertEqual(sorted(delta['order']), ['1', '2', '3'])
+
+        with mock.patch('services.gantt_service.schedule_engine.schedule_project', return_value=schedules[1]):
+            _, unchanged = service.sync(1, new_version)
+            _, unknown = service.sync(1, 'unknown')
+        self.assertEqual((unchanged['changed'], unchanged['removed']), ([], []))
+        self.assertTrue(unknown['full'])
+        self.assertEqual(len(unknown['tasks']), 3)
+
+    def test_route_sets_etag_and_answers_304(self):
+        app = Flask(__name__)
+        app.register_blueprint(gantt_bp)
+        client = app.test_client()
+        with mock.patch('services.gantt_service.schedule_engine.schedule_project',
+                        return_value=_schedule({1: 2, 2: 1}, [(2, 1)])):
+            first = client.get('/api/projects/1/gantt-data')
+            self.assertEqual(first.status_code, 200)
+            self.assertEqual(len(json.loads(first.data)), 2)
+            etag = first.headers['ETag']
+            second = client.get('/api/projects/1/gantt-data', headers={'If-None-Match': etag})
+            self.assertEqual(second.status_code, 304)
+            delta = json.loads(client.get(f'/api/projects/1/gantt-data?since={etag.strip(chr(34))}').data)
+            self.assertEqual(delta['changed'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import uuid
+from unittest import mock
+
+from database import DatabasePool
+from db_init import init_db
+from services.geo_enrichment_service import GeoEnrichmentService
+from utils.geo_service import geo_service
+
+
+class GeoEnrichmentTests(unittest.TestCase):
+    def setUp(self):
+        init_db()
+        suffix = uuid.uuid4().hex[:8]
+        self.unresolvable = [f'无法解析医院{suffix}-{i}' for i in range(3)]
+        self.target = f'可解析医院{suffix}'
+        with DatabasePool.get_connection() as conn:
+            self.ids = []
+            for name in self.unresolvable + [self.target]:
+                cursor = conn.execute(DatabasePool.format_sql(
+                    "INSERT INTO projects (project_name, hospital_name, status) VALUES (?, ?, '进行中')"
+                ), (name, name))
+                self.ids.append(DatabasePool.get_inserted_id(cursor))
+            conn.commit()
+
+    def tearDown(self):
+        with DatabasePool.get_connection() as conn:
+            conn.cursor().executemany(
+                DatabasePool.format_sql('DELETE FROM projects WHERE id = ?'), [(pid,) for pid in self.ids]
+            )
+            conn.commit()
+
+    def test_unresolvable_rows_do_not_block_later_batches(self):
+        service = GeoEnrichmentService()
+        resolved = {self.target: {'province': '浙江', 'city': '杭州', 'lng': 120.1, 'lat': 30.2}}
+        with mock.patch.object(service, 'resolve_many', return_value=resolved):
+            service.run_all(limit=2)
+        with DatabasePool.get_connection() as conn:
+            row = conn.execute(DatabasePool.format_sql(
+                'SELECT province, city FROM projects WHERE id = ?'
+            ), (self.ids[-1],)).fetchone()
+        self.assertEqual((row['province'], row['city']), ('浙江', '杭州'))
+
+    def test_recorded_failures_are_not_served_as_cached_coordinates(self):
+        service = GeoEnrichmentService()
+        with DatabasePool.get_connection() as conn:
+            service._save_failures(conn, [self.target])
+            conn.commit()
+        try:
+            self.assertIsNone(geo_service._get_from_cache(self.target))
+            self.assertIsNone(geo_service._get_details_from_cache(self.target))
+        finally:
+            with DatabasePool.get_connection() as conn:
+                conn.execute(DatabasePool.format_sql('DELETE FROM geo_cache WHERE location_name = ?'), (self.target,))
+                conn.commit()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+from unittest import mock
+
+from utils.geo_service import gazetteer, geo_service
+
+
+class GazetteerTests(unittest.TestCase):
+    def test_county_hospital_resolves_full_hierarchy(self):
+        details = geo_service.resolve_offline('湖北省襄阳市保康县人民医院')
+        self.assertEqual(details['province'], '湖北')
+        self.assertEqual(details['city'], '襄阳')
+        self.assertEqual(details['county'], '保康县')
+        self.assertEqual(details['provider'], 'gazetteer')
+
+    def test_bare_county_name_maps_to_prefecture(self):
+        details = geo_service.resolve_offline('丘北县人民医院')
+        self.assertEqual((details['province'], details['city']), ('云南', '文山'))
+
+    def test_municipality_and_autonomous_prefecture(self):
+        self.assertEqual(geo_service.resolve_offline('垫江县人民医院')['city'], '重庆')
+        self.assertEqual(geo_service.resolve_offline('凉山州第一人民医院')['city'], '凉山')
+        self.assertEqual(geo_service.resolve_offline('新疆维吾尔自治区人民医院')['province'], '新疆')
+
+    def test_ambiguous_or_institutional_names_are_not_guessed(self):
+        self.assertIsNone(gazetteer.match('南山区人民医院'))
+        self.assertIsNone(gazetteer.match('中山大学附属第一医院'))
+        self.assertEqual(gazetteer.match('深圳市南山区人民医院')['city'], '深圳')
+
+    def test_university_names_do_not_resolve_to_their_namesake_city(self):
+        self.assertIsNone(geo_service.resolve_offline('吉林大学第一医院'))
+        self.assertIsNone(gazetteer.match('南华大学附属第一医院'))
+        self.assertEqual(gazetteer.match('吉林省吉林市人民医院')['city'], '吉林')
+
+    def test_province_only_match_still_queries_provider_for_city(self):
+        amap = {'province': '', 'city': '郑州', 'lng': 113.67, 'lat': 34.75, 'provider': 'amap'}
+        with mock.patch.multiple(geo_service, provider='amap', amap_key='key', baidu_ak=''), \
+                mock.patch.object(geo_service, '_get_details_from_cache', return_value=None), \
+                mock.patch.object(geo_service, '_save_details_to_cache') as save, \
+                mock.patch.object(geo_service, '_fetch_details_from_amap', return_value=amap) as fetch:
+            details = geo_service.resolve_address_details('河南省人民医院')
+        fetch.assert_called_once_with('河南省人民医院')
+        self.assertEqual((details['province'], details['city']), ('河南', '郑州'))
+        save.assert_called_once()
+
+    def test_province_only_match_is_fallback_when_providers_fail(self):
+        with mock.patch.multiple(geo_service, provider='amap', amap_key='key', baidu_ak=''), \
+                mock.patch.object(geo_service, '_get_details_from_cache', return_value=None), \
+                mock.patch.object(geo_service, '_save_details_to_cache') as save, \
+                mock.patch.object(geo_service, '_fetch_details_from_amap', return_value=None), \
+                mock.patch.object(geo_service, '_fetch_from_osm_simple', return_value=None):
+            details = geo_service.resolve_address_details('广东省人民医院')
+        self.assertEqual((details['province'], details['city']), ('广东', ''))
+        save.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
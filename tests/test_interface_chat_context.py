@@ -0,0 +1,92 @@
+import unittest
+import uuid
+
+from database import DatabasePool
+from db_init import init_db
+from services.interface_chat_service import InterfaceChatService
+
+
+# 每次运行使用独立分类，共享数据库重复运行时不会命中上次的标准规范
+CATEGORY = f'对话上下文测试标准-{uuid.uuid4().hex[:8]}'
+
+
+def _insert_spec(conn, project_id, source, name, transcode, category=CATEGORY, description=''):
+    cursor = conn.execute(DatabasePool.format_sql('''
+        INSERT INTO interface_specs (project_id, spec_source, category, system_type, interface_name, transcode, description)
+        VALUES (?, ?, ?, 'HIS', ?, ?, ?)
+    '''), (project_id, source, category, name, transcode, description))
+    return DatabasePool.get_inserted_id(cursor)
+
+
+class InterfaceChatContextTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+        with DatabasePool.get_connection() as conn:
+            cursor = conn.execute(DatabasePool.format_sql(
+                'INSERT INTO projects (project_name, hospital_name) VALUES (?, ?)'
+            ), ('对话项目', '对话医院'))
+            cls.project_id = DatabasePool.get_inserted_id(cursor)
+            cls.patient_spec = _insert_spec(conn, None, 'our_standard', '住院病人信息', 'GET_ZYBR', description='patient')
+            cls.order_spec = _insert_spec(conn, None, 'our_standard', '医嘱读取', 'GET_ZYYZ')
+            conn.execute(DatabasePool.format_sql(
+                'INSERT INTO interface_spec_fields (spec_id, field_name, field_order) VALUES (?, ?, ?)'
+            ), (cls.patient_spec, 'zyh', 1))
+            vendor_spec = _insert_spec(conn, cls.project_id, 'vendor', '病人视图', 'V_PATIENT')
+            cls.comparison_ids = []
+            for our_spec in (cls.patient_spec, cls.order_spec):
+                cursor = conn.execute(DatabasePool.format_sql('''
+                    INSERT INTO interface_comparisons (project_id, our_spec_id, vendor_spec_id, category, gap_count, transform_count)
+                    VALUES (?, ?, ?, ?, 1, 0)
+                '''), (cls.project_id, our_spec, vendor_spec, CATEGORY))
+                comparison_id = DatabasePool.get_inserted_id(cursor)
+                cls.comparison_ids.append(comparison_id)
+                conn.execute(DatabasePool.format_sql('''
+                    INSERT INTO field_mappings (comparison_id, our_field_name, vendor_field_name, mapping_status)
+                    VALUES (?, ?, ?, 'missing')
+                '''), (comparison_id, f'field_{comparison_id}', ''))
+            conn.commit()
+
+    def _traced(self, func):
+        statements = []
+        with DatabasePool.get_connection() as conn:
+            conn.set_trace_callback(statements.append)
+            try:
+                result = func()
+            finally:
+                conn.set_trace_callback(None)
+        return result, [s for s in statements if not s.lstrip().startswith('--')]
+
+    def test_context_is_cached_until_interface_data_changes(self):
+        service = InterfaceChatService()
+        context, statements = self._traced(lambda: service._build_context(self.project_id, CATEGORY))
+        self.assertIn(f'field_{self.comparison_ids[1]}', context)
+        self.assertEqual(sum(1 for s in statements if 'FROM field_mappings' in s), 1)
+
+        cached, statements = self._traced(lambda: service._build_context(self.project_id, CATEGORY))
+        self.assertEqual(cached, context)
+        self.assertEqual(len(statements), 1)
+
+        with DatabasePool.get_connection() as conn:
+            conn.execute(DatabasePool.format_sql(
+                "UPDATE field_mappings SET vendor_field_name = ? WHERE comparison_id = ?"
+            ), ('VENDOR_NEW', self.comparison_ids[0]))
+            conn.commit()
+        self.assertIn('VENDOR_NEW', service._build_context(self.project_id, CATEGORY))
+
+    def test_standard_specs_are_found_through_the_index(self):
+        service = InterfaceChatService()
+        specs = service._find_standard_specs('住院病人信息字段有哪些', CATEGORY)
+        self.assertEqual(specs[0]['id'], self.patient_spec)
+        self.assertEqual([f['field_name'] for f in specs[0]['fields']], ['zyh'])
+        self.assertEqual(service._find_standard_specs('医嘱', CATEGORY)[0]['id'], self.order_spec)
+        self.assertEqual(service._find_standard_specs('手术排班', CATEGORY), [])
+
+        with DatabasePool.get_connection() as conn:
+            new_spec = _insert_spec(conn, None, 'our_standard', '手术排班', 'GET_OPER')
+            conn.commit()
+        self.assertEqual(service._find_standard_specs('手术排班', CATEGORY)[0]['id'], new_spec)
+
+
+if __name__ == '__main__':
+    unittest.main()
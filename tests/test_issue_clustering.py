@@ -0,0 +1,90 @@
+import unittest
+
+from database import DatabasePool
+from db_init import init_db
+from services.analytics_service import AnalyticsService
+from services.issue_cluster_service import issue_cluster_engine
+
+
+TEXTS = {
+    'a1': '监护仪数据无法上传到中心站，床旁监护仪显示离线',
+    'a2': '床旁监护仪显示离线，监护仪数据无法上传中心站',
+    'b1': '呼吸机参数采集延迟严重，影响护理记录',
+    'b2': '呼吸机参数采集延迟很严重，影响护理记录',
+    'c': '监护仪报警音量无法调节',
+}
+
+
+class IssueClusteringTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+        cls.ids = {}
+        with DatabasePool.get_connection() as conn:
+            cursor = conn.execute(DatabasePool.format_sql(
+                'INSERT INTO projects (project_name, hospital_name) VALUES (?, ?)'
+            ), ('聚类项目', '聚类医院'))
+            cls.project_id = DatabasePool.get_inserted_id(cursor)
+            for key, text in TEXTS.items():
+                # 直接写表，模拟未经 index_issue 的写入入口
+                cursor = conn.execute(DatabasePool.format_sql('''
+                    INSERT INTO issues (project_id, issue_type, description, severity, status)
+                    VALUES (?, '现场问题', ?, '高', '待处理')
+                '''), (cls.project_id, text))
+                cls.ids[key] = DatabasePool.get_inserted_id(cursor)
+            conn.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        # 簇计数覆盖全库未解决问题，清理本次数据以免重复运行时累加
+        with DatabasePool.get_connection() as conn:
+            conn.execute(DatabasePool.format_sql(
+                'DELETE FROM issue_signatures WHERE issue_id IN (SELECT id FROM issues WHERE project_id = ?)'
+            ), (cls.project_id,))
+            conn.execute(DatabasePool.format_sql('DELETE FROM issues WHERE project_id = ?'), (cls.project_id,))
+            conn.commit()
+
+    def _clusters(self):
+        with DatabasePool.get_connection() as conn:
+            rows = conn.execute(DatabasePool.format_sql(
+                'SELECT issue_id, cluster_id FROM issue_signatures'
+            )).fetchall()
+        return {r['issue_id']: r['cluster_id'] for r in rows}
+
+    def test_near_duplicates_cluster_and_new_issues_join_incrementally(self):
+        result = AnalyticsService().get_issue_pattern_clusters(days=30, min_count=2)
+        clusters = self._clusters()
+        ids = self.ids
+        self.assertEqual(clusters[ids['a1']], clusters[ids['a2']])
+        self.assertEqual(clusters[ids['b1']], clusters[ids['b2']])
+        self.assertNotEqual(clusters[ids['a1']], clusters[ids['b1']])
+        self.assertNotEqual(clusters[ids['a1']], clusters[ids['c']])
+
+        ours = {c['cluster_id']: c for c in result['clusters']}
+        self.assertEqual(ours[clusters[ids['a1']]]['count'], 2)
+        self.assertEqual(ours[clusters[ids['a1']]]['high_severity_count'], 2)
+        self.assertNotIn(clusters[ids['c']], ours)
+
+        statements = []
+        with DatabasePool.get_connection() as conn:
+            cursor = conn.execute(DatabasePool.format_sql('''
+                INSERT INTO issues (project_id, issue_type, description, severity, status)
+                VALUES (?, '现场问题', ?, '中', '待处理')
+            '''), (self.project_id, '监护仪数据无法上传中心站，床旁监护仪离线'))
+            issue_id = DatabasePool.get_inserted_id(cursor)
+            conn.set_trace_callback(statements.append)
+            try:
+                cluster_id = issue_cluster_engine.index_issue(conn, issue_id, '监护仪数据无法上传中心站，床旁监护仪离线')
+            finally:
+                conn.set_trace_callback(None)
+            conn.commit()
+        self.assertEqual(cluster_id, clusters[ids['a1']])
+        self.assertFalse(any('FROM issues' in s for s in statements))
+
+        again = AnalyticsService().get_issue_pattern_clusters(days=30, min_count=2)
+        counts = {c['cluster_id']: c['count'] for c in again['clusters']}
+        self.assertEqual(counts[cluster_id], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from unittest import mock
+
+import migrations
+from database import DatabasePool
+from db_init import init_db
+
+
+class SchemaMigrationTests(unittest.TestCase):
+    def test_up_to_date_boot_is_a_single_query(self):
+        init_db()
+        statements = []
+        with DatabasePool.get_connection() as conn:
+            conn.set_trace_callback(statements.append)
+            try:
+                self.assertEqual(migrations.migrate(), [])
+            finally:
+                conn.set_trace_callback(None)
+            versions = {r['version'] for r in migrations.applied_migrations(conn).values()}
+        self.assertEqual(versions, {m.version for m in migrations.MIGRATIONS})
+        self.assertEqual([s for s in statements if not s.lstrip().startswith('--')], [
+            'SELECT version, name, checksum, duration_ms, applied_at FROM schema_migrations ORDER BY version'
+        ])
+
+    def test_changed_repeatable_step_is_reapplied_alone(self):
+        init_db()
+        step = migrations.MIGRATIONS[1]
+        changed = step._replace(apply=mock.Mock(), checksum_source=lambda: 'changed-indexes')
+        with mock.patch.object(migrations, 'MIGRATIONS', [migrations.MIGRATIONS[0], changed, migrations.MIGRATIONS[2]]):
+            self.assertEqual(migrations.migrate(), [step.version])
+            self.assertEqual(migrations.migrate(), [])
+        changed.apply.assert_called_once_with()
+        # 恢复原校验和，避免影响其他用例
+        self.assertEqual(migrations.migrate(), [step.version])
+
+    def test_missing_source_keeps_applied_steps(self):
+        init_db()
+        with mock.patch.object(migrations.inspect, 'getsource', side_effect=OSError('could not get source code')):
+            self.assertEqual(migrations.migrate(), [])
+
+    def test_new_steps_cannot_be_repeatable(self):
+        step = migrations.Migration(migrations.BASELINE_VERSION + 1, 'add_column', mock.Mock(), lambda: 'sql', True)
+        with mock.patch.object(migrations, 'MIGRATIONS', migrations.MIGRATIONS + [step]), \
+                DatabasePool.get_connection() as conn:
+            with self.assertRaises(ValueError):
+                migrations.pending_migrations(conn)
+
+
+if __name__ == '__main__':
+    unittest.main()
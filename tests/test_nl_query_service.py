@@ -0,0 +1,59 @@
+import unittest
+from unittest import mock
+
+from database import DatabasePool
+from db_init import init_db
+from services.nl_query_service import NLQueryService
+
+
+class NLQuerySandboxTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+        with DatabasePool.get_connection() as conn:
+            cursor = conn.execute(DatabasePool.format_sql(
+                'INSERT INTO projects (project_name, hospital_name, status) VALUES (?, ?, ?)'
+            ), ('沙箱项目', '沙箱医院', '实施中'))
+            cls.project_id = DatabasePool.get_inserted_id(cursor)
+            conn.executemany(DatabasePool.format_sql(
+                'INSERT INTO issues (project_id, description, severity, status) VALUES (?, ?, ?, ?)'
+            ), [(cls.project_id, '问题' * 50, '高', '待处理') for _ in range(30)])
+            conn.commit()
+
+    def test_readonly_connection_rejects_writes(self):
+        with DatabasePool.get_readonly_connection() as conn:
+            with self.assertRaises(Exception):
+                conn.execute("UPDATE projects SET status = '已完成'")
+
+    def test_row_and_byte_caps_are_applied_while_reading(self):
+        service = NLQueryService()
+        service.MAX_ROWS = 10
+        sql = f'SELECT id, description FROM issues WHERE project_id = {self.project_id} LIMIT 1000'
+        result = service.execute_query(self.project_id, sql)
+        self.assertEqual(len(result['rows']), 10)
+        self.assertTrue(result['truncated'])
+
+        service.MAX_ROWS = 1000
+        service.MAX_BYTES = 1000
+        result = service.execute_query(self.project_id, sql)
+        self.assertTrue(result['truncated'])
+        self.assertLess(len(result['rows']), 10)
+
+    def test_near_duplicate_questions_skip_the_model(self):
+        service = NLQueryService()
+        sql = f'SELECT COUNT(*) AS total FROM issues WHERE project_id = {self.project_id}'
+        with mock.patch('services.nl_query_service.ai_service.call_ai_api', return_value=sql) as call_ai:
+            self.assertEqual(service.convert_to_sql(self.project_id, '有多少个问题？'), (sql, None))
+            self.assertEqual(service.convert_to_sql(self.project_id, ' 有多少个问题 ?'), (sql, None))
+            self.assertEqual(call_ai.call_count, 1)
+            service.convert_to_sql(self.project_id + 1, '有多少个问题？')
+            self.assertEqual(call_ai.call_count, 2)
+
+        service.cache_plan(self.project_id, '坏查询', 'SELECT missing_column FROM issues')
+        result = service.execute_query(self.project_id, 'SELECT missing_column FROM issues', '坏查询')
+        self.assertIn('error', result)
+        self.assertIsNone(service.get_cached_plan(self.project_id, '坏查询'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import time
+import unittest
+import uuid
+
+from database import DatabasePool
+from db_init import init_db
+from services.notification_dispatcher import CHANNEL_WECOM_GROUP, NotificationDispatcher
+
+
+class NotificationDispatcherTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+
+    def setUp(self):
+        self.dispatcher = NotificationDispatcher()
+        # 测试中不启动工作线程，直接调用 deliver
+        self.dispatcher._started = True
+        self.calls = []
+        self.results = []
+
+        def handler(title, content, payload):
+            self.calls.append(title)
+            return self.results.pop(0) if self.results else (True, 'ok')
+
+        self.dispatcher._handlers[CHANNEL_WECOM_GROUP] = handler
+
+    def _row(self, outbox_id):
+        with DatabasePool.get_connection() as conn:
+            return dict(conn.execute(DatabasePool.format_sql(
+                'SELECT * FROM notification_outbox WHERE id = ?'
+            ), (outbox_id,)).fetchone())
+
+    def test_duplicates_coalesce_into_one_delivery(self):
+        # 每次运行使用不同标题，避免与上次运行已发送的记录合并
+        title = f'合并测试-{uuid.uuid4().hex[:8]}'
+        first = self.dispatcher.enqueue(CHANNEL_WECOM_GROUP, title, '同一条内容')
+        second = self.dispatcher.enqueue(CHANNEL_WECOM_GROUP, title, '同一条内容')
+        self.assertEqual(first, second)
+        self.assertEqual(self.dispatcher.deliver(first), 'sent')
+        # 刚发送过的同内容消息在合并窗口内不再重复外发
+        self.assertEqual(self.dispatcher.enqueue(CHANNEL_WECOM_GROUP, title, '同一条内容'), first)
+        self.assertEqual(self._row(first)['coalesced_count'], 2)
+        self.assertEqual(self.calls, [title])
+        self.assertEqual(self.dispatcher.metrics()['delivery_latency']['samples'], 1)
+
+    def test_failures_back_off_then_fail(self):
+        self.dispatcher.MAX_ATTEMPTS = 2
+        self.results = [(False, 'timeout'), (False, 'timeout')]
+        outbox_id = self.dispatcher.enqueue(CHANNEL_WECOM_GROUP, f'重试测试-{uuid.uuid4().hex[:8]}', '内容')
+        self.assertEqual(self.dispatcher.deliver(outbox_id), 'pending')
+        row = self._row(outbox_id)
+        self.assertEqual((row['attempts'], row['last_error']), (1, 'timeout'))
+        # 退避期内不可认领
+        self.assertIsNone(self.dispatcher.deliver(outbox_id))
+        with DatabasePool.get_connection() as conn:
+            conn.execute(DatabasePool.format_sql(
+                "UPDATE notification_outbox SET next_attempt_at = '2000-01-01 00:00:00' WHERE id = ?"
+            ), (outbox_id,))
+            conn.commit()
+        self.assertEqual(self.dispatcher.deliver(outbox_id), 'failed')
+        self.assertEqual(self.dispatcher.metrics()['counters']['failed'], 1)
+
+    def test_start_resends_rows_left_pending_before_restart(self):
+        title = f'重启补发-{uuid.uuid4().hex[:8]}'
+        outbox_id = self.dispatcher.enqueue(CHANNEL_WECOM_GROUP, title, '内容')
+        # 模拟新进程：未入队、线程未启动，记录只在库里
+        restarted = NotificationDispatcher()
+        for channel in restarted._handlers:
+            restarted._handlers[channel] = self.dispatcher._handlers[CHANNEL_WECOM_GROUP]
+        restarted.start()
+        try:
+            deadline = time.time() + 5
+            while self._row(outbox_id)['status'] != 'sent' and time.time() < deadline:
+                time.sleep(0.05)
+        finally:
+            restarted._stop.set()
+        self.assertEqual(self._row(outbox_id)['status'], 'sent')
+        self.assertIn(title, self.calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import socket
+import threading
+import unittest
+from unittest import mock
+
+from db_init import init_db
+from services.auth_service import auth_service
+from services.monitor_service import monitor_service
+from services.notification_stream_server import NotificationStreamServer
+from services.notification_stream_service import NotificationStreamService, notification_stream_service
+
+
+class NotificationStreamTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+
+    def test_long_poll_wakes_on_publish_and_filters_by_user(self):
+        service = NotificationStreamService()
+        service._counts[7] = (3, float('inf'))
+        since = service.current_seq
+        timer = threading.Timer(0.05, service.notifications_created, args=([7],))
+        timer.start()
+        result = service.poll(7, since=since, timeout=2)
+        timer.join()
+        self.assertEqual(result['events'], [{'event': 'unread', 'data': {'count': 4}}])
+
+        service.notifications_created([8])
+        self.assertEqual(service.poll(7, since=result['seq'], timeout=0.05)['events'], [])
+
+    def test_unread_counter_tracks_create_and_read(self):
+        notification_stream_service.notifications_changed()
+        before = notification_stream_service.unread_count(None)
+        monitor_service.create_notification({'title': '推送测试', 'content': '内容', 'type': 'info'})
+        self.assertEqual(notification_stream_service.unread_count(None), before + 1)
+        monitor_service.mark_as_read()
+        self.assertEqual(notification_stream_service.unread_count(None), 0)
+
+
+
+class NotificationStreamServerTests(unittest.TestCase):
+    def setUp(self):
+        self.service = NotificationStreamService()
+        self.service._counts[1] = (2, float('inf'))
+        self.server = NotificationStreamServer(self.service, enabled=True, host='127.0.0.1', port=0,
+                                               max_connections=500, public_url='')
+        patcher = mock.patch.object(auth_service, 'validate_token',
+                                    side_effect=lambda token: {'id': 1} if token == 'good' else None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.assertTrue(self.server.start())
+        self.addCleanup(self.server.stop)
+        self.sockets = []
+        self.addCleanup(lambda: [sock.close() for sock in self.sockets])
+
+    def _connect(self, token='good'):
+        sock = socket.create_connection(('127.0.0.1', self.server.port), timeout=5)
+        self.sockets.append(sock)
+        sock.sendall(f'GET /api/notifications/stream HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+                     f'Cookie: auth_token={token}\r\n\r\n'.encode())
+        return sock
+
+    @staticmethod
+    def _read_until(sock, marker):
+        data = b''
+        while marker.encode() not in data:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        return data.decode('utf-8')
+
+    def test_stream_emits_unread_and_task_events(self):
+        sock = self._connect()
+        head = self._read_until(sock, 'event: unread')
+        self.assertIn('HTTP/1.1 200 OK', head)
+        self.assertIn('text/event-stream', head)
+        self.assertIn('"count": 2', head)
+        threading.Timer(0.05, self.service.task_updated, args=({'task_id': 'abc', 'status': 'completed'},)).start()
+        message = self._read_until(sock, '"status": "completed"')
+        self.assertIn('event: task', message)
+
+    def test_idle_streams_do_not_hold_threads(self):
+        self._read_until(self._connect(), 'event: unread')
+        baseline = threading.active_count()
+        for sock in [self._connect() for _ in range(200)]:
+            self._read_until(sock, 'event: unread')
+        self.assertEqual(self.server.connections, 201)
+        self.assertLessEqual(threading.active_count(), baseline + NotificationStreamServer.DB_WORKERS)
+
+    def test_rejects_unauthenticated_stream(self):
+        self.assertIn('401 Unauthorized', self._read_until(self._connect('bad'), '}'))
+        self.assertEqual(self.server.connections, 0)
+
+    def test_stream_url_uses_request_hostname(self):
+        self.assertEqual(self.server.stream_url('icu.example.com:5000'),
+                         f'http://icu.example.com:{self.server.port}/api/notifications/stream')
+        self.assertIsNone(NotificationStreamServer(self.service, enabled=False).stream_url('icu.example.com'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import unittest
+import uuid
+
+from database import DatabasePool
+from db_init import init_db
+from services.performance_review_service import PerformanceReviewService
+
+
+class PerformanceOverviewQueryCountTests(unittest.TestCase):
+    """基准：总览查询次数不随研发对象数量增长"""
+
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+        cycle_key = f'bench-W01-{uuid.uuid4().hex[:8]}'
+        with DatabasePool.get_connection() as conn:
+            conn.execute(DatabasePool.format_sql('''
+                INSERT INTO performance_review_cycles (cycle_key, title, start_date, end_date, status)
+                VALUES (?, ?, ?, ?, ?)
+            '''), (cycle_key, '基准周期', '2026-01-05', '2026-01-11', 'active'))
+            cls.cycle_id = conn.execute(DatabasePool.format_sql(
+                'SELECT id FROM performance_review_cycles WHERE cycle_key = ?'
+            ), (cycle_key,)).fetchone()['id']
+            cursor = conn.execute(DatabasePool.format_sql(
+                'INSERT INTO projects (project_name, hospital_name, status) VALUES (?, ?, ?)'
+            ), ('绩效基准项目', '基准医院', '实施中'))
+            cls.project_id = DatabasePool.get_inserted_id(cursor)
+            conn.execute(DatabasePool.format_sql(
+                'INSERT INTO project_members (project_id, name, role, status) VALUES (?, ?, ?, ?)'
+            ), (cls.project_id, '现场评审', '实施工程师', '在岗'))
+            conn.commit()
+        cls.member_seq = 0
+
+    @classmethod
+    def _add_targets(cls, count):
+        with DatabasePool.get_connection() as conn:
+            for _ in range(count):
+                cls.member_seq += 1
+                name = f'研发{cls.member_seq:03d}'
+                cursor = conn.execute(DatabasePool.format_sql('''
+                    INSERT INTO performance_review_targets (cycle_id, project_id, member_name, member_role, status)
+                    VALUES (?, ?, ?, ?, 'active')
+                '''), (cls.cycle_id, cls.project_id, name, '后端开发'))
+                target_id = DatabasePool.get_inserted_id(cursor)
+                cursor = conn.execute(DatabasePool.format_sql('''
+                    INSERT INTO performance_score_cards
+                    (cycle_id, target_id, project_id, target_member_name, final_score, ai_generated_at)
+                    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                '''), (cls.cycle_id, target_id, cls.project_id, name, 80))
+                scorecard_id = DatabasePool.get_inserted_id(cursor)
+                for i in range(3):
+                    conn.execute(DatabasePool.format_sql('''
+                        INSERT INTO performance_recognition (cycle_id, target_id, project_id, giver_name, title, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    '''), (cls.cycle_id, target_id, cls.project_id, '现场评审', f'感谢{i}', f'2026-01-0{5 + i} 10:00:00'))
+                conn.execute(DatabasePool.format_sql('''
+                    INSERT INTO performance_review_forms (cycle_id, target_id, project_id, reviewer_name, score_responsibility, updated_at)
+                    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                '''), (cls.cycle_id, target_id, cls.project_id, '现场评审', 4))
+                for status, created_at in (('rejected', '2026-01-06 09:00:00'), ('pending', '2026-01-07 09:00:00')):
+                    conn.execute(DatabasePool.format_sql('''
+                        INSERT INTO performance_appeals (scorecard_id, cycle_id, target_id, appellant_name, status, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    '''), (scorecard_id, cls.cycle_id, target_id, name, status, created_at))
+            conn.commit()
+
+    def _measure(self):
+        statements = []
+        with DatabasePool.get_connection() as conn:
+            conn.set_trace_callback(statements.append)
+            try:
+                overview = PerformanceReviewService.get_overview(
+                    cycle_id=self.cycle_id,
+                    project_id=self.project_id,
+                    current_user={'display_name': '现场评审', 'role': 'admin'},
+                )
+            finally:
+                conn.set_trace_callback(None)
+        return overview, len(statements)
+
+    def test_query_count_is_constant_in_member_count(self):
+        self._add_targets(5)
+        small, small_queries = self._measure()
+        self._add_targets(45)
+        large, large_queries = self._measure()
+
+        self.assertEqual(small['summary']['member_count'], 5)
+        self.assertEqual(large['summary']['member_count'], 50)
+        self.assertEqual(small_queries, large_queries)
+
+        member = large['projects'][0]['members'][0]
+        self.assertEqual(len(member['recognitions']), 3)
+        self.assertEqual(member['recognitions'][0]['title'], '感谢2')
+        self.assertEqual(len(member['appeals']), 2)
+        self.assertEqual(member['my_review']['reviewer_name'], '现场评审')
+        self.assertTrue(member['actions']['can_review'])
+        self.assertEqual(large['summary']['pending_appeals'], 50)
+
+
+class CycleSignalSyncTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+        cycle_key = f'signal-W02-{uuid.uuid4().hex[:8]}'
+        with DatabasePool.get_connection() as conn:
+            conn.execute(DatabasePool.format_sql('''
+                INSERT INTO performance_review_cycles (cycle_key, title, start_date, end_date, status)
+                VALUES (?, ?, ?, ?, ?)
+            '''), (cycle_key, '信号周期', '2026-01-12', '2026-01-18', 'active'))
+            cls.cycle = dict(conn.execute(DatabasePool.format_sql(
+                'SELECT * FROM performance_review_cycles WHERE cycle_key = ?'
+            ), (cycle_key,)).fetchone())
+            cursor = conn.execute(DatabasePool.format_sql(
+                'INSERT INTO projects (project_name, hospital_name, status) VALUES (?, ?, ?)'
+            ), ('信号项目', '信号医院', '实施中'))
+            cls.project_id = DatabasePool.get_inserted_id(cursor)
+            ids = {}
+            for name, role in (('研发甲', '后端开发'), ('研发乙', '前端开发'), ('实施丙', '实施工程师')):
+                cursor = conn.execute(DatabasePool.format_sql(
+                    'INSERT INTO project_members (project_id, name, role, status) VALUES (?, ?, ?, ?)'
+                ), (cls.project_id, name, role, '在岗'))
+                ids[name] = DatabasePool.get_inserted_id(cursor)
+            cls.member_ids = ids
+            logs = [
+                (ids['研发甲'], '研发甲', '2026-01-13'),
+                (None, '研发甲', '2026-01-14'),
+                (ids['研发甲'], '研发甲', '2026-01-20'),
+                (ids['研发乙'], '研发乙', '2026-01-15'),
+            ]
+            for member_id, member_name, log_date in logs:
+                conn.execute(DatabasePool.format_sql('''
+                    INSERT INTO work_logs (project_id, member_id, member_name, log_date, work_content)
+                    VALUES (?, ?, ?, ?, ?)
+                '''), (cls.project_id, member_id, member_name, log_date, '开发'))
+            cursor = conn.execute(DatabasePool.format_sql('''
+                INSERT INTO project_stages (project_id, stage_name, stage_order, responsible_person) VALUES (?, ?, ?, ?)
+            '''), (cls.project_id, '接口开发', 1, '研发甲'))
+            stage_id = DatabasePool.get_inserted_id(cursor)
+            for i in range(2):
+                conn.execute(DatabasePool.format_sql(
+                    'INSERT INTO tasks (stage_id, task_name, assigned_to, is_completed) VALUES (?, ?, ?, ?)'
+                ), (stage_id, f'接口{i}', '研发甲', False))
+            conn.execute(DatabasePool.format_sql('''
+                INSERT INTO issues (project_id, description, owner_member_id, created_at) VALUES (?, ?, ?, ?)
+            '''), (cls.project_id, '联调阻塞', ids['研发乙'], '2026-01-10 09:00:00'))
+            conn.commit()
+
+    def test_bulk_signals_match_per_member_semantics(self):
+        with DatabasePool.get_connection() as conn:
+            targets = PerformanceReviewService._sync_targets_for_cycle(conn, self.cycle, self.project_id)
+        by_name = {t['member_name']: t for t in targets}
+        self.assertEqual(set(by_name), {'研发甲', '研发乙'})
+        first = by_name['研发甲']
+        self.assertEqual(
+            (first['signal_logs'], first['signal_tasks'], first['signal_stages'], first['signal_issues']),
+            (2, 2, 1, 0),
+        )
+        second = by_name['研发乙']
+        self.assertEqual((second['signal_logs'], second['signal_issues']), (1, 1))
+
+        with DatabasePool.get_connection() as conn:
+            again = PerformanceReviewService._sync_targets_for_cycle(conn, self.cycle, self.project_id)
+        self.assertEqual([t['id'] for t in again], [t['id'] for t in targets])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+
+from database import DatabasePool
+from db_init import init_db
+from services.project_detail_service import ProjectDetailLoader
+
+
+class ProjectDetailCacheTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+
+    def _create_project(self, stage_count):
+        with DatabasePool.get_connection() as conn:
+            cursor = conn.execute(DatabasePool.format_sql(
+                'INSERT INTO projects (project_name, hospital_name, status) VALUES (?, ?, ?)'
+            ), ('详情项目', '详情医院', '实施中'))
+            pid = DatabasePool.get_inserted_id(cursor)
+            for order in range(stage_count):
+                cursor = conn.execute(DatabasePool.format_sql(
+                    'INSERT INTO project_stages (project_id, stage_name, stage_order) VALUES (?, ?, ?)'
+                ), (pid, f'阶段{order}', order))
+                stage_id = DatabasePool.get_inserted_id(cursor)
+                for done in (True, False):
+                    conn.execute(DatabasePool.format_sql(
+                        'INSERT INTO tasks (stage_id, task_name, is_completed) VALUES (?, ?, ?)'
+                    ), (stage_id, '任务', done))
+            conn.commit()
+        return pid
+
+    def _load_counting(self, pid):
+        statements = []
+        with DatabasePool.get_connection() as conn:
+            conn.set_trace_callback(statements.append)
+            try:
+                detail = ProjectDetailLoader.load(conn, pid)
+            finally:
+                conn.set_trace_callback(None)
+        return detail, len(statements)
+
+    def test_query_count_does_not_grow_with_stages(self):
+        small, small_queries = self._load_counting(self._create_project(2))
+        large, large_queries = self._load_counting(self._create_project(12))
+        self.assertEqual(small_queries, large_queries)
+        self.assertEqual(len(large['stages']), 12)
+        self.assertEqual(large['stages'][5]['progress'], 50)
+        self.assertEqual(large['progress'], 50)
+
+    def test_child_writes_invalidate_cached_payload(self):
+        loader = ProjectDetailLoader()
+        pid = self._create_project(1)
+        first = loader.get(pid)
+        first['issues'].append({'mutated': True})
+        self.assertEqual(loader.get(pid)['issues'], [])
+        self.assertEqual(loader.metrics()['hits'], 1)
+
+        with DatabasePool.get_connection() as conn:
+            conn.execute(DatabasePool.format_sql(
+                'INSERT INTO issues (project_id, description, status) VALUES (?, ?, ?)'
+            ), (pid, '新问题', '待处理'))
+            conn.execute(DatabasePool.format_sql(
+                'UPDATE tasks SET is_completed = ? WHERE stage_id IN (SELECT id FROM project_stages WHERE project_id = ?)'
+            ), (True, pid))
+            conn.commit()
+        refreshed = loader.get(pid)
+        self.assertEqual(len(refreshed['issues']), 1)
+        self.assertEqual(refreshed['progress'], 100)
+        self.assertEqual(loader.metrics()['stale'], 1)
+        self.assertIsNone(loader.get(10 ** 9))
+
+
+if __name__ == '__main__':
+    unittest.main()
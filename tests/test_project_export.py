@@ -0,0 +1,111 @@
+import io
+import json
+import unittest
+import zipfile
+from unittest import mock
+
+import database
+from database import DatabasePool, PGConnectionWrapper, PGCursorWrapper
+from db_init import init_db
+from services.project_export_service import ProjectExportService, project_export_service
+
+
+class _FakePGCursor:
+    """模拟 psycopg2 游标：只有带 RETURNING 的语句有结果可取"""
+
+    def __init__(self, queries):
+        self.queries = queries
+        self._pending = None
+
+    def execute(self, query, vars=None):
+        self.queries.append(query)
+        self._pending = (42,) if 'RETURNING' in query.upper() else None
+
+    def fetchone(self):
+        if self._pending is None:
+            raise RuntimeError('no results to fetch')
+        row, self._pending = self._pending, None
+        return row
+
+
+class _FakePGConnection:
+    def __init__(self):
+        self.queries = []
+
+    def cursor(self, *args, **kwargs):
+        return _FakePGCursor(self.queries)
+
+
+class ProjectExportTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+        with DatabasePool.get_connection() as conn:
+            cursor = conn.execute(DatabasePool.format_sql('''
+                INSERT INTO projects (project_name, hospital_name, status)
+                VALUES (?, ?, ?)
+            '''), ('导出测试项目', '导出测试医院', '实施中'))
+            cls.project_id = DatabasePool.get_inserted_id(cursor)
+            cursor = conn.execute(DatabasePool.format_sql('''
+                INSERT INTO project_stages (project_id, stage_name, stage_order) VALUES (?, ?, ?)
+            '''), (cls.project_id, '部署', 1))
+            stage_id = DatabasePool.get_inserted_id(cursor)
+            for i in range(3):
+                conn.execute(DatabasePool.format_sql(
+                    'INSERT INTO tasks (stage_id, task_name) VALUES (?, ?)'
+                ), (stage_id, f'任务{i}'))
+            cursor = conn.execute(DatabasePool.format_sql(
+                'INSERT INTO project_members (project_id, name, role) VALUES (?, ?, ?)'
+            ), (cls.project_id, '张工', '实施'))
+            member_id = DatabasePool.get_inserted_id(cursor)
+            conn.execute(DatabasePool.format_sql('''
+                INSERT INTO work_logs (project_id, member_id, member_name, log_date, work_content, stage_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            '''), (cls.project_id, member_id, '张工', '2026-01-02', '联调', stage_id))
+            conn.commit()
+
+    def _export_zip(self):
+        return b''.join(project_export_service.iter_zip(self.project_id))
+
+    def test_zip_contains_ndjson_per_table_and_manifest(self):
+        with zipfile.ZipFile(io.BytesIO(self._export_zip())) as zf:
+            manifest = json.loads(zf.read('manifest.json'))
+            self.assertEqual(manifest['tables']['tasks'], 3)
+            lines = zf.read('tasks.ndjson').decode('utf-8').strip().splitlines()
+            self.assertEqual(len(lines), 3)
+            self.assertEqual(json.loads(lines[0])['task_name'], '任务0')
+
+    def test_clone_remaps_stage_and_member_ids(self):
+        result = project_export_service.import_archive(io.BytesIO(self._export_zip()), mode='clone')
+        new_id = result['project_id']
+        self.assertNotEqual(new_id, self.project_id)
+        self.assertEqual(result['tables']['tasks'], 3)
+
+        cloned = project_export_service.build_json(new_id)
+        self.assertTrue(cloned['project']['project_name'].endswith('(副本)'))
+        self.assertEqual(len(cloned['stages'][0]['tasks']), 3)
+        log = cloned['work_logs'][0]
+        self.assertEqual(log['stage_id'], cloned['stages'][0]['id'])
+        self.assertEqual(log['member_id'], cloned['members'][0]['id'])
+
+    def test_postgres_row_insert_returns_new_id(self):
+        conn = PGConnectionWrapper(_FakePGConnection())
+        with mock.patch.dict(database.DB_CONFIG, {'TYPE': 'postgres'}), \
+                mock.patch.dict(PGCursorWrapper._id_column_cache, {('public', 'projects'): True}):
+            new_id = ProjectExportService._insert_row(conn, 'projects', {'project_name': '克隆', 'status': '实施中'})
+        self.assertEqual(new_id, 42)
+        self.assertEqual(len(conn.queries), 1)
+        self.assertTrue(conn.queries[0].endswith('RETURNING id'))
+        self.assertIn('%s', conn.queries[0])
+
+    def test_rejects_archive_without_manifest(self):
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w') as zf:
+            zf.writestr('projects.ndjson', '{}\n')
+        buf.seek(0)
+        with self.assertRaises(ValueError):
+            project_export_service.import_archive(buf)
+
+
+if __name__ == '__main__':
+    unittest.main()
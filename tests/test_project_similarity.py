@@ -0,0 +1,80 @@
+import unittest
+
+import numpy as np
+
+from database import DatabasePool
+from db_init import init_db
+from services.ai_insight_service import AIInsightService
+from services.project_similarity_service import ProjectFeatureIndex, project_feature_index
+
+
+def _project(conn, name, province, city, icu, rooms, systems=(), issue_types=(), devices=()):
+    cursor = conn.execute(DatabasePool.format_sql('''
+        INSERT INTO projects (project_name, hospital_name, province, city, icu_beds, operating_rooms, pacu_beds)
+        VALUES (?, ?, ?, ?, ?, ?, 0)
+    '''), (name, name + '医院', province, city, icu, rooms))
+    pid = DatabasePool.get_inserted_id(cursor)
+    for system in systems:
+        conn.execute(DatabasePool.format_sql(
+            'INSERT INTO interfaces (project_id, system_name, interface_name) VALUES (?, ?, ?)'
+        ), (pid, system, system + '接口'))
+    for issue_type in issue_types:
+        conn.execute(DatabasePool.format_sql(
+            "INSERT INTO issues (project_id, issue_type, description, severity, status) VALUES (?, ?, '描述', '中', '待处理')"
+        ), (pid, issue_type))
+    for device in devices:
+        conn.execute(DatabasePool.format_sql(
+            'INSERT INTO medical_devices (project_id, device_type) VALUES (?, ?)'
+        ), (pid, device))
+    return pid
+
+
+class ProjectSimilarityTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+        with DatabasePool.get_connection() as conn:
+            cls.base = _project(conn, '相似基准', '浙江省', '杭州市', 30, 0, ['HIS', 'LIS'], ['接口问题'], ['监护仪', '呼吸机'])
+            cls.twin = _project(conn, '相似孪生', '浙江省', '杭州市', 32, 0, ['HIS', 'LIS'], ['接口问题'], ['监护仪', '呼吸机'])
+            cls.other = _project(conn, '相似对照', '广东省', '深圳市', 0, 20, ['PACS'], ['硬件问题'], ['麻醉机'])
+            conn.commit()
+
+    def test_weighted_cosine_decomposes_into_block_contributions(self):
+        index = ProjectFeatureIndex()
+        a = index.build_vector({'province': '浙江省', 'city': '杭州市', 'icu_beds': 30}, interfaces=[{'system_name': 'HIS'}])
+        b = index.build_vector({'province': '浙江省', 'city': '宁波市', 'icu_beds': 20})
+        self.assertEqual(a.dtype, np.float32)
+        self.assertAlmostEqual(float(np.dot(a, a)), 0.65, places=4)  # 问题/设备/工期块为空
+        contributions = index.contributions(a, b)
+        self.assertAlmostEqual(sum(contributions.values()), float(np.dot(a, b)) * 100, places=0)
+        self.assertEqual(contributions['接口构成'], 0)
+        self.assertAlmostEqual(contributions['地区'], 10.0, places=1)
+
+    def _neighbors(self):
+        """基准项目的近邻中只保留本次创建的项目（共享数据库中有历次运行留下的同特征项目）"""
+        ours = {self.twin, self.other}
+        return [n for n in project_feature_index.search(self.base, k=10000) if n[0] in ours]
+
+    def test_similar_projects_use_stored_vectors_and_refresh_on_change(self):
+        result = AIInsightService.find_similar_projects(self.base, limit=10)
+        self.assertTrue(result)
+        self.assertIn('feature_contributions', result[0])
+
+        ids = [pid for pid, _, _ in self._neighbors()]
+        self.assertEqual(ids[0], self.twin)
+        if self.other in ids:
+            self.assertLess(ids.index(self.twin), ids.index(self.other))
+        self.assertIn('设备类型', self._neighbors()[0][2])
+
+        with DatabasePool.get_connection() as conn:
+            self.assertEqual(project_feature_index.refresh(conn), 0)
+            conn.execute(DatabasePool.format_sql(
+                "UPDATE projects SET province = '广东省', city = '深圳市' WHERE id = ?"
+            ), (self.twin,))
+            conn.commit()
+            self.assertEqual(project_feature_index.refresh(conn), 1)
+        moved = {pid: contributions for pid, _, contributions in self._neighbors()}
+        self.assertEqual(moved[self.twin]['地区'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import json
+import unittest
+from datetime import date
+
+import numpy as np
+
+from database import DatabasePool
+from db_init import init_db
+from services.dependency_service import ProjectDependencyGraph
+from services.risk_simulation_service import RiskSimulationService, risk_simulation_service
+from services.schedule_engine import ScheduleEngine, WorkCalendar
+
+
+class PropagationTests(unittest.TestCase):
+    def test_vectorized_pass_matches_cpm_engine(self):
+        tasks = [
+            {'id': i, 'task_name': f'任务{i}', 'is_completed': False, 'estimated_duration': d,
+             'stage_id': 1, 'stage_name': '实施', 'stage_order': 1, 'plan_start_date': None}
+            for i, d in ((1, 5), (2, 2), (3, 3), (4, 2))
+        ]
+        graph = ProjectDependencyGraph(1, [1, 2, 3, 4], [
+            (1, 2, 1, 'finish_to_start'), (2, 3, 1, 'start_to_start'),
+            (3, 4, 3, 'finish_to_finish'), (4, 4, 2, 'finish_to_start'),
+        ])
+        calendar = WorkCalendar(date(2026, 1, 5))
+        order, _, duration, release, preds, succs = ScheduleEngine.build_network(tasks, graph, calendar)
+        expected = ScheduleEngine.compute(tasks, graph, calendar)
+
+        durations = np.repeat(np.array(duration, dtype=float)[None, :], 3, axis=0)
+        es, ef, slack, finish = RiskSimulationService._propagate(durations, release, preds, succs)
+        self.assertTrue((finish == expected['project_duration']).all())
+        for i, task in enumerate(expected['tasks']):
+            self.assertEqual(order[i], task['id'])
+            self.assertEqual(es[0, i], task['early_start'])
+            self.assertEqual(slack[0, i], task['slack'])
+
+
+class MonteCarloTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+        with DatabasePool.get_connection() as conn:
+            cursor = conn.execute(DatabasePool.format_sql(
+                'INSERT INTO projects (project_name, hospital_name, status, plan_start_date, plan_end_date) VALUES (?, ?, ?, ?, ?)'
+            ), ('风险模拟项目', '模拟医院', '实施中', '2026-01-05', '2026-01-30'))
+            cls.project_id = DatabasePool.get_inserted_id(cursor)
+            cursor = conn.execute(DatabasePool.format_sql(
+                'INSERT INTO project_stages (project_id, stage_name, stage_order) VALUES (?, ?, ?)'
+            ), (cls.project_id, '实施', 1))
+            stage_id = DatabasePool.get_inserted_id(cursor)
+            ids = []
+            for name, duration in (('主线A', 5), ('主线B', 5), ('支线', 1)):
+                cursor = conn.execute(DatabasePool.format_sql(
+                    'INSERT INTO tasks (stage_id, task_name, estimated_duration) VALUES (?, ?, ?)'
+                ), (stage_id, name, duration))
+                ids.append(DatabasePool.get_inserted_id(cursor))
+            conn.execute(DatabasePool.format_sql(
+                'INSERT INTO task_dependencies (task_id, depends_on_task_id) VALUES (?, ?)'
+            ), (ids[1], ids[0]))
+            conn.execute(DatabasePool.format_sql(
+                'INSERT INTO milestones (project_id, name, target_date) VALUES (?, ?, ?)'
+            ), (cls.project_id, '实施完成', '2026-01-16'))
+            conn.commit()
+        cls.task_ids = ids
+
+    def test_percentiles_and_criticality(self):
+        result = risk_simulation_service.simulate_schedule(self.project_id, iterations=500, seed=7)
+        json.dumps(result)
+        finish = result['project_finish']
+        self.assertLessEqual(finish['p50'], finish['p80'])
+        self.assertLessEqual(finish['p80'], finish['p95'])
+        milestone = result['milestones'][0]
+        self.assertEqual(milestone['milestone'], '实施完成')
+        self.assertIn('on_time_probability', milestone)
+        criticality = {t['task_id']: t['criticality'] for t in result['tasks']}
+        self.assertEqual(criticality[self.task_ids[0]], 1.0)
+        self.assertLess(criticality[self.task_ids[2]], 0.05)
+
+    def test_deterministic_delay_skips_sampling(self):
+        result = risk_simulation_service.simulate_schedule(
+            self.project_id, task_id=self.task_ids[0], delay_days=3, deterministic=True
+        )
+        self.assertEqual(result['iterations'], 1)
+        self.assertEqual(result['finish_delay_workdays'], 3)
+        # 2026-01-05 起 13 个工作日
+        self.assertEqual(result['project_finish']['p50'], '2026-01-21')
+
+
+if __name__ == '__main__':
+    unittest.main()
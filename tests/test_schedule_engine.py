@@ -0,0 +1,98 @@
+import random
+import time
+import unittest
+from datetime import date
+
+from services.dependency_service import ProjectDependencyGraph
+from services.schedule_engine import ScheduleEngine, WorkCalendar
+
+
+def _task(tid, duration=1, assigned_to=None, plan_start_date=None):
+    return {
+        'id': tid, 'task_name': f'任务{tid}', 'is_completed': False, 'estimated_duration': duration,
+        'assigned_to': assigned_to, 'stage_id': 1, 'stage_name': '实施', 'stage_order': 1,
+        'plan_start_date': plan_start_date,
+    }
+
+
+class WorkCalendarTests(unittest.TestCase):
+    def test_skips_weekends_holidays_and_honours_make_up_days(self):
+        # 2026-10-01 周四；国庆 10-01~10-07 放假，10-10 周六调休上班
+        holidays = [date(2026, 10, d) for d in range(1, 8)]
+        calendar = WorkCalendar(date(2026, 9, 30), holidays=holidays, extra_workdays=[date(2026, 10, 10)])
+        self.assertEqual(calendar.to_date(0), date(2026, 9, 30))
+        self.assertEqual(calendar.to_date(1), date(2026, 10, 8))
+        self.assertEqual(calendar.to_date(3), date(2026, 10, 10))
+        self.assertEqual(calendar.to_date(4), date(2026, 10, 12))
+        self.assertEqual(calendar.to_index(date(2026, 10, 3)), 1)
+
+
+class ScheduleEngineTests(unittest.TestCase):
+    def setUp(self):
+        self.calendar = WorkCalendar(date(2026, 1, 5))  # 周一
+
+    def _graph(self, task_ids, edges):
+        return ProjectDependencyGraph(1, task_ids, [
+            (i, task_id, depends_on, dep_type) for i, (task_id, depends_on, dep_type) in enumerate(edges, 1)
+        ])
+
+    def test_four_dependency_types(self):
+        tasks = [_task(1, 5), _task(2, 2), _task(3, 3), _task(4, 2), _task(5, 1)]
+        graph = self._graph([1, 2, 3, 4, 5], [
+            (2, 1, 'finish_to_start'),
+            (3, 1, 'start_to_start'),
+            (4, 1, 'finish_to_finish'),
+            (5, 1, 'start_to_finish'),
+        ])
+        result = ScheduleEngine.compute(tasks, graph, self.calendar)
+        by_id = {t['id']: t for t in result['tasks']}
+        self.assertEqual(by_id[2]['early_start'], 5)
+        self.assertEqual(by_id[3]['early_start'], 0)
+        self.assertEqual(by_id[4]['early_finish'], 5)
+        self.assertEqual(by_id[5]['early_start'], 0)
+        self.assertEqual(result['project_duration'], 7)
+        self.assertEqual([t['id'] for t in result['tasks'] if t['is_critical']], [1, 2])
+        # 第 5 个工作日（周五）结束，FS 后继从下周一开始
+        self.assertEqual(by_id[1]['end_date'], '2026-01-09')
+        self.assertEqual(by_id[2]['start_date'], '2026-01-12')
+
+    def test_cyclic_graph_still_lists_tasks(self):
+        tasks = [_task(1, 2, plan_start_date='2026-01-05'), _task(2, 3, plan_start_date='2026-01-05')]
+        tasks[0]['plan_end_date'] = '2026-01-09'
+        graph = self._graph([1, 2], [(2, 1, 'finish_to_start'), (1, 2, 'finish_to_start')])
+        result = ScheduleEngine.compute(tasks, graph, self.calendar)
+        self.assertTrue(result['cyclic'])
+        by_id = {t['id']: t for t in result['tasks']}
+        self.assertEqual(set(by_id), {1, 2})
+        self.assertEqual(by_id[1]['predecessors'], [2])
+        self.assertEqual((by_id[1]['start_date'], by_id[1]['end_date']), ('2026-01-05', '2026-01-09'))
+        self.assertFalse(by_id[2]['is_critical'])
+
+    def test_resource_leveling_serialises_same_assignee(self):
+        tasks = [_task(1, 3, '张工'), _task(2, 2, '张工'), _task(3, 2, '李工')]
+        graph = self._graph([1, 2, 3], [])
+        result = ScheduleEngine.compute(tasks, graph, self.calendar, level=True)
+        by_id = {t['id']: t for t in result['tasks']}
+        self.assertEqual((by_id[1]['leveled_start'], by_id[2]['leveled_start']), (0, 3))
+        self.assertEqual(by_id[2]['resource_delay'], 3)
+        self.assertEqual(by_id[3]['leveled_start'], 0)
+        self.assertEqual(result['leveled_duration'], 5)
+
+    def test_five_thousand_tasks_schedule_quickly(self):
+        rng = random.Random(3)
+        n = 5000
+        tasks = [_task(i, rng.randint(1, 5), f'工程师{i % 40}') for i in range(1, n + 1)]
+        edges = []
+        for i in range(2, n + 1):
+            for parent in rng.sample(range(max(1, i - 50), i), min(2, i - 1)):
+                edges.append((i, parent, 'finish_to_start'))
+        graph = self._graph(list(range(1, n + 1)), edges)
+        started = time.perf_counter()
+        result = ScheduleEngine.compute(tasks, graph, WorkCalendar(date(2026, 1, 5)))
+        elapsed = time.perf_counter() - started
+        self.assertEqual(len(result['tasks']), n)
+        self.assertLess(elapsed, 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
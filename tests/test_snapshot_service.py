@@ -0,0 +1,83 @@
+import json
+import unittest
+
+from database import DatabasePool
+from db_init import init_db, migrate_snapshot_metric_columns
+from services.snapshot_service import SnapshotService
+
+
+class BulkSnapshotTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+        cls.project_ids = []
+
+    def _add_projects(self, count):
+        with DatabasePool.get_connection() as conn:
+            for _ in range(count):
+                cursor = conn.execute(DatabasePool.format_sql(
+                    'INSERT INTO projects (project_name, hospital_name, status, progress) VALUES (?, ?, ?, ?)'
+                ), (f'快照项目{len(self.project_ids)}', '快照医院', '实施中', 40))
+                pid = DatabasePool.get_inserted_id(cursor)
+                cursor = conn.execute(DatabasePool.format_sql(
+                    'INSERT INTO project_stages (project_id, stage_name, stage_order, progress, status) VALUES (?, ?, ?, ?, ?)'
+                ), (pid, '实施', 1, 50, '进行中'))
+                stage_id = DatabasePool.get_inserted_id(cursor)
+                for done in (True, False):
+                    conn.execute(DatabasePool.format_sql(
+                        'INSERT INTO tasks (stage_id, task_name, is_completed) VALUES (?, ?, ?)'
+                    ), (stage_id, '任务', done))
+                conn.execute(DatabasePool.format_sql(
+                    'INSERT INTO issues (project_id, description, status) VALUES (?, ?, ?)'
+                ), (pid, '问题', '待处理'))
+                self.project_ids.append(pid)
+            conn.commit()
+
+    def _capture(self):
+        statements = []
+        with DatabasePool.get_connection() as conn:
+            conn.set_trace_callback(statements.append)
+            try:
+                captured = SnapshotService.capture_snapshots(self.project_ids)
+            finally:
+                conn.set_trace_callback(None)
+        return captured, sum(1 for s in statements if s.lstrip().upper().startswith('SELECT'))
+
+    def test_select_count_is_constant_and_upsert_is_idempotent(self):
+        self._add_projects(3)
+        small, small_selects = self._capture()
+        self._add_projects(30)
+        large, large_selects = self._capture()
+        self.assertEqual(len(large) - len(small), 30)
+        self.assertEqual(small_selects, large_selects)
+
+        pid = self.project_ids[-1]
+        self.assertEqual(large[pid]['tasks'], {'total': 2, 'completed': 1})
+        self.assertEqual(large[pid]['issues'], {'total': 1, 'open': 1})
+        snapshots = SnapshotService.get_snapshots(pid)
+        self.assertEqual(len(snapshots), 1)
+        self.assertEqual(snapshots[0]['data']['stages'][0]['progress'], 50)
+        self.assertEqual(snapshots[0]['data']['tasks']['completed'], 1)
+
+    def test_legacy_json_rows_are_backfilled(self):
+        self._add_projects(1)
+        pid = self.project_ids[-1]
+        legacy = {
+            'overall_progress': 20, 'status': '实施中',
+            'stages': [{'stage_name': '调研', 'stage_order': 1, 'progress': 100, 'status': '已完成'}],
+            'tasks': {'total': 4, 'completed': 3}, 'issues': {'total': 2, 'open': 0},
+            'interfaces': {'total': 1, 'completed': 1},
+        }
+        with DatabasePool.get_connection() as conn:
+            conn.execute(DatabasePool.format_sql(
+                'INSERT INTO progress_snapshots (project_id, snapshot_date, overall_progress, snapshot_data) VALUES (?, ?, ?, ?)'
+            ), (pid, '2025-12-01', 20, json.dumps(legacy, ensure_ascii=False)))
+            migrate_snapshot_metric_columns(conn.cursor())
+            conn.commit()
+        snapshot = SnapshotService.get_snapshots(pid)[-1]
+        self.assertEqual(snapshot['data']['tasks'], {'total': 4, 'completed': 3})
+        self.assertEqual(snapshot['data']['stages'][0]['stage_name'], '调研')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from app_config import STARTUP_CONFIG
+from utils import background_role as role_module
+from utils.background_role import BackgroundRole
+from utils.lazy import LazyProxy, is_resolved
+
+ROOT = Path(__file__).resolve().parents[1]
+# 冷启动导入预算（毫秒），较慢的 CI 机器可通过环境变量放宽
+STARTUP_BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS', 1000))
+
+
+class StartupTests(unittest.TestCase):
+    def test_cold_import_skips_heavy_dependencies_and_fits_budget(self):
+        completed = subprocess.run(
+            [sys.executable, 'scripts/startup_profile.py', '--json', '--budget-ms', str(STARTUP_BUDGET_MS)],
+            cwd=ROOT, capture_output=True, text=True, encoding='utf-8',
+        )
+        self.assertEqual(completed.returncode, 0, completed.stdout + completed.stderr)
+        self.assertIn('"heavy_loaded": []', completed.stdout)
+
+    def test_lazy_proxy_builds_once_on_first_use(self):
+        calls = []
+
+        class Service:
+            def __init__(self):
+                calls.append(1)
+                self.value = 1
+
+        with mock.patch.dict(STARTUP_CONFIG, {'LAZY_IMPORTS': True}):
+            proxy = LazyProxy(Service, 'service')
+        self.assertFalse(is_resolved(proxy))
+        self.assertEqual(proxy.value, 1)
+        proxy.value = 2
+        self.assertEqual(proxy.value, 2)
+        self.assertTrue(is_resolved(proxy))
+        self.assertEqual(calls, [1])
+
+    @unittest.skipIf(role_module.fcntl is None, 'fcntl unavailable')
+    def test_only_one_holder_runs_background_tasks(self):
+        directory = tempfile.mkdtemp()
+        try:
+            lock_path = os.path.join(directory, 'background.lock')
+            first, second = BackgroundRole('auto', lock_path), BackgroundRole('auto', lock_path)
+            self.assertTrue(first.is_designated())
+            self.assertFalse(second.is_designated())
+            first.release()
+            second._next_attempt = 0
+            self.assertTrue(second.is_designated())
+            self.assertFalse(BackgroundRole('false', lock_path).is_designated())
+            second.release()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
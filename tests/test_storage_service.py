@@ -0,0 +1,127 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from storage_service import AttachmentDiskCache, R2Storage, StorageService
+
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:  # moto 仅用于本地 S3/R2 替身
+    mock_aws = None
+
+
+class _FakeUpload:
+    def __init__(self, data, filename='payload.bin'):
+        self.stream = io.BytesIO(data)
+        self.filename = filename
+
+
+@unittest.skipIf(mock_aws is None, "moto is not installed")
+class R2StreamingTests(unittest.TestCase):
+    def setUp(self):
+        self.mock = mock_aws()
+        self.mock.start()
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        self.client = boto3.client('s3', region_name='us-east-1')
+        self.client.create_bucket(Bucket='icu-test')
+        self.backend = R2Storage.__new__(R2Storage)
+        self.backend.s3_client = self.client
+        self.backend.bucket_name = 'icu-test'
+        self.backend.type = 'r2'
+
+        self.service = StorageService.__new__(StorageService)
+        self.service.config = {}
+        self.service.active_backend = self.backend
+        self.cache_dir = tempfile.mkdtemp()
+        self.service.attachment_cache = AttachmentDiskCache(self.cache_dir, max_bytes=1024 * 1024)
+        self.service._last_temp_sweep = 0
+        self.app = Flask(__name__)
+
+    def tearDown(self):
+        self.mock.stop()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_large_upload_uses_multipart(self):
+        # S3 分片下限为 5 MiB（最后一片除外），数据需超过一个分片才会走分片上传
+        part_size = 5 * 1024 * 1024
+        data = os.urandom(part_size + 123)
+        with mock.patch.object(self.client, 'create_multipart_upload', wraps=self.client.create_multipart_upload) as create, \
+                mock.patch.object(self.client, 'upload_part', wraps=self.client.upload_part) as upload_part:
+            written = self.backend.upload_stream(io.BytesIO(data), '7/big.bin', part_size=part_size)
+        self.assertEqual(written, len(data))
+        self.assertEqual(create.call_count, 1)
+        self.assertEqual(upload_part.call_count, 2)
+
+        body = self.client.get_object(Bucket='icu-test', Key='7/big.bin')['Body'].read()
+        self.assertEqual(body, data)
+
+    def test_upload_file_streams_to_project_key(self):
+        key = self.backend.upload_file(_FakeUpload(b'payload'), 7, filename='small.bin')
+        self.assertEqual(key, '7/small.bin')
+        self.assertEqual(self.client.get_object(Bucket='icu-test', Key=key)['Body'].read(), b'payload')
+
+    def test_small_upload_roundtrip(self):
+        written = self.backend.upload_stream(io.BytesIO(b'hello'), 'common/a.txt', part_size=1024)
+        self.assertEqual(written, 5)
+        self.assertEqual(self.backend.get_size('common/a.txt'), 5)
+
+    def test_stream_response_honours_range(self):
+        self.client.put_object(Bucket='icu-test', Key='1/doc.txt', Body=b'0123456789')
+        with self.app.test_request_context('/'):
+            resp = self.service.stream_response('1/doc.txt', '说明.txt', range_header='bytes=2-5')
+            self.assertEqual(resp.status_code, 206)
+            self.assertEqual(resp.headers['Content-Range'], 'bytes 2-5/10')
+            self.assertEqual(b''.join(resp.response), b'2345')
+
+            full = self.service.stream_response('1/doc.txt', 'doc.txt')
+            self.assertEqual(full.status_code, 200)
+            self.assertEqual(b''.join(full.response), b'0123456789')
+
+            bad = self.service.stream_response('1/doc.txt', 'doc.txt', range_header='bytes=50-60')
+            self.assertEqual(bad.status_code, 416)
+
+    def test_cached_download_hits_disk_cache(self):
+        self.client.put_object(Bucket='icu-test', Key='common/kb.pdf', Body=b'kb-bytes')
+        first = self.service.get_cached_file('common/kb.pdf')
+        second = self.service.get_cached_file('common/kb.pdf')
+        self.assertEqual(first, second)
+        self.assertEqual(self.service.attachment_cache.hits, 1)
+        with open(first, 'rb') as f:
+            self.assertEqual(f.read(), b'kb-bytes')
+
+
+class AttachmentDiskCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.src_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        shutil.rmtree(self.src_dir, ignore_errors=True)
+
+    def _write(self, name, size):
+        path = os.path.join(self.src_dir, name)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        return path
+
+    def test_evicts_least_recently_used_over_budget(self):
+        cache = AttachmentDiskCache(self.cache_dir, max_bytes=250)
+        cache.put('a', self._write('a', 100))
+        os.utime(cache._path_for('a'), (1, 1))
+        cache.put('b', self._write('b', 100))
+        cache.put('c', self._write('c', 100))
+
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import threading
+import unittest
+import uuid
+
+from database import DatabasePool
+from db_init import init_db
+from services.wecom_callback_service import WecomCallbackPipeline
+
+
+class RecordingPipeline(WecomCallbackPipeline):
+    def __init__(self):
+        super().__init__()
+        self.handled = []
+        self.replies = []
+        self.done = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def handle(self, msg):
+        if msg.get('MsgType') != 'text':
+            self.release.wait(2)
+        self.handled.append(msg.get('MsgId'))
+        self.done.set()
+        return f"已处理 {msg.get('MsgId')}"
+
+    def _reply(self, userid, content):
+        self.replies.append((userid, content))
+
+
+class WecomCallbackPipelineTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+
+    def test_retry_of_same_message_is_processed_once(self):
+        pipeline = RecordingPipeline()
+        msg_id = uuid.uuid4().hex
+        msg = {'MsgType': 'text', 'MsgId': msg_id, 'FromUserName': 'zhangsan', 'Content': '状态'}
+        self.assertEqual(pipeline.accept(msg), 'accepted')
+        self.assertEqual(pipeline.accept(dict(msg)), 'duplicate')
+        self.assertTrue(pipeline.done.wait(2))
+        pipeline.shutdown()
+        self.assertEqual(pipeline.handled, [msg_id])
+        self.assertEqual(pipeline.replies, [('zhangsan', f'已处理 {msg_id}')])
+
+    def test_retry_on_another_worker_is_deduplicated(self):
+        # 每个实例有独立的进程内缓存，相当于两个 gunicorn worker，只共享数据库
+        key = WecomCallbackPipeline.dedup_key({'MsgId': uuid.uuid4().hex})
+        self.assertTrue(WecomCallbackPipeline().first_seen(key))
+        self.assertFalse(WecomCallbackPipeline().first_seen(key))
+
+    def test_events_without_msgid_dedup_by_sender_and_time(self):
+        pipeline = WecomCallbackPipeline()
+        event = {'MsgType': 'event', 'Event': 'click', 'EventKey': 'menu_help',
+                 'FromUserName': uuid.uuid4().hex, 'CreateTime': '100'}
+        self.assertTrue(pipeline.first_seen(pipeline.dedup_key(event)))
+        self.assertFalse(pipeline.first_seen(pipeline.dedup_key(event)))
+        self.assertTrue(pipeline.first_seen(pipeline.dedup_key(dict(event, CreateTime='101'))))
+
+    def test_full_queue_rejects_with_busy_reply(self):
+        pipeline = RecordingPipeline()
+        pipeline._slots['image'] = threading.BoundedSemaphore(1)
+        pipeline.release.clear()
+        image = {'MsgType': 'image', 'MediaId': 'm', 'FromUserName': 'u1'}
+        self.assertEqual(pipeline.accept(dict(image, MsgId=uuid.uuid4().hex)), 'accepted')
+        self.assertEqual(pipeline.accept(dict(image, MsgId=uuid.uuid4().hex, FromUserName='u2')), 'busy')
+        pipeline.release.set()
+        pipeline.shutdown()
+        self.assertIn(('u2', '当前消息较多，请稍后再试。'), pipeline.replies)
+
+    def test_slow_media_does_not_delay_text_messages(self):
+        pipeline = RecordingPipeline()
+        pipeline.release.clear()
+        for _ in range(pipeline.WORKERS):
+            voice = {'MsgType': 'voice', 'MediaId': 'm', 'MsgId': uuid.uuid4().hex, 'FromUserName': 'u1'}
+            self.assertEqual(pipeline.accept(voice), 'accepted')
+        text_id = uuid.uuid4().hex
+        self.assertEqual(pipeline.accept({'MsgType': 'text', 'MsgId': text_id, 'FromUserName': 'u2'}), 'accepted')
+        self.assertTrue(pipeline.done.wait(2))
+        self.assertEqual(pipeline.handled, [text_id])
+        pipeline.release.set()
+        pipeline.shutdown()
+
+    def test_debug_logs_are_written_in_batch(self):
+        pipeline = WecomCallbackPipeline()
+        pipeline._flusher_started = True  # 测试中手动落库
+        for i in range(5):
+            pipeline.log_debug('text', f'<xml>{i}</xml>', {'MsgId': str(i)})
+        with DatabasePool.get_connection() as conn:
+            before = conn.execute('SELECT COUNT(*) FROM wecom_debug_logs').fetchone()[0]
+        self.assertEqual(pipeline.flush_logs(), 5)
+        self.assertEqual(pipeline.flush_logs(), 0)
+        with DatabasePool.get_connection() as conn:
+            after = conn.execute('SELECT COUNT(*) FROM wecom_debug_logs').fetchone()[0]
+        self.assertEqual(after - before, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
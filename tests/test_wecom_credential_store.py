@@ -0,0 +1,86 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from services import wecom_credential_store as store_module
+from services.wecom_credential_store import WecomCredentialStore
+from services.wecom_service import WeComService
+
+
+def _fetch_in_child(directory, counter_path, queue):
+    def fetcher():
+        with open(counter_path, 'a') as f:
+            f.write('x')
+        time.sleep(0.3)
+        return f'token-{os.getpid()}', 7200
+
+    store = WecomCredentialStore(directory)
+    queue.put(store.get('access_token:test', fetcher))
+    store.stop()
+
+
+def _response(payload, content_type='application/json'):
+    resp = mock.Mock()
+    resp.headers = {'Content-Type': content_type}
+    resp.json.return_value = payload
+    return resp
+
+
+class WecomCredentialStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = WecomCredentialStore(self.directory)
+
+    def tearDown(self):
+        self.store.stop()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    @unittest.skipIf(store_module.fcntl is None, 'fcntl unavailable')
+    def test_refresh_is_single_flight_across_processes(self):
+        ctx = multiprocessing.get_context('fork')
+        queue = ctx.Queue()
+        counter = os.path.join(self.directory, 'fetches')
+        workers = [ctx.Process(target=_fetch_in_child, args=(self.directory, counter, queue)) for _ in range(4)]
+        for w in workers:
+            w.start()
+        tokens = {queue.get(timeout=10) for _ in workers}
+        for w in workers:
+            w.join(timeout=10)
+        with open(counter) as f:
+            self.assertEqual(f.read(), 'x')
+        self.assertEqual(len(tokens), 1)
+        self.assertEqual(self.store.get('access_token:test', lambda: None), tokens.pop())
+
+    def test_invalidate_only_drops_matching_value(self):
+        fetcher = mock.Mock(side_effect=[('old', 7200), ('new', 7200)])
+        self.assertEqual(self.store.get('k', fetcher), 'old')
+        self.store.invalidate('k', 'stale-from-another-worker')
+        self.assertEqual(self.store.get('k', fetcher), 'old')
+        self.store.invalidate('k', 'old')
+        self.assertEqual(self.store.get('k', fetcher), 'new')
+        self.assertEqual(fetcher.call_count, 2)
+
+    def test_expired_token_errcode_invalidates_and_retries_once(self):
+        service = WeComService()
+        service._credentials = self.store
+        calls = []
+
+        def fake_request(method, url, params=None, **kwargs):
+            calls.append(params['access_token'])
+            if params['access_token'] == 't1':
+                return _response({'errcode': 42001, 'errmsg': 'access_token expired'})
+            return _response({'errcode': 0, 'errmsg': 'ok'})
+
+        with mock.patch.object(service, '_fetch_access_token', side_effect=[('t1', 7200), ('t2', 7200)]), \
+                mock.patch('services.wecom_service.requests.request', side_effect=fake_request):
+            result = service.send_text('zhangsan', 'hello')
+        self.assertEqual(result['errcode'], 0)
+        self.assertEqual(calls, ['t1', 't2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+后台任务进程选举
+多 worker 部署（gunicorn --workers N）时，报告调度、AI 健康检查等常驻后台线程只应在一个进程中运行：
+- BACKGROUND_TASKS=auto：各进程以非阻塞方式争抢同一个 fcntl 文件锁，抢到的进程成为后台进程并持有锁直到退出；
+  该进程退出后锁由内核释放，其余进程在下一次检查（最多每 RETRY_SECONDS 秒一次）时接管
+- BACKGROUND_TASKS=true / false：每个进程都运行 / 都不运行（例如由独立的调度进程负责）
+- 无 fcntl 的平台（Windows 开发环境）按单进程处理，auto 视为 true
+"""
+
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+from app_config import STARTUP_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundRole:
+    RETRY_SECONDS = 30
+
+    def __init__(self, mode=None, lock_path=None):
+        self.mode = (mode or STARTUP_CONFIG['BACKGROUND_TASKS']).lower()
+        self.lock_path = lock_path or STARTUP_CONFIG['BACKGROUND_LOCK_FILE']
+        self._lock = threading.Lock()
+        self._fd = None
+        self._pid = None
+        self._next_attempt = 0
+
+    def is_designated(self):
+        """当前进程是否负责运行后台线程"""
+        if self.mode in ('true', '1', 'yes', 'on'):
+            return True
+        if self.mode != 'auto':
+            return False
+        if fcntl is None:
+            return True
+        if self._fd is not None and self._pid == os.getpid():
+            return True
+        if time.monotonic() < self._next_attempt:
+            return False
+        with self._lock:
+            if self._fd is not None and self._pid == os.getpid():
+                return True
+            # fork 继承来的描述符不代表本进程持锁
+            self._fd = None
+            self._next_attempt = time.monotonic() + self.RETRY_SECONDS
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            os.ftruncate(fd, 0)
+            os.write(fd, str(os.getpid()).encode('ascii'))
+            self._fd, self._pid = fd, os.getpid()
+            logger.info("当前进程 (pid=%s) 被选为后台任务进程", self._pid)
+            return True
+
+    def release(self):
+        with self._lock:
+            if self._fd is not None and self._pid == os.getpid():
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+                os.close(self._fd)
+            self._fd = self._pid = None
+            self._next_attempt = 0
+
+
+background_role = BackgroundRole()
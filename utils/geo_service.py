@@ -2,6 +2,8 @@ import requests
 import os
 import re
 import logging
+import threading
+from functools import lru_cache
 from database import DatabasePool
 
 logger = logging.getLogger(__name__)
@@ -28,6 +30,181 @@ BASE_CITY_COORDS = {
     '保康': [111.2613, 31.8783]
 }
 
+
+GAZETTEER_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static', 'data', 'china_gazetteer.tsv'
+)
+
+MUNICIPALITY_CODES = ('11', '12', '31', '50')
+
+MINORITY_NAMES = (
+    '蒙古族', '回族', '藏族', '维吾尔族', '苗族', '彝族', '壮族', '布依族', '朝鲜族', '满族', '侗族',
+    '瑶族', '白族', '土家族', '哈尼族', '哈萨克族', '傣族', '黎族', '傈僳族', '佤族', '畲族', '高山族',
+    '拉祜族', '水族', '东乡族', '纳西族', '景颇族', '柯尔克孜族', '土族', '达斡尔族', '仫佬族', '羌族',
+    '布朗族', '撒拉族', '毛南族', '仡佬族', '锡伯族', '阿昌族', '普米族', '塔吉克族', '怒族',
+    '乌孜别克族', '俄罗斯族', '鄂温克族', '德昂族', '保安族', '裕固族', '京族', '塔塔尔族', '独龙族',
+    '鄂伦春族', '赫哲族', '门巴族', '珞巴族', '基诺族', '各族', '维吾尔'
+)
+
+# 含地名但并不指向该地的机构名，匹配前先屏蔽
+NON_LOCATION_TERMS = (
+    '中山大学', '中山医科大学', '中山医院', '江南大学', '和平医院', '中南大学',
+    # 校名含地名但校址不在该地：吉林大学在长春，南华大学在衡阳（而非云南南华县）
+    '吉林大学', '南华大学',
+)
+
+_REGION_SUFFIXES = ('特别行政区', '自治区', '自治州', '自治县', '自治旗', '地区', '林区', '新区', '省', '市', '盟', '县', '区', '旗')
+
+
+def _short_region_name(name):
+    """行政区划简称：去掉民族自治称谓与行政级别后缀，不足两字时返回空串"""
+    short = name
+    if re.search(r'自治(区|州|县|旗)$', short):
+        cut = len(short)
+        for nation in MINORITY_NAMES:
+            idx = short.find(nation, 2)
+            if 0 <= idx < cut:
+                cut = idx
+        short = short[:cut]
+    for suffix in _REGION_SUFFIXES:
+        if short.endswith(suffix) and len(short) - len(suffix) >= 2:
+            short = short[:-len(suffix)]
+            break
+    return short if len(short) >= 2 and short != name else ''
+
+
+class Gazetteer:
+    """离线行政区划词典：省/地市/区县 + 中心点，字典树一次扫描识别地名（零 I/O）"""
+
+    LEVEL_RANK = {'city': 3, 'province': 2, 'county': 1}
+
+    def __init__(self, path=GAZETTEER_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.entries = {}
+        self._trie = {}
+        self.match = lru_cache(maxsize=4096)(self._match)
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            entries = {}
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    for line in f:
+                        if not line.strip() or line.startswith('#'):
+                            continue
+                        adcode, name, lng, lat = line.rstrip('\n').split('\t')
+                        if adcode.endswith('0000'):
+                            level = 'province'
+                        elif adcode.endswith('00'):
+                            level = 'city'
+                        else:
+                            level = 'county'
+                        entries[adcode] = {
+                            'adcode': adcode, 'name': name, 'short': _short_region_name(name),
+                            'level': level, 'lng': float(lng), 'lat': float(lat)
+                        }
+            except OSError as e:
+                logger.warning(f"Gazetteer data unavailable ({self.path}): {e}")
+
+            trie = {}
+            for adcode, entry in entries.items():
+                aliases = [(entry['name'], True)]
+                if entry['short']:
+                    aliases.append((entry['short'], False))
+                    if entry['name'].endswith('自治州'):
+                        aliases.append((entry['short'] + '州', True))
+                for alias, is_full in aliases:
+                    node = trie
+                    for ch in alias:
+                        node = node.setdefault(ch, {})
+                    node.setdefault('$', []).append((adcode, is_full))
+            self.entries = entries
+            self._trie = trie
+            self._loaded = True
+
+    def _scan(self, text):
+        """最左最长匹配，返回 [(start, end, [(adcode, is_full), ...]), ...]"""
+        hits = []
+        i, n = 0, len(text)
+        while i < n:
+            node, last = self._trie, None
+            j = i
+            while j < n and text[j] in node:
+                node = node[text[j]]
+                j += 1
+                if '$' in node:
+                    last = (j, node['$'])
+            if last:
+                hits.append((i, last[0], last[1]))
+                i = last[0]
+            else:
+                i += 1
+        return hits
+
+    def _parents(self, adcode):
+        return adcode[:2] + '0000', adcode[:4] + '00'
+
+    def _match(self, text):
+        self._ensure_loaded()
+        if not text or not self._trie:
+            return None
+        for term in NON_LOCATION_TERMS:
+            text = text.replace(term, '#' * len(term))
+        hits = self._scan(text)
+        if not hits:
+            return None
+
+        best, best_key, ambiguous = None, None, False
+        for idx, (_, _, candidates) in enumerate(hits):
+            others = {code for k, (_, _, cs) in enumerate(hits) if k != idx for code, _ in cs}
+            for adcode, is_full in candidates:
+                entry = self.entries[adcode]
+                support = sum(1 for parent in set(self._parents(adcode)) if parent != adcode and parent in others)
+                # 区的简称（如“南山”“江南”）极易误伤，必须有上级地名佐证
+                if not is_full and not support and entry['level'] == 'county' and entry['name'].endswith('区'):
+                    continue
+                key = (support, is_full, self.LEVEL_RANK[entry['level']] if not support else -self.LEVEL_RANK[entry['level']])
+                if best_key is None or key > best_key:
+                    best, best_key, ambiguous = entry, key, False
+                elif key == best_key and entry['adcode'] != best['adcode']:
+                    ambiguous = True
+        # 同名且无上下文可区分（如多个“南山区”）时交给缓存/在线服务
+        if not best or ambiguous:
+            return None
+        return self._describe(best)
+
+    def _describe(self, entry):
+        adcode = entry['adcode']
+        province_code, city_code = self._parents(adcode)
+        province = self.entries.get(province_code, {})
+        province_short = province.get('short') or province.get('name', '')
+        if adcode[:2] in MUNICIPALITY_CODES:
+            city = province_short
+        elif entry['level'] == 'province':
+            city = ''
+        elif city_code in self.entries:
+            city_entry = self.entries[city_code]
+            city = city_entry['short'] or city_entry['name']
+        else:
+            # 省直辖县级市等无地级上级的单位
+            city = entry['short'] or entry['name']
+        return {
+            'province': province_short,
+            'city': city,
+            'county': entry['name'] if entry['level'] == 'county' else '',
+            'adcode': adcode,
+            'lng': entry['lng'],
+            'lat': entry['lat'],
+            'provider': 'gazetteer'
+        }
+
+
 class GeoService:
     def __init__(self):
         # Keys and Provider settings
@@ -79,6 +256,10 @@ class GeoService:
         
         if clean_name in BASE_CITY_COORDS:
             return BASE_CITY_COORDS[clean_name]
+
+        offline = gazetteer.match(location_name)
+        if offline:
+            return [offline['lng'], offline['lat']]
         
         cached = self._get_from_cache(location_name)
         if cached: return cached
@@ -94,32 +275,35 @@ class GeoService:
             
         return None
 
+    def resolve_offline(self, location_name):
+        """仅用内存中的行政区划词典解析地址，不访问数据库或外部 API（供读路径使用）。"""
+        if not location_name: return None
+        location_name = location_name.strip()
+        result = gazetteer.match(location_name)
+        if result:
+            return dict(result)
+        clean_name = self.normalize_name(location_name)
+        coords = BASE_CITY_COORDS.get(clean_name)
+        if not coords:
+            return None
+        return {'province': '', 'city': clean_name, 'lng': coords[0], 'lat': coords[1], 'provider': 'heuristic'}
+
     def resolve_address_details(self, location_name):
         """Resolves address into structured detail: province, city, lng, lat."""
         if not location_name: return None
         location_name = location_name.strip()
-        normalized = self.normalize_name(location_name)
 
-        # 0. 优先使用本地启发式映射，避免医院全称被公共地理服务误匹配到错误地区
-        province_hint, city_hint = self._parse_name_heuristically(location_name)
-        if not city_hint and normalized:
-            province_hint, city_hint = self._parse_name_heuristically(normalized)
-        result = None
-        if city_hint:
-            coords = BASE_CITY_COORDS.get(city_hint)
-            if coords:
-                result = {
-                    'province': province_hint,
-                    'city': city_hint,
-                    'lng': coords[0],
-                    'lat': coords[1],
-                    'provider': 'heuristic'
-                }
+        # 0. 优先使用离线行政区划词典，避免医院全称被公共地理服务误匹配到错误地区；
+        #    只匹配到省份（如“河南省人民医院”）时城市仍未知，继续查缓存和外部服务，省份留作兜底
+        offline = self.resolve_offline(location_name)
+        if offline and offline.get('city'):
+            return offline
 
         cached = self._get_details_from_cache(location_name)
-        if cached and not result:
-            return cached
-        
+        if cached:
+            return self._fill_province(cached, offline)
+
+        result = None
         # 1. Try primary provider
         if not result and self.provider == 'baidu' and self.baidu_ak:
             result = self._fetch_details_from_baidu(location_name)
@@ -149,6 +333,7 @@ class GeoService:
             
             if coords:
                 province, city = self._parse_name_heuristically(location_name)
+                province = province or (offline or {}).get('province', '')
                 result = {
                     'province': province,
                     'city': city or (location_name[:5] if len(location_name) < 10 else ''),
@@ -158,18 +343,23 @@ class GeoService:
                 }
         
         if result:
+            result = self._fill_province(result, offline)
             self._save_details_to_cache(location_name, result)
-        return result
+            return result
+        # 外部服务都失败时退回离线匹配到的省级结果，不写缓存，以便下次继续尝试解析城市
+        return offline
+
+    @staticmethod
+    def _fill_province(details, offline):
+        """外部结果缺省份时用离线词典匹配到的省份补齐。"""
+        if offline and not details.get('province') and offline.get('province'):
+            details = dict(details, province=offline['province'])
+        return details
 
     def _parse_name_heuristically(self, location_name):
-        standalone_map = {
-            '莆田': '福建', '垫江': '重庆', '眉山': '四川', '襄阳': '湖北', '随州': '湖北',
-            '昆明': '云南', '文山': '云南', '丘北': '云南', '红河': '云南', '广南': '云南',
-            '保康': '湖北'
-        }
-        for c, p in standalone_map.items():
-            if c in location_name:
-                return p, c
+        details = gazetteer.match(location_name) if location_name else None
+        if details:
+            return details['province'], details['city']
         return '', ''
 
     def _get_details_from_cache(self, name):
@@ -177,7 +367,7 @@ class GeoService:
             with DatabasePool.get_connection() as conn:
                 sql = DatabasePool.format_sql('SELECT province, city, lng, lat FROM geo_cache WHERE location_name = ?')
                 res = conn.execute(sql, (name,)).fetchone()
-                if res and res['lng'] is not None: 
+                if res and res['lng'] is not None and res['lat'] is not None:
                     return dict(res)
         except: pass
         return None
@@ -318,7 +508,10 @@ class GeoService:
     def _get_from_cache(self, name):
         try:
             with DatabasePool.get_connection() as conn:
-                res = conn.execute(DatabasePool.format_sql('SELECT lng, lat FROM geo_cache WHERE location_name = ?'), (name,)).fetchone()
+                # 地理编码失败的记录（provider='unresolved'，坐标为空）不算命中，仍需走外部服务
+                res = conn.execute(DatabasePool.format_sql(
+                    'SELECT lng, lat FROM geo_cache WHERE location_name = ? AND lng IS NOT NULL AND lat IS NOT NULL'
+                ), (name,)).fetchone()
                 if res: return [res['lng'], res['lat']]
         except: pass
         return None
@@ -350,4 +543,5 @@ class GeoService:
                 conn.commit()
         except: pass
 
+gazetteer = Gazetteer()
 geo_service = GeoService()
@@ -0,0 +1,68 @@
+"""
+延迟加载工具
+- LazyProxy：包装工厂函数，首次访问属性时才调用并缓存结果，之后的属性读写都转发给真实对象；
+  用于构造代价高（建客户端、查库、依赖 numpy 等）的服务单例，`from x import y_service` 只拿到代理
+- lazy_import：返回模块代理，首次访问属性时才真正 import（适合模块级大量 `np.xxx` 调用的情况；
+  只在个别函数里用到的依赖直接在函数内 import 即可）
+- STARTUP_CONFIG['LAZY_IMPORTS'] 为 false 时代理在创建时立即解析，行为与直接构造一致
+"""
+
+import importlib
+import sys
+import threading
+
+from app_config import STARTUP_CONFIG
+
+_UNRESOLVED = object()
+
+
+class LazyProxy:
+    __slots__ = ('_lazy_factory', '_lazy_target', '_lazy_lock', '_lazy_name')
+
+    def __init__(self, factory, name=None):
+        object.__setattr__(self, '_lazy_factory', factory)
+        object.__setattr__(self, '_lazy_target', _UNRESOLVED)
+        object.__setattr__(self, '_lazy_lock', threading.Lock())
+        object.__setattr__(self, '_lazy_name', name or getattr(factory, '__qualname__', repr(factory)))
+        if not STARTUP_CONFIG['LAZY_IMPORTS']:
+            self._lazy_resolve()
+
+    def _lazy_resolve(self):
+        target = self._lazy_target
+        if target is _UNRESOLVED:
+            with self._lazy_lock:
+                target = self._lazy_target
+                if target is _UNRESOLVED:
+                    target = self._lazy_factory()
+                    object.__setattr__(self, '_lazy_target', target)
+        return target
+
+    def __getattr__(self, name):
+        return getattr(self._lazy_resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._lazy_resolve(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._lazy_resolve(), name)
+
+    def __dir__(self):
+        return dir(self._lazy_resolve())
+
+    def __repr__(self):
+        if self._lazy_target is _UNRESOLVED:
+            return f'<LazyProxy {self._lazy_name} (unresolved)>'
+        return repr(self._lazy_target)
+
+
+def lazy_import(name):
+    """按模块名返回延迟导入的模块；已导入过则直接返回模块本身"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyProxy(lambda: importlib.import_module(name), name)
+
+
+def is_resolved(obj):
+    """对象是否已实际加载（非代理对象视为已加载）"""
+    return not isinstance(obj, LazyProxy) or obj._lazy_target is not _UNRESOLVED
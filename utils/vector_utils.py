@@ -1,7 +1,10 @@
-import numpy as np
 import json
 import base64
 
+from utils.lazy import lazy_import
+
+np = lazy_import('numpy')
+
 class VectorUtils:
     @staticmethod
     def cosine_similarity(v1, v2):
@@ -13,7 +13,6 @@ import string
 import struct
 import socket
 import xml.etree.ElementTree as ET
-from Cryptodome.Cipher import AES
 
 class WeComCrypto:
     """企业微信消息加解密"""
@@ -30,6 +29,11 @@ class WeComCrypto:
         sort_list = sorted([str(a) for a in args])
         raw = "".join(sort_list).encode('utf-8')
         return hashlib.sha1(raw).hexdigest()
+
+    def _cipher(self):
+        # pycryptodomex 只在收发加密回调时加载
+        from Cryptodome.Cipher import AES
+        return AES.new(self.aes_key, AES.MODE_CBC, self.iv)
     
     def verify_signature(self, msg_signature: str, timestamp: str, nonce: str, echostr: str) -> bool:
         """验证签名"""
@@ -52,7 +56,7 @@ class WeComCrypto:
     def decrypt(self, encrypted_text: str) -> str:
         """解密消息"""
         cipher_bytes = base64.b64decode(encrypted_text)
-        cipher = AES.new(self.aes_key, AES.MODE_CBC, self.iv)
+        cipher = self._cipher()
         plain_bytes = self._pkcs7_unpad(cipher.decrypt(cipher_bytes))
         
         # 前16字节为随机字符串，后4字节为消息长度（网络字节序），然后是消息内容，最后是 receiveid
@@ -77,7 +81,7 @@ class WeComCrypto:
         plain_bytes = random_str + msg_len + msg_bytes + corp_id_bytes
         padded = self._pkcs7_pad(plain_bytes)
         
-        cipher = AES.new(self.aes_key, AES.MODE_CBC, self.iv)
+        cipher = self._cipher()
         encrypted = cipher.encrypt(padded)
         return base64.b64encode(encrypted).decode('utf-8')
     